@@ -0,0 +1 @@
+# This file makes the 'benchmarks' directory a Python package
@@ -0,0 +1,246 @@
+import re
+import time
+from collections import Counter, deque
+
+from gspread.cell import Cell
+from gspread.exceptions import GSpreadException, WorksheetNotFound
+from gspread.utils import numericise_all
+
+# In-process fake of the gspread surface used by utils/db_api.
+#
+# Every method that would hit the Sheets API counts as one request (two for
+# get_records/get_all_records, which gspread implements as a header read plus
+# a values read), sleeps for the configured latency and is checked against the
+# per-minute quota, so benchmarks see the same call pattern as the real bot.
+
+# Methods of gspread that are read requests; everything else counted is a write
+READ_METHODS = {'fetch_sheet_metadata', 'get_values', 'find', 'row_values', 'values_batch_get'}
+
+# Grid size of a new worksheet, as created by ensure_schema
+DEFAULT_ROW_COUNT = 1000
+
+
+class QuotaExceeded(GSpreadException):
+    """Raised when a simulated per-minute quota is exhausted (HTTP 429)"""
+
+
+def to_cell_value(value):
+    """Convert a Python value to the string Google Sheets would store"""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    return str(value)
+
+
+class FakeSpreadsheet:
+    """
+    Spreadsheet held in memory.
+
+    latency is the delay of a single API request in seconds. read_quota and
+    write_quota are requests per minute (None disables the limit), matching
+    the per-user quotas of the Sheets API.
+    """
+
+    def __init__(self, latency=0.0, read_quota=None, write_quota=None):
+        self.latency = latency
+        self.read_quota = read_quota
+        self.write_quota = write_quota
+        self.calls = Counter()
+        self.quota_errors = 0
+        self._worksheets = {}
+        self._windows = {'read': deque(), 'write': deque()}
+
+    # Request accounting
+
+    def request(self, method):
+        """Account for one API request"""
+        kind = 'read' if method in READ_METHODS else 'write'
+        quota = self.read_quota if kind == 'read' else self.write_quota
+
+        if quota:
+            now = time.monotonic()
+            window = self._windows[kind]
+            while window and now - window[0] >= 60:
+                window.popleft()
+            if len(window) >= quota:
+                self.quota_errors += 1
+                raise QuotaExceeded(
+                    f"APIError: [429]: Quota exceeded for quota metric '{kind.title()} requests'"
+                )
+            window.append(now)
+
+        self.calls[method] += 1
+        self.calls[kind] += 1
+
+        if self.latency:
+            time.sleep(self.latency)
+
+    def reset_stats(self):
+        """Reset request counters"""
+        self.calls = Counter()
+        self.quota_errors = 0
+
+    def get_stats(self):
+        """Get request counters"""
+        return {
+            'reads': self.calls['read'],
+            'writes': self.calls['write'],
+            'quota_errors': self.quota_errors,
+            'methods': {
+                method: count for method, count in self.calls.items()
+                if method not in ('read', 'write')
+            },
+        }
+
+    # Seeding (no requests are counted)
+
+    def load(self, title, headers, rows):
+        """Create or replace a worksheet with the given headers and rows"""
+        worksheet = FakeWorksheet(self, title)
+        worksheet.values = [list(headers)] + [
+            [to_cell_value(row.get(header)) for header in headers] for row in rows
+        ]
+        worksheet.grid_rows = max(len(worksheet.values), DEFAULT_ROW_COUNT)
+        self._worksheets[title] = worksheet
+        return worksheet
+
+    # gspread.Spreadsheet
+
+    def worksheet(self, title):
+        self.request('fetch_sheet_metadata')
+        try:
+            return self._worksheets[title]
+        except KeyError:
+            raise WorksheetNotFound(title)
+
+    def worksheets(self):
+        self.request('fetch_sheet_metadata')
+        return list(self._worksheets.values())
+
+    def add_worksheet(self, title, rows, cols):
+        self.request('batch_update')
+        worksheet = FakeWorksheet(self, title, grid_rows=rows)
+        self._worksheets[title] = worksheet
+        return worksheet
+
+    def batch_update(self, body):
+        self.request('batch_update')
+        for item in body.get('requests', []):
+            properties = item.get('addSheet', {}).get('properties')
+            if properties:
+                grid_rows = properties.get('gridProperties', {}).get('rowCount', DEFAULT_ROW_COUNT)
+                self._worksheets[properties['title']] = FakeWorksheet(self, properties['title'], grid_rows)
+        return {}
+
+    def values_batch_get(self, ranges):
+        self.request('values_batch_get')
+        value_ranges = []
+        for value_range in ranges:
+            # Only "'Sheet'!1:1" (header row) ranges are used by the bot
+            match = re.match(r"'?(.+?)'?!(\d+):\d+$", value_range)
+            worksheet = self._worksheets[match.group(1)]
+            row = int(match.group(2)) - 1
+            values = [list(worksheet.values[row])] if row < len(worksheet.values) and worksheet.values[row] else []
+            value_ranges.append({'range': value_range, 'values': values})
+        return {'valueRanges': value_ranges}
+
+    def values_batch_update(self, body):
+        self.request('values_batch_update')
+        for item in body.get('data', []):
+            # Only "'Sheet'!A<row>" ranges are used by the bot
+            match = re.match(r"'?(.+?)'?!A(\d+)$", item['range'])
+            worksheet = self._worksheets[match.group(1)]
+            start = int(match.group(2)) - 1
+            for offset, row in enumerate(item['values']):
+                worksheet._put_row(start + offset, row)
+        return {}
+
+
+class FakeWorksheet:
+    """Worksheet held in memory as a list of string rows (row 1 is the header)"""
+
+    def __init__(self, spreadsheet, title, grid_rows=DEFAULT_ROW_COUNT):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.values = []
+        self.grid_rows = grid_rows
+
+    @property
+    def row_count(self):
+        return self.grid_rows
+
+    def _put_row(self, index, row):
+        while len(self.values) <= index:
+            self.values.append([])
+        self.values[index] = [to_cell_value(value) for value in row]
+        self.grid_rows = max(self.grid_rows, len(self.values))
+
+    def _records(self, rows):
+        headers = self.values[0] if self.values else []
+        return [
+            dict(zip(headers, numericise_all(row + [''] * (len(headers) - len(row)))))
+            for row in rows
+        ]
+
+    # gspread.Worksheet
+
+    def get_all_records(self):
+        return self.get_records()
+
+    def get_records(self, first_index=None, last_index=None):
+        # A header read and a values read, as in gspread
+        self.spreadsheet.request('get_values')
+        self.spreadsheet.request('get_values')
+
+        first_index = first_index or 2
+        last_index = last_index or self.row_count
+        if first_index > self.row_count or last_index < first_index:
+            raise ValueError("first_index/last_index out of the worksheet range")
+
+        rows = self.values[first_index - 1:last_index]
+        if not rows:
+            # gspread fails on an empty values range the same way
+            raise IndexError("list index out of range")
+        return self._records(rows)
+
+    def row_values(self, row):
+        self.spreadsheet.request('row_values')
+        if row > len(self.values):
+            return []
+        return list(self.values[row - 1])
+
+    def find(self, query, in_row=None, in_column=None):
+        self.spreadsheet.request('find')
+        for row_index, row in enumerate(self.values, start=1):
+            if in_row and row_index != in_row:
+                continue
+            for col_index, value in enumerate(row, start=1):
+                if in_column and col_index != in_column:
+                    continue
+                if value == query:
+                    return Cell(row_index, col_index, value)
+        return None
+
+    def update_cell(self, row, col, value):
+        self.spreadsheet.request('update_cell')
+        while len(self.values) < row:
+            self.values.append([])
+        cells = self.values[row - 1]
+        cells.extend([''] * (col - len(cells)))
+        cells[col - 1] = to_cell_value(value)
+
+    def append_row(self, values):
+        self.append_rows([values], method='append_row')
+
+    def append_rows(self, values, method='append_rows'):
+        self.spreadsheet.request(method)
+        for row in values:
+            self.values.append([to_cell_value(value) for value in row])
+        self.grid_rows = max(self.grid_rows, len(self.values))
+
+    def delete_rows(self, start_index, end_index=None):
+        self.spreadsheet.request('delete_rows')
+        end_index = end_index or start_index
+        del self.values[start_index - 1:end_index]
+        self.grid_rows -= end_index - start_index + 1
@@ -0,0 +1,352 @@
+"""
+Replay load test of the bot.
+
+Feeds synthetic or recorded Telegram updates to the real Dispatcher of the
+bot (all handlers and middlewares) with a mocked Bot session and the fake
+spreadsheet, many users at once, and reports throughput, update latency
+percentiles and event loop lag:
+
+    python -m benchmarks.load_test --users 200 --concurrency 200
+    python -m benchmarks.load_test --mix booking=1 --sheets-latency-ms 100 --telegram-latency-ms 50
+    python -m benchmarks.load_test --dump updates.jsonl
+    python -m benchmarks.load_test --replay updates.jsonl --concurrency 50
+
+Recorded updates are JSON lines in the format of the Bot API getUpdates;
+updates of one user are replayed in order, different users concurrently.
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import logging
+import os
+import random
+import statistics
+import time
+from collections import Counter, defaultdict
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Update, Message, CallbackQuery, Chat, User
+
+from benchmarks.fake_sheets import FakeSpreadsheet
+from benchmarks.seed import seed
+from benchmarks.run import install
+from keyboards.callback_data import (
+    CategoryCallback, ServiceCallback, MasterCallback, AppointmentCallback,
+    FinancePeriodCallback, ForecastCallback,
+)
+
+# Loop lag is sampled by a task that sleeps for this long, in seconds
+LAG_SAMPLE_INTERVAL = 0.01
+
+
+class FakeSession(BaseSession):
+    """Bot session answering every API request locally after a simulated delay"""
+
+    def __init__(self, latency=0.0):
+        super().__init__()
+        self.latency = latency
+        self.requests = Counter()
+        self._message_ids = itertools.count(1000)
+
+    async def make_request(self, bot, method, timeout=None):
+        self.requests[type(method).__name__] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        # Methods that return a message get one, all the others just succeed
+        if method.__returning__ is Message:
+            chat_id = getattr(method, 'chat_id', 0)
+            return Message(
+                message_id=next(self._message_ids),
+                date=datetime.datetime.now(),
+                chat=Chat(id=chat_id if isinstance(chat_id, int) else 0, type='private'),
+                text=getattr(method, 'text', None),
+            )
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b''
+
+    async def close(self):
+        pass
+
+
+# Synthetic updates
+
+class UpdateFactory:
+    """Builds Telegram updates on behalf of one user"""
+
+    update_ids = itertools.count(1)
+
+    def __init__(self, user_id):
+        self.user = User(id=user_id, is_bot=False, first_name=f"User {user_id}", username=f"user{user_id}")
+        self.chat = Chat(id=user_id, type='private')
+        self.message_ids = itertools.count(1)
+
+    def message(self, text):
+        return Update(
+            update_id=next(self.update_ids),
+            message=Message(
+                message_id=next(self.message_ids),
+                date=datetime.datetime.now(),
+                chat=self.chat,
+                from_user=self.user,
+                text=text,
+            ),
+        )
+
+    def callback(self, data):
+        return Update(
+            update_id=next(self.update_ids),
+            callback_query=CallbackQuery(
+                id=str(next(self.update_ids)),
+                from_user=self.user,
+                chat_instance=str(self.chat.id),
+                message=Message(
+                    message_id=next(self.message_ids),
+                    date=datetime.datetime.now(),
+                    chat=self.chat,
+                    text="...",
+                ),
+                data=data,
+            ),
+        )
+
+
+def booking_flow(user_id, dataset, rnd):
+    """Client books a service: /book -> category -> service -> master -> date -> time -> confirm"""
+    factory = UpdateFactory(user_id)
+    service = rnd.choice(dataset['Services'])
+    master = rnd.choice(dataset['Masters'])
+    date = (datetime.date.today() + datetime.timedelta(days=rnd.randint(1, 14))).strftime("%Y-%m-%d")
+    return [
+        factory.message("/book"),
+        factory.callback(CategoryCallback(id=str(service['category_id'])).pack()),
+        factory.callback(ServiceCallback(id=str(service['id'])).pack()),
+        factory.callback(MasterCallback(id=str(master['id'])).pack()),
+        factory.message(date),
+        factory.callback(rnd.choice(["10:00", "12:30", "15:00", "17:30"])),
+        factory.callback("confirm"),
+    ]
+
+
+def admin_flow(user_id, dataset, rnd):
+    """Admin opens today's appointments and changes the status of one"""
+    factory = UpdateFactory(user_id)
+    today = datetime.date.today().strftime("%Y-%m-%d")
+    todays = [row for row in dataset['Appointments'] if row['date'] == today] or dataset['Appointments']
+    appointment_id = str(rnd.choice(todays)['id'])
+    return [
+        factory.message("/admin"),
+        factory.callback("admin_appointments"),
+        factory.callback("admin_appointments_today"),
+        factory.callback(AppointmentCallback(action="view", id=appointment_id).pack()),
+        factory.callback(AppointmentCallback(action=rnd.choice(["confirm", "completed"]), id=appointment_id).pack()),
+    ]
+
+
+def finance_flow(user_id, dataset, rnd):
+    """Admin browses the finance screens: income for a period and the forecast"""
+    factory = UpdateFactory(user_id)
+    return [
+        factory.message("/finance"),
+        factory.callback("finance_income"),
+        factory.callback(FinancePeriodCallback(period=rnd.choice(["week", "month", "30days"])).pack()),
+        factory.callback("finance_forecast"),
+        factory.callback(ForecastCallback(days=30).pack()),
+    ]
+
+
+FLOWS = {
+    'booking': booking_flow,
+    'admin': admin_flow,
+    'finance': finance_flow,
+}
+
+
+def parse_mix(text):
+    """Parse a flow mix like "booking=70,admin=20,finance=10" """
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        if name.strip() not in FLOWS:
+            raise argparse.ArgumentTypeError(f"Unknown flow '{name}', expected one of: {', '.join(FLOWS)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def build_sessions(dataset, users, mix, seed_value=42):
+    """Build the update sequences of the virtual users as (flow name, updates) pairs"""
+    rnd = random.Random(seed_value)
+    clients = [row['user_id'] for row in dataset['Clients'] if row['role'] == 'client']
+    admins = [row['user_id'] for row in dataset['Clients'] if row['role'] == 'admin']
+
+    names = list(mix)
+    weights = [mix[name] for name in names]
+
+    sessions = []
+    for i in range(users):
+        name = rnd.choices(names, weights=weights)[0]
+        user_id = clients[i % len(clients)] if name == 'booking' else admins[i % len(admins)]
+        sessions.append((name, FLOWS[name](user_id, dataset, rnd)))
+    return sessions
+
+
+def load_sessions(path):
+    """Load recorded updates and group them into per-user sequences"""
+    by_user = defaultdict(list)
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            update = Update.model_validate(json.loads(line))
+            event = update.message or update.callback_query
+            user_id = event.from_user.id if event and event.from_user else 0
+            by_user[user_id].append(update)
+    return [('replay', updates) for updates in by_user.values()]
+
+
+def dump_sessions(sessions, path):
+    """Write the updates of all sessions as JSON lines"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for _, updates in sessions:
+            for update in updates:
+                f.write(update.model_dump_json(exclude_none=True, by_alias=True) + "\n")
+
+
+# Runner
+
+async def monitor_loop_lag(samples, stop):
+    """Record how late the event loop wakes up a sleeping task"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(LAG_SAMPLE_INTERVAL)
+        samples.append(loop.time() - started - LAG_SAMPLE_INTERVAL)
+
+
+async def run_session(dp, bot, name, updates, semaphore, think_time, results):
+    """Feed the updates of one user in order, recording the latency of each"""
+    async with semaphore:
+        for update in updates:
+            started = time.perf_counter()
+            try:
+                await dp.feed_update(bot, update)
+                failed = False
+            except Exception as e:
+                failed = True
+                if results['errors'] < 5:
+                    logging.error(f"Update {update.update_id} of flow {name} failed: {e!r}")
+            elapsed = time.perf_counter() - started
+
+            results['latencies'].append(elapsed)
+            results['by_flow'][name].append(elapsed)
+            if failed:
+                results['errors'] += 1
+
+            if think_time:
+                await asyncio.sleep(think_time)
+
+
+def percentiles(values):
+    """p50, p95 and p99 of the values"""
+    if len(values) < 2:
+        value = values[0] if values else 0
+        return value, value, value
+    cuts = statistics.quantiles(values, n=100, method='inclusive')
+    return cuts[49], cuts[94], cuts[98]
+
+
+def format_ms(values):
+    p50, p95, p99 = percentiles(values)
+    return f"{p50 * 1000:>9.1f} {p95 * 1000:>9.1f} {p99 * 1000:>9.1f} {max(values, default=0) * 1000:>9.1f}"
+
+
+async def run(args):
+    # The bot module needs a token to build its own Bot; requests never leave the process
+    os.environ.setdefault('BOT_TOKEN', '42:LOAD-TEST')
+    import main
+    from utils import metrics
+
+    spreadsheet = FakeSpreadsheet(latency=args.sheets_latency_ms / 1000)
+    dataset = seed(spreadsheet, clients=args.clients, appointments=args.appointments, masters=args.masters)
+    install(spreadsheet)
+
+    if args.replay:
+        sessions = load_sessions(args.replay)
+    else:
+        sessions = build_sessions(dataset, args.users, args.mix)
+
+    if args.dump:
+        dump_sessions(sessions, args.dump)
+        print(f"Wrote {sum(len(updates) for _, updates in sessions)} updates to {args.dump}")
+        return
+
+    dp = main.dp
+    await main.register_all_handlers()
+    session = FakeSession(latency=args.telegram_latency_ms / 1000)
+    bot = Bot(token=os.environ['BOT_TOKEN'], session=session)
+
+    results = {'latencies': [], 'by_flow': defaultdict(list), 'errors': 0}
+    lag_samples = []
+    stop = asyncio.Event()
+    lag_monitor = asyncio.create_task(monitor_loop_lag(lag_samples, stop))
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    spreadsheet.reset_stats()
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        run_session(dp, bot, name, updates, semaphore, args.think_ms / 1000, results)
+        for name, updates in sessions
+    ))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await lag_monitor
+
+    total = len(results['latencies'])
+    stats = spreadsheet.get_stats()
+    print(
+        f"{len(sessions)} users, concurrency {args.concurrency}: {total} updates in {elapsed:.2f} s, "
+        f"{total / elapsed:.1f} updates/s, {results['errors']} errors\n"
+        f"Sheets API: {stats['reads']} reads, {stats['writes']} writes; "
+        f"Bot API: {sum(session.requests.values())} requests\n"
+    )
+    print(f"{'latency, ms':<14} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    print(f"{'all updates':<14} {format_ms(results['latencies'])}")
+    for name, latencies in sorted(results['by_flow'].items()):
+        print(f"{name:<14} {format_ms(latencies)}")
+    print(f"{'loop lag':<14} {format_ms(lag_samples)}")
+
+    if args.verbose:
+        print()
+        print(metrics.format_summary(limit=20))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay Telegram updates against the bot's dispatcher")
+    parser.add_argument('--users', type=int, default=200, help="virtual users, each running one flow")
+    parser.add_argument('--concurrency', type=int, default=200, help="users active at the same time")
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix("booking=70,admin=20,finance=10"),
+                        help="weights of the synthetic flows")
+    parser.add_argument('--replay', help="JSON lines file with recorded updates to replay instead")
+    parser.add_argument('--dump', help="write the synthetic updates to this file and exit")
+    parser.add_argument('--think-ms', type=float, default=0, help="pause of a user between updates")
+    parser.add_argument('--sheets-latency-ms', type=float, default=0, help="simulated latency of a Sheets request")
+    parser.add_argument('--telegram-latency-ms', type=float, default=0, help="simulated latency of a Bot API request")
+    parser.add_argument('--clients', type=int, default=10000)
+    parser.add_argument('--appointments', type=int, default=100000)
+    parser.add_argument('--masters', type=int, default=50)
+    parser.add_argument('--verbose', action='store_true', help="show per-handler metrics")
+    args = parser.parse_args()
+
+    # Handlers log every update at INFO level, only problems are of interest here
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Offline check of the CSV price list import and export.
+
+Seeds a fake in-process spreadsheet with a small catalog and checks that
+an exported price list imports back without changes, that edited and new
+rows are applied, and that invalid files are rejected without writing:
+
+    python -m benchmarks.price_list_check
+
+Exits with a non-zero status if a check fails.
+"""
+import asyncio
+import sys
+
+from benchmarks.fake_sheets import FakeSpreadsheet
+from benchmarks.run import install
+from utils.db_api import google_sheets, service_commands
+
+CATEGORIES = [
+    {'id': 1, 'name': 'Маникюр'},
+    {'id': 2, 'name': 'Педикюр'},
+]
+
+SERVICES = [
+    {'id': 1, 'name': 'Классический маникюр', 'description': 'С обработкой кутикулы, "без покрытия"',
+     'price': 1200, 'duration': 40, 'category_id': 1},
+    {'id': 2, 'name': 'Аппаратный педикюр', 'description': 'Фреза; две зоны',
+     'price': 1850.5, 'duration': 60, 'category_id': 2},
+    {'id': 3, 'name': 'Снятие покрытия', 'description': '', 'price': 300, 'duration': 15, 'category_id': ''},
+]
+
+
+def catalog_spreadsheet():
+    """Get a fake spreadsheet with the sample catalog"""
+    spreadsheet = FakeSpreadsheet()
+    rows = {'Categories': CATEGORIES, 'Services': SERVICES}
+    for name, headers in google_sheets.SHEET_HEADERS.items():
+        spreadsheet.load(name, headers, rows.get(name, []))
+    return spreadsheet
+
+
+async def catalog():
+    """Get the services and categories as plain comparable rows"""
+    services = [dict(service) for service in await service_commands.get_all_services()]
+    categories = [dict(category) for category in await service_commands.get_all_categories()]
+    return services, categories
+
+
+async def check_round_trip():
+    """An exported price list imports back as updates that change nothing"""
+    before = await catalog()
+    text = await service_commands.export_price_list_csv()
+
+    success, message = await service_commands.import_price_list_csv(text)
+    assert success, message
+    assert message.startswith(f"Обновлено услуг: {len(SERVICES)}, добавлено: 0"), message
+    assert await catalog() == before, "round trip changed the catalog"
+    assert await service_commands.export_price_list_csv() == text, "export changed after the round trip"
+
+
+async def check_edits():
+    """Edited rows update services, rows without a known ID add them with new categories"""
+    text = await service_commands.export_price_list_csv()
+    lines = text.splitlines()
+    lines[1] = lines[1].replace('1200', '1300')
+    lines.append('99,Брови,Коррекция бровей,,700,20')
+    lines.append(',Маникюр,Дизайн ногтя,,150,')
+
+    success, message = await service_commands.import_price_list_csv("\n".join(lines) + "\n")
+    assert success, message
+
+    services, categories = await catalog()
+    by_name = {service['name']: service for service in services}
+    category_ids = {category['name']: str(category['id']) for category in categories}
+    assert by_name['Классический маникюр']['price'] == 1300, by_name['Классический маникюр']
+    assert 'Брови' in category_ids, categories
+    assert str(by_name['Коррекция бровей']['category_id']) == category_ids['Брови'], by_name['Коррекция бровей']
+    assert str(by_name['Дизайн ногтя']['category_id']) == category_ids['Маникюр'], by_name['Дизайн ногтя']
+    assert len(services) == len(SERVICES) + 2, services
+
+
+async def check_semicolons():
+    """Price lists saved by spreadsheet apps with ';' and decimal commas are read"""
+    text = 'id;category;name;description;price;duration\n2;Педикюр;Аппаратный педикюр;;1900,5;60\n'
+
+    success, message = await service_commands.import_price_list_csv(text)
+    assert success, message
+    assert (await service_commands.get_service(2))['price'] == 1900.5
+
+
+async def check_invalid():
+    """Invalid files are rejected and nothing is written"""
+    before = await catalog()
+    for text, error in [
+        ('id,name,duration\n1,Маникюр,40\n', "Нет обязательных колонок: price"),
+        ('name,price,duration\nМаникюр,дорого,40\n', "Строка 2: неверная цена или продолжительность"),
+        ('name,price\n,100\n', "Строка 2: не указано название"),
+        ('name,price\n', "Файл не содержит услуг"),
+    ]:
+        success, message = await service_commands.import_price_list_csv(text)
+        assert not success and message == error, (text, message)
+    assert await catalog() == before, "a rejected import changed the catalog"
+
+
+CHECKS = [check_round_trip, check_edits, check_semicolons, check_invalid]
+
+
+async def main():
+    failed = 0
+    for check in CHECKS:
+        install(catalog_spreadsheet())
+        await google_sheets.clear_cache()
+        try:
+            await check()
+        except AssertionError as e:
+            failed += 1
+            print(f"FAIL {check.__name__}: {e}")
+        else:
+            print(f"ok   {check.__name__}")
+    return failed
+
+
+if __name__ == '__main__':
+    sys.exit(1 if asyncio.run(main()) else 0)
@@ -0,0 +1,205 @@
+"""
+Offline benchmarks of the bot's data layer.
+
+Seeds a fake in-process spreadsheet and times the hot paths of the bot
+against it, reporting wall time and Sheets API requests per operation:
+
+    python -m benchmarks.run
+    python -m benchmarks.run --latency-ms 150 --read-quota 60 --scenario admin_day_view
+    python -m benchmarks.run --columnar Appointments
+
+Every scenario is run once with cold caches and then --repeat times warm.
+"""
+import argparse
+import asyncio
+import datetime
+import logging
+import statistics
+import time
+
+from benchmarks.fake_sheets import FakeSpreadsheet
+from benchmarks.seed import seed
+from utils import appointment_reminders, catalog_snapshot, day_agenda
+from utils.db_api import (
+    google_sheets, user_commands, appointment_commands, master_commands,
+    finance_commands, subscription_commands, tenant_commands, schedule, work_calendar,
+)
+
+
+def install(spreadsheet):
+    """Make the data layer use the fake spreadsheet"""
+    google_sheets.sheet = spreadsheet
+    user_commands.sheet = spreadsheet
+
+
+async def reset_caches():
+    """Drop every in-process cache so the next run starts cold"""
+    await google_sheets.clear_cache()
+    catalog_snapshot._snapshots.clear()
+    day_agenda.clear()
+    schedule.clear()
+    work_calendar.clear()
+    subscription_commands.clear_status_cache()
+
+
+async def resolve_user(user_id):
+    """The lookups RoleMiddleware does for every update"""
+    user = await user_commands.get_user(user_id)
+    if user and user['role'] == 'admin':
+        await subscription_commands.check_subscription_status(user_id)
+    await tenant_commands.get_user_tenant(user_id, user and user['role'])
+    return user
+
+
+# Scenarios
+
+async def booking_flow(ctx):
+    """/book -> category -> service -> master -> date -> time -> confirm"""
+    client_id = ctx['client_id']
+
+    await resolve_user(client_id)
+    catalog = await catalog_snapshot.get_catalog()
+    category = catalog.categories[0]
+
+    await resolve_user(client_id)
+    catalog = await catalog_snapshot.get_catalog()
+    service = catalog.get_services_by_category_id(category['id'])[0]
+    catalog.get_services_keyboard(category['id'])
+
+    await resolve_user(client_id)
+    masters = await master_commands.get_masters()
+    master_id = masters[0]['id']
+
+    await resolve_user(client_id)
+    date = ctx['tomorrow']
+    times = await master_commands.get_master_availability(master_id, date)
+
+    await resolve_user(client_id)
+    await catalog_snapshot.get_catalog()
+    await master_commands.get_master(master_id)
+
+    await resolve_user(client_id)
+    await appointment_commands.add_appointment(client_id, service['id'], date, times[0], master_id)
+
+
+async def admin_day_view(ctx):
+    """Admin panel: today's appointments"""
+    await resolve_user(ctx['admin_id'])
+    await day_agenda.get_day_agenda(ctx['today'])
+
+
+async def finance_reports(ctx):
+    """Finance section: income reports for the standard periods and the daily forecast"""
+    admin_id = ctx['admin_id']
+    today = datetime.date.fromisoformat(ctx['today'])
+    periods = [
+        today - datetime.timedelta(days=today.weekday()),
+        today.replace(day=1),
+        today - datetime.timedelta(days=30),
+    ]
+
+    for start_date in periods:
+        await resolve_user(admin_id)
+        await finance_commands.get_analytics_period(admin_id, start_date.strftime("%Y-%m-%d"), ctx['today'])
+
+    await resolve_user(admin_id)
+    await finance_commands.get_daily_forecast_message(admin_id)
+
+
+async def reminder_sweep(ctx):
+    """Scheduler: today's appointments that still need a status"""
+    await appointment_reminders.get_today_uncompleted_appointments()
+
+
+SCENARIOS = {
+    'booking_flow': booking_flow,
+    'admin_day_view': admin_day_view,
+    'finance_reports': finance_reports,
+    'reminder_sweep': reminder_sweep,
+}
+
+
+# Runner
+
+async def measure(spreadsheet, scenario, ctx):
+    """Run a scenario once and return (wall time in ms, request stats)"""
+    spreadsheet.reset_stats()
+    started = time.perf_counter()
+    await scenario(ctx)
+    elapsed = (time.perf_counter() - started) * 1000
+    return elapsed, spreadsheet.get_stats()
+
+
+async def run(args):
+    spreadsheet = FakeSpreadsheet(
+        latency=args.latency_ms / 1000,
+        read_quota=args.read_quota or None,
+        write_quota=args.write_quota or None,
+    )
+
+    started = time.perf_counter()
+    dataset = seed(spreadsheet, clients=args.clients, appointments=args.appointments, masters=args.masters)
+    print(
+        f"Seeded {args.clients} clients, {args.appointments} appointments, {args.masters} masters "
+        f"in {time.perf_counter() - started:.1f} s "
+        f"(latency {args.latency_ms:g} ms, read quota {args.read_quota or '-'}/min, "
+        f"write quota {args.write_quota or '-'}/min)\n"
+    )
+    install(spreadsheet)
+    google_sheets.columnar_sheets = set(args.columnar or ())
+
+    today = datetime.date.today()
+    ctx = {
+        'today': today.strftime("%Y-%m-%d"),
+        'tomorrow': (today + datetime.timedelta(days=1)).strftime("%Y-%m-%d"),
+        'admin_id': dataset['Clients'][0]['user_id'],
+        # A client near the end of the sheet, so user lookups scan most of it
+        'client_id': dataset['Clients'][-1]['user_id'],
+    }
+
+    print(f"{'scenario':<18} {'run':<5} {'wall ms':>10} {'reads':>7} {'writes':>7} {'429s':>6}")
+    for name in args.scenario or SCENARIOS:
+        scenario = SCENARIOS[name]
+
+        await reset_caches()
+        elapsed, stats = await measure(spreadsheet, scenario, ctx)
+        report(name, 'cold', [elapsed], stats, args.verbose)
+
+        if args.repeat:
+            results = [await measure(spreadsheet, scenario, ctx) for _ in range(args.repeat)]
+            report(name, 'warm', [elapsed for elapsed, _ in results], results[-1][1], args.verbose)
+
+
+def report(name, mode, timings, stats, verbose=False):
+    """Print one line of the report"""
+    print(
+        f"{name:<18} {mode:<5} {statistics.median(timings):>10.1f} "
+        f"{stats['reads']:>7} {stats['writes']:>7} {stats['quota_errors']:>6}"
+    )
+    if verbose:
+        for method, count in sorted(stats['methods'].items(), key=lambda item: -item[1]):
+            print(f"{'':<25}{method:<24} {count:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bot's data layer against a fake spreadsheet")
+    parser.add_argument('--clients', type=int, default=10000)
+    parser.add_argument('--appointments', type=int, default=100000)
+    parser.add_argument('--masters', type=int, default=50)
+    parser.add_argument('--latency-ms', type=float, default=0, help="simulated latency of one API request")
+    parser.add_argument('--read-quota', type=int, default=0, help="read requests per minute (0 disables)")
+    parser.add_argument('--write-quota', type=int, default=0, help="write requests per minute (0 disables)")
+    parser.add_argument('--repeat', type=int, default=3, help="warm runs per scenario")
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS))
+    parser.add_argument('--columnar', action='append', choices=sorted(google_sheets.COLUMN_STORES),
+                        help="cache this sheet as a column store")
+    parser.add_argument('--verbose', action='store_true', help="show requests per gspread method")
+    args = parser.parse_args()
+
+    # Errors of the data layer are still shown, routine info is not
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
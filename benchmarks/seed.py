@@ -0,0 +1,171 @@
+import datetime
+import random
+
+from utils.db_api.google_sheets import SHEET_HEADERS
+
+# Realistic data set for the benchmarks: a busy salon network with a year of
+# history and a month of bookings ahead.
+
+CATEGORY_NAMES = [
+    'Маникюр', 'Педикюр', 'Стрижки', 'Окрашивание',
+    'Брови и ресницы', 'Массаж', 'Уход за лицом', 'Макияж',
+]
+SERVICES_PER_CATEGORY = 8
+OFFERS_COUNT = 5
+ADMINS_COUNT = 3
+HISTORY_DAYS = 365
+FUTURE_DAYS = 30
+TIMES = [f"{hour:02d}:{minute:02d}" for hour in range(10, 19) for minute in (0, 30)]
+
+
+def build_dataset(clients=10000, appointments=100000, masters=50, today=None, seed=42):
+    """Generate rows for every worksheet, keyed by worksheet name"""
+    rnd = random.Random(seed)
+    today = today or datetime.date.today()
+
+    categories = [{'id': i, 'name': name} for i, name in enumerate(CATEGORY_NAMES, start=1)]
+
+    services = []
+    for category in categories:
+        for n in range(1, SERVICES_PER_CATEGORY + 1):
+            services.append({
+                'id': len(services) + 1,
+                'name': f"{category['name']} {n}",
+                'description': f"Услуга {n} категории {category['name']}",
+                'price': rnd.randrange(800, 6000, 100),
+                'duration': rnd.choice([30, 60, 90, 120]),
+                'category_id': category['id'],
+            })
+
+    offers = [
+        {
+            'id': 1000 + i,
+            'name': f"Акция {i}",
+            'description': f"Специальное предложение {i}",
+            'price': rnd.randrange(1000, 5000, 100),
+            'duration_days': rnd.choice([7, 14, 30]),
+        }
+        for i in range(1, OFFERS_COUNT + 1)
+    ]
+
+    master_rows = [
+        {
+            'id': i,
+            'telegram_id': 500000000 + i,
+            'name': f"Мастер {i}",
+            'telegram': f"@master{i}",
+            'phone': f"+7900{i:07d}",
+            'specialties': rnd.choice(CATEGORY_NAMES),
+            'location': f"Филиал {i % 5 + 1}",
+            'description': '',
+        }
+        for i in range(1, masters + 1)
+    ]
+
+    client_rows = [
+        {
+            'user_id': 100000000 + i,
+            'username': f"client{i}",
+            'full_name': f"Клиент {i}",
+            'role': 'admin' if i <= ADMINS_COUNT else 'client',
+            'master_id': '',
+        }
+        for i in range(1, clients + 1)
+    ]
+    client_ids = [row['user_id'] for row in client_rows]
+    admin_ids = client_ids[:ADMINS_COUNT]
+
+    verified_users = [{'user_id': user_id} for user_id in client_ids if rnd.random() < 0.6]
+
+    appointment_rows = []
+    for i in range(1, appointments + 1):
+        day = today + datetime.timedelta(days=rnd.randint(-HISTORY_DAYS, FUTURE_DAYS))
+        if day < today:
+            status = rnd.choices(['completed', 'paid', 'canceled'], weights=[2, 7, 1])[0]
+        else:
+            status = rnd.choices(['confirmed', 'pending'], weights=[4, 1])[0]
+        appointment_rows.append({
+            'id': i,
+            'user_id': rnd.choice(client_ids),
+            'service_id': rnd.choice(services)['id'],
+            'date': day.strftime("%Y-%m-%d"),
+            'time': rnd.choice(TIMES),
+            'status': status,
+            'master_id': rnd.randint(1, masters),
+            'payment_method': rnd.choice(['Наличные', 'Карта']) if status == 'paid' else '',
+        })
+
+    client_stats = [
+        {
+            'client_id': user_id,
+            'total_visits': visits,
+            'total_spent': visits * rnd.randrange(1000, 4000, 100),
+            'last_visit': (today - datetime.timedelta(days=rnd.randint(0, HISTORY_DAYS))).strftime("%Y-%m-%d"),
+            'favorite_service': rnd.choice(services)['id'],
+            'vip_status': 'Yes' if visits >= 20 else 'No',
+            'notes': '',
+        }
+        for user_id in client_ids
+        for visits in [rnd.randint(0, 25)]
+    ]
+
+    finance_analytics = []
+    for admin_id in admin_ids:
+        for days_ago in range(HISTORY_DAYS, 0, -1):
+            income = rnd.randrange(20000, 90000, 500)
+            expenses = rnd.randrange(5000, 30000, 500)
+            finance_analytics.append({
+                'admin_id': admin_id,
+                'date': (today - datetime.timedelta(days=days_ago)).strftime("%Y-%m-%d"),
+                'total_income': income,
+                'total_expenses': expenses,
+                'profit': income - expenses,
+                'appointments_count': rnd.randint(10, 60),
+            })
+
+    service_costs = [
+        {
+            'service_id': service['id'],
+            'materials_cost': rnd.randrange(100, 800, 50),
+            'time_cost': rnd.randrange(200, 1000, 50),
+            'other_costs': rnd.randrange(0, 300, 50),
+            'last_updated': today.strftime("%Y-%m-%d"),
+        }
+        for service in services
+    ]
+
+    subscriptions = [
+        {
+            'user_id': admin_id,
+            'start_date': (today - datetime.timedelta(days=10)).strftime("%Y-%m-%d"),
+            'end_date': (today + datetime.timedelta(days=20)).strftime("%Y-%m-%d"),
+            'trial': False,
+            'referrer_id': '',
+        }
+        for admin_id in admin_ids
+    ]
+
+    return {
+        'Categories': categories,
+        'Services': services,
+        'Offers': offers,
+        'Masters': master_rows,
+        'Clients': client_rows,
+        'VerifiedUsers': verified_users,
+        'Appointments': appointment_rows,
+        'ClientStats': client_stats,
+        'FinanceAnalytics': finance_analytics,
+        'ServiceCosts': service_costs,
+        'Subscriptions': subscriptions,
+        'History': [],
+        'ServiceTemplates': [],
+        'Payments': [],
+    }
+
+
+def seed(spreadsheet, **kwargs):
+    """Fill a fake spreadsheet with the benchmark data set and return it"""
+    dataset = build_dataset(**kwargs)
+    for name, headers in SHEET_HEADERS.items():
+        spreadsheet.load(name, headers, dataset.get(name, []))
+    return dataset
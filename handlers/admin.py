@@ -1,7 +1,7 @@
 
 from aiogram import Router, F, Dispatcher
-from aiogram.types import Message, CallbackQuery
-from aiogram.filters import Command
+from aiogram.types import Message, CallbackQuery, BufferedInputFile
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 import datetime
@@ -17,9 +17,17 @@ from keyboards.admin_keyboards import get_all_offers_keyboard, get_offer_actions
 from keyboards.admin_keyboards import get_service_actions_keyboard, get_edit_service_keyboard, get_category_services_price_keyboard
 from keyboards.admin_keyboards import get_master_actions_keyboard, get_edit_master_keyboard
 from keyboards.admin_keyboards import get_confirm_delete_keyboard, get_admin_appointments_keyboard, get_appointment_actions_keyboard
-from keyboards.admin_keyboards import get_date_appointments_admin_keyboard, get_cancel_appointment_keyboard
+from keyboards.admin_keyboards import get_cancel_appointment_keyboard
+from keyboards.admin_keyboards import get_all_appointments_keyboard, get_masters_list_keyboard
 
-from utils.db_api import service_commands, user_commands, master_commands, appointment_commands
+from keyboards.callback_data import TemplateCategoryCallback, AdminServiceCallback, AdminCategoryCallback, AdminOfferCallback
+from keyboards.callback_data import AdminMasterCallback, get_template_category_key
+from keyboards.callback_data import AppointmentCallback, AppointmentDateCallback, PaymentMethodCallback, PageCallback
+from keyboards.pagination import PAGE_SIZE, paginate
+
+from utils.db_api import service_commands, user_commands, master_commands, appointment_commands, google_sheets, work_calendar, timezones
+from utils import catalog_snapshot, day_agenda
+from utils.callback_routes import CallbackRoutes
 
 # Define FSM states
 class AdminServiceStates(StatesGroup):
@@ -34,6 +42,9 @@ class AdminServiceStates(StatesGroup):
     editing_price = State()
     editing_duration = State()
     editing_category = State()
+    editing_category_price = State()
+    
+    importing_price_list = State()
 
 class AdminCategoryStates(StatesGroup):
     adding_name = State()
@@ -67,6 +78,8 @@ class AdminAppointmentStates(StatesGroup):
 # Function to register admin handlers
 def register_handlers(dp: Dispatcher):
     """Register admin handlers"""
+    # Parametrized admin callbacks are resolved through a single routing table
+    admin_callbacks = CallbackRoutes("admin")
     
     @dp.message(Command("admin"))
     async def admin_command(message: Message):
@@ -114,11 +127,15 @@ def register_handlers(dp: Dispatcher):
         )
         await callback.answer()
     
-    @dp.callback_query(F.data.startswith("template_category_"))
-    async def template_category_selected(callback: CallbackQuery):
+    @admin_callbacks.route(TemplateCategoryCallback)
+    async def template_category_selected(callback: CallbackQuery, callback_data: TemplateCategoryCallback):
         """Handle template category selection"""
-        # Extract category name
-        category = callback.data.replace("template_category_", "")
+        # Resolve category name by its key
+        categories = await service_commands.get_all_template_categories()
+        category = next((name for name in categories if get_template_category_key(name) == callback_data.key), None)
+        if category is None:
+            await callback.answer("Категория не найдена", show_alert=True)
+            return
         
         # Create services from templates
         result = await service_commands.create_services_from_template(category)
@@ -255,9 +272,8 @@ def register_handlers(dp: Dispatcher):
         # Reset the state
         await state.clear()
     
-    @dp.callback_query(F.data == "view_services")
-    async def view_services(callback: CallbackQuery):
-        """Show all services by category"""
+    async def show_service_categories(callback: CallbackQuery, offset=0):
+        """Show one page of service categories"""
         services_by_category = await service_commands.get_services_by_category()
         
         if not services_by_category:
@@ -267,36 +283,60 @@ def register_handlers(dp: Dispatcher):
             )
             return
         
+        page, has_more = paginate(list(services_by_category.items()), offset)
+        
         await callback.message.edit_text(
             "Выберите категорию услуг:",
-            reply_markup=get_service_categories_keyboard(services_by_category)
+            reply_markup=get_service_categories_keyboard(dict(page), offset, has_more)
         )
         await callback.answer()
     
-    @dp.callback_query(F.data.startswith("view_category_services_"))
-    async def view_category_services(callback: CallbackQuery):
-        """Show services in a specific category"""
-        category_name = callback.data.replace("view_category_services_", "")
-        services = await service_commands.get_services_by_category_name(category_name)
+    @dp.callback_query(F.data == "view_services")
+    async def view_services(callback: CallbackQuery):
+        """Show all services by category"""
+        await show_service_categories(callback)
+    
+    @admin_callbacks.route(PageCallback, action="services")
+    async def view_services_page(callback: CallbackQuery, callback_data: PageCallback):
+        """Show another page of service categories"""
+        await show_service_categories(callback, callback_data.offset)
+    
+    async def show_category_services(callback: CallbackQuery, category_id, offset=0):
+        """Show one page of services in a specific category"""
+        catalog = await catalog_snapshot.get_catalog()
+        category = catalog.get_category(category_id) if category_id else None
+        category_name = category.get('name') if category else catalog_snapshot.UNCATEGORIZED_NAME
+        services = catalog.grouped_services.get(category_name, ())
         
         if not services:
             await callback.message.edit_text(
                 f"В категории '{category_name}' нет услуг.",
-                reply_markup=get_service_categories_keyboard(await service_commands.get_services_by_category())
+                reply_markup=get_services_management_keyboard()
             )
             return
         
-        # Create a paginated keyboard for services
+        page, has_more = paginate(services, offset)
+        
         await callback.message.edit_text(
             f"Услуги в категории '{category_name}':",
-            reply_markup=get_category_services_keyboard(services, category_name)
+            reply_markup=get_category_services_keyboard(page, category_id, offset, has_more)
         )
         await callback.answer()
     
-    @dp.callback_query(F.data.startswith("admin_view_service_"))
-    async def admin_view_service(callback: CallbackQuery):
+    @admin_callbacks.route(AdminCategoryCallback, action="services")
+    async def view_category_services(callback: CallbackQuery, callback_data: AdminCategoryCallback):
+        """Show services in a specific category"""
+        await show_category_services(callback, callback_data.id)
+    
+    @admin_callbacks.route(PageCallback, action="category_services")
+    async def view_category_services_page(callback: CallbackQuery, callback_data: PageCallback):
+        """Show another page of services in a category"""
+        await show_category_services(callback, callback_data.key, callback_data.offset)
+    
+    @admin_callbacks.route(AdminServiceCallback, action="view")
+    async def admin_view_service(callback: CallbackQuery, callback_data: AdminServiceCallback):
         """Show service details"""
-        service_id = callback.data.replace("admin_view_service_", "")
+        service_id = callback_data.id
         service = await service_commands.get_service(service_id)
         
         if not service:
@@ -328,10 +368,10 @@ def register_handlers(dp: Dispatcher):
         )
         await callback.answer()
     
-    @dp.callback_query(F.data.startswith("edit_service_"))
-    async def edit_service(callback: CallbackQuery):
+    @admin_callbacks.route(AdminServiceCallback, action="edit")
+    async def edit_service(callback: CallbackQuery, callback_data: AdminServiceCallback):
         """Show service edit options"""
-        service_id = callback.data.replace("edit_service_", "")
+        service_id = callback_data.id
         service = await service_commands.get_service(service_id)
         
         if not service:
@@ -347,10 +387,10 @@ def register_handlers(dp: Dispatcher):
         )
         await callback.answer()
     
-    @dp.callback_query(F.data.startswith("edit_service_name_"))
-    async def edit_service_name_start(callback: CallbackQuery, state: FSMContext):
+    @admin_callbacks.route(AdminServiceCallback, action="name")
+    async def edit_service_name_start(callback: CallbackQuery, callback_data: AdminServiceCallback, state: FSMContext):
         """Start editing service name"""
-        service_id = callback.data.replace("edit_service_name_", "")
+        service_id = callback_data.id
         await state.update_data(service_id=service_id)
         
         await callback.message.edit_text("Введите новое название услуги:")
@@ -381,10 +421,10 @@ def register_handlers(dp: Dispatcher):
         # Reset the state
         await state.clear()
     
-    @dp.callback_query(F.data.startswith("edit_service_description_"))
-    async def edit_service_description_start(callback: CallbackQuery, state: FSMContext):
+    @admin_callbacks.route(AdminServiceCallback, action="description")
+    async def edit_service_description_start(callback: CallbackQuery, callback_data: AdminServiceCallback, state: FSMContext):
         """Start editing service description"""
-        service_id = callback.data.replace("edit_service_description_", "")
+        service_id = callback_data.id
         await state.update_data(service_id=service_id)
         
         await callback.message.edit_text("Введите новое описание услуги:")
@@ -414,10 +454,10 @@ def register_handlers(dp: Dispatcher):
         # Reset the state
         await state.clear()
     
-    @dp.callback_query(F.data.startswith("edit_service_price_"))
-    async def edit_service_price_start(callback: CallbackQuery, state: FSMContext):
+    @admin_callbacks.route(AdminServiceCallback, action="price")
+    async def edit_service_price_start(callback: CallbackQuery, callback_data: AdminServiceCallback, state: FSMContext):
         """Start editing service price"""
-        service_id = callback.data.replace("edit_service_price_", "")
+        service_id = callback_data.id
         await state.update_data(service_id=service_id)
         
         await callback.message.edit_text("Введите новую цену услуги (только цифры):")
@@ -455,10 +495,10 @@ def register_handlers(dp: Dispatcher):
         # Reset the state
         await state.clear()
     
-    @dp.callback_query(F.data.startswith("edit_service_duration_"))
-    async def edit_service_duration_start(callback: CallbackQuery, state: FSMContext):
+    @admin_callbacks.route(AdminServiceCallback, action="duration")
+    async def edit_service_duration_start(callback: CallbackQuery, callback_data: AdminServiceCallback, state: FSMContext):
         """Start editing service duration"""
-        service_id = callback.data.replace("edit_service_duration_", "")
+        service_id = callback_data.id
         await state.update_data(service_id=service_id)
         
         await callback.message.edit_text("Введите новую продолжительность услуги в минутах (только цифры):")
@@ -496,10 +536,10 @@ def register_handlers(dp: Dispatcher):
         # Reset the state
         await state.clear()
     
-    @dp.callback_query(F.data.startswith("edit_service_category_"))
-    async def edit_service_category_start(callback: CallbackQuery, state: FSMContext):
+    @admin_callbacks.route(AdminServiceCallback, action="category")
+    async def edit_service_category_start(callback: CallbackQuery, callback_data: AdminServiceCallback, state: FSMContext):
         """Start editing service category"""
-        service_id = callback.data.replace("edit_service_category_", "")
+        service_id = callback_data.id
         await state.update_data(service_id=service_id)
         
         # Get all categories
@@ -575,10 +615,10 @@ def register_handlers(dp: Dispatcher):
         # Reset the state
         await state.clear()
     
-    @dp.callback_query(F.data.startswith("delete_service_confirm_"))
-    async def delete_service_confirm(callback: CallbackQuery):
+    @admin_callbacks.route(AdminServiceCallback, action="delete")
+    async def delete_service_confirm(callback: CallbackQuery, callback_data: AdminServiceCallback):
         """Confirm service deletion"""
-        service_id = callback.data.replace("delete_service_confirm_", "")
+        service_id = callback_data.id
         service = await service_commands.get_service(service_id)
         
         if not service:
@@ -594,10 +634,10 @@ def register_handlers(dp: Dispatcher):
         )
         await callback.answer()
     
-    @dp.callback_query(F.data.startswith("confirm_delete_service_"))
-    async def delete_service(callback: CallbackQuery):
+    @admin_callbacks.route(AdminServiceCallback, action="delete_ok")
+    async def delete_service(callback: CallbackQuery, callback_data: AdminServiceCallback):
         """Delete service"""
-        service_id = callback.data.replace("confirm_delete_service_", "")
+        service_id = callback_data.id
         
         # Delete the service
         success = await service_commands.delete_service(service_id)
@@ -615,10 +655,10 @@ def register_handlers(dp: Dispatcher):
         
         await callback.answer()
     
-    @dp.callback_query(F.data.startswith("update_category_price_"))
-    async def update_category_price_start(callback: CallbackQuery, state: FSMContext):
+    @admin_callbacks.route(AdminCategoryCallback, action="price")
+    async def update_category_price_start(callback: CallbackQuery, callback_data: AdminCategoryCallback, state: FSMContext):
         """Start updating prices for all services in a category"""
-        category_id = callback.data.replace("update_category_price_", "")
+        category_id = callback_data.id
         category = await service_commands.get_category(category_id)
         
         if not category:
@@ -629,12 +669,100 @@ def register_handlers(dp: Dispatcher):
             return
         
         await callback.message.edit_text(
-            f"Введите цену для всех услуг в категории '{category.get('name')}' (только цифры):"
+            f"Введите цену для всех услуг в категории '{category.get('name')}' (только цифры)\n"
+            f"или изменение цены в процентах (например, +10% или -5%):"
         )
         await state.update_data(category_id=category_id)
-        await state.set_state(AdminServiceStates.editing_price)
+        await state.set_state(AdminServiceStates.editing_category_price)
+        await callback.answer()
+    
+    @dp.message(AdminServiceStates.editing_category_price)
+    async def update_category_price(message: Message, state: FSMContext):
+        """Handle price input for all services in a category"""
+        data = await state.get_data()
+        category_id = data.get('category_id')
+        text = message.text.strip().replace(',', '.')
+        
+        try:
+            if text.endswith('%'):
+                percent = float(text[:-1])
+                updated_count = await service_commands.bulk_update_prices(category_id, percent=percent)
+            else:
+                price = float(text)
+                updated_count = await service_commands.bulk_update_prices(category_id, price=price)
+        except ValueError:
+            await message.answer(
+                "Пожалуйста, введите корректную цену (только цифры) или процент (например, +10%)."
+            )
+            return
+        
+        if updated_count is False:
+            await message.answer(
+                "Ошибка при изменении цен услуг.",
+                reply_markup=get_category_services_price_keyboard(category_id)
+            )
+        else:
+            await message.answer(
+                f"Цены обновлены для {updated_count} услуг.",
+                reply_markup=get_category_services_price_keyboard(category_id)
+            )
+        
+        # Reset the state
+        await state.clear()
+    
+    @dp.callback_query(F.data == "export_price_list")
+    async def export_price_list(callback: CallbackQuery):
+        """Send the price list as a CSV file"""
+        csv_text = await service_commands.export_price_list_csv()
+        
+        # utf-8-sig so that Excel detects the encoding of Cyrillic names
+        document = BufferedInputFile(csv_text.encode('utf-8-sig'), filename="price_list.csv")
+        await callback.message.answer_document(
+            document,
+            caption="Прайс-лист. Измените файл и загрузите его через 'Импорт прайс-листа'."
+        )
+        await callback.answer()
+    
+    @dp.callback_query(F.data == "import_price_list")
+    async def import_price_list_start(callback: CallbackQuery, state: FSMContext):
+        """Ask for a CSV price list to import"""
+        await callback.message.edit_text(
+            "Отправьте CSV-файл с колонками: id, category, name, description, price, duration.\n\n"
+            "Строки с существующим id обновят услуги, строки без id добавят новые услуги."
+        )
+        await state.set_state(AdminServiceStates.importing_price_list)
         await callback.answer()
     
+    @dp.message(AdminServiceStates.importing_price_list)
+    async def import_price_list(message: Message, state: FSMContext):
+        """Handle uploaded CSV price list"""
+        if not message.document:
+            await message.answer("Пожалуйста, отправьте CSV-файл.")
+            return
+        
+        file = await message.bot.download(message.document)
+        try:
+            csv_text = file.read().decode('utf-8-sig')
+        except UnicodeDecodeError:
+            await message.answer("Не удалось прочитать файл. Сохраните его в кодировке UTF-8.")
+            return
+        
+        success, result_message = await service_commands.import_price_list_csv(csv_text)
+        
+        if success:
+            await message.answer(
+                f"Прайс-лист импортирован. {result_message}",
+                reply_markup=get_services_management_keyboard()
+            )
+        else:
+            await message.answer(
+                f"Ошибка импорта, изменения не сохранены:\n{result_message}",
+                reply_markup=get_services_management_keyboard()
+            )
+        
+        # Reset the state
+        await state.clear()
+    
     # Category management handlers
     @dp.callback_query(F.data == "admin_categories")
     async def admin_categories(callback: CallbackQuery):
@@ -690,10 +818,10 @@ def register_handlers(dp: Dispatcher):
         )
         await callback.answer()
     
-    @dp.callback_query(F.data.startswith("admin_view_category_"))
-    async def admin_view_category(callback: CallbackQuery):
+    @admin_callbacks.route(AdminCategoryCallback, action="view")
+    async def admin_view_category(callback: CallbackQuery, callback_data: AdminCategoryCallback):
         """Show category details"""
-        category_id = callback.data.replace("admin_view_category_", "")
+        category_id = callback_data.id
         category = await service_commands.get_category(category_id)
         
         if not category:
@@ -720,10 +848,10 @@ def register_handlers(dp: Dispatcher):
         )
         await callback.answer()
     
-    @dp.callback_query(F.data.startswith("edit_category_"))
-    async def edit_category(callback: CallbackQuery):
+    @admin_callbacks.route(AdminCategoryCallback, action="edit")
+    async def edit_category(callback: CallbackQuery, callback_data: AdminCategoryCallback):
         """Show category edit options"""
-        category_id = callback.data.replace("edit_category_", "")
+        category_id = callback_data.id
         category = await service_commands.get_category(category_id)
         
         if not category:
@@ -739,10 +867,10 @@ def register_handlers(dp: Dispatcher):
         )
         await callback.answer()
     
-    @dp.callback_query(F.data.startswith("edit_category_name_"))
-    async def edit_category_name_start(callback: CallbackQuery, state: FSMContext):
+    @admin_callbacks.route(AdminCategoryCallback, action="rename")
+    async def edit_category_name_start(callback: CallbackQuery, callback_data: AdminCategoryCallback, state: FSMContext):
         """Start editing category name"""
-        category_id = callback.data.replace("edit_category_name_", "")
+        category_id = callback_data.id
         await state.update_data(category_id=category_id)
         
         await callback.message.edit_text("Введите новое название категории:")
@@ -772,10 +900,10 @@ def register_handlers(dp: Dispatcher):
         # Reset the state
         await state.clear()
     
-    @dp.callback_query(F.data.startswith("delete_category_confirm_"))
-    async def delete_category_confirm(callback: CallbackQuery):
+    @admin_callbacks.route(AdminCategoryCallback, action="delete")
+    async def delete_category_confirm(callback: CallbackQuery, callback_data: AdminCategoryCallback):
         """Confirm category deletion"""
-        category_id = callback.data.replace("delete_category_confirm_", "")
+        category_id = callback_data.id
         category = await service_commands.get_category(category_id)
         
         if not category:
@@ -792,10 +920,10 @@ def register_handlers(dp: Dispatcher):
         )
         await callback.answer()
     
-    @dp.callback_query(F.data.startswith("confirm_delete_category_"))
-    async def delete_category(callback: CallbackQuery):
+    @admin_callbacks.route(AdminCategoryCallback, action="delete_ok")
+    async def delete_category(callback: CallbackQuery, callback_data: AdminCategoryCallback):
         """Delete category"""
-        category_id = callback.data.replace("confirm_delete_category_", "")
+        category_id = callback_data.id
         
         # Delete the category
         success = await service_commands.delete_category(category_id)
@@ -813,10 +941,10 @@ def register_handlers(dp: Dispatcher):
         
         await callback.answer()
     
-    @dp.callback_query(F.data.startswith("view_category_"))
-    async def view_category(callback: CallbackQuery):
+    @admin_callbacks.route(AdminCategoryCallback, action="list")
+    async def view_category(callback: CallbackQuery, callback_data: AdminCategoryCallback):
         """Show services in a category from edit menu"""
-        category_id = callback.data.replace("view_category_", "")
+        category_id = callback_data.id
         category = await service_commands.get_category(category_id)
         
         if not category:
@@ -836,9 +964,11 @@ def register_handlers(dp: Dispatcher):
             )
             return
         
+        page, has_more = paginate(services, 0)
+        
         await callback.message.edit_text(
             f"Услуги в категории '{category.get('name')}':",
-            reply_markup=get_category_services_keyboard(services, category.get('name'))
+            reply_markup=get_category_services_keyboard(page, category_id, 0, has_more)
         )
         await callback.answer()
     
@@ -941,10 +1071,10 @@ def register_handlers(dp: Dispatcher):
         )
         await callback.answer()
     
-    @dp.callback_query(F.data.startswith("admin_view_offer_"))
-    async def admin_view_offer(callback: CallbackQuery):
+    @admin_callbacks.route(AdminOfferCallback, action="view")
+    async def admin_view_offer(callback: CallbackQuery, callback_data: AdminOfferCallback):
         """Show offer details"""
-        offer_id = callback.data.replace("admin_view_offer_", "")
+        offer_id = callback_data.id
         offer = await service_commands.get_offer(offer_id)
         
         if not offer:
@@ -968,10 +1098,10 @@ def register_handlers(dp: Dispatcher):
         )
         await callback.answer()
     
-    @dp.callback_query(F.data.startswith("edit_offer_"))
-    async def edit_offer(callback: CallbackQuery):
+    @admin_callbacks.route(AdminOfferCallback, action="edit")
+    async def edit_offer(callback: CallbackQuery, callback_data: AdminOfferCallback):
         """Show offer edit options"""
-        offer_id = callback.data.replace("edit_offer_", "")
+        offer_id = callback_data.id
         offer = await service_commands.get_offer(offer_id)
         
         if not offer:
@@ -987,10 +1117,10 @@ def register_handlers(dp: Dispatcher):
         )
         await callback.answer()
     
-    @dp.callback_query(F.data.startswith("edit_offer_name_"))
-    async def edit_offer_name_start(callback: CallbackQuery, state: FSMContext):
+    @admin_callbacks.route(AdminOfferCallback, action="name")
+    async def edit_offer_name_start(callback: CallbackQuery, callback_data: AdminOfferCallback, state: FSMContext):
         """Start editing offer name"""
-        offer_id = callback.data.replace("edit_offer_name_", "")
+        offer_id = callback_data.id
         await state.update_data(offer_id=offer_id)
         
         await callback.message.edit_text("Введите новое название специального предложения:")
@@ -1020,10 +1150,118 @@ def register_handlers(dp: Dispatcher):
         # Reset the state
         await state.clear()
     
-    @dp.callback_query(F.data.startswith("delete_offer_confirm_"))
-    async def delete_offer_confirm(callback: CallbackQuery):
+    @admin_callbacks.route(AdminOfferCallback, action="description")
+    async def edit_offer_description_start(callback: CallbackQuery, callback_data: AdminOfferCallback, state: FSMContext):
+        """Start editing offer description"""
+        await state.update_data(offer_id=callback_data.id)
+        
+        await callback.message.edit_text("Введите новое описание специального предложения:")
+        await state.set_state(AdminOfferStates.editing_description)
+        await callback.answer()
+    
+    @dp.message(AdminOfferStates.editing_description)
+    async def edit_offer_description(message: Message, state: FSMContext):
+        """Handle offer description edit"""
+        data = await state.get_data()
+        offer_id = data.get('offer_id')
+        
+        # Update offer description
+        success = await service_commands.update_offer(offer_id, description=message.text)
+        
+        if success:
+            await message.answer(
+                "Описание специального предложения успешно изменено.",
+                reply_markup=get_offer_actions_keyboard(offer_id)
+            )
+        else:
+            await message.answer(
+                "Ошибка при изменении описания специального предложения.",
+                reply_markup=get_offers_management_keyboard()
+            )
+        
+        # Reset the state
+        await state.clear()
+    
+    @admin_callbacks.route(AdminOfferCallback, action="price")
+    async def edit_offer_price_start(callback: CallbackQuery, callback_data: AdminOfferCallback, state: FSMContext):
+        """Start editing offer price"""
+        await state.update_data(offer_id=callback_data.id)
+        
+        await callback.message.edit_text("Введите новую цену специального предложения (только цифры):")
+        await state.set_state(AdminOfferStates.editing_price)
+        await callback.answer()
+    
+    @dp.message(AdminOfferStates.editing_price)
+    async def edit_offer_price(message: Message, state: FSMContext):
+        """Handle offer price edit"""
+        data = await state.get_data()
+        offer_id = data.get('offer_id')
+        
+        try:
+            price = float(message.text)
+        except ValueError:
+            await message.answer("Пожалуйста, введите корректную цену (только цифры).")
+            return
+        
+        # Update offer price
+        success = await service_commands.update_offer(offer_id, price=price)
+        
+        if success:
+            await message.answer(
+                f"Цена специального предложения успешно изменена на {price} руб.",
+                reply_markup=get_offer_actions_keyboard(offer_id)
+            )
+        else:
+            await message.answer(
+                "Ошибка при изменении цены специального предложения.",
+                reply_markup=get_offers_management_keyboard()
+            )
+        
+        # Reset the state
+        await state.clear()
+    
+    @admin_callbacks.route(AdminOfferCallback, action="duration")
+    async def edit_offer_duration_start(callback: CallbackQuery, callback_data: AdminOfferCallback, state: FSMContext):
+        """Start editing offer duration"""
+        await state.update_data(offer_id=callback_data.id)
+        
+        await callback.message.edit_text("Введите новую продолжительность специального предложения в минутах (только цифры):")
+        await state.set_state(AdminOfferStates.editing_duration)
+        await callback.answer()
+    
+    @dp.message(AdminOfferStates.editing_duration)
+    async def edit_offer_duration(message: Message, state: FSMContext):
+        """Handle offer duration edit"""
+        data = await state.get_data()
+        offer_id = data.get('offer_id')
+        
+        try:
+            duration = int(message.text)
+        except ValueError:
+            await message.answer("Пожалуйста, введите корректную продолжительность (только цифры).")
+            return
+        
+        # Update offer duration
+        success = await service_commands.update_offer(offer_id, duration=duration)
+        
+        if success:
+            await message.answer(
+                f"Продолжительность специального предложения успешно изменена на {duration} мин.",
+                reply_markup=get_offer_actions_keyboard(offer_id)
+            )
+        else:
+            await message.answer(
+                "Ошибка при изменении продолжительности специального предложения.",
+                reply_markup=get_offers_management_keyboard()
+            )
+        
+        # Reset the state
+        await state.clear()
+    
+    @admin_callbacks.route(AdminOfferCallback, action="delete")
+    async def delete_offer_confirm(callback: CallbackQuery, callback_data: AdminOfferCallback):
         """Confirm offer deletion"""
-        offer_id = callback.data.replace("delete_offer_confirm_", "")
+        offer_id = callback_data.id
         offer = await service_commands.get_offer(offer_id)
         
         if not offer:
@@ -1039,10 +1277,10 @@ def register_handlers(dp: Dispatcher):
         )
         await callback.answer()
     
-    @dp.callback_query(F.data.startswith("confirm_delete_offer_"))
-    async def delete_offer(callback: CallbackQuery):
+    @admin_callbacks.route(AdminOfferCallback, action="delete_ok")
+    async def delete_offer(callback: CallbackQuery, callback_data: AdminOfferCallback):
         """Delete offer"""
-        offer_id = callback.data.replace("confirm_delete_offer_", "")
+        offer_id = callback_data.id
         
         # Delete the offer
         success = await service_commands.delete_offer(offer_id)
@@ -1073,10 +1311,10 @@ def register_handlers(dp: Dispatcher):
     @dp.callback_query(F.data == "admin_appointments_today")
     async def admin_appointments_today(callback: CallbackQuery):
         """Show today's appointments"""
-        today = datetime.datetime.now().strftime("%Y-%m-%d")
-        appointments = await appointment_commands.get_appointments_by_date(today)
+        today = timezones.today().isoformat()
+        agenda = await day_agenda.get_day_agenda(today)
         
-        if not appointments:
+        if not agenda:
             await callback.message.edit_text(
                 "На сегодня нет записей.",
                 reply_markup=get_appointments_management_keyboard()
@@ -1084,15 +1322,14 @@ def register_handlers(dp: Dispatcher):
             return
         
         await callback.message.edit_text(
-            f"Записи на сегодня ({today}):",
-            reply_markup=get_date_appointments_admin_keyboard(appointments, today)
+            f"Записи на сегодня ({today}): {agenda.format_status_counts()}",
+            reply_markup=agenda.keyboard
         )
         await callback.answer()
     
-    @dp.callback_query(F.data == "admin_appointments_all")
-    async def admin_appointments_all(callback: CallbackQuery, state: FSMContext):
-        """Show all appointments"""
-        appointments = await appointment_commands.get_all_appointments()
+    async def show_appointments_page(callback: CallbackQuery, offset=0):
+        """Show one page of all appointments"""
+        appointments, has_more = await google_sheets.get_sheet_page('Appointments', offset, PAGE_SIZE)
         
         if not appointments:
             await callback.message.edit_text(
@@ -1101,46 +1338,46 @@ def register_handlers(dp: Dispatcher):
             )
             return
         
-        # Group appointments by date for better display
+        catalog = await catalog_snapshot.get_catalog()
+        
+        # Group appointments of the page by date for better display
         grouped_appointments = {}
         for appointment in appointments:
-            date = appointment.get('date')
-            if date not in grouped_appointments:
-                grouped_appointments[date] = []
-            
-            # Get client details
-            user = await user_commands.get_user(appointment.get('user_id'))
-            if user:
-                appointment['client_name'] = user.get('full_name') or user.get('username') or f"ID: {user.get('user_id')}"
-            
-            grouped_appointments[date].append(appointment)
+            grouped_appointments.setdefault(appointment.get('date'), []).append(appointment)
         
-        # Sort dates
-        sorted_dates = sorted(grouped_appointments.keys())
-        
-        # Create a list of appointments grouped by date
-        message_text = "Все записи:\n\n"
-        for date in sorted_dates:
+        page_number = offset // PAGE_SIZE + 1
+        message_text = f"Все записи (стр. {page_number}):\n\n"
+        for date in sorted(grouped_appointments.keys(), key=str):
             message_text += f"📅 {date}:\n"
             for appointment in grouped_appointments[date]:
-                service = await service_commands.get_service(appointment.get('service_id'))
+                # Client and service details are only looked up for the records on this page
+                user = await user_commands.get_user(appointment.get('user_id'))
+                client_name = (user.get('full_name') or user.get('username') or f"ID: {user.get('user_id')}") if user else f"ID: {appointment.get('user_id')}"
+                
+                service = catalog.get_service(appointment.get('service_id'))
                 service_name = service.get('name') if service else "Неизвестная услуга"
                 
                 status_emoji = "✅" if appointment.get('status') == 'completed' else "🔄" if appointment.get('status') == 'confirmed' else "⏳" if appointment.get('status') == 'pending' else "❌"
                 
-                message_text += f"  {status_emoji} {appointment.get('time')} - {service_name} - {appointment.get('client_name')}\n"
+                message_text += f"  {status_emoji} {appointment.get('time')} - {service_name} - {client_name}\n"
             message_text += "\n"
         
-        # If message is too long, need pagination or truncation
-        if len(message_text) > 4000:
-            message_text = message_text[:3990] + "\n... (и еще записи)"
-        
         await callback.message.edit_text(
             message_text,
-            reply_markup=get_appointments_management_keyboard()
+            reply_markup=get_all_appointments_keyboard(appointments, offset, has_more)
         )
         await callback.answer()
     
+    @dp.callback_query(F.data == "admin_appointments_all")
+    async def admin_appointments_all(callback: CallbackQuery):
+        """Show all appointments"""
+        await show_appointments_page(callback)
+    
+    @admin_callbacks.route(PageCallback, action="appointments")
+    async def admin_appointments_all_page(callback: CallbackQuery, callback_data: PageCallback):
+        """Show another page of all appointments"""
+        await show_appointments_page(callback, callback_data.offset)
+    
     @dp.callback_query(F.data == "admin_appointments_date")
     async def admin_appointments_date(callback: CallbackQuery, state: FSMContext):
         """Ask for date to show appointments"""
@@ -1150,13 +1387,13 @@ def register_handlers(dp: Dispatcher):
         await state.set_state(AdminAppointmentStates.selecting_date)
         await callback.answer()
     
-    @dp.callback_query(F.data.startswith("admin_appointments_date_"))
-    async def admin_appointments_date_selected(callback: CallbackQuery):
+    @admin_callbacks.route(AppointmentDateCallback)
+    async def admin_appointments_date_selected(callback: CallbackQuery, callback_data: AppointmentDateCallback):
         """Show appointments for selected date"""
-        date = callback.data.replace("admin_appointments_date_", "")
-        appointments = await appointment_commands.get_appointments_by_date(date)
+        date = callback_data.date
+        agenda = await day_agenda.get_day_agenda(date)
         
-        if not appointments:
+        if not agenda:
             await callback.message.edit_text(
                 f"На {date} нет записей.",
                 reply_markup=get_appointments_management_keyboard()
@@ -1164,8 +1401,8 @@ def register_handlers(dp: Dispatcher):
             return
         
         await callback.message.edit_text(
-            f"Записи на {date}:",
-            reply_markup=get_date_appointments_admin_keyboard(appointments, date)
+            f"Записи на {date}: {agenda.format_status_counts()}",
+            reply_markup=agenda.keyboard
         )
         await callback.answer()
     
@@ -1176,17 +1413,17 @@ def register_handlers(dp: Dispatcher):
             # Validate date format
             date = datetime.datetime.strptime(message.text, "%Y-%m-%d").strftime("%Y-%m-%d")
             
-            appointments = await appointment_commands.get_appointments_by_date(date)
+            agenda = await day_agenda.get_day_agenda(date)
             
-            if not appointments:
+            if not agenda:
                 await message.answer(
                     f"На {date} нет записей.",
                     reply_markup=get_appointments_management_keyboard()
                 )
             else:
                 await message.answer(
-                    f"Записи на {date}:",
-                    reply_markup=get_date_appointments_admin_keyboard(appointments, date)
+                    f"Записи на {date}: {agenda.format_status_counts()}",
+                    reply_markup=agenda.keyboard
                 )
         except ValueError:
             await message.answer(
@@ -1197,10 +1434,10 @@ def register_handlers(dp: Dispatcher):
         # Reset the state
         await state.clear()
     
-    @dp.callback_query(F.data.startswith("admin_view_appointment_"))
-    async def admin_view_appointment(callback: CallbackQuery):
+    @admin_callbacks.route(AppointmentCallback, action="view")
+    async def admin_view_appointment(callback: CallbackQuery, callback_data: AppointmentCallback):
         """Show appointment details"""
-        appointment_id = callback.data.replace("admin_view_appointment_", "")
+        appointment_id = callback_data.id
         appointment = await appointment_commands.get_appointment(appointment_id)
         
         if not appointment:
@@ -1250,10 +1487,10 @@ def register_handlers(dp: Dispatcher):
         )
         await callback.answer()
     
-    @dp.callback_query(F.data.startswith("mark_completed_"))
-    async def mark_completed(callback: CallbackQuery):
+    @admin_callbacks.route(AppointmentCallback, action="completed")
+    async def mark_completed(callback: CallbackQuery, callback_data: AppointmentCallback):
         """Mark appointment as completed"""
-        appointment_id = callback.data.replace("mark_completed_", "")
+        appointment_id = callback_data.id
         
         # Update the appointment status
         success = await appointment_commands.update_appointment_status(appointment_id, "completed")
@@ -1271,10 +1508,10 @@ def register_handlers(dp: Dispatcher):
         
         await callback.answer()
     
-    @dp.callback_query(F.data.startswith("mark_paid_"))
-    async def mark_paid(callback: CallbackQuery):
+    @admin_callbacks.route(AppointmentCallback, action="paid")
+    async def mark_paid(callback: CallbackQuery, callback_data: AppointmentCallback):
         """Mark appointment as paid"""
-        appointment_id = callback.data.replace("mark_paid_", "")
+        appointment_id = callback_data.id
         
         # Update the appointment status
         success = await appointment_commands.update_appointment_status(appointment_id, "paid")
@@ -1292,12 +1529,11 @@ def register_handlers(dp: Dispatcher):
         
         await callback.answer()
     
-    @dp.callback_query(F.data.startswith("set_payment_"))
-    async def set_payment_method(callback: CallbackQuery):
+    @admin_callbacks.route(PaymentMethodCallback)
+    async def set_payment_method(callback: CallbackQuery, callback_data: PaymentMethodCallback):
         """Set payment method for appointment"""
-        parts = callback.data.split("_")
-        appointment_id = parts[2]
-        payment_method = parts[1]
+        appointment_id = callback_data.id
+        payment_method = callback_data.method
         
         payment_map = {
             "cash": "Наличные",
@@ -1321,10 +1557,10 @@ def register_handlers(dp: Dispatcher):
         
         await callback.answer()
     
-    @dp.callback_query(F.data.startswith("admin_cancel_appointment_"))
-    async def admin_cancel_appointment_confirm(callback: CallbackQuery):
+    @admin_callbacks.route(AppointmentCallback, action="cancel")
+    async def admin_cancel_appointment_confirm(callback: CallbackQuery, callback_data: AppointmentCallback):
         """Confirm appointment cancellation"""
-        appointment_id = callback.data.replace("admin_cancel_appointment_", "")
+        appointment_id = callback_data.id
         appointment = await appointment_commands.get_appointment(appointment_id)
         
         if not appointment:
@@ -1340,10 +1576,10 @@ def register_handlers(dp: Dispatcher):
         )
         await callback.answer()
     
-    @dp.callback_query(F.data.startswith("confirm_cancel_appointment_"))
-    async def admin_cancel_appointment(callback: CallbackQuery):
+    @admin_callbacks.route(AppointmentCallback, action="cancel_ok")
+    async def admin_cancel_appointment(callback: CallbackQuery, callback_data: AppointmentCallback):
         """Cancel appointment"""
-        appointment_id = callback.data.replace("confirm_cancel_appointment_", "")
+        appointment_id = callback_data.id
         
         # Cancel the appointment
         success = await appointment_commands.cancel_appointment(appointment_id)
@@ -1361,10 +1597,10 @@ def register_handlers(dp: Dispatcher):
         
         await callback.answer()
     
-    @dp.callback_query(F.data.startswith("admin_confirm_appointment_"))
-    async def admin_confirm_appointment(callback: CallbackQuery):
+    @admin_callbacks.route(AppointmentCallback, action="confirm")
+    async def admin_confirm_appointment(callback: CallbackQuery, callback_data: AppointmentCallback):
         """Confirm a pending appointment"""
-        appointment_id = callback.data.replace("admin_confirm_appointment_", "")
+        appointment_id = callback_data.id
         
         # Update the appointment status to confirmed
         success = await appointment_commands.update_appointment_status(appointment_id, "confirmed")
@@ -1387,6 +1623,39 @@ def register_handlers(dp: Dispatcher):
         
         await callback.answer()
     
+    # End-of-day reminder actions (see utils.appointment_reminders)
+    @admin_callbacks.route(AppointmentCallback, action="complete_paid")
+    async def reminder_complete_paid(callback: CallbackQuery, callback_data: AppointmentCallback):
+        """Mark appointment from a reminder as completed and paid"""
+        success = await appointment_commands.update_appointment_status(callback_data.id, "paid")
+        
+        if success:
+            await callback.message.edit_text(f"Запись #{callback_data.id} отмечена как выполненная и оплаченная.")
+        else:
+            await callback.message.edit_text("Ошибка при обновлении статуса записи.")
+        
+        await callback.answer()
+    
+    @admin_callbacks.route(AppointmentCallback, action="complete_unpaid")
+    async def reminder_complete_unpaid(callback: CallbackQuery, callback_data: AppointmentCallback):
+        """Mark appointment from a reminder as completed but not paid"""
+        success = await appointment_commands.update_appointment_status(callback_data.id, "completed")
+        
+        if success:
+            await callback.message.edit_text(f"Запись #{callback_data.id} отмечена как выполненная, оплата не получена.")
+        else:
+            await callback.message.edit_text("Ошибка при обновлении статуса записи.")
+        
+        await callback.answer()
+    
+    @admin_callbacks.route(AppointmentCallback, action="remind_later")
+    async def reminder_later(callback: CallbackQuery, callback_data: AppointmentCallback):
+        """Postpone the reminder until the next hourly check"""
+        await callback.message.edit_text(
+            f"Напоминание о записи #{callback_data.id} отложено. Мы напомним при следующей проверке."
+        )
+        await callback.answer()
+    
     # Master management handlers
     @dp.callback_query(F.data == "admin_masters")
     async def admin_masters(callback: CallbackQuery):
@@ -1488,10 +1757,9 @@ def register_handlers(dp: Dispatcher):
         # Reset the state
         await state.clear()
     
-    @dp.callback_query(F.data == "view_masters_admin")
-    async def view_masters_admin(callback: CallbackQuery):
-        """Show all masters"""
-        masters = await master_commands.get_masters()
+    async def show_masters_page(callback: CallbackQuery, offset=0):
+        """Show one page of masters"""
+        masters, has_more = await google_sheets.get_sheet_page('Masters', offset, PAGE_SIZE)
         
         if not masters:
             await callback.message.edit_text(
@@ -1503,17 +1771,331 @@ def register_handlers(dp: Dispatcher):
         # Create a list of masters
         message_text = "Все мастера:\n\n"
         
-        for idx, master in enumerate(masters, start=1):
+        for idx, master in enumerate(masters, start=offset + 1):
             message_text += f"{idx}. {master.get('name')} (@{master.get('telegram')})\n"
             if master.get('address'):
                 message_text += f"   📍 {master.get('address')}\n"
         
         await callback.message.edit_text(
             message_text,
-            reply_markup=get_masters_management_keyboard()
+            reply_markup=get_masters_list_keyboard(masters, offset, has_more)
+        )
+        await callback.answer()
+    
+    @dp.callback_query(F.data == "view_masters_admin")
+    async def view_masters_admin(callback: CallbackQuery):
+        """Show all masters"""
+        await show_masters_page(callback)
+    
+    @admin_callbacks.route(PageCallback, action="masters")
+    async def view_masters_admin_page(callback: CallbackQuery, callback_data: PageCallback):
+        """Show another page of masters"""
+        await show_masters_page(callback, callback_data.offset)
+    
+    @admin_callbacks.route(AdminMasterCallback, action="view")
+    async def admin_view_master(callback: CallbackQuery, callback_data: AdminMasterCallback):
+        """Show master details"""
+        master_id = callback_data.id
+        master = await master_commands.get_master(master_id)
+        
+        if not master:
+            await callback.message.edit_text(
+                "Мастер не найден.",
+                reply_markup=get_masters_management_keyboard()
+            )
+            return
+        
+        master_text = (
+            f"👤 Информация о мастере\n\n"
+            f"📌 Имя: {master.get('name')}\n"
+            f"📱 Telegram: @{master.get('telegram') or '-'}\n"
+            f"📍 Адрес: {master.get('address') or '-'}\n"
+            f"🗺 Местоположение: {master.get('location') or '-'}\n"
+        )
+        
+        await callback.message.edit_text(
+            master_text,
+            reply_markup=get_master_actions_keyboard(master_id)
+        )
+        await callback.answer()
+    
+    @admin_callbacks.route(AdminMasterCallback, action="edit")
+    async def edit_master(callback: CallbackQuery, callback_data: AdminMasterCallback):
+        """Show master edit options"""
+        master_id = callback_data.id
+        master = await master_commands.get_master(master_id)
+        
+        if not master:
+            await callback.message.edit_text(
+                "Мастер не найден.",
+                reply_markup=get_masters_management_keyboard()
+            )
+            return
+        
+        await callback.message.edit_text(
+            f"Выберите, что вы хотите изменить для мастера '{master.get('name')}':",
+            reply_markup=get_edit_master_keyboard(master_id)
         )
         await callback.answer()
     
+    @admin_callbacks.route(AdminMasterCallback, action="name")
+    async def edit_master_name_start(callback: CallbackQuery, callback_data: AdminMasterCallback, state: FSMContext):
+        """Start editing master name"""
+        await state.update_data(master_id=callback_data.id)
+        
+        await callback.message.edit_text("Введите новое имя мастера:")
+        await state.set_state(AdminMasterStates.editing_name)
+        await callback.answer()
+    
+    @dp.message(AdminMasterStates.editing_name)
+    async def edit_master_name(message: Message, state: FSMContext):
+        """Handle master name edit"""
+        data = await state.get_data()
+        master_id = data.get('master_id')
+        
+        success = await master_commands.update_master(master_id, name=message.text)
+        
+        if success:
+            await message.answer(
+                "Имя мастера успешно изменено.",
+                reply_markup=get_master_actions_keyboard(master_id)
+            )
+        else:
+            await message.answer(
+                "Ошибка при изменении мастера.",
+                reply_markup=get_masters_management_keyboard()
+            )
+        
+        # Reset the state
+        await state.clear()
+    
+    @admin_callbacks.route(AdminMasterCallback, action="telegram")
+    async def edit_master_telegram_start(callback: CallbackQuery, callback_data: AdminMasterCallback, state: FSMContext):
+        """Start editing master telegram"""
+        await state.update_data(master_id=callback_data.id)
+        
+        await callback.message.edit_text("Введите новый telegram контакт мастера (username без @):")
+        await state.set_state(AdminMasterStates.editing_telegram)
+        await callback.answer()
+    
+    @dp.message(AdminMasterStates.editing_telegram)
+    async def edit_master_telegram(message: Message, state: FSMContext):
+        """Handle master telegram edit"""
+        data = await state.get_data()
+        master_id = data.get('master_id')
+        
+        success = await master_commands.update_master(master_id, telegram=message.text)
+        
+        if success:
+            await message.answer(
+                "Telegram мастера успешно изменен.",
+                reply_markup=get_master_actions_keyboard(master_id)
+            )
+        else:
+            await message.answer(
+                "Ошибка при изменении мастера.",
+                reply_markup=get_masters_management_keyboard()
+            )
+        
+        # Reset the state
+        await state.clear()
+    
+    @admin_callbacks.route(AdminMasterCallback, action="address")
+    async def edit_master_address_start(callback: CallbackQuery, callback_data: AdminMasterCallback, state: FSMContext):
+        """Start editing master address"""
+        await state.update_data(master_id=callback_data.id)
+        
+        await callback.message.edit_text("Введите новый адрес мастера:")
+        await state.set_state(AdminMasterStates.editing_address)
+        await callback.answer()
+    
+    @dp.message(AdminMasterStates.editing_address)
+    async def edit_master_address(message: Message, state: FSMContext):
+        """Handle master address edit"""
+        data = await state.get_data()
+        master_id = data.get('master_id')
+        
+        success = await master_commands.update_master(master_id, address=message.text)
+        
+        if success:
+            await message.answer(
+                "Адрес мастера успешно изменен.",
+                reply_markup=get_master_actions_keyboard(master_id)
+            )
+        else:
+            await message.answer(
+                "Ошибка при изменении мастера.",
+                reply_markup=get_masters_management_keyboard()
+            )
+        
+        # Reset the state
+        await state.clear()
+    
+    @admin_callbacks.route(AdminMasterCallback, action="location")
+    async def edit_master_location_start(callback: CallbackQuery, callback_data: AdminMasterCallback, state: FSMContext):
+        """Start editing master location"""
+        await state.update_data(master_id=callback_data.id)
+        
+        await callback.message.edit_text("Введите новое местоположение мастера (координаты или описание):")
+        await state.set_state(AdminMasterStates.editing_location)
+        await callback.answer()
+    
+    @dp.message(AdminMasterStates.editing_location)
+    async def edit_master_location(message: Message, state: FSMContext):
+        """Handle master location edit"""
+        data = await state.get_data()
+        master_id = data.get('master_id')
+        
+        success = await master_commands.update_master(master_id, location=message.text)
+        
+        if success:
+            await message.answer(
+                "Местоположение мастера успешно изменено.",
+                reply_markup=get_master_actions_keyboard(master_id)
+            )
+        else:
+            await message.answer(
+                "Ошибка при изменении мастера.",
+                reply_markup=get_masters_management_keyboard()
+            )
+        
+        # Reset the state
+        await state.clear()
+    
+    @admin_callbacks.route(AdminMasterCallback, action="delete")
+    async def delete_master_confirm(callback: CallbackQuery, callback_data: AdminMasterCallback):
+        """Confirm master deletion"""
+        master_id = callback_data.id
+        master = await master_commands.get_master(master_id)
+        
+        if not master:
+            await callback.message.edit_text(
+                "Мастер не найден.",
+                reply_markup=get_masters_management_keyboard()
+            )
+            return
+        
+        await callback.message.edit_text(
+            f"Вы уверены, что хотите удалить мастера '{master.get('name')}'?",
+            reply_markup=get_confirm_delete_keyboard(master_id, "master")
+        )
+        await callback.answer()
+    
+    @admin_callbacks.route(AdminMasterCallback, action="delete_ok")
+    async def delete_master(callback: CallbackQuery, callback_data: AdminMasterCallback):
+        """Delete master"""
+        success = await master_commands.delete_master(callback_data.id)
+        
+        if success:
+            await callback.message.edit_text(
+                "Мастер успешно удален.",
+                reply_markup=get_masters_management_keyboard()
+            )
+        else:
+            await callback.message.edit_text(
+                "Ошибка при удалении мастера.",
+                reply_markup=get_masters_management_keyboard()
+            )
+        
+        await callback.answer()
+    
+    # Working-hours exceptions: breaks, days off, vacations, holidays and extra hours
+    def parse_time_range(text):
+        """Parse "HH:MM-HH:MM" into (start, end), or (None, None)"""
+        start, sep, end = text.partition('-')
+        return (start, end) if sep and ':' in start and ':' in end else (None, None)
+    
+    def format_exception(exception):
+        kind = "➕ Доп. часы" if exception.get('kind') == work_calendar.EXTRA else "⛔ Не работает"
+        who = f"мастер {exception.get('master_id')}" if exception.get('master_id') else "весь салон"
+        days = exception.get('date_from')
+        if exception.get('date_to') and exception.get('date_to') != exception.get('date_from'):
+            days += f" – {exception.get('date_to')}"
+        hours = f" {exception.get('start')}-{exception.get('end')}" if exception.get('start') else " весь день"
+        note = f" ({exception.get('note')})" if exception.get('note') else ""
+        return f"#{exception.get('id')} {kind}: {who}, {days}{hours}{note}"
+    
+    @dp.message(Command("exceptions"))
+    async def list_exceptions(message: Message, command: CommandObject):
+        """Handle /exceptions [master_id] - list working-hours exceptions"""
+        user = await user_commands.get_user(message.from_user.id)
+        if not user or user.get('role') != 'admin':
+            await message.answer("У вас нет доступа к этой команде.")
+            return
+        
+        today = timezones.today().isoformat()
+        exceptions = [
+            exception for exception in await work_calendar.get_exceptions((command.args or "").strip() or None)
+            if str(exception.get('date_to') or exception.get('date_from')) >= today
+        ]
+        if not exceptions:
+            await message.answer("Нет предстоящих исключений в графике.")
+            return
+        await message.answer("Исключения в графике:\n" + "\n".join(format_exception(e) for e in exceptions))
+    
+    @dp.message(Command("day_off"))
+    async def add_day_off(message: Message, command: CommandObject):
+        """Handle /day_off <master_id|all> <date>[:<date>] [HH:MM-HH:MM] [note]"""
+        user = await user_commands.get_user(message.from_user.id)
+        if not user or user.get('role') != 'admin':
+            await message.answer("У вас нет доступа к этой команде.")
+            return
+        
+        args = (command.args or "").split()
+        if len(args) < 2:
+            await message.answer(
+                "Использование: /day_off <ID мастера|all> <ГГГГ-ММ-ДД>[:<ГГГГ-ММ-ДД>] [ЧЧ:ММ-ЧЧ:ММ] [комментарий]\n"
+                "Например: /day_off 3 2025-07-01:2025-07-14 отпуск\n"
+                "или перерыв: /day_off 3 2025-07-01 13:00-14:00"
+            )
+            return
+        
+        date_from, _, date_to = args[1].partition(':')
+        start, end = parse_time_range(args[2]) if len(args) > 2 else (None, None)
+        note = " ".join(args[3 if start else 2:])
+        exception = await work_calendar.add_exception(
+            None if args[0] == 'all' else args[0], date_from, date_to or None, start, end, work_calendar.OFF, note
+        )
+        if exception:
+            await message.answer(f"✅ Добавлено: {format_exception(exception)}")
+        else:
+            await message.answer("❌ Не удалось добавить исключение. Проверьте даты и время.")
+    
+    @dp.message(Command("extra_hours"))
+    async def add_extra_hours(message: Message, command: CommandObject):
+        """Handle /extra_hours <master_id> <date> <HH:MM-HH:MM> [note]"""
+        user = await user_commands.get_user(message.from_user.id)
+        if not user or user.get('role') != 'admin':
+            await message.answer("У вас нет доступа к этой команде.")
+            return
+        
+        args = (command.args or "").split()
+        start, end = parse_time_range(args[2]) if len(args) > 2 else (None, None)
+        if not start:
+            await message.answer("Использование: /extra_hours <ID мастера> <ГГГГ-ММ-ДД> <ЧЧ:ММ-ЧЧ:ММ> [комментарий]")
+            return
+        
+        exception = await work_calendar.add_exception(
+            args[0], args[1], None, start, end, work_calendar.EXTRA, " ".join(args[3:])
+        )
+        if exception:
+            await message.answer(f"✅ Добавлено: {format_exception(exception)}")
+        else:
+            await message.answer("❌ Не удалось добавить часы. Проверьте дату и время.")
+    
+    @dp.message(Command("del_exception"))
+    async def del_exception(message: Message, command: CommandObject):
+        """Handle /del_exception <id>"""
+        user = await user_commands.get_user(message.from_user.id)
+        if not user or user.get('role') != 'admin':
+            await message.answer("У вас нет доступа к этой команде.")
+            return
+        
+        if await work_calendar.delete_exception((command.args or "").strip().lstrip('#')):
+            await message.answer("✅ Исключение удалено.")
+        else:
+            await message.answer("❌ Исключение не найдено.")
+    
     # Admin help handler
     @dp.message(Command("admin_help"))
     async def admin_help(message: Message):
@@ -1540,7 +2122,9 @@ def register_handlers(dp: Dispatcher):
             
             "👨‍💼 Управление мастерами:\n"
             "- Для добавления мастера вам потребуется его Telegram ID\n"
-            "- После добавления мастера вы можете настроить его рабочие часы\n\n"
+            "- После добавления мастера вы можете настроить его рабочие часы\n"
+            "- Перерывы, выходные и отпуска: /day_off, дополнительные часы: /extra_hours, "
+            "список: /exceptions, удаление: /del_exception\n\n"
             
             "📅 Управление записями:\n"
             "- В разделе 'Записи по дате' вы можете просматривать и управлять записями клиентов\n"
@@ -1552,3 +2136,5 @@ def register_handlers(dp: Dispatcher):
         )
         
         await message.answer(help_text)
+    
+    admin_callbacks.register(dp)
@@ -1,11 +1,13 @@
 
+from collections import Counter
 from aiogram import Dispatcher, F
 from aiogram.types import Message, CallbackQuery
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from utils.db_api import user_commands, service_commands, appointment_commands
+from utils.db_api import user_commands, service_commands, appointment_commands, tenant_commands, timezones
+from utils import metrics
 from keyboards.admin_keyboards import get_back_to_admin_keyboard
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
@@ -214,35 +216,32 @@ async def ceo_global_stats(callback: CallbackQuery, role: str):
         await callback.answer("Access denied. This command is only available to CEO.")
         return
     
-    # Get all appointments for statistics
-    appointments = await appointment_commands.get_all_appointments()
-    
-    # Get all services for statistics
-    services = await service_commands.get_all_services()
-    
-    # Basic statistics
-    total_appointments = len(appointments)
-    confirmed_appointments = len([a for a in appointments if a['status'] == 'confirmed'])
-    canceled_appointments = len([a for a in appointments if a['status'] == 'canceled'])
+    # Collect statistics of the main spreadsheet and of every tenant
+    total_appointments = 0
+    status_counts = Counter()
+    service_counts = Counter()
+    for tenant in [None, *await tenant_commands.get_all_tenants()]:
+        with tenant_commands.use_tenant(tenant):
+            appointments = await appointment_commands.get_appointments_table()
+            services = await service_commands.get_all_services()
+        
+        total_appointments += len(appointments)
+        status_counts.update(appointments.count_by('status'))
+        
+        # Service IDs are per tenant, count services by name
+        names = {str(service["id"]): service["name"] for service in services}
+        for service_id, count in appointments.count_by('service_id').items():
+            if str(service_id) in names:
+                service_counts[names[str(service_id)]] += count
+    
+    confirmed_appointments = status_counts['confirmed']
+    canceled_appointments = status_counts['canceled']
     
     # Calculate revenue (would need price data from history)
     total_revenue = 0
     
-    # Service popularity
-    service_counts = {}
-    for appointment in appointments:
-        service_id = appointment['service_id']
-        if service_id in service_counts:
-            service_counts[service_id] += 1
-        else:
-            service_counts[service_id] = 1
-    
     # Get top services
-    top_services = []
-    for service_id, count in sorted(service_counts.items(), key=lambda x: x[1], reverse=True)[:3]:
-        service = next((s for s in services if str(s["id"]) == str(service_id)), None)
-        if service:
-            top_services.append(f"{service['name']}: {count} bookings")
+    top_services = [f"{name}: {count} bookings" for name, count in service_counts.most_common(3)]
     
     # Format stats message
     stats_text = f"""
@@ -271,11 +270,91 @@ async def ceo_global_stats(callback: CallbackQuery, role: str):
     
     await callback.answer()
 
+async def cmd_tenants(message: Message, role: str):
+    """Handle the /tenants command - list salons with their own spreadsheet"""
+    if role != "ceo":
+        await message.answer("Access denied. This command is only available to CEO.")
+        return
+    
+    tenants = await tenant_commands.get_all_tenants()
+    if not tenants:
+        await message.answer("No tenants yet. All admins use the main spreadsheet.")
+        return
+    
+    lines = ["🏢 Tenants:"]
+    for tenant in tenants:
+        lines.append(
+            f"{tenant['tenant_id']}. {tenant['name'] or '-'} (admin {tenant['admin_id']}): "
+            f"{tenant['spreadsheet_id']}, time zone: {tenant['timezone'] or timezones.DEFAULT_TIMEZONE or 'server'}, "
+            f"client link: /start t{tenant['tenant_id']}"
+        )
+    await message.answer("\n".join(lines))
+
+async def cmd_add_tenant(message: Message, role: str, command: CommandObject):
+    """Handle /add_tenant <admin_id> <spreadsheet_id> [name] - give an admin's salon its own spreadsheet"""
+    if role != "ceo":
+        await message.answer("Access denied. This command is only available to CEO.")
+        return
+    
+    args = (command.args or "").split(maxsplit=2)
+    if len(args) < 2 or not args[0].isdigit():
+        await message.answer("Usage: /add_tenant <admin_id> <spreadsheet_id> [name]")
+        return
+    
+    admin_id, spreadsheet_id = int(args[0]), args[1]
+    user = await user_commands.get_user(admin_id)
+    if not user or user['role'] != 'admin':
+        await message.answer(f"❌ User with ID {admin_id} is not an admin.")
+        return
+    
+    tenant = await tenant_commands.add_tenant(admin_id, spreadsheet_id, args[2] if len(args) > 2 else user['full_name'])
+    if tenant:
+        await message.answer(
+            f"✅ Tenant {tenant['tenant_id']} now uses spreadsheet {spreadsheet_id}.\n"
+            f"Clients join it with the link /start t{tenant['tenant_id']}"
+        )
+    else:
+        await message.answer("❌ Failed to save the tenant. Please try again later.")
+
+async def cmd_tenant_timezone(message: Message, role: str, command: CommandObject):
+    """Handle /tenant_timezone <tenant_id> <zone> - set the time zone of a salon, e.g. Europe/Moscow"""
+    if role != "ceo":
+        await message.answer("Access denied. This command is only available to CEO.")
+        return
+    
+    args = (command.args or "").split()
+    if len(args) != 2 or not args[0].isdigit():
+        await message.answer("Usage: /tenant_timezone <tenant_id> <zone>, e.g. /tenant_timezone 1 Europe/Moscow")
+        return
+    
+    tenant_id, zone = int(args[0]), args[1]
+    if not timezones.is_valid_zone(zone):
+        await message.answer(f"❌ Unknown time zone {zone}. Use an IANA name like Europe/Moscow.")
+        return
+    
+    tenant = await tenant_commands.set_tenant_timezone(tenant_id, zone)
+    if tenant:
+        await message.answer(f"✅ Tenant {tenant_id} now uses the time zone {zone}.")
+    else:
+        await message.answer(f"❌ Tenant {tenant_id} not found or could not be saved.")
+
+async def cmd_metrics(message: Message, role: str):
+    """Handle the /metrics command - show handler latency and Sheets usage"""
+    if role != "ceo":
+        await message.answer("Access denied. This command is only available to CEO.")
+        return
+    
+    await message.answer(metrics.format_summary())
+
 def register_handlers(dp: Dispatcher):
     """Register CEO handlers"""
     # CEO command
     dp.message.register(cmd_ceo, Command("ceo"))
     dp.callback_query.register(cmd_ceo, F.data == "cmd_ceo")
+    dp.message.register(cmd_metrics, Command("metrics"))
+    dp.message.register(cmd_tenants, Command("tenants"))
+    dp.message.register(cmd_add_tenant, Command("add_tenant"))
+    dp.message.register(cmd_tenant_timezone, Command("tenant_timezone"))
     
     # CEO panel sections
     dp.callback_query.register(ceo_manage_admins, F.data == "ceo_manage_admins")
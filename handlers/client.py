@@ -1,6 +1,6 @@
 
 from aiogram import F, Router, Dispatcher
-from aiogram.filters import Command
+from aiogram.filters import Command, CommandObject
 from aiogram.types import Message, CallbackQuery
 
 def register_handlers(dp: Dispatcher):
@@ -10,10 +10,17 @@ def register_handlers(dp: Dispatcher):
     main_router = Router()
     
     @main_router.message(Command("start"))
-    async def cmd_start(message: Message, user: dict):
+    async def cmd_start(message: Message, user: dict, command: CommandObject):
         """Handle /start command"""
         from keyboards import client_keyboards
         
+        # Deep link t<tenant_id> from a salon binds the user to that salon
+        if command.args and command.args.startswith("t") and user["role"] != "admin":
+            from utils.db_api import tenant_commands
+            tenant = await tenant_commands.get_tenant(command.args[1:])
+            if tenant:
+                await tenant_commands.add_tenant_member(message.from_user.id, tenant.get('tenant_id'))
+        
         # Check if user is admin for subscription status
         has_subscription = True
         if user["role"] == "admin":
@@ -8,8 +8,10 @@ import datetime
 import logging
 
 # Import utils and keyboards
-from utils.db_api import service_commands, appointment_commands, master_commands
+from utils.db_api import appointment_commands, master_commands, waitlist_commands, series_commands, timezones
+from utils import catalog_snapshot, master_load, waitlist
 from keyboards import client_keyboards
+from keyboards.callback_data import CategoryCallback, ServiceCallback, MasterCallback, ClientAppointmentCallback, WaitlistCallback, SeriesCallback
 
 router = Router()
 
@@ -21,6 +23,11 @@ class BookingStates(StatesGroup):
     select_time = State()
     confirm_booking = State()
 
+class RescheduleStates(StatesGroup):
+    select_date = State()
+    select_time = State()
+    confirm = State()
+
 # Command handlers
 @router.message(Command("book"))
 async def cmd_book(message: Message, state: FSMContext):
@@ -32,26 +39,30 @@ async def cmd_book(message: Message, state: FSMContext):
 
 # Category selection
 @router.callback_query(BookingStates.select_category, F.data == "back_to_main")
-async def back_to_main_from_category(callback: CallbackQuery, state: FSMContext, user: dict):
+async def back_to_main_from_category(callback: CallbackQuery, state: FSMContext, user: dict, has_subscription: bool):
     await state.clear()
-    has_subscription = callback.message.proxy_data.get("has_subscription", True) if hasattr(callback.message, "proxy_data") else True
     await callback.message.edit_text("Главное меню:", 
                                  reply_markup=await client_keyboards.get_main_menu_keyboard(user["role"], has_subscription))
     await callback.answer()
 
-@router.callback_query(BookingStates.select_category)
-async def select_category(callback: CallbackQuery, state: FSMContext):
-    category_name = callback.data
+@router.callback_query(BookingStates.select_category, CategoryCallback.filter())
+async def select_category(callback: CallbackQuery, callback_data: CategoryCallback, state: FSMContext):
+    category_id = callback_data.id
     
-    # Store selected category
-    await state.update_data(selected_category=category_name)
+    # Get the category and its services from the catalog snapshot
+    catalog = await catalog_snapshot.get_catalog()
+    category = catalog.get_category(category_id)
+    services = catalog.get_services_by_category_id(category_id)
     
-    # Get services in this category
-    services = await service_commands.get_services_by_category_name(category_name)
+    # Store selected category
+    await state.update_data(
+        selected_category_id=category_id,
+        selected_category=category.get('name') if category else None
+    )
     
     if services:
         await callback.message.edit_text("Выберите услугу:", 
-                                    reply_markup=await client_keyboards.get_services_keyboard(services))
+                                    reply_markup=catalog.get_services_keyboard(category_id))
         await state.set_state(BookingStates.select_service)
     else:
         await callback.message.edit_text("В данной категории нет услуг.")
@@ -67,23 +78,24 @@ async def back_to_categories(callback: CallbackQuery, state: FSMContext):
     await state.set_state(BookingStates.select_category)
     await callback.answer()
 
-@router.callback_query(BookingStates.select_service)
-async def select_service(callback: CallbackQuery, state: FSMContext):
-    service_id = callback.data
+@router.callback_query(BookingStates.select_service, ServiceCallback.filter())
+async def select_service(callback: CallbackQuery, callback_data: ServiceCallback, state: FSMContext):
+    service_id = callback_data.id
     
     # Store selected service
     await state.update_data(selected_service_id=service_id)
     
     # Get service details
-    service = await service_commands.get_service(service_id)
+    catalog = await catalog_snapshot.get_catalog()
+    service = catalog.get_service(service_id)
     
     if service:
         # Get available masters for this service
-        masters = await master_commands.get_masters()
+        masters = await master_commands.get_service_masters(service_id)
         
         if masters:
             await callback.message.edit_text("Выберите мастера:", 
-                                        reply_markup=await client_keyboards.get_masters_keyboard(masters))
+                                        reply_markup=await client_keyboards.get_masters_keyboard(masters, any_master=len(masters) > 1))
             await state.set_state(BookingStates.select_master)
         else:
             await callback.message.edit_text("Нет доступных мастеров для данной услуги.")
@@ -99,13 +111,13 @@ async def select_service(callback: CallbackQuery, state: FSMContext):
 async def back_to_services(callback: CallbackQuery, state: FSMContext):
     # Retrieve the selected category from the state
     data = await state.get_data()
-    selected_category = data.get("selected_category")
+    selected_category_id = data.get("selected_category_id")
     
     # If a category was previously selected, show services for that category
-    if selected_category:
-        services = await service_commands.get_services_by_category_name(selected_category)
+    catalog = await catalog_snapshot.get_catalog()
+    if selected_category_id and catalog.get_services_keyboard(selected_category_id):
         await callback.message.edit_text("Выберите услугу:", 
-                                    reply_markup=await client_keyboards.get_services_keyboard(services))
+                                    reply_markup=catalog.get_services_keyboard(selected_category_id))
         await state.set_state(BookingStates.select_service)
     else:
         # If no category was selected, go back to the category selection
@@ -115,9 +127,9 @@ async def back_to_services(callback: CallbackQuery, state: FSMContext):
     
     await callback.answer()
 
-@router.callback_query(BookingStates.select_master)
-async def select_master(callback: CallbackQuery, state: FSMContext):
-    master_id = callback.data
+@router.callback_query(BookingStates.select_master, MasterCallback.filter())
+async def select_master(callback: CallbackQuery, callback_data: MasterCallback, state: FSMContext):
+    master_id = callback_data.id
     
     # Store selected master
     await state.update_data(selected_master_id=master_id)
@@ -135,11 +147,15 @@ async def select_date(message: Message, state: FSMContext):
     
     # Validate date format
     try:
-        datetime.datetime.strptime(date, '%Y-%m-%d')
+        date_obj = datetime.datetime.strptime(date, '%Y-%m-%d').date()
     except ValueError:
         await message.answer("Неверный формат даты. Пожалуйста, введите дату в формате ГГГГ-ММ-ДД.")
         return
     
+    if date_obj < timezones.today():
+        await message.answer("Эта дата уже прошла. Пожалуйста, выберите другую дату.")
+        return
+    
     # Store selected date
     await state.update_data(selected_date=date)
     
@@ -147,17 +163,43 @@ async def select_date(message: Message, state: FSMContext):
     data = await state.get_data()
     master_id = data.get('selected_master_id')
     
-    # Get available times for this master and date
-    available_times = await master_commands.get_master_availability(master_id, date)
+    # Get available times for this master and date (or of any master offering the service)
+    if master_id == master_load.ANY_MASTER:
+        available_times = await master_load.get_any_master_availability(data.get('selected_service_id'), date)
+    else:
+        available_times = await master_commands.get_master_availability(
+            master_id, date, service_id=data.get('selected_service_id'))
     
     if available_times:
         await message.answer("Выберите время:", 
                             reply_markup=await client_keyboards.get_times_keyboard(available_times))
         await state.set_state(BookingStates.select_time)
     else:
-        await message.answer("Нет доступного времени на выбранную дату. Пожалуйста, выберите другую дату.")
+        await message.answer("Нет доступного времени на выбранную дату. Пожалуйста, выберите другую дату "
+                            "или встаньте в лист ожидания.", 
+                            reply_markup=await client_keyboards.get_waitlist_join_keyboard())
         await state.set_state(BookingStates.select_date)
 
+@router.callback_query(BookingStates.select_date, F.data == "waitlist_join")
+async def waitlist_join(callback: CallbackQuery, state: FSMContext, user: dict, has_subscription: bool):
+    data = await state.get_data()
+    date = data.get('selected_date')
+    
+    master_id = data.get('selected_master_id')
+    entry = await waitlist_commands.add_to_waitlist(
+        callback.from_user.id, data.get('selected_service_id'), date,
+        master_id=None if master_id == master_load.ANY_MASTER else master_id
+    )
+    
+    if entry:
+        await state.clear()
+        await callback.message.edit_text(f"Вы в листе ожидания на {date}. Мы сообщим, если время освободится.", 
+                                    reply_markup=await client_keyboards.get_main_menu_keyboard(user["role"], has_subscription))
+    else:
+        await callback.message.edit_text("Ошибка при записи в лист ожидания. Пожалуйста, попробуйте еще раз.")
+    
+    await callback.answer()
+
 # Time selection
 @router.callback_query(BookingStates.select_time, F.data == "back_to_date")
 async def back_to_date(callback: CallbackQuery, state: FSMContext):
@@ -180,8 +222,12 @@ async def select_time(callback: CallbackQuery, state: FSMContext):
     date = data.get('selected_date')
     
     # Get service and master details
-    service = await service_commands.get_service(service_id)
-    master = await master_commands.get_master(master_id)
+    catalog = await catalog_snapshot.get_catalog()
+    service = catalog.get_service(service_id)
+    if master_id == master_load.ANY_MASTER:
+        master = {'name': "любой свободный"}
+    else:
+        master = await master_commands.get_master(master_id)
     
     if service and master:
         # Confirm booking
@@ -205,7 +251,7 @@ async def select_time(callback: CallbackQuery, state: FSMContext):
 
 # Confirmation
 @router.callback_query(BookingStates.confirm_booking, F.data == "confirm")
-async def confirm(callback: CallbackQuery, state: FSMContext, user: dict):
+async def confirm(callback: CallbackQuery, state: FSMContext, user: dict, has_subscription: bool):
     # Get data from state
     data = await state.get_data()
     user_id = callback.from_user.id
@@ -214,54 +260,42 @@ async def confirm(callback: CallbackQuery, state: FSMContext, user: dict):
     date = data.get('selected_date')
     time = data.get('selected_time')
     
-    # Create appointment
-    appointment = await appointment_commands.add_appointment(
-        user_id=user_id,
-        service_id=service_id,
-        master_id=master_id,
-        date=date,
-        time=time
-    )
+    # Create appointment, unless the slot was taken (or held for the waitlist) meanwhile
+    if master_id == master_load.ANY_MASTER:
+        appointment = await master_load.book_any_master(user_id, service_id, date, time)
+    else:
+        appointment = await appointment_commands.book_slot(
+            user_id=user_id,
+            service_id=service_id,
+            master_id=master_id,
+            date=date,
+            time=time
+        )
     
     if appointment:
-        has_subscription = True  # Default for clients
-        if user["role"] == "admin":
-            # Only check subscription for admins
-            has_subscription = callback.message.proxy_data.get("has_subscription", True) if hasattr(callback.message, "proxy_data") else True
-        
         await callback.message.edit_text("Запись успешно создана!", 
                                     reply_markup=await client_keyboards.get_main_menu_keyboard(user["role"], has_subscription))
     else:
-        await callback.message.edit_text("Ошибка при создании записи. Пожалуйста, попробуйте еще раз.")
+        await callback.message.edit_text("Это время уже занято. Пожалуйста, начните запись заново.")
     
     await state.clear()
     await callback.answer()
 
 @router.callback_query(BookingStates.confirm_booking, F.data == "cancel")
-async def cancel(callback: CallbackQuery, state: FSMContext, user: dict):
+async def cancel(callback: CallbackQuery, state: FSMContext, user: dict, has_subscription: bool):
     await state.clear()
     await callback.message.edit_text("Запись отменена.")
     
-    # Get subscription status for admins only
-    has_subscription = True  # Default for clients
-    if user["role"] == "admin":
-        has_subscription = callback.message.proxy_data.get("has_subscription", True) if hasattr(callback.message, "proxy_data") else True
-    
     await callback.message.answer("Главное меню:", 
                                reply_markup=await client_keyboards.get_main_menu_keyboard(user["role"], has_subscription))
     await callback.answer()
 
 @router.callback_query(F.data == "cancel_booking")
-async def cancel_booking(callback: CallbackQuery, state: FSMContext, user: dict):
+async def cancel_booking(callback: CallbackQuery, state: FSMContext, user: dict, has_subscription: bool):
     # Fix: removed reference to bot['temp_data']
     await state.clear()
     await callback.message.edit_text("Запись отменена.")
     
-    # Get subscription status for admins only
-    has_subscription = True  # Default for clients
-    if user["role"] == "admin":
-        has_subscription = callback.message.proxy_data.get("has_subscription", True) if hasattr(callback.message, "proxy_data") else True
-    
     await callback.message.answer("Главное меню:", 
                                reply_markup=await client_keyboards.get_main_menu_keyboard(user["role"], has_subscription))
     await callback.answer()
@@ -291,3 +325,202 @@ async def my_appointments(callback: CallbackQuery, state: FSMContext):
                                     reply_markup=await client_keyboards.get_main_menu_keyboard())
     
     await callback.answer()
+
+# Appointments of one date from the user's appointments list
+@router.callback_query(F.data.startswith("date_"))
+async def my_appointments_date(callback: CallbackQuery, state: FSMContext):
+    date = callback.data[len("date_"):]
+    
+    appointments = [
+        appointment for appointment in await appointment_commands.get_user_appointments(callback.from_user.id)
+        if appointment.get('date') == date
+    ]
+    
+    lines = [f"Ваши записи на {date}:"]
+    for appointment in sorted(appointments, key=lambda a: str(a.get('time'))):
+        lines.append(
+            f"• {appointment.get('time')} — {appointment.get('service_name', 'Услуга')}, "
+            f"мастер: {appointment.get('master_name', 'не указан')}"
+        )
+    
+    await callback.message.edit_text("\n".join(lines), 
+                                reply_markup=await client_keyboards.get_date_appointments_keyboard(appointments))
+    await callback.answer()
+
+# Rescheduling an appointment to another free slot of the same master
+@router.callback_query(ClientAppointmentCallback.filter(F.action == "reschedule"))
+async def reschedule_start(callback: CallbackQuery, callback_data: ClientAppointmentCallback, state: FSMContext):
+    appointment = await appointment_commands.get_appointment(callback_data.id)
+    
+    # Clients can move only their own upcoming appointments
+    if (not appointment or str(appointment.get('user_id')) != str(callback.from_user.id)
+            or appointment.get('status') not in appointment_commands.RESCHEDULABLE_STATUSES
+            or timezones.has_started(appointment)):
+        await callback.answer("Эту запись нельзя перенести.")
+        return
+    
+    await state.clear()
+    await state.update_data(reschedule_id=str(appointment.get('id')), selected_master_id=str(appointment.get('master_id')),
+                            selected_service_id=str(appointment.get('service_id')))
+    await callback.message.edit_text(
+        f"Запись на {appointment.get('date')} {appointment.get('time')}.\n"
+        "Введите новую дату (ГГГГ-ММ-ДД):"
+    )
+    await state.set_state(RescheduleStates.select_date)
+    await callback.answer()
+
+@router.message(RescheduleStates.select_date)
+async def reschedule_select_date(message: Message, state: FSMContext):
+    date = message.text
+    
+    # Validate date format
+    try:
+        date_obj = datetime.datetime.strptime(date, '%Y-%m-%d').date()
+    except ValueError:
+        await message.answer("Неверный формат даты. Пожалуйста, введите дату в формате ГГГГ-ММ-ДД.")
+        return
+    
+    if date_obj < timezones.today():
+        await message.answer("Эта дата уже прошла. Пожалуйста, выберите другую дату.")
+        return
+    
+    data = await state.get_data()
+    available_times = await master_commands.get_master_availability(
+        data.get('selected_master_id'), date, service_id=data.get('selected_service_id'), ignore=data.get('reschedule_id'))
+    
+    if available_times:
+        await state.update_data(selected_date=date, available_times=available_times)
+        await message.answer("Выберите новое время:", 
+                            reply_markup=await client_keyboards.get_times_keyboard(available_times))
+        await state.set_state(RescheduleStates.select_time)
+    else:
+        await message.answer("Нет свободного времени на выбранную дату. Пожалуйста, выберите другую дату.")
+
+@router.callback_query(RescheduleStates.select_time, F.data == "back_to_date")
+async def reschedule_back_to_date(callback: CallbackQuery, state: FSMContext):
+    await callback.message.edit_text("Введите новую дату (ГГГГ-ММ-ДД):")
+    await state.set_state(RescheduleStates.select_date)
+    await callback.answer()
+
+@router.callback_query(RescheduleStates.select_time)
+async def reschedule_select_time(callback: CallbackQuery, state: FSMContext):
+    time = callback.data
+    data = await state.get_data()
+    
+    if time not in data.get('available_times', []):
+        await callback.answer()
+        return
+    
+    await state.update_data(selected_time=time)
+    await callback.message.edit_text(
+        f"Перенести запись на {data.get('selected_date')} {time}?",
+        reply_markup=await client_keyboards.get_confirmation_keyboard()
+    )
+    await state.set_state(RescheduleStates.confirm)
+    await callback.answer()
+
+@router.callback_query(RescheduleStates.confirm, F.data == "confirm")
+async def reschedule_confirm(callback: CallbackQuery, state: FSMContext, user: dict, has_subscription: bool):
+    data = await state.get_data()
+    date = data.get('selected_date')
+    
+    # The slot is checked again, it may have been taken meanwhile
+    appointment = await appointment_commands.reschedule_appointment(
+        data.get('reschedule_id'), date, data.get('selected_time')
+    )
+    
+    if appointment:
+        await state.clear()
+        await callback.message.edit_text(f"Запись перенесена на {appointment.get('date')} {appointment.get('time')}.", 
+                                    reply_markup=await client_keyboards.get_main_menu_keyboard(user["role"], has_subscription))
+    else:
+        # Offer the slots that are still free
+        available_times = await master_commands.get_master_availability(
+            data.get('selected_master_id'), date, service_id=data.get('selected_service_id'), ignore=data.get('reschedule_id'))
+        await state.update_data(available_times=available_times)
+        await callback.message.edit_text("Это время уже занято. Выберите другое время:", 
+                                    reply_markup=await client_keyboards.get_times_keyboard(available_times))
+        await state.set_state(RescheduleStates.select_time)
+    
+    await callback.answer()
+
+@router.callback_query(RescheduleStates.confirm, F.data == "cancel")
+async def reschedule_cancel(callback: CallbackQuery, state: FSMContext, user: dict, has_subscription: bool):
+    await state.clear()
+    await callback.message.edit_text("Перенос отменен, запись осталась прежней.", 
+                                reply_markup=await client_keyboards.get_main_menu_keyboard(user["role"], has_subscription))
+    await callback.answer()
+
+# Recurring series: the same service, master and time every few weeks
+@router.callback_query(ClientAppointmentCallback.filter(F.action == "repeat"))
+async def repeat_start(callback: CallbackQuery, callback_data: ClientAppointmentCallback):
+    appointment = await appointment_commands.get_appointment(callback_data.id)
+    
+    if (not appointment or str(appointment.get('user_id')) != str(callback.from_user.id)
+            or not appointment.get('master_id')):
+        await callback.answer("Эту запись нельзя повторять.")
+        return
+    
+    await callback.message.edit_text(f"Как часто повторять запись {appointment.get('time')}?", 
+                                reply_markup=await client_keyboards.get_series_interval_keyboard(callback_data.id))
+    await callback.answer()
+
+@router.callback_query(SeriesCallback.filter(F.action == "create"))
+async def repeat_create(callback: CallbackQuery, callback_data: SeriesCallback):
+    appointment = await appointment_commands.get_appointment(callback_data.id)
+    if not appointment or str(appointment.get('user_id')) != str(callback.from_user.id) or callback_data.weeks < 1:
+        await callback.answer("Эту запись нельзя повторять.")
+        return
+    
+    # The series starts with the next occurrence, the appointment itself is already booked
+    start_date = datetime.date.fromisoformat(appointment.get('date')) + datetime.timedelta(weeks=callback_data.weeks)
+    series, appointments, busy = await series_commands.create_series(
+        callback.from_user.id, appointment.get('service_id'), appointment.get('master_id'),
+        start_date.isoformat(), appointment.get('time'), series_commands.format_rule(callback_data.weeks)
+    )
+    
+    if series is None:
+        await callback.message.edit_text("Ошибка при создании серии. Пожалуйста, попробуйте еще раз.")
+    else:
+        lines = [f"Запись будет повторяться каждые {callback_data.weeks} нед. в {appointment.get('time')}."]
+        if appointments:
+            lines.append("Созданы записи на: " + ", ".join(str(a.get('date')) for a in appointments))
+        if busy:
+            lines.append("Время занято, записи не созданы: " + ", ".join(busy))
+        lines.append("Следующие записи будут создаваться автоматически.")
+        await callback.message.edit_text("\n".join(lines), 
+                                    reply_markup=await client_keyboards.get_series_keyboard(series.get('id')))
+    
+    await callback.answer()
+
+@router.callback_query(SeriesCallback.filter(F.action == "cancel"))
+async def series_cancel(callback: CallbackQuery, callback_data: SeriesCallback):
+    if await series_commands.cancel_series(callback_data.id, callback.from_user.id):
+        await callback.message.edit_text("Серия отменена, предстоящие записи серии отменены.", 
+                                    reply_markup=await client_keyboards.get_main_menu_keyboard())
+    else:
+        await callback.answer("Серия не найдена.")
+        return
+    
+    await callback.answer()
+
+# Waitlist offers
+@router.callback_query(WaitlistCallback.filter(F.action == "accept"))
+async def waitlist_accept(callback: CallbackQuery, callback_data: WaitlistCallback, user: dict, has_subscription: bool):
+    appointment = await waitlist.accept_offer(callback_data.id, callback.from_user.id)
+    
+    if appointment:
+        await callback.message.edit_text(f"Запись успешно создана на {appointment.get('date')} {appointment.get('time')}!", 
+                                    reply_markup=await client_keyboards.get_main_menu_keyboard(user["role"], has_subscription))
+    else:
+        await callback.message.edit_text("Предложение больше не действует. Вы остаетесь в листе ожидания.")
+    
+    await callback.answer()
+
+@router.callback_query(WaitlistCallback.filter(F.action == "decline"))
+async def waitlist_decline(callback: CallbackQuery, callback_data: WaitlistCallback):
+    if await waitlist.decline_offer(callback_data.id, callback.from_user.id):
+        await callback.message.edit_text("Вы отказались от этого времени и остаетесь в листе ожидания.")
+    else:
+        await callback.message.edit_text("Предложение больше не действует.")
+    await callback.answer()
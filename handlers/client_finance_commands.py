@@ -8,9 +8,16 @@ import logging
 import re
 from utils.db_api import finance_commands, service_commands, user_commands, appointment_commands
 from keyboards import finance_keyboards
+from keyboards.callback_data import FinancePeriodCallback, FinanceServiceCallback, FinanceClientCallback
+from keyboards.callback_data import ForecastCallback, TipCallback, PageCallback
+from keyboards.pagination import PAGE_SIZE
+from utils.callback_routes import CallbackRoutes
 
 router = Router()
 
+# Parametrized finance callbacks are resolved through a single routing table
+finance_callbacks = CallbackRoutes("finance")
+
 # Определяем состояния для финансовой аналитики
 class FinanceStates(StatesGroup):
     setup_materials = State()
@@ -68,10 +75,10 @@ async def show_finance_income(callback: types.CallbackQuery):
     await callback.answer()
 
 # Обработка выбора периода
-@router.callback_query(F.data.startswith("finance_period_"))
-async def handle_finance_period(callback: types.CallbackQuery):
+@finance_callbacks.route(FinancePeriodCallback)
+async def handle_finance_period(callback: types.CallbackQuery, callback_data: FinancePeriodCallback):
     """Handle finance period selection"""
-    period = callback.data.replace("finance_period_", "")
+    period = callback_data.period
     
     # Получаем текущую дату
     today = datetime.datetime.now().date()
@@ -254,16 +261,12 @@ async def show_finance_services(callback: types.CallbackQuery):
     await callback.answer()
 
 # Обработка выбора услуги
-@router.callback_query(F.data.startswith("finance_service_"))
-async def show_service_costs(callback: types.CallbackQuery):
-    """Show service costs"""
-    service_id = callback.data.replace("finance_service_", "")
-    
+async def render_service_costs(service_id):
+    """Build service costs message and keyboard, None if the service is missing"""
     # Получаем данные услуги
     service = await service_commands.get_service(service_id)
     if not service:
-        await callback.answer("Услуга не найдена", show_alert=True)
-        return
+        return None
     
     # Получаем расходы на услугу
     costs = await finance_commands.get_service_costs(service_id)
@@ -290,6 +293,17 @@ async def show_service_costs(callback: types.CallbackQuery):
     # Добавляем кнопки для редактирования расходов
     keyboard = await finance_keyboards.get_finance_service_cost_menu(service_id)
     
+    return message, keyboard
+
+@finance_callbacks.route(FinanceServiceCallback, action="view")
+async def show_service_costs(callback: types.CallbackQuery, callback_data: FinanceServiceCallback):
+    """Show service costs"""
+    rendered = await render_service_costs(callback_data.id)
+    if not rendered:
+        await callback.answer("Услуга не найдена", show_alert=True)
+        return
+    
+    message, keyboard = rendered
     await callback.message.edit_text(
         message,
         reply_markup=keyboard,
@@ -299,10 +313,10 @@ async def show_service_costs(callback: types.CallbackQuery):
     await callback.answer()
 
 # Обработка редактирования стоимости материалов
-@router.callback_query(F.data.startswith("edit_material_cost_"))
-async def edit_material_cost(callback: types.CallbackQuery, state: FSMContext):
+@finance_callbacks.route(FinanceServiceCallback, action="material")
+async def edit_material_cost(callback: types.CallbackQuery, callback_data: FinanceServiceCallback, state: FSMContext):
     """Edit material cost"""
-    service_id = callback.data.replace("edit_material_cost_", "")
+    service_id = callback_data.id
     
     # Сохраняем ID услуги в состоянии
     await state.update_data(service_id=service_id)
@@ -318,10 +332,10 @@ async def edit_material_cost(callback: types.CallbackQuery, state: FSMContext):
     await callback.answer()
 
 # Обработка редактирования стоимости времени
-@router.callback_query(F.data.startswith("edit_time_cost_"))
-async def edit_time_cost(callback: types.CallbackQuery, state: FSMContext):
+@finance_callbacks.route(FinanceServiceCallback, action="time")
+async def edit_time_cost(callback: types.CallbackQuery, callback_data: FinanceServiceCallback, state: FSMContext):
     """Edit time cost"""
-    service_id = callback.data.replace("edit_time_cost_", "")
+    service_id = callback_data.id
     
     # Сохраняем ID услуги в состоянии
     await state.update_data(service_id=service_id)
@@ -337,10 +351,10 @@ async def edit_time_cost(callback: types.CallbackQuery, state: FSMContext):
     await callback.answer()
 
 # Обработка редактирования других расходов
-@router.callback_query(F.data.startswith("edit_other_cost_"))
-async def edit_other_cost(callback: types.CallbackQuery, state: FSMContext):
+@finance_callbacks.route(FinanceServiceCallback, action="other")
+async def edit_other_cost(callback: types.CallbackQuery, callback_data: FinanceServiceCallback, state: FSMContext):
     """Edit other costs"""
-    service_id = callback.data.replace("edit_other_cost_", "")
+    service_id = callback_data.id
     
     # Сохраняем ID услуги в состоянии
     await state.update_data(service_id=service_id)
@@ -383,15 +397,10 @@ async def process_material_cost(message: types.Message, state: FSMContext):
         await state.clear()
         
         # Возвращаемся к просмотру расходов на услугу
-        callback = types.CallbackQuery(
-            id="1",
-            from_user=message.from_user,
-            chat_instance="1",
-            message=message,
-            data=f"finance_service_{service_id}"
-        )
-        
-        await show_service_costs(callback)
+        rendered = await render_service_costs(service_id)
+        if rendered:
+            text, keyboard = rendered
+            await message.answer(text, reply_markup=keyboard, parse_mode="Markdown")
         
     except ValueError:
         await message.answer("Ошибка: введите числовое значение (например, 100 или 150.50):")
@@ -424,15 +433,10 @@ async def process_time_cost(message: types.Message, state: FSMContext):
         await state.clear()
         
         # Возвращаемся к просмотру расходов на услугу
-        callback = types.CallbackQuery(
-            id="1",
-            from_user=message.from_user,
-            chat_instance="1",
-            message=message,
-            data=f"finance_service_{service_id}"
-        )
-        
-        await show_service_costs(callback)
+        rendered = await render_service_costs(service_id)
+        if rendered:
+            text, keyboard = rendered
+            await message.answer(text, reply_markup=keyboard, parse_mode="Markdown")
         
     except ValueError:
         await message.answer("Ошибка: введите числовое значение (например, 100 или 150.50):")
@@ -465,15 +469,10 @@ async def process_other_cost(message: types.Message, state: FSMContext):
         await state.clear()
         
         # Возвращаемся к просмотру расходов на услугу
-        callback = types.CallbackQuery(
-            id="1",
-            from_user=message.from_user,
-            chat_instance="1",
-            message=message,
-            data=f"finance_service_{service_id}"
-        )
-        
-        await show_service_costs(callback)
+        rendered = await render_service_costs(service_id)
+        if rendered:
+            text, keyboard = rendered
+            await message.answer(text, reply_markup=keyboard, parse_mode="Markdown")
         
     except ValueError:
         await message.answer("Ошибка: введите числовое значение (например, 100 или 150.50):")
@@ -506,11 +505,10 @@ async def back_to_finance_clients(callback: types.CallbackQuery):
     await show_finance_clients(callback)
 
 # Обработка меню "VIP клиенты"
-@router.callback_query(F.data == "finance_vip_clients")
-async def show_finance_vip_clients(callback: types.CallbackQuery):
-    """Show VIP clients"""
-    # Получаем список VIP клиентов
-    vip_clients = await finance_commands.get_vip_clients()
+async def show_vip_clients_page(callback: types.CallbackQuery, offset=0):
+    """Show one page of VIP clients"""
+    # Получаем одну страницу VIP клиентов
+    vip_clients, has_more = await finance_commands.get_vip_clients_page(offset, PAGE_SIZE)
     
     if not vip_clients:
         await callback.message.edit_text(
@@ -521,18 +519,15 @@ async def show_finance_vip_clients(callback: types.CallbackQuery):
             parse_mode="Markdown"
         )
     else:
-        keyboard = await finance_keyboards.get_vip_clients_menu(vip_clients)
+        keyboard = await finance_keyboards.get_vip_clients_menu(vip_clients, offset, has_more)
         
         message = "👑 *VIP клиенты*\n\n"
         message += "Список ваших VIP клиентов:\n\n"
         
-        for i, client in enumerate(vip_clients[:5], 1):
+        for i, client in enumerate(vip_clients, offset + 1):
             message += f"{i}. {client['name']}\n"
             message += f"   Визитов: {client['total_visits']}, Потрачено: {client['total_spent']} руб.\n\n"
         
-        if len(vip_clients) > 5:
-            message += f"... и еще {len(vip_clients) - 5} клиентов\n\n"
-        
         message += "Выберите клиента для просмотра подробной информации:"
         
         await callback.message.edit_text(
@@ -543,6 +538,17 @@ async def show_finance_vip_clients(callback: types.CallbackQuery):
     
     await callback.answer()
 
+@router.callback_query(F.data == "finance_vip_clients")
+async def show_finance_vip_clients(callback: types.CallbackQuery):
+    """Show VIP clients"""
+    await show_vip_clients_page(callback)
+
+# Обработка перехода по страницам VIP клиентов
+@finance_callbacks.route(PageCallback, action="vip")
+async def show_finance_vip_clients_page(callback: types.CallbackQuery, callback_data: PageCallback):
+    """Show another page of VIP clients"""
+    await show_vip_clients_page(callback, callback_data.offset)
+
 # Обработка возврата к VIP клиентам
 @router.callback_query(F.data == "back_to_finance_vip")
 async def back_to_finance_vip(callback: types.CallbackQuery):
@@ -550,16 +556,12 @@ async def back_to_finance_vip(callback: types.CallbackQuery):
     await show_finance_vip_clients(callback)
 
 # Обработка выбора клиента
-@router.callback_query(F.data.startswith("finance_client_"))
-async def show_client_stats(callback: types.CallbackQuery):
-    """Show client statistics"""
-    client_id = callback.data.replace("finance_client_", "")
-    
+async def render_client_stats(client_id):
+    """Build client statistics message and keyboard, None if the client is missing"""
     # Получаем данные о клиенте
     client = await user_commands.get_user(client_id)
     if not client:
-        await callback.answer("Клиент не найден", show_alert=True)
-        return
+        return None
     
     # Получаем статистику клиента
     stats = await finance_commands.get_client_stats(client_id)
@@ -593,6 +595,17 @@ async def show_client_stats(callback: types.CallbackQuery):
     # Добавляем кнопки для работы с клиентом
     keyboard = await finance_keyboards.get_client_stats_menu(client_id)
     
+    return message, keyboard
+
+@finance_callbacks.route(FinanceClientCallback, action="view")
+async def show_client_stats(callback: types.CallbackQuery, callback_data: FinanceClientCallback):
+    """Show client statistics"""
+    rendered = await render_client_stats(callback_data.id)
+    if not rendered:
+        await callback.answer("Клиент не найден", show_alert=True)
+        return
+    
+    message, keyboard = rendered
     await callback.message.edit_text(
         message,
         reply_markup=keyboard,
@@ -602,10 +615,10 @@ async def show_client_stats(callback: types.CallbackQuery):
     await callback.answer()
 
 # Обработка добавления заметки о клиенте
-@router.callback_query(F.data.startswith("add_client_note_"))
-async def add_client_note(callback: types.CallbackQuery, state: FSMContext):
+@finance_callbacks.route(FinanceClientCallback, action="note")
+async def add_client_note(callback: types.CallbackQuery, callback_data: FinanceClientCallback, state: FSMContext):
     """Add client note"""
-    client_id = callback.data.replace("add_client_note_", "")
+    client_id = callback_data.id
     
     # Получаем данные о клиенте
     client = await user_commands.get_user(client_id)
@@ -647,21 +660,16 @@ async def process_client_note(message: types.Message, state: FSMContext):
     await state.clear()
     
     # Возвращаемся к просмотру статистики клиента
-    callback = types.CallbackQuery(
-        id="1",
-        from_user=message.from_user,
-        chat_instance="1",
-        message=message,
-        data=f"finance_client_{client_id}"
-    )
-    
-    await show_client_stats(callback)
+    rendered = await render_client_stats(client_id)
+    if rendered:
+        text, keyboard = rendered
+        await message.answer(text, reply_markup=keyboard, parse_mode="Markdown")
 
 # Обработка отправки напоминания клиенту
-@router.callback_query(F.data.startswith("send_client_reminder_"))
-async def send_client_reminder(callback: types.CallbackQuery):
+@finance_callbacks.route(FinanceClientCallback, action="remind")
+async def send_client_reminder(callback: types.CallbackQuery, callback_data: FinanceClientCallback):
     """Send reminder to client"""
-    client_id = callback.data.replace("send_client_reminder_", "")
+    client_id = callback_data.id
     
     # Получаем данные о клиенте
     client = await user_commands.get_user(client_id)
@@ -683,10 +691,13 @@ async def send_client_reminder(callback: types.CallbackQuery):
     await callback.answer()
 
 # Обработка отметки о напоминании
-@router.callback_query(F.data.startswith("reminder_"))
-async def handle_reminder_action(callback: types.CallbackQuery):
+@finance_callbacks.route(FinanceClientCallback, action="called")
+@finance_callbacks.route(FinanceClientCallback, action="messaged")
+@finance_callbacks.route(FinanceClientCallback, action="cancel")
+async def handle_reminder_action(callback: types.CallbackQuery, callback_data: FinanceClientCallback):
     """Handle reminder action"""
-    action, client_id = callback.data.replace("reminder_", "").split("_")
+    action = callback_data.action
+    client_id = callback_data.id
     
     # Получаем данные о клиенте
     client = await user_commands.get_user(client_id)
@@ -704,14 +715,17 @@ async def handle_reminder_action(callback: types.CallbackQuery):
     await callback.answer(message, show_alert=True)
     
     # Возвращаемся к просмотру статистики клиента
-    await show_client_stats(callback)
+    rendered = await render_client_stats(client_id)
+    if rendered:
+        text, keyboard = rendered
+        await callback.message.edit_text(text, reply_markup=keyboard, parse_mode="Markdown")
 
 # Обработка меню "Активность клиентов"
 @router.callback_query(F.data == "finance_client_activity")
 async def show_client_activity(callback: types.CallbackQuery):
     """Show client activity"""
     # Получаем данные о записях
-    appointments = await appointment_commands.get_all_appointments()
+    appointments = await appointment_commands.get_appointments_table()
     
     if not appointments:
         await callback.message.edit_text(
@@ -727,16 +741,13 @@ async def show_client_activity(callback: types.CallbackQuery):
     weekday_counts = [0, 0, 0, 0, 0, 0, 0]  # Пн, Вт, ..., Вс
     month_counts = [0] * 12  # Янв, Фев, ..., Дек
     
-    for appt in appointments:
-        try:
-            date_obj = datetime.datetime.strptime(appt["date"], "%Y-%m-%d")
+    for date_obj, count in appointments.count_by("day").items():
+        if date_obj:
             weekday = date_obj.weekday()
             month = date_obj.month - 1  # Индекс с 0
             
-            weekday_counts[weekday] += 1
-            month_counts[month] += 1
-        except:
-            pass
+            weekday_counts[weekday] += count
+            month_counts[month] += count
     
     # Находим самый и наименее популярный день недели
     max_weekday = weekday_counts.index(max(weekday_counts))
@@ -790,10 +801,10 @@ async def show_finance_forecast(callback: types.CallbackQuery):
     await callback.answer()
 
 # Обработка выбора периода прогноза
-@router.callback_query(F.data.startswith("forecast_"))
-async def handle_forecast_period(callback: types.CallbackQuery):
+@finance_callbacks.route(ForecastCallback)
+async def handle_forecast_period(callback: types.CallbackQuery, callback_data: ForecastCallback):
     """Handle forecast period selection"""
-    days = int(callback.data.replace("forecast_", "").replace("_days", ""))
+    days = callback_data.days
     
     # Получаем прогноз на указанный период
     forecast = await finance_commands.calculate_profit_forecast(callback.from_user.id, days)
@@ -856,10 +867,10 @@ async def show_finance_tips(callback: types.CallbackQuery):
     await callback.answer()
 
 # Обработка выбора совета
-@router.callback_query(F.data.startswith("tip_"))
-async def show_specific_tip(callback: types.CallbackQuery):
+@finance_callbacks.route(TipCallback)
+async def show_specific_tip(callback: types.CallbackQuery, callback_data: TipCallback):
     """Show specific business tip"""
-    tip_type = callback.data.replace("tip_", "")
+    tip_type = callback_data.topic
     
     if tip_type == "increase_profit":
         message = "🚀 *Как увеличить прибыль*\n\n"
@@ -1153,6 +1164,9 @@ async def process_setup_other(message: types.Message, state: FSMContext):
     except ValueError:
         await message.answer("Пожалуйста, введите числовое значение. Например: 5000 или 7500")
 
+# Подключаем таблицу маршрутов параметризованных кнопок
+finance_callbacks.register(router)
+
 # Функция для еженедельного напоминания о расходах
 async def send_weekly_expense_reminder(bot):
     """Send weekly expense reminder to admins"""
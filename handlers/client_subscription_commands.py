@@ -135,8 +135,8 @@ async def select_plan(callback: CallbackQuery, state: FSMContext, user: dict):
         price = base_price * months
         discount_text = "0%"
     
-    # Save price information
-    await state.update_data(price=price, months=months)
+    # Save price information; the payment ID makes a repeated confirmation pay once
+    await state.update_data(price=price, months=months, payment_id=subscription_commands.new_payment_id())
     
     # Confirmation message
     message_text = (
@@ -167,12 +167,22 @@ async def confirm_subscription(callback: CallbackQuery, state: FSMContext, user:
     months = data.get('months', 1)
     
     # This is a placeholder - in a real system, you'd process payment here
-    # For this example, we'll just activate the subscription
+    # For this example, we'll just record the payment and verify it at once
     user_id = callback.from_user.id
-    days = months * 30
+    payment = await subscription_commands.record_payment(
+        user_id, months, data.get('price', 0), payment_id=data.get('payment_id')
+    )
     
-    # Create/extend subscription
-    await subscription_commands.create_subscription(user_id, days)
+    # Verify the payment and create/extend subscription
+    subscription = await subscription_commands.verify_payment(payment['id']) if payment else None
+    if not subscription:
+        # The state keeps the payment ID, so confirming again retries the same payment
+        await callback.message.edit_text(
+            "Не удалось активировать подписку. Попробуйте еще раз.",
+            reply_markup=await client_keyboards.get_subscription_confirm_keyboard()
+        )
+        await callback.answer()
+        return
     
     await callback.message.edit_text(
         f"Поздравляем! Ваша подписка на {months} {'месяц' if months == 1 else 'месяцев'} активирована.",
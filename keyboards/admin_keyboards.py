@@ -1,6 +1,12 @@
 
+from aiogram.types import InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
+from keyboards.callback_data import TemplateCategoryCallback, AdminServiceCallback, AdminCategoryCallback, AdminOfferCallback
+from keyboards.callback_data import AdminMasterCallback, get_template_category_key
+from keyboards.callback_data import AppointmentCallback, PaymentMethodCallback
+from keyboards.pagination import get_page_buttons
+
 def get_admin_keyboard():
     """Get main admin keyboard"""
     builder = InlineKeyboardBuilder()
@@ -21,6 +27,8 @@ def get_services_management_keyboard():
     builder.button(text="✨ Быстрое создание услуг", callback_data="template_categories")
     builder.button(text="➕ Добавить услугу", callback_data="add_service")
     builder.button(text="📋 Просмотреть услуги", callback_data="view_services")
+    builder.button(text="📤 Экспорт прайс-листа (CSV)", callback_data="export_price_list")
+    builder.button(text="📥 Импорт прайс-листа (CSV)", callback_data="import_price_list")
     builder.button(text="◀️ Назад", callback_data="back_to_admin")
     
     builder.adjust(1)
@@ -31,7 +39,7 @@ def get_template_categories_keyboard(categories):
     builder = InlineKeyboardBuilder()
     
     for category in categories:
-        builder.button(text=f"🔹 {category}", callback_data=f"template_category_{category}")
+        builder.button(text=f"🔹 {category}", callback_data=TemplateCategoryCallback(key=get_template_category_key(category)))
     
     builder.button(text="◀️ Назад", callback_data="admin_services")
     
@@ -42,36 +50,43 @@ def get_category_services_price_keyboard(category_id):
     """Get keyboard to set prices for category services"""
     builder = InlineKeyboardBuilder()
     
-    builder.button(text="💰 Установить цену для всех услуг", callback_data=f"update_category_price_{category_id}")
-    builder.button(text="📋 Просмотреть услуги в категории", callback_data=f"view_category_{category_id}")
+    builder.button(text="💰 Установить цену для всех услуг", callback_data=AdminCategoryCallback(action="price", id=str(category_id)))
+    builder.button(text="📋 Просмотреть услуги в категории", callback_data=AdminCategoryCallback(action="list", id=str(category_id)))
     builder.button(text="◀️ Назад", callback_data="admin_services")
     
     builder.adjust(1)
     return builder.as_markup()
 
-def get_service_categories_keyboard(services_by_category):
-    """Get keyboard with service categories"""
+def get_service_categories_keyboard(services_by_category, offset=0, has_more=False):
+    """Get keyboard with one page of service categories"""
     builder = InlineKeyboardBuilder()
     
     for category, services in services_by_category.items():
-        builder.button(text=f"📁 {category} ({len(services)})", callback_data=f"view_category_services_{category}")
-    
-    builder.button(text="◀️ Назад", callback_data="admin_services")
+        # Uncategorized services are grouped under an empty category ID
+        category_id = services[0].get('category_id') if category != "Без категории" else ""
+        builder.button(
+            text=f"📁 {category} ({len(services)})",
+            callback_data=AdminCategoryCallback(action="services", id=str(category_id or ""))
+        )
     
     builder.adjust(1)
+    builder.row(*get_page_buttons("services", offset, has_more))
+    builder.row(InlineKeyboardButton(text="◀️ Назад", callback_data="admin_services"))
+    
     return builder.as_markup()
 
-def get_category_services_keyboard(services, category_name):
-    """Get keyboard with services in a category"""
+def get_category_services_keyboard(services, category_id="", offset=0, has_more=False):
+    """Get keyboard with one page of services in a category"""
     builder = InlineKeyboardBuilder()
     
     for service in services:
-        builder.button(text=f"🔸 {service['name']} - {service.get('price', '0')} руб.", callback_data=f"admin_view_service_{service['id']}")
-    
-    builder.button(text="◀️ Назад к категориям", callback_data="view_services")
-    builder.button(text="◀️ Назад к управлению услугами", callback_data="admin_services")
+        builder.button(text=f"🔸 {service['name']} - {service.get('price', '0')} руб.", callback_data=AdminServiceCallback(action="view", id=str(service['id'])))
     
     builder.adjust(1)
+    builder.row(*get_page_buttons("category_services", offset, has_more, key=str(category_id or "")))
+    builder.row(InlineKeyboardButton(text="◀️ Назад к категориям", callback_data="view_services"))
+    builder.row(InlineKeyboardButton(text="◀️ Назад к управлению услугами", callback_data="admin_services"))
+    
     return builder.as_markup()
 
 def get_back_to_services_keyboard():
@@ -86,8 +101,8 @@ def get_service_actions_keyboard(service_id):
     """Get keyboard with service actions"""
     builder = InlineKeyboardBuilder()
     
-    builder.button(text="✏️ Редактировать", callback_data=f"edit_service_{service_id}")
-    builder.button(text="🗑 Удалить", callback_data=f"delete_service_confirm_{service_id}")
+    builder.button(text="✏️ Редактировать", callback_data=AdminServiceCallback(action="edit", id=str(service_id)))
+    builder.button(text="🗑 Удалить", callback_data=AdminServiceCallback(action="delete", id=str(service_id)))
     builder.button(text="◀️ Назад", callback_data="view_services")
     
     builder.adjust(1)
@@ -97,12 +112,12 @@ def get_edit_service_keyboard(service_id):
     """Get keyboard for editing service"""
     builder = InlineKeyboardBuilder()
     
-    builder.button(text="📝 Изменить название", callback_data=f"edit_service_name_{service_id}")
-    builder.button(text="📝 Изменить описание", callback_data=f"edit_service_description_{service_id}")
-    builder.button(text="💰 Изменить цену", callback_data=f"edit_service_price_{service_id}")
-    builder.button(text="⏱ Изменить продолжительность", callback_data=f"edit_service_duration_{service_id}")
-    builder.button(text="📁 Изменить категорию", callback_data=f"edit_service_category_{service_id}")
-    builder.button(text="◀️ Назад", callback_data=f"admin_view_service_{service_id}")
+    builder.button(text="📝 Изменить название", callback_data=AdminServiceCallback(action="name", id=str(service_id)))
+    builder.button(text="📝 Изменить описание", callback_data=AdminServiceCallback(action="description", id=str(service_id)))
+    builder.button(text="💰 Изменить цену", callback_data=AdminServiceCallback(action="price", id=str(service_id)))
+    builder.button(text="⏱ Изменить продолжительность", callback_data=AdminServiceCallback(action="duration", id=str(service_id)))
+    builder.button(text="📁 Изменить категорию", callback_data=AdminServiceCallback(action="category", id=str(service_id)))
+    builder.button(text="◀️ Назад", callback_data=AdminServiceCallback(action="view", id=str(service_id)))
     
     builder.adjust(1)
     return builder.as_markup()
@@ -118,12 +133,26 @@ def get_masters_management_keyboard():
     builder.adjust(1)
     return builder.as_markup()
 
+def get_masters_list_keyboard(masters, offset=0, has_more=False):
+    """Get keyboard for one page of the masters list"""
+    builder = InlineKeyboardBuilder()
+    
+    for master in masters:
+        builder.button(text=f"👤 {master['name']}", callback_data=AdminMasterCallback(action="view", id=str(master['id'])))
+    
+    builder.adjust(1)
+    builder.row(*get_page_buttons("masters", offset, has_more))
+    builder.row(InlineKeyboardButton(text="➕ Добавить мастера", callback_data="add_master"))
+    builder.row(InlineKeyboardButton(text="◀️ Назад", callback_data="admin_masters"))
+    
+    return builder.as_markup()
+
 def get_master_actions_keyboard(master_id):
     """Get keyboard with master actions"""
     builder = InlineKeyboardBuilder()
     
-    builder.button(text="✏️ Редактировать", callback_data=f"edit_master_{master_id}")
-    builder.button(text="🗑 Удалить", callback_data=f"delete_master_confirm_{master_id}")
+    builder.button(text="✏️ Редактировать", callback_data=AdminMasterCallback(action="edit", id=str(master_id)))
+    builder.button(text="🗑 Удалить", callback_data=AdminMasterCallback(action="delete", id=str(master_id)))
     builder.button(text="◀️ Назад", callback_data="view_masters_admin")
     
     builder.adjust(1)
@@ -133,11 +162,11 @@ def get_edit_master_keyboard(master_id):
     """Get keyboard for editing master"""
     builder = InlineKeyboardBuilder()
     
-    builder.button(text="📝 Изменить имя", callback_data=f"edit_master_name_{master_id}")
-    builder.button(text="📱 Изменить Telegram", callback_data=f"edit_master_telegram_{master_id}")
-    builder.button(text="📍 Изменить адрес", callback_data=f"edit_master_address_{master_id}")
-    builder.button(text="🗺 Изменить местоположение", callback_data=f"edit_master_location_{master_id}")
-    builder.button(text="◀️ Назад", callback_data=f"admin_view_master_{master_id}")
+    builder.button(text="📝 Изменить имя", callback_data=AdminMasterCallback(action="name", id=str(master_id)))
+    builder.button(text="📱 Изменить Telegram", callback_data=AdminMasterCallback(action="telegram", id=str(master_id)))
+    builder.button(text="📍 Изменить адрес", callback_data=AdminMasterCallback(action="address", id=str(master_id)))
+    builder.button(text="🗺 Изменить местоположение", callback_data=AdminMasterCallback(action="location", id=str(master_id)))
+    builder.button(text="◀️ Назад", callback_data=AdminMasterCallback(action="view", id=str(master_id)))
     
     builder.adjust(1)
     return builder.as_markup()
@@ -156,31 +185,53 @@ def get_date_appointments_admin_keyboard(appointments, date):
     """Get keyboard with appointments for a specific date"""
     builder = InlineKeyboardBuilder()
     
-    for appointment in appointments:
-        builder.button(text=f"Запись {appointment['id']} - {appointment['time']}", callback_data=f"admin_view_appointment_{appointment['id']}")
+    # Added with one call: the builder copies all its buttons on every add
+    builder.row(*[
+        InlineKeyboardButton(
+            text=f"Запись {appointment['id']} - {appointment['time']}",
+            callback_data=AppointmentCallback(action="view", id=str(appointment['id'])).pack()
+        )
+        for appointment in appointments
+    ], width=1)
     
     builder.button(text="◀️ Назад", callback_data="admin_appointments")
     
     builder.adjust(1)
     return builder.as_markup()
 
+def get_all_appointments_keyboard(appointments, offset=0, has_more=False):
+    """Get keyboard with one page of all appointments"""
+    builder = InlineKeyboardBuilder()
+    
+    for appointment in appointments:
+        builder.button(
+            text=f"Запись {appointment['id']} - {appointment.get('date')} {appointment.get('time')}",
+            callback_data=AppointmentCallback(action="view", id=str(appointment['id']))
+        )
+    
+    builder.adjust(1)
+    builder.row(*get_page_buttons("appointments", offset, has_more))
+    builder.row(InlineKeyboardButton(text="◀️ Назад", callback_data="admin_appointments"))
+    
+    return builder.as_markup()
+
 def get_appointment_actions_keyboard(appointment_id, status):
     """Get keyboard with appointment actions"""
     builder = InlineKeyboardBuilder()
     
     if status == "pending":
-        builder.button(text="✅ Подтвердить", callback_data=f"admin_confirm_appointment_{appointment_id}")
+        builder.button(text="✅ Подтвердить", callback_data=AppointmentCallback(action="confirm", id=str(appointment_id)))
     
     if status != "completed":
-        builder.button(text="✓ Отметить выполненной", callback_data=f"mark_completed_{appointment_id}")
+        builder.button(text="✓ Отметить выполненной", callback_data=AppointmentCallback(action="completed", id=str(appointment_id)))
     
     if status != "paid":
-        builder.button(text="💰 Отметить оплаченной", callback_data=f"mark_paid_{appointment_id}")
+        builder.button(text="💰 Отметить оплаченной", callback_data=AppointmentCallback(action="paid", id=str(appointment_id)))
     
-    builder.button(text="💵 Наличные", callback_data=f"set_payment_cash_{appointment_id}")
-    builder.button(text="💳 Карта/Терминал", callback_data=f"set_payment_card_{appointment_id}")
-    builder.button(text="📲 Перевод", callback_data=f"set_payment_transfer_{appointment_id}")
-    builder.button(text="❌ Отменить запись", callback_data=f"admin_cancel_appointment_{appointment_id}")
+    builder.button(text="💵 Наличные", callback_data=PaymentMethodCallback(method="cash", id=str(appointment_id)))
+    builder.button(text="💳 Карта/Терминал", callback_data=PaymentMethodCallback(method="card", id=str(appointment_id)))
+    builder.button(text="📲 Перевод", callback_data=PaymentMethodCallback(method="transfer", id=str(appointment_id)))
+    builder.button(text="❌ Отменить запись", callback_data=AppointmentCallback(action="cancel", id=str(appointment_id)))
     builder.button(text="◀️ Назад", callback_data="admin_appointments")
     
     builder.adjust(1)
@@ -190,8 +241,8 @@ def get_cancel_appointment_keyboard(appointment_id):
     """Get keyboard for cancelling appointment"""
     builder = InlineKeyboardBuilder()
     
-    builder.button(text="✅ Подтвердить отмену", callback_data=f"confirm_cancel_appointment_{appointment_id}")
-    builder.button(text="◀️ Назад", callback_data=f"admin_view_appointment_{appointment_id}")
+    builder.button(text="✅ Подтвердить отмену", callback_data=AppointmentCallback(action="cancel_ok", id=str(appointment_id)))
+    builder.button(text="◀️ Назад", callback_data=AppointmentCallback(action="view", id=str(appointment_id)))
     
     builder.adjust(1)
     return builder.as_markup()
@@ -212,7 +263,7 @@ def get_all_categories_keyboard(categories):
     builder = InlineKeyboardBuilder()
     
     for category in categories:
-        builder.button(text=f"📁 {category['name']}", callback_data=f"admin_view_category_{category['id']}")
+        builder.button(text=f"📁 {category['name']}", callback_data=AdminCategoryCallback(action="view", id=str(category['id'])))
     
     builder.button(text="◀️ Назад", callback_data="admin_categories")
     
@@ -223,9 +274,9 @@ def get_category_actions_keyboard(category_id):
     """Get keyboard with category actions"""
     builder = InlineKeyboardBuilder()
     
-    builder.button(text="✏️ Редактировать", callback_data=f"edit_category_{category_id}")
-    builder.button(text="🗑 Удалить", callback_data=f"delete_category_confirm_{category_id}")
-    builder.button(text="📋 Услуги категории", callback_data=f"view_category_{category_id}")
+    builder.button(text="✏️ Редактировать", callback_data=AdminCategoryCallback(action="edit", id=str(category_id)))
+    builder.button(text="🗑 Удалить", callback_data=AdminCategoryCallback(action="delete", id=str(category_id)))
+    builder.button(text="📋 Услуги категории", callback_data=AdminCategoryCallback(action="list", id=str(category_id)))
     builder.button(text="◀️ Назад", callback_data="view_categories")
     
     builder.adjust(1)
@@ -235,8 +286,8 @@ def get_edit_category_keyboard(category_id):
     """Get keyboard for editing category"""
     builder = InlineKeyboardBuilder()
     
-    builder.button(text="📝 Изменить название", callback_data=f"edit_category_name_{category_id}")
-    builder.button(text="◀️ Назад", callback_data=f"admin_view_category_{category_id}")
+    builder.button(text="📝 Изменить название", callback_data=AdminCategoryCallback(action="rename", id=str(category_id)))
+    builder.button(text="◀️ Назад", callback_data=AdminCategoryCallback(action="view", id=str(category_id)))
     
     builder.adjust(1)
     return builder.as_markup()
@@ -257,7 +308,7 @@ def get_all_offers_keyboard(offers):
     builder = InlineKeyboardBuilder()
     
     for offer in offers:
-        builder.button(text=f"🌟 {offer['name']}", callback_data=f"admin_view_offer_{offer['id']}")
+        builder.button(text=f"🌟 {offer['name']}", callback_data=AdminOfferCallback(action="view", id=str(offer['id'])))
     
     builder.button(text="◀️ Назад", callback_data="admin_offers")
     
@@ -268,8 +319,8 @@ def get_offer_actions_keyboard(offer_id):
     """Get keyboard with offer actions"""
     builder = InlineKeyboardBuilder()
     
-    builder.button(text="✏️ Редактировать", callback_data=f"edit_offer_{offer_id}")
-    builder.button(text="🗑 Удалить", callback_data=f"delete_offer_confirm_{offer_id}")
+    builder.button(text="✏️ Редактировать", callback_data=AdminOfferCallback(action="edit", id=str(offer_id)))
+    builder.button(text="🗑 Удалить", callback_data=AdminOfferCallback(action="delete", id=str(offer_id)))
     builder.button(text="◀️ Назад", callback_data="view_offers")
     
     builder.adjust(1)
@@ -279,11 +330,11 @@ def get_edit_offer_keyboard(offer_id):
     """Get keyboard for editing offer"""
     builder = InlineKeyboardBuilder()
     
-    builder.button(text="📝 Изменить название", callback_data=f"edit_offer_name_{offer_id}")
-    builder.button(text="📝 Изменить описание", callback_data=f"edit_offer_description_{offer_id}")
-    builder.button(text="💰 Изменить цену", callback_data=f"edit_offer_price_{offer_id}")
-    builder.button(text="⏱ Изменить продолжительность", callback_data=f"edit_offer_duration_{offer_id}")
-    builder.button(text="◀️ Назад", callback_data=f"admin_view_offer_{offer_id}")
+    builder.button(text="📝 Изменить название", callback_data=AdminOfferCallback(action="name", id=str(offer_id)))
+    builder.button(text="📝 Изменить описание", callback_data=AdminOfferCallback(action="description", id=str(offer_id)))
+    builder.button(text="💰 Изменить цену", callback_data=AdminOfferCallback(action="price", id=str(offer_id)))
+    builder.button(text="⏱ Изменить продолжительность", callback_data=AdminOfferCallback(action="duration", id=str(offer_id)))
+    builder.button(text="◀️ Назад", callback_data=AdminOfferCallback(action="view", id=str(offer_id)))
     
     builder.adjust(1)
     return builder.as_markup()
@@ -300,16 +351,17 @@ def get_confirm_delete_keyboard(entity_id, entity_type):
     """Get confirmation keyboard for deletion"""
     builder = InlineKeyboardBuilder()
     
-    builder.button(text="✅ Да, удалить", callback_data=f"confirm_delete_{entity_type}_{entity_id}")
-    
-    if entity_type == "service":
-        builder.button(text="❌ Отмена", callback_data=f"admin_view_service_{entity_id}")
-    elif entity_type == "category":
-        builder.button(text="❌ Отмена", callback_data=f"admin_view_category_{entity_id}")
-    elif entity_type == "master":
-        builder.button(text="❌ Отмена", callback_data=f"admin_view_master_{entity_id}")
-    elif entity_type == "offer":
-        builder.button(text="❌ Отмена", callback_data=f"admin_view_offer_{entity_id}")
+    factories = {
+        "service": AdminServiceCallback,
+        "category": AdminCategoryCallback,
+        "offer": AdminOfferCallback,
+        "master": AdminMasterCallback,
+    }
+    factory = factories.get(entity_type)
+    
+    if factory:
+        builder.button(text="✅ Да, удалить", callback_data=factory(action="delete_ok", id=str(entity_id)))
+        builder.button(text="❌ Отмена", callback_data=factory(action="view", id=str(entity_id)))
     else:
         builder.button(text="❌ Отмена", callback_data="back_to_admin")
     
@@ -0,0 +1,103 @@
+import hashlib
+
+from aiogram.filters.callback_data import CallbackData
+
+# Compact callback data for inline keyboards.
+#
+# Every factory packs into "<prefix>:<field>:..." with a short prefix and
+# entity IDs instead of names, so callback data always stays well under
+# Telegram's 64-byte limit. Factories whose first field names an action
+# (or a view) are routed by (prefix, action) through utils.callback_routes.
+
+
+# Paginated list views
+class PageCallback(CallbackData, prefix="pg"):
+    view: str
+    # Row offset of the first record on the page
+    offset: int
+    # Optional view argument, e.g. a category ID
+    key: str = ""
+
+
+# Booking flow
+class CategoryCallback(CallbackData, prefix="c"):
+    id: str
+
+class ServiceCallback(CallbackData, prefix="s"):
+    id: str
+
+class MasterCallback(CallbackData, prefix="m"):
+    id: str
+
+# Client's own appointments
+class ClientAppointmentCallback(CallbackData, prefix="ca"):
+    action: str
+    id: str
+
+# Recurring series of a client's appointment
+class SeriesCallback(CallbackData, prefix="sr"):
+    action: str
+    # Appointment ID to repeat, or series ID to cancel
+    id: str
+    weeks: int = 0
+
+# Waitlist offers, by waitlist entry ID
+class WaitlistCallback(CallbackData, prefix="wl"):
+    action: str
+    id: str
+
+
+# Admin panel
+def get_template_category_key(name):
+    """Get a short key of a template category name that fits in callback data"""
+    return hashlib.sha1(name.encode()).hexdigest()[:10]
+
+class TemplateCategoryCallback(CallbackData, prefix="tc"):
+    # Key of the template category name, stable when other categories change
+    key: str
+
+class AdminServiceCallback(CallbackData, prefix="as"):
+    action: str
+    id: str
+
+class AdminCategoryCallback(CallbackData, prefix="ac"):
+    action: str
+    id: str
+
+class AdminOfferCallback(CallbackData, prefix="ao"):
+    action: str
+    id: str
+
+class AdminMasterCallback(CallbackData, prefix="am"):
+    action: str
+    id: str
+
+class AppointmentCallback(CallbackData, prefix="ap"):
+    action: str
+    id: str
+
+class AppointmentDateCallback(CallbackData, prefix="ad"):
+    date: str
+
+class PaymentMethodCallback(CallbackData, prefix="pm"):
+    method: str
+    id: str
+
+
+# Finance section
+class FinancePeriodCallback(CallbackData, prefix="fp"):
+    period: str
+
+class FinanceServiceCallback(CallbackData, prefix="fs"):
+    action: str
+    id: str
+
+class FinanceClientCallback(CallbackData, prefix="fc"):
+    action: str
+    id: str
+
+class ForecastCallback(CallbackData, prefix="fd"):
+    days: int
+
+class TipCallback(CallbackData, prefix="tp"):
+    topic: str
@@ -85,18 +85,23 @@ async def get_main_menu_keyboard(user_role="client", has_subscription=True):
 # Add the missing categories keyboard function
 async def get_categories_keyboard():
     """Get categories keyboard"""
-    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-    from utils.db_api import service_commands
+    from utils import catalog_snapshot
     
-    # Get all categories
-    categories = await service_commands.get_categories()
+    # The keyboard is prebuilt once per catalog version
+    catalog = await catalog_snapshot.get_catalog()
+    return catalog.categories_keyboard
+
+def build_categories_keyboard(categories):
+    """Build categories keyboard from a list of categories"""
+    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+    from keyboards.callback_data import CategoryCallback
     
     # Create buttons for each category
     buttons = []
     for category in categories:
         buttons.append([InlineKeyboardButton(
             text=category.get('name', 'Unknown'), 
-            callback_data=category.get('name', 'unknown')
+            callback_data=CategoryCallback(id=str(category.get('id'))).pack()
         )])
     
     # Add back button
@@ -107,36 +112,46 @@ async def get_categories_keyboard():
 # Add other missing keyboard functions 
 async def get_services_keyboard(services):
     """Get services keyboard"""
+    return build_services_keyboard(services)
+
+def build_services_keyboard(services):
+    """Build services keyboard from a list of services"""
     from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+    from keyboards.callback_data import ServiceCallback
     
     buttons = []
     
     # Add a button for each service
     for service in services:
-        service_id = service.get('id')
+        service_id = str(service.get('id'))
         service_name = service.get('name')
         service_price = service.get('price', '0')
         
         button_text = f"{service_name} - {service_price} руб."
-        buttons.append([InlineKeyboardButton(text=button_text, callback_data=service_id)])
+        buttons.append([InlineKeyboardButton(text=button_text, callback_data=ServiceCallback(id=service_id).pack())])
     
     # Add back button
     buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_categories")])
     
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-async def get_masters_keyboard(masters):
+async def get_masters_keyboard(masters, any_master=False):
     """Get masters keyboard"""
     from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+    from keyboards.callback_data import MasterCallback
     
     buttons = []
     
+    # Let the bot choose the least loaded free master
+    if any_master:
+        buttons.append([InlineKeyboardButton(text="👥 Любой свободный мастер", callback_data=MasterCallback(id="any").pack())])
+    
     # Add a button for each master
     for master in masters:
-        master_id = master.get('id')
+        master_id = str(master.get('id'))
         master_name = master.get('name')
         
-        buttons.append([InlineKeyboardButton(text=master_name, callback_data=master_id)])
+        buttons.append([InlineKeyboardButton(text=master_name, callback_data=MasterCallback(id=master_id).pack())])
     
     # Add back button
     buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_services")])
@@ -158,6 +173,42 @@ async def get_times_keyboard(times):
     
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+async def get_waitlist_join_keyboard():
+    """Get keyboard offering to wait for a free slot"""
+    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+    
+    buttons = [
+        [InlineKeyboardButton(text="🔔 Сообщить, если освободится", callback_data="waitlist_join")],
+        [InlineKeyboardButton(text="❌ Отменить", callback_data="cancel_booking")]
+    ]
+    
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+async def get_series_interval_keyboard(appointment_id):
+    """Get keyboard choosing how often to repeat an appointment"""
+    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+    from keyboards.callback_data import SeriesCallback
+    
+    buttons = [
+        [InlineKeyboardButton(text=text, callback_data=SeriesCallback(action="create", id=str(appointment_id), weeks=weeks).pack())]
+        for weeks, text in ((1, "Каждую неделю"), (2, "Каждые 2 недели"), (3, "Каждые 3 недели"), (4, "Каждые 4 недели"))
+    ]
+    buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="my_appointments")])
+    
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+async def get_series_keyboard(series_id):
+    """Get keyboard of a created series"""
+    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+    from keyboards.callback_data import SeriesCallback
+    
+    buttons = [
+        [InlineKeyboardButton(text="🚫 Отменить серию", callback_data=SeriesCallback(action="cancel", id=str(series_id)).pack())],
+        [InlineKeyboardButton(text="📋 Мои записи", callback_data="my_appointments")]
+    ]
+    
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
 async def get_confirmation_keyboard():
     """Get confirmation keyboard"""
     from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
@@ -196,3 +247,28 @@ async def get_appointments_keyboard(appointments):
     buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_main")])
     
     return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+async def get_date_appointments_keyboard(appointments):
+    """Get keyboard of a client's appointments on one date"""
+    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+    from keyboards.callback_data import ClientAppointmentCallback
+    
+    buttons = []
+    
+    # Appointments that are still ahead can be moved to another slot
+    for appointment in sorted(appointments, key=lambda a: str(a.get('time'))):
+        if appointment.get('status') in ('pending', 'confirmed'):
+            service_name = appointment.get('service_name', 'Услуга')
+            buttons.append([InlineKeyboardButton(
+                text=f"🔁 Перенести {appointment.get('time')} {service_name}",
+                callback_data=ClientAppointmentCallback(action="reschedule", id=str(appointment.get('id'))).pack()
+            )])
+            buttons.append([InlineKeyboardButton(
+                text=f"🔂 Повторять {appointment.get('time')} {service_name}",
+                callback_data=ClientAppointmentCallback(action="repeat", id=str(appointment.get('id'))).pack()
+            )])
+    
+    # Add back button
+    buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="my_appointments")])
+    
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
@@ -1,6 +1,10 @@
 
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
+from keyboards.callback_data import FinancePeriodCallback, FinanceServiceCallback, FinanceClientCallback
+from keyboards.callback_data import ForecastCallback, TipCallback
+from keyboards.pagination import get_page_buttons
+
 async def get_finance_main_menu():
     """Get finance main menu keyboard"""
     buttons = [
@@ -17,12 +21,12 @@ async def get_finance_main_menu():
 async def get_finance_period_menu():
     """Get finance period selection menu"""
     buttons = [
-        [InlineKeyboardButton(text="📅 Сегодня", callback_data="finance_period_today")],
-        [InlineKeyboardButton(text="📅 Вчера", callback_data="finance_period_yesterday")],
-        [InlineKeyboardButton(text="📅 Текущая неделя", callback_data="finance_period_week")],
-        [InlineKeyboardButton(text="📅 Текущий месяц", callback_data="finance_period_month")],
-        [InlineKeyboardButton(text="📅 Последние 30 дней", callback_data="finance_period_30days")],
-        [InlineKeyboardButton(text="🗓 Выбрать другой период", callback_data="finance_period_custom")],
+        [InlineKeyboardButton(text="📅 Сегодня", callback_data=FinancePeriodCallback(period="today").pack())],
+        [InlineKeyboardButton(text="📅 Вчера", callback_data=FinancePeriodCallback(period="yesterday").pack())],
+        [InlineKeyboardButton(text="📅 Текущая неделя", callback_data=FinancePeriodCallback(period="week").pack())],
+        [InlineKeyboardButton(text="📅 Текущий месяц", callback_data=FinancePeriodCallback(period="month").pack())],
+        [InlineKeyboardButton(text="📅 Последние 30 дней", callback_data=FinancePeriodCallback(period="30days").pack())],
+        [InlineKeyboardButton(text="🗓 Выбрать другой период", callback_data=FinancePeriodCallback(period="custom").pack())],
         [InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_finance")]
     ]
     
@@ -42,7 +46,7 @@ async def get_finance_services_menu(services):
             # Truncate long service names
             if len(service_name) > 30:
                 service_name = service_name[:27] + "..."
-            row.append(InlineKeyboardButton(text=service_name, callback_data=f"finance_service_{service_id}"))
+            row.append(InlineKeyboardButton(text=service_name, callback_data=FinanceServiceCallback(action="view", id=str(service_id)).pack()))
         buttons.append(row)
     
     # Add back button
@@ -53,9 +57,9 @@ async def get_finance_services_menu(services):
 async def get_finance_service_cost_menu(service_id):
     """Get finance service cost menu"""
     buttons = [
-        [InlineKeyboardButton(text="✏️ Стоимость материалов", callback_data=f"edit_material_cost_{service_id}")],
-        [InlineKeyboardButton(text="✏️ Стоимость времени", callback_data=f"edit_time_cost_{service_id}")],
-        [InlineKeyboardButton(text="✏️ Другие расходы", callback_data=f"edit_other_cost_{service_id}")],
+        [InlineKeyboardButton(text="✏️ Стоимость материалов", callback_data=FinanceServiceCallback(action="material", id=str(service_id)).pack())],
+        [InlineKeyboardButton(text="✏️ Стоимость времени", callback_data=FinanceServiceCallback(action="time", id=str(service_id)).pack())],
+        [InlineKeyboardButton(text="✏️ Другие расходы", callback_data=FinanceServiceCallback(action="other", id=str(service_id)).pack())],
         [InlineKeyboardButton(text="⬅️ Назад к услугам", callback_data="back_to_finance_services")]
     ]
     
@@ -72,8 +76,8 @@ async def get_finance_clients_menu():
     
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
-async def get_vip_clients_menu(vip_clients):
-    """Get VIP clients menu"""
+async def get_vip_clients_menu(vip_clients, offset=0, has_more=False):
+    """Get VIP clients menu for one page of clients"""
     buttons = []
     
     # Display VIP clients in chunks of up to 5
@@ -86,9 +90,14 @@ async def get_vip_clients_menu(vip_clients):
             # Truncate long client names
             if len(client_name) > 30:
                 client_name = client_name[:27] + "..."
-            row.append(InlineKeyboardButton(text=client_name, callback_data=f"finance_client_{client_id}"))
+            row.append(InlineKeyboardButton(text=client_name, callback_data=FinanceClientCallback(action="view", id=str(client_id)).pack()))
         buttons.append(row)
     
+    # Add page navigation
+    page_buttons = get_page_buttons("vip", offset, has_more)
+    if page_buttons:
+        buttons.append(page_buttons)
+    
     # Add back button
     buttons.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_finance_clients")])
     
@@ -97,8 +106,8 @@ async def get_vip_clients_menu(vip_clients):
 async def get_client_stats_menu(client_id):
     """Get client stats menu"""
     buttons = [
-        [InlineKeyboardButton(text="📝 Добавить заметку", callback_data=f"add_client_note_{client_id}")],
-        [InlineKeyboardButton(text="🔔 Отправить напоминание", callback_data=f"send_client_reminder_{client_id}")],
+        [InlineKeyboardButton(text="📝 Добавить заметку", callback_data=FinanceClientCallback(action="note", id=str(client_id)).pack())],
+        [InlineKeyboardButton(text="🔔 Отправить напоминание", callback_data=FinanceClientCallback(action="remind", id=str(client_id)).pack())],
         [InlineKeyboardButton(text="⬅️ Назад к VIP клиентам", callback_data="back_to_finance_vip")]
     ]
     
@@ -107,10 +116,10 @@ async def get_client_stats_menu(client_id):
 async def get_finance_tips_menu():
     """Get finance tips menu"""
     buttons = [
-        [InlineKeyboardButton(text="🚀 Как увеличить прибыль", callback_data="tip_increase_profit")],
-        [InlineKeyboardButton(text="💼 Как оптимизировать расходы", callback_data="tip_optimize_costs")],
-        [InlineKeyboardButton(text="👥 Как удержать клиентов", callback_data="tip_retain_clients")],
-        [InlineKeyboardButton(text="🔄 Как получать больше отзывов", callback_data="tip_get_reviews")],
+        [InlineKeyboardButton(text="🚀 Как увеличить прибыль", callback_data=TipCallback(topic="increase_profit").pack())],
+        [InlineKeyboardButton(text="💼 Как оптимизировать расходы", callback_data=TipCallback(topic="optimize_costs").pack())],
+        [InlineKeyboardButton(text="👥 Как удержать клиентов", callback_data=TipCallback(topic="retain_clients").pack())],
+        [InlineKeyboardButton(text="🔄 Как получать больше отзывов", callback_data=TipCallback(topic="get_reviews").pack())],
         [InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_finance")]
     ]
     
@@ -119,14 +128,22 @@ async def get_finance_tips_menu():
 async def get_finance_forecast_menu():
     """Get finance forecast menu"""
     buttons = [
-        [InlineKeyboardButton(text="📅 30 дней", callback_data="forecast_30_days")],
-        [InlineKeyboardButton(text="📅 60 дней", callback_data="forecast_60_days")],
-        [InlineKeyboardButton(text="📅 90 дней", callback_data="forecast_90_days")],
+        [InlineKeyboardButton(text="📅 30 дней", callback_data=ForecastCallback(days=30).pack())],
+        [InlineKeyboardButton(text="📅 60 дней", callback_data=ForecastCallback(days=60).pack())],
+        [InlineKeyboardButton(text="📅 90 дней", callback_data=ForecastCallback(days=90).pack())],
         [InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_finance")]
     ]
     
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+async def get_back_to_finance_clients_keyboard():
+    """Get back to finance clients keyboard"""
+    buttons = [
+        [InlineKeyboardButton(text="⬅️ Назад к статистике клиентов", callback_data="back_to_finance_clients")]
+    ]
+    
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
 async def get_back_to_finance_keyboard():
     """Get back to finance keyboard"""
     buttons = [
@@ -139,9 +156,9 @@ async def get_back_to_finance_keyboard():
 async def get_reminder_menu(client_id):
     """Get reminder menu options"""
     buttons = [
-        [InlineKeyboardButton(text="✅ Позвонил(а)", callback_data=f"reminder_called_{client_id}")],
-        [InlineKeyboardButton(text="📱 Написал(а) в WhatsApp", callback_data=f"reminder_messaged_{client_id}")],
-        [InlineKeyboardButton(text="❌ Отмена", callback_data=f"reminder_cancel_{client_id}")]
+        [InlineKeyboardButton(text="✅ Позвонил(а)", callback_data=FinanceClientCallback(action="called", id=str(client_id)).pack())],
+        [InlineKeyboardButton(text="📱 Написал(а) в WhatsApp", callback_data=FinanceClientCallback(action="messaged", id=str(client_id)).pack())],
+        [InlineKeyboardButton(text="❌ Отмена", callback_data=FinanceClientCallback(action="cancel", id=str(client_id)).pack())]
     ]
     
     return InlineKeyboardMarkup(inline_keyboard=buttons)
@@ -0,0 +1,30 @@
+from aiogram.types import InlineKeyboardButton
+
+from keyboards.callback_data import PageCallback
+
+# Number of records shown on one page of a list view
+PAGE_SIZE = 10
+
+def paginate(items, offset, limit=PAGE_SIZE):
+    """Get one page of an in-memory list as a tuple (page, has_more)"""
+    offset = max(offset, 0)
+    return list(items[offset:offset + limit]), len(items) > offset + limit
+
+def get_page_buttons(view, offset, has_more, key="", page_size=PAGE_SIZE):
+    """Get previous/next page buttons for a paginated view"""
+    buttons = []
+    page = offset // page_size + 1
+    
+    if offset > 0:
+        buttons.append(InlineKeyboardButton(
+            text=f"◀️ Стр. {page - 1}",
+            callback_data=PageCallback(view=view, offset=max(offset - page_size, 0), key=key).pack()
+        ))
+    
+    if has_more:
+        buttons.append(InlineKeyboardButton(
+            text=f"Стр. {page + 1} ▶️",
+            callback_data=PageCallback(view=view, offset=offset + page_size, key=key).pack()
+        ))
+    
+    return buttons
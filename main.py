@@ -2,6 +2,7 @@
 import asyncio
 import logging
 import os
+import time
 from aiogram import Bot, Dispatcher
 from aiogram.types import BotCommand
 from aiogram.fsm.storage.memory import MemoryStorage
@@ -16,16 +17,29 @@ logging.basicConfig(level=logging.INFO)
 # Import modules
 from handlers import client, admin, ceo
 from middlewares.role_middleware import RoleMiddleware
-from utils.db_api import google_sheets, service_commands
+from middlewares.metrics_middleware import MetricsMiddleware
+from middlewares.tenant_middleware import TenantMiddleware
+from utils.db_api import google_sheets, service_commands, subscription_commands, timezones
+from utils import catalog_snapshot, day_agenda, metrics, loop_watchdog, outbound
 from utils.appointment_reminders import start_reminder_scheduler
+from utils.subscription_sweeper import start_subscription_sweeper
+from utils.waitlist import start_waitlist_scheduler
+from utils.series_scheduler import start_series_scheduler
 
 # Initialize bot and dispatcher
 bot = Bot(token=os.getenv('BOT_TOKEN'))
 dp = Dispatcher(storage=MemoryStorage())
 
-# Setup middlewares
+# Moment main() started, used to report startup time
+startup_started = None
+
+# Setup middlewares (metrics first, so they include the role lookup)
+dp.message.middleware(MetricsMiddleware())
+dp.callback_query.middleware(MetricsMiddleware())
 dp.message.middleware(RoleMiddleware())
 dp.callback_query.middleware(RoleMiddleware())
+dp.message.middleware(TenantMiddleware())
+dp.callback_query.middleware(TenantMiddleware())
 
 # Register bot commands
 async def set_commands():
@@ -46,24 +60,77 @@ async def register_all_handlers():
     admin.register_handlers(dp)
     ceo.register_handlers(dp)
 
-# Main function to start the bot
-async def main():
+# Warm up Google Sheets and caches in the background
+async def warm_up(started):
+    """Connect to Google Sheets, initialize template data and build caches"""
     try:
         # Initialize Google Sheets
         logging.info("Initializing Google Sheets connection...")
-        await google_sheets.setup()
-        logging.info("Google Sheets connection established successfully")
+        if await google_sheets.setup() is None:
+            logging.error("Google Sheets connection failed, data will be loaded on first request")
+            return
+        connected = time.perf_counter()
         
         # Initialize template data for services
-        logging.info("Initializing template service data...")
         await service_commands.initialize_template_data()
-        logging.info("Template service data initialized successfully")
+        templates_ready = time.perf_counter()
+        
+        # Build the service catalog snapshot used by the booking flow
+        await catalog_snapshot.get_catalog()
+        finished = time.perf_counter()
+        
+        # Apply the payments the bot stopped in the middle of
+        await subscription_commands.reconcile_payments()
         
+        # Today's agenda is the first thing admins open
+        await day_agenda.get_day_agenda(timezones.today().isoformat())
+        
+        logging.info(
+            f"Warm-up finished {(finished - started) * 1000:.0f} ms after start "
+            f"(sheets {(connected - started) * 1000:.0f} ms, "
+            f"templates {(templates_ready - connected) * 1000:.0f} ms, "
+            f"catalog {(finished - templates_ready) * 1000:.0f} ms)"
+        )
+    except Exception as e:
+        logging.error(f"Error warming up: {str(e)}")
+        if "MalformedError" in str(e):
+            logging.error("Your Google credentials file appears to be invalid. Please verify it contains all required fields.")
+            logging.error("Run the verify_credentials.py script to check your credentials file")
+        elif "FileNotFoundError" in str(e):
+            logging.error("Make sure your .env file contains the correct path to your credentials file")
+        elif "SPREADSHEET_ID" in str(e):
+            logging.error("Make sure your .env file contains your Google Spreadsheet ID")
+        else:
+            logging.error("If the error persists, check your internet connection and Google API access")
+
+# Report startup time once polling is running
+async def on_startup():
+    logging.info(f"Bot started polling in {(time.perf_counter() - startup_started) * 1000:.0f} ms")
+
+# Main function to start the bot
+async def main():
+    global startup_started
+    startup_started = time.perf_counter()
+    
+    try:
         # Register all handlers
         await register_all_handlers()
         
+        # Sheets connection, template data and caches are prepared while polling runs
+        asyncio.create_task(warm_up(startup_started))
+        
         # Set bot commands
-        await set_commands()
+        asyncio.create_task(set_commands())
+        
+        # Watch for handlers blocking the event loop if enabled
+        if os.getenv('LOOP_WATCHDOG', '').strip().lower() in ('1', 'true', 'yes'):
+            threshold_ms = float(os.getenv('LOOP_WATCHDOG_THRESHOLD_MS', '100'))
+            await loop_watchdog.start_watchdog(threshold_ms)
+        
+        # Serve Prometheus metrics if a port is configured
+        metrics_port = os.getenv('METRICS_PORT', '').strip()
+        if metrics_port.isdigit():
+            await metrics.start_metrics_server(int(metrics_port))
         
         # Start appointment reminder scheduler
         # Get admin IDs from environment variable (comma-separated list)
@@ -76,20 +143,24 @@ async def main():
         else:
             logging.warning("No admin IDs configured for appointment reminders. Set ADMIN_IDS in .env file.")
         
+        # Remind admins of ending subscriptions and apply referral credits
+        asyncio.create_task(start_subscription_sweeper(bot))
+        
+        # Send queued notifications (waitlist offers) and pass on unanswered offers
+        asyncio.create_task(outbound.start_outbound_worker(bot))
+        asyncio.create_task(start_waitlist_scheduler())
+        
+        # Create the upcoming appointments of recurring series
+        asyncio.create_task(start_series_scheduler())
+        
         # Start polling
         logging.info("Starting bot")
+        dp.startup.register(on_startup)
+        # Referral credits are applied in batches, apply the pending ones before exiting
+        dp.shutdown.register(subscription_commands.apply_referral_credits)
         await dp.start_polling(bot)
     except Exception as e:
         logging.error(f"Error starting bot: {str(e)}")
-        if "MalformedError" in str(e):
-            logging.error("Your Google credentials file appears to be invalid. Please verify it contains all required fields.")
-            logging.error("Run the verify_credentials.py script to check your credentials file")
-        elif "FileNotFoundError" in str(e):
-            logging.error("Make sure your .env file contains the correct path to your credentials file")
-        elif "SPREADSHEET_ID" in str(e):
-            logging.error("Make sure your .env file contains your Google Spreadsheet ID")
-        else:
-            logging.error("If the error persists, check your internet connection and Google API access")
 
 if __name__ == '__main__':
     asyncio.run(main())
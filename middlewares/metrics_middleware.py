@@ -0,0 +1,49 @@
+import asyncio
+import time
+from typing import Dict, Any, Callable, Awaitable
+from aiogram import BaseMiddleware
+from aiogram.types import Message, CallbackQuery
+from utils import metrics
+
+def get_handler_name(data):
+    """Get a readable name of the handler chosen for the update"""
+    # Callbacks routed through a CallbackRoutes table resolve to their own handler
+    route = data.get("callback_route")
+    handler = route or data.get("handler")
+    if handler is None:
+        return "unhandled"
+
+    callback = handler.callback
+    module = getattr(callback, "__module__", "") or ""
+    name = getattr(callback, "__name__", type(callback).__name__)
+    return f"{module.rsplit('.', 1)[-1]}.{name}" if module else name
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Middleware recording handler latency and Sheets operations per update
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message | CallbackQuery,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_name = get_handler_name(data)
+        task = asyncio.current_task()
+        metrics.active_handlers[task] = handler_name
+
+        stats = metrics.UpdateStats()
+        token = metrics.current_update.set(stats)
+        started = time.perf_counter()
+        failed = False
+
+        try:
+            return await handler(event, data)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            metrics.current_update.reset(token)
+            metrics.active_handlers.pop(task, None)
+            metrics.observe_update(handler_name, time.perf_counter() - started, stats, failed)
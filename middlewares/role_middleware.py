@@ -67,19 +67,5 @@ class RoleMiddleware(BaseMiddleware):
         data["role"] = user["role"]
         data["has_subscription"] = has_subscription
         
-        # Store subscription data in event object for access in callbacks
-        if isinstance(event, Message):
-            # Store in Message object
-            if not hasattr(event, "proxy_data"):
-                event.proxy_data = {}
-            event.proxy_data["has_subscription"] = has_subscription
-            event.proxy_data["role"] = user["role"]
-        elif isinstance(event, CallbackQuery) and event.message:
-            # Store in CallbackQuery.message object
-            if not hasattr(event.message, "proxy_data"):
-                event.message.proxy_data = {}
-            event.message.proxy_data["has_subscription"] = has_subscription
-            event.message.proxy_data["role"] = user["role"]
-        
         # Call the handler with the updated data
         return await handler(event, data)
@@ -0,0 +1,31 @@
+import logging
+from typing import Dict, Any, Callable, Awaitable
+from aiogram import BaseMiddleware
+from aiogram.types import Message, CallbackQuery
+from utils.db_api import tenant_commands
+from utils.db_api.google_sheets import current_tenant
+
+class TenantMiddleware(BaseMiddleware):
+    """
+    Middleware routing the sheet operations of an update to the tenant
+    (salon spreadsheet) of the user; runs after RoleMiddleware
+    """
+    
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message | CallbackQuery,
+        data: Dict[str, Any]
+    ) -> Any:
+        try:
+            tenant = await tenant_commands.get_user_tenant(event.from_user.id, data.get("role"))
+        except Exception as e:
+            logging.error(f"Error resolving tenant: {str(e)}")
+            tenant = None
+        
+        data["tenant"] = tenant
+        token = current_tenant.set(tenant)
+        try:
+            return await handler(event, data)
+        finally:
+            current_tenant.reset(token)
@@ -1,46 +1,36 @@
 
 import asyncio
 import logging
-from datetime import datetime, time, timedelta
+from datetime import timedelta
 from aiogram import Bot
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from utils.db_api import appointment_commands, master_commands, service_commands
+from utils import day_agenda
+from utils.db_api import tenant_commands, timezones
+from keyboards.callback_data import AppointmentCallback
 
 async def get_today_uncompleted_appointments():
-    """Get all appointments for today that are not marked as completed or canceled"""
-    today = datetime.now().strftime("%Y-%m-%d")
-    appointments = await appointment_commands.get_appointments_by_date(today)
+    """Get today's appointments that have started but are not marked as completed or canceled"""
+    today = timezones.today().isoformat()
+    agenda = await day_agenda.get_day_agenda(today)
+    now = timezones.epoch_now()
     
-    # Filter for appointments that are not completed or canceled
-    uncompleted = []
-    for appointment in appointments:
-        if appointment.get('status') not in ['completed', 'canceled', 'paid']:
-            # Add service info
-            service_id = appointment.get('service_id')
-            if service_id:
-                service = await service_commands.get_service(service_id)
-                if service:
-                    appointment['service_name'] = service.get('name')
-                    
-            # Add master info
-            master_id = appointment.get('master_id')
-            if master_id:
-                master = await master_commands.get_master(master_id)
-                if master:
-                    appointment['master_name'] = master.get('name')
-            
-            uncompleted.append(appointment)
-    
-    return uncompleted
+    # Filter for appointments that are not completed or canceled; the
+    # agenda already has the service and master info
+    return [
+        appointment for appointment in agenda.appointments
+        if appointment.get('status') not in ['completed', 'canceled', 'paid']
+        and timezones.has_started(appointment, now)
+    ]
 
 async def send_completion_reminder(bot, admin_id, appointment):
     """Send reminder to admin to mark appointment status"""
     # Create keyboard with action buttons
+    appointment_id = str(appointment['id'])
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="✅ Завершено и оплачено", callback_data=f"complete_paid_{appointment['id']}")],
-        [InlineKeyboardButton(text="✅ Завершено, не оплачено", callback_data=f"complete_unpaid_{appointment['id']}")],
-        [InlineKeyboardButton(text="❌ Отменено", callback_data=f"admin_cancel_appointment_{appointment['id']}")],
-        [InlineKeyboardButton(text="⏩ Отложить напоминание", callback_data=f"remind_later_{appointment['id']}")],
+        [InlineKeyboardButton(text="✅ Завершено и оплачено", callback_data=AppointmentCallback(action="complete_paid", id=appointment_id).pack())],
+        [InlineKeyboardButton(text="✅ Завершено, не оплачено", callback_data=AppointmentCallback(action="complete_unpaid", id=appointment_id).pack())],
+        [InlineKeyboardButton(text="❌ Отменено", callback_data=AppointmentCallback(action="cancel", id=appointment_id).pack())],
+        [InlineKeyboardButton(text="⏩ Отложить напоминание", callback_data=AppointmentCallback(action="remind_later", id=appointment_id).pack())],
     ])
     
     # Get service and client info
@@ -61,48 +51,53 @@ async def send_completion_reminder(bot, admin_id, appointment):
         reply_markup=keyboard
     )
 
+def is_end_of_day():
+    """Check if it is the end of the day (between 19:00 and 23:59) in the current tenant's salon"""
+    return 19 <= timezones.now().hour <= 23
+
 async def check_daily_appointments(bot, admin_ids):
     """Check for uncompleted appointments at the end of the day and send reminders"""
-    # Get current hour
-    now = datetime.now()
-    current_hour = now.hour
+    try:
+        # The main spreadsheet is reported to the configured admins,
+        # the spreadsheet of every tenant to the admin of that tenant,
+        # each at the end of the day in its own time zone
+        if is_end_of_day():
+            logging.info("Running end-of-day appointment status check")
+            await send_daily_reminders(bot, admin_ids)
+        for tenant in await tenant_commands.get_all_tenants():
+            with tenant_commands.use_tenant(tenant):
+                if is_end_of_day():
+                    await send_daily_reminders(bot, [tenant['admin_id']])
     
-    # Only run at the end of the day (between 19:00 and 23:59)
-    if 19 <= current_hour <= 23:
-        logging.info("Running end-of-day appointment status check")
-        
-        try:
-            # Get uncompleted appointments for today
-            uncompleted = await get_today_uncompleted_appointments()
-            
-            if uncompleted:
-                logging.info(f"Found {len(uncompleted)} uncompleted appointments for today")
-                
-                # Send reminders to all admins
-                for admin_id in admin_ids:
-                    for appointment in uncompleted:
-                        await send_completion_reminder(bot, admin_id, appointment)
-                        # Add small delay to avoid flood limit
-                        await asyncio.sleep(0.3)
-            else:
-                logging.info("No uncompleted appointments found for today")
+    except Exception as e:
+        logging.error(f"Error in daily appointment check: {str(e)}")
+
+async def send_daily_reminders(bot, admin_ids):
+    """Send reminders about today's uncompleted appointments of the current tenant"""
+    # Get uncompleted appointments for today
+    uncompleted = await get_today_uncompleted_appointments()
+    
+    if uncompleted:
+        logging.info(f"Found {len(uncompleted)} uncompleted appointments for today")
         
-        except Exception as e:
-            logging.error(f"Error in daily appointment check: {str(e)}")
+        # Send reminders to all admins
+        for admin_id in admin_ids:
+            for appointment in uncompleted:
+                await send_completion_reminder(bot, admin_id, appointment)
+                # Add small delay to avoid flood limit
+                await asyncio.sleep(0.3)
+    else:
+        logging.info("No uncompleted appointments found for today")
 
 async def start_reminder_scheduler(bot, admin_ids):
     """Start the scheduler for appointment reminders"""
     while True:
         await check_daily_appointments(bot, admin_ids)
         
-        # Calculate time until next check (run every hour during evening)
-        now = datetime.now()
-        if now.hour >= 23:
-            # Next check tomorrow at 19:00
-            next_check = datetime.combine(now.date() + timedelta(days=1), time(19, 0))
-        else:
-            # Next check in one hour
-            next_check = now + timedelta(hours=1)
+        # Check again at the start of the next hour: salons in other time
+        # zones reach their evening at different times
+        now = timezones.now(timezones.get_zone())
+        next_check = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
         
         # Calculate seconds to sleep
         seconds_to_sleep = (next_check - now).total_seconds()
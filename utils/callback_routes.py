@@ -0,0 +1,63 @@
+import logging
+
+from aiogram.dispatcher.event.handler import CallableObject
+from aiogram.types import CallbackQuery
+
+SEPARATOR = ":"
+
+
+class CallbackRoutes:
+    """
+    Dispatch table for packed callback data.
+
+    Routes are keyed by the callback prefix and, for factories with an
+    `action` field, by the action too. A callback query is resolved with a
+    single dict lookup, so routing cost does not grow with the number of
+    registered handlers.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._routes = {}
+
+    def route(self, factory, action=None):
+        """Register a handler for a callback factory (and an optional action)"""
+        def decorator(handler):
+            key = (factory.__prefix__, action)
+            if key in self._routes:
+                raise ValueError(f"Callback route {key} is already registered in '{self.name}'")
+            self._routes[key] = (factory, CallableObject(handler))
+            return handler
+        return decorator
+
+    def resolve(self, data):
+        """Find the route for packed callback data"""
+        if not data:
+            return None
+
+        prefix, _, rest = data.partition(SEPARATOR)
+        action = rest.split(SEPARATOR, 1)[0]
+        return self._routes.get((prefix, action)) or self._routes.get((prefix, None))
+
+    async def match(self, callback: CallbackQuery):
+        """Filter: match the callback and unpack its data for the handler"""
+        route = self.resolve(callback.data)
+        if route is None:
+            return False
+
+        factory, handler = route
+        try:
+            callback_data = factory.unpack(callback.data)
+        except (TypeError, ValueError) as e:
+            logging.error(f"Malformed callback data {callback.data!r}: {e}")
+            return False
+
+        return {'callback_data': callback_data, 'callback_route': handler}
+
+    async def dispatch(self, callback: CallbackQuery, callback_route: CallableObject, **kwargs):
+        """Call the handler resolved by the filter"""
+        return await callback_route.call(callback, **kwargs)
+
+    def register(self, router):
+        """Attach the table to a router as a single callback query handler"""
+        router.callback_query.register(self.dispatch, self.match)
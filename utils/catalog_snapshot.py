@@ -0,0 +1,164 @@
+import asyncio
+import logging
+from types import MappingProxyType
+
+from utils.db_api import service_commands
+from utils.db_api.google_sheets import get_sheet_table, get_tenant_key
+from keyboards import client_keyboards
+
+UNCATEGORIZED_NAME = 'Без категории'
+
+# Sheets a snapshot is built from
+CATALOG_SHEETS = (service_commands.CATEGORIES_SHEET, service_commands.SERVICES_SHEET, service_commands.OFFERS_SHEET)
+
+# Current snapshot of each tenant (None is the main spreadsheet) and the
+# locks that guard their rebuild
+_snapshots = {}
+_rebuild_locks = {}
+
+
+class CatalogSnapshot:
+    """
+    Immutable view of the service catalog (categories, services, offers)
+    together with the keyboards used by the booking flow.
+
+    A snapshot is built once per catalog version and cached copy of the
+    catalog sheets, so booking callbacks can render keyboards and look up
+    services without touching the sheets, and edits made right in the
+    spreadsheet show up once the sheet cache reloads them.
+    """
+
+    __slots__ = (
+        'version', 'source', 'categories', 'categories_by_id', 'categories_by_name',
+        'services', 'services_by_id', 'services_by_category_id',
+        'services_by_category_name', 'grouped_services',
+        'offers', 'offers_by_id',
+        'categories_keyboard', 'services_keyboards',
+    )
+
+    def __init__(self, version, categories, services, offers, source=()):
+        freeze = MappingProxyType
+
+        categories = tuple(freeze(dict(category)) for category in categories)
+        services = tuple(freeze(dict(service)) for service in services)
+        offers = tuple(freeze(dict(offer)) for offer in offers)
+
+        categories_by_id = {}
+        categories_by_name = {}
+        for category in categories:
+            categories_by_id.setdefault(str(category.get('id')), category)
+            categories_by_name.setdefault(category.get('name'), category)
+
+        services_by_id = {}
+        services_by_category_id = {}
+        for service in services:
+            services_by_id.setdefault(str(service.get('id')), service)
+            category_id = service.get('category_id')
+            if category_id not in (None, ''):
+                services_by_category_id.setdefault(str(category_id), []).append(service)
+
+        # Services grouped by category name, uncategorized ones included
+        grouped_services = {}
+        for service in services:
+            category = categories_by_id.get(str(service.get('category_id', 'uncategorized')))
+            category_name = category.get('name') if category else UNCATEGORIZED_NAME
+            grouped_services.setdefault(category_name, []).append(service)
+
+        services_by_category_name = {}
+        for name, category in categories_by_name.items():
+            services_by_category_name[name] = tuple(
+                services_by_category_id.get(str(category.get('id')), ())
+            )
+
+        self.version = version
+        # Cached tables the snapshot was built from
+        self.source = source
+        self.categories = categories
+        self.categories_by_id = freeze(categories_by_id)
+        self.categories_by_name = freeze(categories_by_name)
+        self.services = services
+        self.services_by_id = freeze(services_by_id)
+        self.services_by_category_id = freeze(
+            {key: tuple(value) for key, value in services_by_category_id.items()}
+        )
+        self.services_by_category_name = freeze(services_by_category_name)
+        self.grouped_services = freeze(
+            {key: tuple(value) for key, value in grouped_services.items()}
+        )
+        self.offers = offers
+        self.offers_by_id = freeze({str(offer.get('id')): offer for offer in offers})
+
+        # Prebuilt keyboards for the booking flow
+        self.categories_keyboard = client_keyboards.build_categories_keyboard(categories)
+        self.services_keyboards = freeze({
+            category_id: client_keyboards.build_services_keyboard(category_services)
+            for category_id, category_services in self.services_by_category_id.items()
+        })
+
+    def is_current(self, version, source):
+        """Check if the snapshot was built from this catalog version and these cached tables"""
+        return self.version == version and len(self.source) == len(source) and all(
+            cached is current for cached, current in zip(self.source, source)
+        )
+
+    def get_service(self, service_id):
+        """Get a service by its ID"""
+        return self.services_by_id.get(str(service_id))
+
+    def get_offer(self, offer_id):
+        """Get a special offer by its ID"""
+        return self.offers_by_id.get(str(offer_id))
+
+    def get_category(self, category_id):
+        """Get a category by its ID"""
+        return self.categories_by_id.get(str(category_id))
+
+    def get_services_by_category_name(self, category_name):
+        """Get services of a category by the category name"""
+        return self.services_by_category_name.get(category_name, ())
+
+    def get_services_by_category_id(self, category_id):
+        """Get services of a category by the category ID"""
+        return self.services_by_category_id.get(str(category_id), ())
+
+    def get_services_keyboard(self, category_id):
+        """Get the prebuilt services keyboard of a category"""
+        return self.services_keyboards.get(str(category_id))
+
+
+async def _get_source():
+    """Get the cached tables of the catalog sheets"""
+    return tuple([await get_sheet_table(sheet) for sheet in CATALOG_SHEETS])
+
+
+async def build_catalog():
+    """Read the catalog sheets and build a new snapshot"""
+    version = service_commands.get_catalog_version()
+    source = await _get_source()
+
+    categories, services, offers = (list(table) for table in source)
+    return CatalogSnapshot(version, categories, services, offers, source)
+
+
+async def get_catalog():
+    """
+    Get the catalog snapshot of the current tenant, rebuilding it if the
+    catalog was changed by the bot or the cached sheets were reloaded.
+    """
+    key = get_tenant_key(service_commands.SERVICES_SHEET)
+
+    snapshot = _snapshots.get(key)
+    if snapshot is not None and snapshot.is_current(service_commands.get_catalog_version(), await _get_source()):
+        return snapshot
+
+    async with _rebuild_locks.setdefault(key, asyncio.Lock()):
+        # Another task may have rebuilt the snapshot while we were waiting
+        snapshot = _snapshots.get(key)
+        if snapshot is None or not snapshot.is_current(service_commands.get_catalog_version(), await _get_source()):
+            snapshot = _snapshots[key] = await build_catalog()
+            logging.info(
+                f"Catalog snapshot v{snapshot.version} built: "
+                f"{len(snapshot.categories)} categories, {len(snapshot.services)} services, "
+                f"{len(snapshot.offers)} offers"
+            )
+        return snapshot
@@ -0,0 +1,207 @@
+import asyncio
+from collections import Counter, OrderedDict
+from types import MappingProxyType
+
+from utils import catalog_snapshot
+from utils.db_api import appointment_commands, master_commands, service_commands
+from utils.db_api.google_sheets import get_sheet, get_sheet_table, get_sheet_cache, get_tenant_key
+from utils.db_api.records import parse_date
+from keyboards.admin_keyboards import get_date_appointments_admin_keyboard
+
+# Agendas of this many dates are kept, least recently used ones are dropped
+AGENDA_CACHE_SIZE = 64
+
+STATUS_EMOJI = {
+    'pending': "⏳",
+    'confirmed': "🔄",
+    'completed': "✅",
+    'paid': "💰",
+    'canceled': "❌",
+}
+
+# Cached agendas by tenant and date
+_agendas = OrderedDict()
+
+# Bumped on every appointment change, so agendas built from older data are not stored
+_generation = 0
+
+# Guards agenda builds, so concurrent requests of a date share one build
+_build_lock = asyncio.Lock()
+
+
+class Lookups:
+    """Names of the services, masters and clients appointments refer to"""
+
+    __slots__ = ('catalog', 'masters_by_id', 'clients_by_id')
+
+    def __init__(self, catalog, masters, clients):
+        self.catalog = catalog
+        self.masters_by_id = {str(master.get('id')): master for master in reversed(masters)}
+        self.clients_by_id = {str(client.get('user_id')): client for client in reversed(clients)}
+
+    @classmethod
+    async def load(cls):
+        """Load the lookups from the cached sheets"""
+        catalog = await catalog_snapshot.get_catalog()
+        masters = await master_commands.get_all_masters()
+        clients = await get_sheet('Clients')
+        return cls(catalog, masters, clients)
+
+    def enrich(self, appointment):
+        """Get a read-only view of an appointment with service, master and client info"""
+        view = appointment.to_dict()
+
+        service_id = appointment.get('service_id')
+        if service_id:
+            # Try both regular service and offer
+            service = self.catalog.get_service(service_id) or self.catalog.get_offer(service_id)
+            if service:
+                view['service_name'] = service.get('name')
+                view['service_price'] = service.get('price')
+
+        master_id = appointment.get('master_id')
+        if master_id:
+            master = self.masters_by_id.get(str(master_id))
+            if master:
+                view['master_name'] = master.get('name')
+
+        user_id = appointment.get('user_id')
+        if user_id:
+            client = self.clients_by_id.get(str(user_id))
+            if client:
+                view['user_name'] = client.get('full_name') or 'Unknown'
+                view['user_username'] = client.get('username') or None
+
+        return MappingProxyType(view)
+
+
+def _sort_key(appointment):
+    return str(appointment.get('time')), str(appointment.get('master_id'))
+
+
+class DayAgenda:
+    """
+    Appointments of one date, enriched and sorted by time and master, with
+    counts by status and the prebuilt keyboard of the admin day view.
+
+    source is the cached Appointments table the agenda matches. Changes
+    made by the bot are applied through the appointment hooks, so the agenda
+    stays valid until the table is read again from the sheet, however old
+    it is.
+    """
+
+    __slots__ = ('date', 'appointments', 'status_counts', 'keyboard', 'catalog_version', 'source')
+
+    def __init__(self, date, appointments, catalog_version, source):
+        self.date = date
+        self.appointments = tuple(sorted(appointments, key=_sort_key))
+        self.status_counts = MappingProxyType(Counter(str(a.get('status')) for a in self.appointments))
+        self.keyboard = get_date_appointments_admin_keyboard(self.appointments, date)
+        self.catalog_version = catalog_version
+        self.source = source
+
+    def __len__(self):
+        return len(self.appointments)
+
+    def is_current(self, catalog_version, source):
+        """
+        Check if the agenda may still be served: the catalog did not change
+        and the cached table, if any, is the one the agenda matches
+        """
+        return self.catalog_version == catalog_version and (source is None or source is self.source)
+
+    def format_status_counts(self):
+        """Short summary of the statuses, e.g. '🔄 3 · ✅ 2'"""
+        order = list(STATUS_EMOJI)
+        statuses = sorted(self.status_counts, key=lambda status: order.index(status) if status in order else len(order))
+        return " · ".join(f"{STATUS_EMOJI.get(status, '•')} {self.status_counts[status]}" for status in statuses)
+
+    def with_change(self, before, after, lookups, source):
+        """Get a new agenda with an appointment added, changed or moved away, matching the table written with it"""
+        appointments = list(self.appointments)
+        if before is not None:
+            appointments = [a for a in appointments if str(a.get('id')) != str(before.get('id'))]
+        if after is not None and after.get('date') == self.date:
+            appointments.append(lookups.enrich(after))
+        return DayAgenda(self.date, appointments, self.catalog_version, source or self.source)
+
+
+def _cached_source():
+    """Get the cached Appointments table without loading it, or None"""
+    return get_sheet_cache(appointment_commands.APPOINTMENTS_SHEET).cached(appointment_commands.APPOINTMENTS_SHEET)
+
+
+async def build_agenda(date):
+    """Build the agenda of a date from the appointments of that date in the cached table"""
+    version = service_commands.get_catalog_version()
+    source = await get_sheet_table(appointment_commands.APPOINTMENTS_SHEET)
+    table = await appointment_commands.get_appointments_table()
+    lookups = await Lookups.load()
+    appointments = [lookups.enrich(table[index]) for index in table.indexes(date=date)]
+    return DayAgenda(date, appointments, version, source)
+
+
+def _agenda_key(date):
+    return get_tenant_key(appointment_commands.APPOINTMENTS_SHEET), date
+
+
+def _store(key, agenda):
+    _agendas[key] = agenda
+    _agendas.move_to_end(key)
+    while len(_agendas) > AGENDA_CACHE_SIZE:
+        _agendas.popitem(last=False)
+
+
+async def get_day_agenda(date):
+    """Get the agenda of a date (YYYY-MM-DD), building it if it is not cached"""
+    date = parse_date(date)
+    key = _agenda_key(date)
+
+    agenda = _agendas.get(key)
+    if agenda is not None and agenda.is_current(service_commands.get_catalog_version(), _cached_source()):
+        _agendas.move_to_end(key)
+        return agenda
+
+    async with _build_lock:
+        # Another task may have built the agenda while we were waiting
+        agenda = _agendas.get(key)
+        if agenda is not None and agenda.is_current(service_commands.get_catalog_version(), _cached_source()):
+            return agenda
+
+        generation = _generation
+        agenda = await build_agenda(date)
+        # Appointments changed during the build, the agenda may miss the change
+        if generation == _generation:
+            _store(key, agenda)
+        return agenda
+
+
+async def on_appointment_change(before, after):
+    """Appointment hook: apply a change to the cached agendas of its dates"""
+    global _generation
+    _generation += 1
+
+    # Hooks run in the context of the writing update, so of its tenant
+    keys = {_agenda_key(record.get('date')) for record in (before, after) if record is not None}
+    if not any(key in _agendas for key in keys):
+        return
+
+    lookups = await Lookups.load()
+    # The change was written, so the cached table holds it
+    source = _cached_source()
+    for key in keys:
+        # Applying a change is idempotent, so an agenda rebuilt meanwhile is fine too
+        agenda = _agendas.get(key)
+        if agenda is not None:
+            _agendas[key] = agenda.with_change(before, after, lookups, source)
+
+
+def clear():
+    """Drop all cached agendas"""
+    global _generation
+    _generation += 1
+    _agendas.clear()
+
+
+# Keep the agendas in step with the appointments the bot changes
+appointment_commands.add_appointment_hook(on_appointment_change)
@@ -1,128 +1,282 @@
-
-from utils.db_api.google_sheets import get_sheet, write_to_sheet
+import asyncio
+import logging
+import time as clock
+from utils.db_api.google_sheets import get_sheet, get_sheet_table, write_to_sheet, get_tenant_key
+from utils.db_api.appointment_store import AppointmentTable, AppointmentRows
+from utils.db_api.records import Appointment, next_id
+from utils.db_api import timezones
 from utils.db_api.service_commands import get_service, get_offer
-from utils.db_api.master_commands import get_master
+from utils.db_api.master_commands import get_master, get_master_availability, get_master_availability_by_date
 import utils.db_api.user_commands as user_commands
 
 # Sheet name
 APPOINTMENTS_SHEET = "Appointments"
 VERIFIED_USERS_SHEET = "VerifiedUsers"
 
+# Statuses of appointments that no longer take their slot
+FREE_SLOT_STATUSES = ('canceled',)
+
+# Statuses of appointments that may still be moved to another slot
+RESCHEDULABLE_STATUSES = ('pending', 'confirmed')
+
+# Serializes every read-modify-write of the Appointments sheet: two moves
+# cannot take the same free slot, and a cancel or status change cannot be
+# overwritten by a booking or a move written at the same time
+_appointments_lock = asyncio.Lock()
+
+# Slots held for someone (e.g. a waitlist offer), hidden from everyone else
+# until the hold expires: (tenant key, master ID, date, time) -> (owner,
+# expiry, ID of the service the slot is held for)
+_holds = {}
+
+# Coroutine functions notified about every appointment the bot writes as
+# hook(before, after), with the records before and after the change
+# (before is None for a new appointment)
+appointment_hooks = []
+
+def add_appointment_hook(hook):
+    """Register a coroutine function notified about appointment changes"""
+    appointment_hooks.append(hook)
+
+async def notify_appointment_hooks(before, after):
+    """Notify the registered hooks about a written appointment change"""
+    for hook in appointment_hooks:
+        try:
+            await hook(before, after)
+        except Exception as e:
+            logging.error(f"Error in appointment hook: {str(e)}")
+
 async def get_all_appointments():
     """Get all appointments from the database"""
     appointments = await get_sheet(APPOINTMENTS_SHEET)
     return appointments
 
+async def get_appointments_table():
+    """Get all appointments as a table to filter and aggregate without copying the rows"""
+    table = await get_sheet_table(APPOINTMENTS_SHEET)
+    return table if isinstance(table, AppointmentTable) else AppointmentRows(table)
+
 async def get_appointment(appointment_id):
     """Get an appointment by its ID"""
-    appointments = await get_all_appointments()
-    for appointment in appointments:
-        if appointment.get('id') == appointment_id:
-            return appointment
-    return None
+    table = await get_appointments_table()
+    return table.first(id=appointment_id)
 
 async def get_user_appointments(user_id):
     """Get all appointments for a specific user"""
-    appointments = await get_all_appointments()
+    table = await get_appointments_table()
     user_appointments = []
     
-    for appointment in appointments:
-        if str(appointment.get('user_id')) == str(user_id):
-            # Add service and master info to appointment
-            service_id = appointment.get('service_id')
-            if service_id:
-                # First try to get as a regular service
-                service = await get_service(service_id)
-                if not service:
-                    # If not a regular service, try as an offer
-                    service = await get_offer(service_id)
-                if service:
-                    appointment['service_name'] = service.get('name')
-                    appointment['service_price'] = service.get('price')
-            
-            master_id = appointment.get('master_id')
-            if master_id:
-                master = await get_master(master_id)
-                if master:
-                    appointment['master_name'] = master.get('name')
-            
-            user_appointments.append(appointment)
+    for appointment in table.select(user_id=user_id):
+        # Enrich a copy, the cached record is shared and immutable
+        appointment = appointment.to_dict()
+        # Add service and master info to appointment
+        service_id = appointment.get('service_id')
+        if service_id:
+            # First try to get as a regular service
+            service = await get_service(service_id)
+            if not service:
+                # If not a regular service, try as an offer
+                service = await get_offer(service_id)
+            if service:
+                appointment['service_name'] = service.get('name')
+                appointment['service_price'] = service.get('price')
+        
+        master_id = appointment.get('master_id')
+        if master_id:
+            master = await get_master(master_id)
+            if master:
+                appointment['master_name'] = master.get('name')
+        
+        user_appointments.append(appointment)
     
     return user_appointments
 
+async def get_client_appointments(client_id):
+    """Get the appointment records of a client, without service and master info"""
+    table = await get_appointments_table()
+    return table.select(user_id=client_id)
+
 async def get_master_appointments(master_id):
     """Get all appointments for a specific master"""
-    appointments = await get_all_appointments()
+    table = await get_appointments_table()
     master_appointments = []
     
-    for appointment in appointments:
-        if appointment.get('master_id') == master_id:
-            # Add service and user info
-            service_id = appointment.get('service_id')
-            if service_id:
-                # First try to get as a regular service
-                service = await get_service(service_id)
-                if not service:
-                    # If not a regular service, try as an offer
-                    service = await get_offer(service_id)
-                if service:
-                    appointment['service_name'] = service.get('name')
-                    appointment['service_price'] = service.get('price')
-            
-            user_id = appointment.get('user_id')
-            if user_id:
-                user = await user_commands.get_user(user_id)
-                if user:
-                    appointment['user_name'] = user.get('name', 'Unknown')
-                    appointment['user_username'] = user.get('username', None)
-            
-            master_appointments.append(appointment)
+    for appointment in table.select(master_id=master_id):
+        # Enrich a copy, the cached record is shared and immutable
+        appointment = appointment.to_dict()
+        # Add service and user info
+        service_id = appointment.get('service_id')
+        if service_id:
+            # First try to get as a regular service
+            service = await get_service(service_id)
+            if not service:
+                # If not a regular service, try as an offer
+                service = await get_offer(service_id)
+            if service:
+                appointment['service_name'] = service.get('name')
+                appointment['service_price'] = service.get('price')
+        
+        user_id = appointment.get('user_id')
+        if user_id:
+            user = await user_commands.get_user(user_id)
+            if user:
+                appointment['user_name'] = user.get('name', 'Unknown')
+                appointment['user_username'] = user.get('username', None)
+        
+        master_appointments.append(appointment)
     
     return master_appointments
 
 async def get_appointments_by_date(date):
     """Get all appointments for a specific date"""
-    appointments = await get_all_appointments()
+    table = await get_appointments_table()
     date_appointments = []
     
-    for appointment in appointments:
-        if appointment.get('date') == date:
-            # Add service, master and user info
-            service_id = appointment.get('service_id')
-            if service_id:
-                # Try both regular service and offer
-                service = await get_service(service_id)
-                if not service:
-                    service = await get_offer(service_id)
-                if service:
-                    appointment['service_name'] = service.get('name')
-                    appointment['service_price'] = service.get('price')
-            
-            master_id = appointment.get('master_id')
-            if master_id:
-                master = await get_master(master_id)
-                if master:
-                    appointment['master_name'] = master.get('name')
-            
-            user_id = appointment.get('user_id')
-            if user_id:
-                user = await user_commands.get_user(user_id)
-                if user:
-                    appointment['user_name'] = user.get('name', 'Unknown')
-                    appointment['user_username'] = user.get('username', None)
-            
-            date_appointments.append(appointment)
+    for appointment in table.select(date=date):
+        # Enrich a copy, the cached record is shared and immutable
+        appointment = appointment.to_dict()
+        # Add service, master and user info
+        service_id = appointment.get('service_id')
+        if service_id:
+            # Try both regular service and offer
+            service = await get_service(service_id)
+            if not service:
+                service = await get_offer(service_id)
+            if service:
+                appointment['service_name'] = service.get('name')
+                appointment['service_price'] = service.get('price')
+        
+        master_id = appointment.get('master_id')
+        if master_id:
+            master = await get_master(master_id)
+            if master:
+                appointment['master_name'] = master.get('name')
+        
+        user_id = appointment.get('user_id')
+        if user_id:
+            user = await user_commands.get_user(user_id)
+            if user:
+                appointment['user_name'] = user.get('name', 'Unknown')
+                appointment['user_username'] = user.get('username', None)
+        
+        date_appointments.append(appointment)
     
     return date_appointments
 
+def _hold_key(master_id, date, time):
+    return get_tenant_key(APPOINTMENTS_SHEET), str(master_id), str(date), str(time)
+
+def hold_slot(master_id, date, time, owner, seconds, service_id=None):
+    """Hold a free slot for an owner, so nobody else can take it (or the time its service takes) for a while"""
+    _holds[_hold_key(master_id, date, time)] = (owner, clock.monotonic() + seconds, service_id)
+
+def release_slot(master_id, date, time, owner):
+    """Release a slot held by an owner"""
+    key = _hold_key(master_id, date, time)
+    if key in _holds and _holds[key][0] == owner:
+        del _holds[key]
+
+def get_held_slots(master_id, date, owner=None):
+    """Get the slots of a master on a date held for someone other than the owner, as {time: service ID}"""
+    now = clock.monotonic()
+    tenant_key = get_tenant_key(APPOINTMENTS_SHEET)
+    held = {}
+    for key, (hold_owner, expires, service_id) in list(_holds.items()):
+        if expires <= now:
+            del _holds[key]
+        elif key[:3] == (tenant_key, str(master_id), str(date)) and hold_owner != owner:
+            held[key[3]] = service_id
+    return held
+
+async def book_slot(user_id, service_id, date, time, master_id, owner=None):
+    """
+    Book an appointment if the slot is still free (or held for the owner).
+    
+    Returns the new appointment, or None if the slot was taken meanwhile.
+    """
+    async with _appointments_lock:
+        if time not in await get_master_availability(master_id, date, owner, service_id):
+            return None
+        appointment = await _add_appointment(user_id, service_id, date, time, master_id)
+    
+    if appointment is None:
+        return None
+    if owner is not None:
+        release_slot(master_id, date, time, owner)
+    await notify_appointment_hooks(None, Appointment(appointment))
+    return appointment
+
+async def book_slots(user_id, service_id, slots, master_id):
+    """
+    Book the free ones of many (date, time) slots of a master at once.
+    
+    Availability is checked for all dates in one pass and the free slots
+    are written with a single write. Returns (new appointments, busy slots),
+    or None if the write failed.
+    """
+    async with _appointments_lock:
+        availability = await get_master_availability_by_date(master_id, {date for date, _ in slots}, service_id=service_id)
+        free = [(date, time) for date, time in slots if time in availability[date]]
+        busy = [(date, time) for date, time in slots if time not in availability[date]]
+        appointments = await _add_appointments(user_id, service_id, free, master_id)
+    
+    if free and not appointments:
+        return None
+    for appointment in appointments:
+        await notify_appointment_hooks(None, appointment)
+    return appointments, busy
+
+async def reschedule_appointment(appointment_id, date, time, master_id=None):
+    """
+    Move an appointment to another slot, keeping its ID and status.
+    
+    The new slot is checked against the availability of the master right
+    before the move. Returns the moved appointment, or None if the slot is
+    not free or the appointment cannot be moved.
+    """
+    async with _appointments_lock:
+        appointments = await get_all_appointments()
+        
+        for i, appointment in enumerate(appointments):
+            if str(appointment.get('id')) == str(appointment_id):
+                break
+        else:
+            return None
+        
+        if appointment.get('status') not in RESCHEDULABLE_STATUSES or timezones.has_started(appointment):
+            return None
+        
+        master_id = master_id or appointment.get('master_id')
+        # The appointment does not conflict with its own current time
+        if not master_id or time not in await get_master_availability(
+                master_id, date, service_id=appointment.get('service_id'), ignore=appointment.get('id')):
+            return None
+        
+        appointments[i] = appointment.replace(
+            date=date, time=time, master_id=master_id, starts_at=timezones.to_epoch(date, time) or ''
+        )
+        if not await write_to_sheet(APPOINTMENTS_SHEET, appointments):
+            return None
+    
+    # Agendas and reminders follow the change through the hooks
+    await notify_appointment_hooks(appointment, appointments[i])
+    return appointments[i]
+
 async def add_appointment(user_id, service_id, date, time, master_id=None, payment_method=None):
-    """Add a new appointment to the database"""
+    """Add a new appointment to the database. Returns it, or None if it could not be written"""
+    async with _appointments_lock:
+        new_appointment = await _add_appointment(user_id, service_id, date, time, master_id, payment_method)
+    
+    if new_appointment is not None:
+        await notify_appointment_hooks(None, Appointment(new_appointment))
+    return new_appointment
+
+async def _add_appointment(user_id, service_id, date, time, master_id=None, payment_method=None):
+    """Write a new appointment, with the appointments lock held"""
     appointments = await get_all_appointments()
     
     # Generate a new ID
-    new_id = "1"
-    if appointments:
-        new_id = str(max([int(appointment.get('id', 0)) for appointment in appointments]) + 1)
+    new_id = str(next_id(appointments))
     
     # Check if user is verified
     verified_users = await get_sheet(VERIFIED_USERS_SHEET)
@@ -138,7 +292,10 @@ async def add_appointment(user_id, service_id, date, time, master_id=None, payme
         'service_id': service_id,
         'date': date,
         'time': time,
-        'status': initial_status
+        'status': initial_status,
+        # UTC start in the salon's time zone, compared as an integer
+        # instead of parsing the date and time (see timezones.has_started)
+        'starts_at': timezones.to_epoch(date, time) or '',
     }
     
     # Add master_id if provided
@@ -158,50 +315,119 @@ async def add_appointment(user_id, service_id, date, time, master_id=None, payme
             if username:
                 new_appointment['user_username'] = username
     except Exception as e:
-        print(f"Error getting user info: {e}")
+        logging.error(f"Error getting user info: {str(e)}")
     
     # Add to sheet
     appointments.append(new_appointment)
-    await write_to_sheet(APPOINTMENTS_SHEET, appointments)
+    if not await write_to_sheet(APPOINTMENTS_SHEET, appointments):
+        return None
     
     return new_appointment
 
-async def update_appointment_status(appointment_id, status):
-    """Update an appointment's status"""
+async def add_appointments(user_id, service_id, slots, master_id=None):
+    """
+    Add appointments of a client for many (date, time) slots with a single write.
+    
+    Returns the new appointments, or an empty list if the write failed.
+    """
+    async with _appointments_lock:
+        new_appointments = await _add_appointments(user_id, service_id, slots, master_id)
+    
+    for appointment in new_appointments:
+        await notify_appointment_hooks(None, appointment)
+    return new_appointments
+
+async def _add_appointments(user_id, service_id, slots, master_id=None):
+    """Write new appointments for many slots, with the appointments lock held"""
+    if not slots:
+        return []
+    
     appointments = await get_all_appointments()
-    updated = False
+    last_id = next_id(appointments) - 1
     
-    for i, appointment in enumerate(appointments):
-        if appointment.get('id') == appointment_id:
-            appointments[i]['status'] = status
-            updated = True
-            break
+    # Check if user is verified
+    is_verified = await is_user_verified(user_id)
     
-    if updated:
-        await write_to_sheet(APPOINTMENTS_SHEET, appointments)
+    user_fields = {}
+    try:
+        user = await user_commands.get_user(user_id)
+        if user:
+            user_fields['user_name'] = user.get('name', '')
+            if user.get('username'):
+                user_fields['user_username'] = user.get('username')
+    except Exception as e:
+        logging.error(f"Error getting user info: {str(e)}")
+    
+    new_appointments = []
+    for i, (date, time) in enumerate(slots, start=1):
+        new_appointment = {
+            'id': str(last_id + i),
+            'user_id': user_id,
+            'service_id': service_id,
+            'date': date,
+            'time': time,
+            'status': "confirmed" if is_verified else "pending",
+            'starts_at': timezones.to_epoch(date, time) or '',
+            **user_fields,
+        }
+        if master_id:
+            new_appointment['master_id'] = master_id
+        new_appointments.append(new_appointment)
+    
+    if not await write_to_sheet(APPOINTMENTS_SHEET, appointments + new_appointments):
+        return []
     
-    return updated
+    return [Appointment(appointment) for appointment in new_appointments]
+
+async def update_appointment_status(appointment_id, status):
+    """Update an appointment's status"""
+    return await _update_appointment(appointment_id, status=status)
+
+async def _update_appointment(appointment_id, **changes):
+    """Change fields of an appointment. Returns False if there is no such appointment or it could not be written"""
+    async with _appointments_lock:
+        appointments = await get_all_appointments()
+        
+        for i, appointment in enumerate(appointments):
+            if str(appointment.get('id')) == str(appointment_id):
+                break
+        else:
+            return False
+        
+        appointments[i] = appointment.replace(**changes)
+        written = await write_to_sheet(APPOINTMENTS_SHEET, appointments)
+    
+    if written:
+        await notify_appointment_hooks(appointment, appointments[i])
+    return written
 
 async def update_appointment_payment(appointment_id, payment_method):
     """Update an appointment's payment method"""
-    appointments = await get_all_appointments()
-    updated = False
-    
-    for i, appointment in enumerate(appointments):
-        if appointment.get('id') == appointment_id:
-            appointments[i]['payment_method'] = payment_method
-            updated = True
-            break
-    
-    if updated:
-        await write_to_sheet(APPOINTMENTS_SHEET, appointments)
-    
-    return updated
+    return await _update_appointment(appointment_id, payment_method=payment_method)
 
 async def cancel_appointment(appointment_id):
     """Cancel an appointment by updating its status"""
     return await update_appointment_status(appointment_id, "canceled")
 
+async def cancel_appointments(appointment_ids):
+    """Cancel many appointments with a single write, returns the number canceled"""
+    appointment_ids = {str(appointment_id) for appointment_id in appointment_ids}
+    async with _appointments_lock:
+        appointments = await get_all_appointments()
+        changes = []
+        
+        for i, appointment in enumerate(appointments):
+            if str(appointment.get('id')) in appointment_ids and appointment.get('status') not in FREE_SLOT_STATUSES:
+                appointments[i] = appointment.replace(status="canceled")
+                changes.append((appointment, appointments[i]))
+        
+        if not changes or not await write_to_sheet(APPOINTMENTS_SHEET, appointments):
+            return 0
+    
+    for before, after in changes:
+        await notify_appointment_hooks(before, after)
+    return len(changes)
+
 async def complete_appointment(appointment_id):
     """Mark an appointment as completed"""
     return await update_appointment_status(appointment_id, "completed")
@@ -219,16 +445,20 @@ async def verify_user(user_id):
     await write_to_sheet(VERIFIED_USERS_SHEET, verified_users)
     
     # Also update any pending appointments for this user to confirmed
-    appointments = await get_all_appointments()
-    updated = False
-    
-    for i, appointment in enumerate(appointments):
-        if str(appointment.get('user_id')) == str(user_id) and appointment.get('status') == 'pending':
-            appointments[i]['status'] = 'confirmed'
-            updated = True
+    async with _appointments_lock:
+        appointments = await get_all_appointments()
+        changes = []
+        
+        for i, appointment in enumerate(appointments):
+            if str(appointment.get('user_id')) == str(user_id) and appointment.get('status') == 'pending':
+                appointments[i] = appointment.replace(status='confirmed')
+                changes.append((appointment, appointments[i]))
+        
+        written = changes and await write_to_sheet(APPOINTMENTS_SHEET, appointments)
     
-    if updated:
-        await write_to_sheet(APPOINTMENTS_SHEET, appointments)
+    if written:
+        for before, after in changes:
+            await notify_appointment_hooks(before, after)
     
     return True
 
@@ -256,38 +486,34 @@ async def is_user_verified(user_id):
 
 async def get_appointments_statistics(master_id=None, start_date=None, end_date=None):
     """Get statistics for appointments"""
-    appointments = await get_all_appointments()
-    filtered_appointments = appointments
-    
-    # Filter by master if provided
-    if master_id:
-        filtered_appointments = [a for a in filtered_appointments if a.get('master_id') == master_id]
+    table = await get_appointments_table()
     
-    # Filter by date range if provided
-    if start_date:
-        filtered_appointments = [a for a in filtered_appointments if a.get('date') >= start_date]
-    if end_date:
-        filtered_appointments = [a for a in filtered_appointments if a.get('date') <= end_date]
+    # Filter by master and date range if provided
+    filters = {
+        'master_id': master_id or None,
+        'date_from': start_date or None,
+        'date_to': end_date or None,
+    }
     
     # Calculate statistics
-    total_count = len(filtered_appointments)
-    completed_count = len([a for a in filtered_appointments if a.get('status') == 'completed'])
-    paid_count = len([a for a in filtered_appointments if a.get('status') == 'paid'])
-    canceled_count = len([a for a in filtered_appointments if a.get('status') == 'canceled'])
+    status_counts = table.count_by('status', **filters)
+    total_count = sum(status_counts.values())
+    completed_count = status_counts['completed']
+    paid_count = status_counts['paid']
+    canceled_count = status_counts['canceled']
     
-    # Calculate revenue
+    # Calculate revenue, looking up each service once
     revenue = 0
-    for appointment in filtered_appointments:
-        if appointment.get('status') in ['completed', 'paid']:
-            service_id = appointment.get('service_id')
-            if service_id:
-                # Try both regular service and offer
-                service = await get_service(service_id)
-                if not service:
-                    service = await get_offer(service_id)
-                if service:
-                    price = float(service.get('price', 0))
-                    revenue += price
+    service_counts = table.count_by('service_id', statuses=('completed', 'paid'), **filters)
+    for service_id, count in service_counts.items():
+        if service_id:
+            # Try both regular service and offer
+            service = await get_service(service_id)
+            if not service:
+                service = await get_offer(service_id)
+            if service:
+                price = float(service.get('price', 0))
+                revenue += price * count
     
     return {
         'total_count': total_count,
@@ -300,13 +526,10 @@ async def get_appointments_statistics(master_id=None, start_date=None, end_date=
 # Группировка записей по датам
 async def get_appointments_grouped_by_date(user_id=None, master_id=None):
     """Get appointments grouped by date"""
-    appointments = await get_all_appointments()
+    table = await get_appointments_table()
     
     # Filter appointments by user or master if provided
-    if user_id:
-        appointments = [a for a in appointments if str(a.get('user_id')) == str(user_id)]
-    if master_id:
-        appointments = [a for a in appointments if a.get('master_id') == master_id]
+    appointments = table.select(user_id=user_id or None, master_id=master_id or None)
     
     # Group appointments by date
     grouped = {}
@@ -315,6 +538,8 @@ async def get_appointments_grouped_by_date(user_id=None, master_id=None):
         if date not in grouped:
             grouped[date] = []
         
+        appointment = appointment.to_dict()
+        
         # Добавляем информацию об услуге и мастере
         service_id = appointment.get('service_id')
         if service_id:
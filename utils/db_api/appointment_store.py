@@ -0,0 +1,407 @@
+import sys
+from abc import ABC, abstractmethod
+from array import array
+from collections import Counter
+from datetime import date
+from functools import lru_cache
+
+from utils.db_api.records import Appointment, as_date, parse_date, parse_int
+
+# Tables of appointments that can be scanned without building a dict or a
+# record per row. AppointmentColumns keeps the Appointments sheet as typed
+# columns (enabled with COLUMNAR_SHEETS=Appointments); AppointmentRows
+# gives the same interface over the default tuple of records, so the
+# repository and the analytics code do not depend on the storage in use.
+
+# Column value of an empty cell
+MISSING = -1
+
+# Largest ID that fits the ID columns
+MAX_ID = 2 ** 63 - 1
+
+# Fields a table can be filtered on, see AppointmentTable.indexes()
+FILTERS = ('id', 'user_id', 'service_id', 'master_id', 'date', 'date_from', 'date_to', 'statuses')
+
+
+@lru_cache(maxsize=4096)
+def _minutes_of(time):
+    """Get an HH:MM time as minutes since midnight, or None if it is not one"""
+    hours, sep, minutes = time.partition(':')
+    if not (sep and len(hours) == 2 and len(minutes) == 2 and hours.isdigit() and minutes.isdigit()):
+        return None
+    return int(hours) * 60 + int(minutes)
+
+
+def _record_matches(record, filters):
+    """Check a record against the filters of AppointmentTable.indexes()"""
+    for name in ('id', 'user_id', 'service_id', 'master_id'):
+        if name in filters and record[name] != parse_int(filters[name]):
+            return False
+    if 'date' in filters and record.date != parse_date(filters['date']):
+        return False
+    if 'date_from' in filters or 'date_to' in filters:
+        day = record.day
+        if day is None:
+            return False
+        if 'date_from' in filters and day < as_date(parse_date(filters['date_from'])):
+            return False
+        if 'date_to' in filters and day > as_date(parse_date(filters['date_to'])):
+            return False
+    if 'statuses' in filters and record.status not in filters['statuses']:
+        return False
+    return True
+
+
+def _check_filters(filters):
+    unknown = set(filters) - set(FILTERS)
+    if unknown:
+        raise TypeError(f"Unknown appointment filters: {', '.join(sorted(unknown))}")
+    # Filters left as None are not applied
+    return {name: value for name, value in filters.items() if value is not None}
+
+
+class AppointmentTable(ABC):
+    """Read-only sequence of appointment records with filters and aggregates"""
+
+    __slots__ = ()
+
+    @abstractmethod
+    def indexes(self, **filters):
+        """
+        Get the positions of the appointments matching all the filters.
+
+        Filters: id, user_id, service_id, master_id (exact), date (exact),
+        date_from and date_to (inclusive) and statuses (any of).
+        """
+
+    def value(self, index, field):
+        """Get one field of the appointment at a position"""
+        return self[index][field]
+
+    def select(self, **filters):
+        """Get the records of the appointments matching the filters"""
+        return [self[index] for index in self.indexes(**filters)]
+
+    def first(self, **filters):
+        """Get the first appointment matching the filters, or None"""
+        indexes = self.indexes(**filters)
+        return self[indexes[0]] if indexes else None
+
+    def count(self, **filters):
+        """Count the appointments matching the filters"""
+        return len(self.indexes(**filters))
+
+    def count_by(self, field, **filters):
+        """
+        Count the matching appointments by the value of a field.
+
+        Besides the record fields, 'day' counts by date as a date object.
+        """
+        if field == 'day':
+            return Counter(as_date(self.value(index, 'date')) for index in self.indexes(**filters))
+        return Counter(self.value(index, field) for index in self.indexes(**filters))
+
+    def to_records(self):
+        """Get all appointments as a tuple of records"""
+        return tuple(self)
+
+    def to_dicts(self):
+        """Get all appointments as plain dicts, the format of the sheet rows"""
+        return [record.to_dict() for record in self]
+
+
+class AppointmentRows(AppointmentTable):
+    """Table over a sequence of appointment records"""
+
+    __slots__ = ('rows',)
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self.rows[index])
+        return self.rows[index]
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def indexes(self, **filters):
+        filters = _check_filters(filters)
+        if not filters:
+            return list(range(len(self.rows)))
+        return [index for index, record in enumerate(self.rows) if _record_matches(record, filters)]
+
+
+class _Labels:
+    """Dictionary encoding of a low-cardinality text column"""
+
+    __slots__ = ('values', 'codes')
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class AppointmentColumns(AppointmentTable):
+    """
+    Column store of the Appointments sheet.
+
+    IDs and start timestamps are kept in integer arrays, dates as day
+    ordinals, times as minutes since midnight and statuses and payment methods as codes of a small
+    dictionary, which takes a fraction of the memory of a record per row
+    and lets filters and aggregates run over the arrays. Rows whose values
+    do not fit the columns (e.g. a text ID or an invalid date) are kept
+    aside as records, columns of the sheet unknown to Appointment as dicts.
+    Records are built only for the rows a caller asks for.
+    """
+
+    __slots__ = (
+        'ids', 'user_ids', 'service_ids', 'master_ids', 'starts', 'days', 'minutes',
+        'statuses', 'payment_methods', 'status_labels', 'payment_labels',
+        'irregular', 'extras',
+    )
+
+    INT_COLUMNS = {
+        'id': 'ids', 'user_id': 'user_ids', 'service_id': 'service_ids', 'master_id': 'master_ids',
+        'starts_at': 'starts',
+    }
+
+    def __init__(self):
+        self.ids = array('q')
+        self.user_ids = array('q')
+        self.service_ids = array('q')
+        self.master_ids = array('q')
+        self.starts = array('q')
+        self.days = array('i')
+        self.minutes = array('h')
+        self.statuses = array('H')
+        self.payment_methods = array('H')
+        self.status_labels = _Labels()
+        self.payment_labels = _Labels()
+        # Position -> record of rows that could not be encoded
+        self.irregular = {}
+        # Position -> columns of the row that Appointment does not know
+        self.extras = {}
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build the store from sheet rows (dicts) or records"""
+        store = cls()
+        for row in rows:
+            store.append(row if isinstance(row, Appointment) else Appointment(row))
+        return store
+
+    from_records = from_rows
+    from_dicts = from_rows
+
+    def append(self, record):
+        """Add an appointment record at the end"""
+        index = len(self.ids)
+        encoded = self._encode(record)
+        if encoded is None:
+            self.irregular[index] = record
+            encoded = (MISSING, MISSING, MISSING, MISSING, MISSING, 0, MISSING, '', '')
+        elif record.extra:
+            self.extras[index] = dict(record.extra)
+
+        appointment_id, user_id, service_id, master_id, starts_at, day, minutes, status, payment_method = encoded
+        self.ids.append(appointment_id)
+        self.user_ids.append(user_id)
+        self.service_ids.append(service_id)
+        self.master_ids.append(master_id)
+        self.starts.append(starts_at)
+        self.days.append(day)
+        self.minutes.append(minutes)
+        self.statuses.append(self.status_labels.encode(status))
+        self.payment_methods.append(self.payment_labels.encode(payment_method))
+
+    @staticmethod
+    def _encode_id(value):
+        if value == '':
+            return MISSING
+        if type(value) is int and 0 <= value <= MAX_ID:
+            return value
+        raise ValueError(value)
+
+    def _encode(self, record):
+        """Encode a record into column values, or None if it does not fit"""
+        encode_id = self._encode_id
+        try:
+            ids = (
+                encode_id(record.id), encode_id(record.user_id), encode_id(record.service_id),
+                encode_id(record.master_id), encode_id(record.starts_at),
+            )
+        except ValueError:
+            return None
+
+        if record.date == '':
+            day = 0
+        else:
+            day = as_date(record.date)
+            if day is None:
+                return None
+            day = day.toordinal()
+
+        if record.time == '':
+            minutes = MISSING
+        else:
+            minutes = _minutes_of(record.time) if isinstance(record.time, str) else None
+            if minutes is None:
+                return None
+
+        return (*ids, day, minutes, record.status, record.payment_method)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._record(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("appointment index out of range")
+        return self._record(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self._record(index)
+
+    def _record(self, index):
+        record = self.irregular.get(index)
+        if record is not None:
+            return record
+        return Appointment(self._row(index))
+
+    def _row(self, index):
+        row = {name: self._int_value(index, name) for name in self.INT_COLUMNS}
+        day = self.days[index]
+        minutes = self.minutes[index]
+        row['date'] = date.fromordinal(day).isoformat() if day else ''
+        row['time'] = sys.intern(f"{minutes // 60:02d}:{minutes % 60:02d}") if minutes != MISSING else ''
+        row['status'] = self.status_labels.values[self.statuses[index]]
+        row['payment_method'] = self.payment_labels.values[self.payment_methods[index]]
+        extra = self.extras.get(index)
+        if extra:
+            row.update(extra)
+        return row
+
+    def _int_value(self, index, name):
+        value = getattr(self, self.INT_COLUMNS[name])[index]
+        return '' if value == MISSING else value
+
+    def value(self, index, field):
+        if index in self.irregular:
+            return self.irregular[index][field]
+        if field in self.INT_COLUMNS:
+            return self._int_value(index, field)
+        if field == 'status':
+            return self.status_labels.values[self.statuses[index]]
+        if field == 'payment_method':
+            return self.payment_labels.values[self.payment_methods[index]]
+        return self._row(index)[field]
+
+    def indexes(self, **filters):
+        filters = _check_filters(filters)
+        candidates = None
+
+        for name, column in self.INT_COLUMNS.items():
+            if name in filters:
+                candidates = self._match(getattr(self, column), candidates, self._filter_id(filters[name]))
+
+        if 'date' in filters:
+            day = as_date(parse_date(filters['date']))
+            candidates = self._match(self.days, candidates, day.toordinal() if day else None)
+
+        if 'date_from' in filters or 'date_to' in filters:
+            first = as_date(parse_date(filters.get('date_from', date.min)))
+            last = as_date(parse_date(filters.get('date_to', date.max)))
+            if first is None or last is None:
+                candidates = []
+            else:
+                first, last = max(first.toordinal(), 1), last.toordinal()
+                days = self.days
+                if candidates is None:
+                    candidates = [i for i, day in enumerate(days) if first <= day <= last]
+                else:
+                    candidates = [i for i in candidates if first <= days[i] <= last]
+
+        if 'statuses' in filters:
+            codes = {code for label, code in self.status_labels.codes.items() if label in filters['statuses']}
+            statuses = self.statuses
+            if candidates is None:
+                candidates = [i for i, code in enumerate(statuses) if code in codes]
+            else:
+                candidates = [i for i in candidates if statuses[i] in codes]
+
+        if candidates is None:
+            candidates = list(range(len(self)))
+
+        if self.irregular:
+            # Irregular rows hold placeholders in the columns, check their records instead
+            irregular = [i for i, record in self.irregular.items() if _record_matches(record, filters)]
+            candidates = sorted({i for i in candidates if i not in self.irregular}.union(irregular))
+
+        return candidates
+
+    @staticmethod
+    def _filter_id(value):
+        value = parse_int(value)
+        if value == '':
+            return MISSING
+        return value if type(value) is int and 0 <= value <= MAX_ID else None
+
+    @staticmethod
+    def _match(column, candidates, value):
+        """Narrow the candidates to the rows whose column equals the value"""
+        if value is None:
+            return []
+        if candidates is None:
+            return [i for i, cell in enumerate(column) if cell == value]
+        return [i for i in candidates if column[i] == value]
+
+    def count_by(self, field, **filters):
+        if field not in self.INT_COLUMNS and field not in ('date', 'day', 'time', 'status', 'payment_method'):
+            return super().count_by(field, **filters)
+
+        filters = _check_filters(filters)
+        column, decode = self._decoder(field)
+        indexes = self.indexes(**filters) if filters else range(len(self))
+        if not filters and not self.irregular:
+            codes = Counter(column)
+        else:
+            codes = Counter(column[i] for i in indexes if i not in self.irregular)
+
+        counts = Counter({decode(code): count for code, count in codes.items()})
+        for index, record in self.irregular.items():
+            if not filters or _record_matches(record, filters):
+                counts[record.day if field == 'day' else record[field]] += 1
+        return counts
+
+    def _decoder(self, field):
+        """Get the column of a field and a function decoding its values"""
+        if field in self.INT_COLUMNS:
+            return getattr(self, self.INT_COLUMNS[field]), lambda value: '' if value == MISSING else value
+        if field == 'day':
+            return self.days, lambda value: date.fromordinal(value) if value else None
+        if field == 'date':
+            return self.days, lambda value: date.fromordinal(value).isoformat() if value else ''
+        if field == 'time':
+            return self.minutes, lambda value: f"{value // 60:02d}:{value % 60:02d}" if value != MISSING else ''
+        if field == 'status':
+            return self.statuses, self.status_labels.values.__getitem__
+        return self.payment_methods, self.payment_labels.values.__getitem__
+
+    def __reduce__(self):
+        return type(self).from_rows, (self.to_records(),)
@@ -299,24 +299,46 @@ async def get_vip_clients():
         logging.error(f"Error getting VIP clients: {str(e)}")
         return []
 
+async def get_vip_clients_page(offset=0, limit=10):
+    """Get one page of VIP clients as a tuple (clients, has_more)"""
+    try:
+        client_stats_data = await google_sheets.get_sheet("ClientStats")
+        
+        vip_stats = [stats for stats in client_stats_data if stats["vip_status"] == "Yes"]
+        page_stats = vip_stats[offset:offset + limit]
+        
+        # Client profiles are only looked up for the clients on this page
+        vip_clients = []
+        for stats in page_stats:
+            client = await user_commands.get_user(stats["client_id"])
+            vip_clients.append({
+                "client_id": stats["client_id"],
+                "name": client.get("full_name", "Unknown") if client else f"ID: {stats['client_id']}",
+                "total_visits": stats["total_visits"],
+                "total_spent": stats["total_spent"]
+            })
+        
+        return vip_clients, len(vip_stats) > offset + limit
+    except Exception as e:
+        logging.error(f"Error getting VIP clients page: {str(e)}")
+        return [], False
+
 async def get_service_popularity():
     """Get popularity ranking of services"""
     try:
-        appointments = await appointment_commands.get_all_appointments()
+        appointments = await appointment_commands.get_appointments_table()
         services = await service_commands.get_all_services()
         
-        service_counts = {}
+        service_counts = appointments.count_by("service_id")
         service_revenue = {}
+        services_by_id = {s["id"]: s for s in reversed(services)}
         
-        for appt in appointments:
-            service_id = appt["service_id"]
-            service_counts[service_id] = service_counts.get(service_id, 0) + 1
-            
+        for service_id, count in service_counts.items():
             # Calculate revenue
-            service = next((s for s in services if str(s["id"]) == str(service_id)), None)
+            service = services_by_id.get(service_id)
             if service:
                 price = float(service.get("price", 0))
-                service_revenue[service_id] = service_revenue.get(service_id, 0) + price
+                service_revenue[service_id] = price * count
         
         # Create popularity ranking
         popularity_data = []
@@ -405,17 +427,13 @@ async def get_daily_forecast_message(admin_id):
         top_service = popular_services[0] if popular_services else None
         
         # Get weekday stats
-        appointments = await appointment_commands.get_all_appointments()
+        appointments = await appointment_commands.get_appointments_table()
         
-        weekday_counts = [0, 0, 0, 0, 0, 0, 0]  # Sun, Mon, ... Sat
+        weekday_counts = [0, 0, 0, 0, 0, 0, 0]  # Mon, Tue, ... Sun
         
-        for appt in appointments:
-            try:
-                date_obj = datetime.datetime.strptime(appt["date"], "%Y-%m-%d")
-                weekday = date_obj.weekday()
-                weekday_counts[weekday] += 1
-            except:
-                pass
+        for date_obj, count in appointments.count_by("day").items():
+            if date_obj:
+                weekday_counts[date_obj.weekday()] += count
         
         # Find least busy day
         min_count = min(weekday_counts[:5])  # Exclude weekend
@@ -1,11 +1,17 @@
 
 import os
+import json
+import hashlib
 import gspread
 import logging
 import time
 import asyncio
-from google.oauth2.service_account import Credentials
+import contextvars
 from dotenv import load_dotenv
+from utils.db_api.sheet_cache import SheetCache, CachePolicy
+from utils.db_api.records import RECORD_TYPES
+from utils.db_api.appointment_store import AppointmentColumns
+from utils.db_api.spreadsheet_pool import SpreadsheetPool
 
 # Load environment variables
 load_dotenv()
@@ -21,9 +27,285 @@ CREDENTIALS_FILE = os.getenv('GOOGLE_CREDENTIALS_FILE')
 client = None
 sheet = None
 
-# Cache for read operations (to reduce API calls)
-sheet_cache = {}
-cache_ttl = 60  # Cache TTL in seconds
+# Authorized client and opened spreadsheets, of the main one and the tenants
+pool = SpreadsheetPool(SCOPES)
+
+
+# Headers of every worksheet the bot relies on
+SHEET_HEADERS = {
+    'Services': ['id', 'name', 'description', 'price', 'duration', 'category_id', 'buffer', 'resource_id'],
+    'Clients': ['user_id', 'username', 'full_name', 'role', 'master_id'],
+    'Appointments': ['id', 'user_id', 'service_id', 'date', 'time', 'status', 'master_id', 'payment_method', 'starts_at'],
+    'History': ['timestamp', 'user_id', 'service_id', 'date', 'time', 'amount', 'master_id', 'payment_method'],
+    'Masters': ['id', 'telegram_id', 'name', 'telegram', 'phone', 'specialties', 'location', 'description'],
+    'Categories': ['id', 'name'],
+    'Offers': ['id', 'name', 'description', 'price', 'duration_days'],
+    'VerifiedUsers': ['user_id'],
+    'ServiceTemplates': ['category_name', 'service_name', 'description', 'default_duration', 'category_id'],
+    'Subscriptions': ['user_id', 'start_date', 'end_date', 'trial', 'referrer_id'],
+    'ServiceCosts': ['service_id', 'materials_cost', 'time_cost', 'other_costs', 'last_updated'],
+    'FinanceAnalytics': ['admin_id', 'date', 'total_income', 'total_expenses', 'profit', 'appointments_count'],
+    'ClientStats': ['client_id', 'total_visits', 'total_spent', 'last_visit', 'favorite_service', 'vip_status', 'notes'],
+    'Payments': ['id', 'user_id', 'plan_months', 'amount', 'payment_date', 'payment_method', 'verified'],
+    'ReferralCredits': ['id', 'referrer_id', 'days', 'created_at', 'status'],
+    'Tenants': ['tenant_id', 'admin_id', 'spreadsheet_id', 'name', 'timezone'],
+    'TenantMembers': ['user_id', 'tenant_id'],
+    'Waitlist': ['id', 'user_id', 'service_id', 'master_id', 'date_from', 'date_to', 'created_at', 'status'],
+    'Resources': ['id', 'name', 'capacity'],
+    'WorkExceptions': ['id', 'master_id', 'date_from', 'date_to', 'start', 'end', 'kind', 'note'],
+    'Series': ['id', 'user_id', 'service_id', 'master_id', 'start_date', 'time', 'rule', 'materialized_until', 'status'],
+}
+
+# Sheets shared by all tenants, they always live in the main spreadsheet.
+# The other sheets (services, masters, appointments...) belong to a salon
+# and are read from the spreadsheet of the current tenant.
+SHARED_SHEETS = frozenset({
+    'Clients', 'VerifiedUsers', 'ServiceTemplates', 'Subscriptions', 'Payments',
+    'ReferralCredits', 'Tenants', 'TenantMembers',
+})
+TENANT_SHEETS = [name for name in SHEET_HEADERS if name not in SHARED_SHEETS]
+
+# Tenant (a Tenant record) the current update is handled for, set by
+# TenantMiddleware; None means the main spreadsheet
+current_tenant = contextvars.ContextVar('current_tenant', default=None)
+
+# Tenant spreadsheets whose worksheets were already ensured
+_tenant_schemas = set()
+
+# Guards of the worksheet requests by (tenant key, sheet)
+_worksheet_guards = {}
+
+class WorksheetGuard:
+    """
+    Orders the requests to one worksheet, which run in threads.
+    
+    Writes run one at a time. Reads neither wait for each other nor hold up
+    writes; a read that overlapped a write may have seen the sheet halfway
+    through being rewritten, so it is repeated with the writes held off.
+    """
+    
+    def __init__(self):
+        self.write_lock = asyncio.Lock()
+        self.writes = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+    
+    async def read(self, func, *args):
+        """Run a blocking read"""
+        await self.idle.wait()
+        writes = self.writes
+        try:
+            data = await asyncio.to_thread(func, *args)
+        except Exception:
+            # A sheet being rewritten may also fail to read
+            if self.idle.is_set() and self.writes == writes:
+                raise
+        else:
+            if self.idle.is_set() and self.writes == writes:
+                return data
+        async with self.write_lock:
+            return await asyncio.to_thread(func, *args)
+    
+    async def write(self, func, *args):
+        """Run a blocking write once the other writes are done"""
+        async with self.write_lock:
+            self.idle.clear()
+            try:
+                return await asyncio.to_thread(func, *args)
+            finally:
+                self.writes += 1
+                self.idle.set()
+
+# Column stores that can replace the records of a sheet in the cache
+COLUMN_STORES = {
+    'Appointments': AppointmentColumns,
+}
+
+# Sheets cached as column stores, e.g. COLUMNAR_SHEETS=Appointments for large salons
+columnar_sheets = {name.strip() for name in os.getenv('COLUMNAR_SHEETS', '').split(',') if name.strip() in COLUMN_STORES}
+
+# Local file remembering that the schema of the spreadsheet was already ensured
+SCHEMA_CACHE_FILE = os.getenv('SCHEMA_CACHE_FILE', '.sheets_schema.json')
+
+# Guards setup() against concurrent initialization
+_setup_lock = asyncio.Lock()
+
+# Callbacks notified about sheet operations as hook(operation, sheet_name),
+# where operation is "read", "write" or "cache_hit"
+sheet_hooks = []
+
+def add_sheet_hook(hook):
+    """Register a callback notified about every sheet operation"""
+    sheet_hooks.append(hook)
+
+def notify_sheet_hooks(operation, sheet_name):
+    """Notify the registered hooks about a sheet operation"""
+    for hook in sheet_hooks:
+        try:
+            hook(operation, sheet_name)
+        except Exception as e:
+            logging.error(f"Error in sheet hook: {str(e)}")
+
+# Cache for read operations (to reduce API calls). Catalog sheets rarely
+# change and are served stale while refreshed; sheets edited on every
+# booking expire quickly, keeping data at most a minute old as before.
+SHEET_CACHE_POLICIES = {
+    'Services': CachePolicy(ttl=300, stale_ttl=900),
+    'Categories': CachePolicy(ttl=300, stale_ttl=900),
+    'Offers': CachePolicy(ttl=300, stale_ttl=900),
+    'ServiceTemplates': CachePolicy(ttl=3600, stale_ttl=3600),
+    'ServiceCosts': CachePolicy(ttl=300, stale_ttl=900),
+    'Masters': CachePolicy(ttl=120, stale_ttl=300),
+    'Appointments': CachePolicy(ttl=15, stale_ttl=45),
+    'Clients': CachePolicy(ttl=30, stale_ttl=30),
+    'VerifiedUsers': CachePolicy(ttl=30, stale_ttl=30),
+    'Subscriptions': CachePolicy(ttl=30, stale_ttl=30),
+    'Payments': CachePolicy(ttl=15, stale_ttl=15),
+    'ReferralCredits': CachePolicy(ttl=15, stale_ttl=15),
+    'Waitlist': CachePolicy(ttl=30, stale_ttl=60),
+    'Resources': CachePolicy(ttl=300, stale_ttl=900),
+    'WorkExceptions': CachePolicy(ttl=120, stale_ttl=300),
+    'Series': CachePolicy(ttl=60, stale_ttl=120),
+}
+
+def _create_cache():
+    return SheetCache(
+        SHEET_CACHE_POLICIES,
+        default_policy=CachePolicy(ttl=60),
+        on_hit=lambda sheet_name: notify_sheet_hooks('cache_hit', sheet_name)
+    )
+
+# Cache of the main spreadsheet, and one cache per tenant spreadsheet
+sheet_cache = _create_cache()
+_tenant_caches = {}
+
+def get_tenant_key(sheet_name):
+    """Get the spreadsheet ID a sheet is routed to, or None for the main spreadsheet"""
+    if sheet_name in SHARED_SHEETS:
+        return None
+    tenant = current_tenant.get()
+    if tenant is None:
+        return None
+    spreadsheet_id = str(tenant.get('spreadsheet_id') or '')
+    if not spreadsheet_id or spreadsheet_id == SPREADSHEET_ID:
+        return None
+    return spreadsheet_id
+
+def get_sheet_cache(sheet_name):
+    """Get the cache holding a sheet for the current tenant"""
+    key = get_tenant_key(sheet_name)
+    if key is None:
+        return sheet_cache
+    cache = _tenant_caches.get(key)
+    if cache is None:
+        cache = _tenant_caches[key] = _create_cache()
+    return cache
+
+def get_worksheet_guard(sheet_name):
+    """Get the guard of the worksheet requests of a sheet for the current tenant"""
+    key = (get_tenant_key(sheet_name), sheet_name)
+    guard = _worksheet_guards.get(key)
+    if guard is None:
+        guard = _worksheet_guards[key] = WorksheetGuard()
+    return guard
+
+def parse_records(sheet_name, rows):
+    """Parse rows of a sheet into immutable records, if the sheet has a record type"""
+    record_type = RECORD_TYPES.get(sheet_name)
+    if record_type is None:
+        return rows
+    return record_type.from_rows(rows)
+
+def parse_sheet(sheet_name, rows):
+    """Parse all rows of a sheet into the form it is cached in"""
+    if sheet_name in columnar_sheets:
+        return COLUMN_STORES[sheet_name].from_rows(rows)
+    return parse_records(sheet_name, rows)
+
+def get_schema_fingerprint():
+    """Get a fingerprint of the expected spreadsheet schema"""
+    schema = json.dumps({'spreadsheet_id': SPREADSHEET_ID, 'sheets': SHEET_HEADERS}, sort_keys=True)
+    return hashlib.sha256(schema.encode('utf-8')).hexdigest()
+
+def is_schema_cached(fingerprint):
+    """Check if the schema with this fingerprint was already ensured"""
+    try:
+        with open(SCHEMA_CACHE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f).get('fingerprint') == fingerprint
+    except (OSError, ValueError):
+        return False
+
+def save_schema_fingerprint(fingerprint):
+    """Remember that the schema with this fingerprint is in place"""
+    try:
+        with open(SCHEMA_CACHE_FILE, 'w', encoding='utf-8') as f:
+            json.dump({'fingerprint': fingerprint, 'checked_at': int(time.time())}, f)
+    except OSError as e:
+        logging.warning(f"Could not save schema fingerprint: {str(e)}")
+
+def ensure_schema(spreadsheet, sheet_names=None):
+    """
+    Create missing worksheets and their headers, and add the missing columns
+    to the headers of existing worksheets, with a few batched requests.
+    Returns the names of the created worksheets.
+    """
+    worksheets = {ws.title: ws for ws in spreadsheet.worksheets()}
+    names = list(sheet_names or SHEET_HEADERS)
+    missing = [name for name in names if name not in worksheets]
+    existing = [name for name in names if name in worksheets]
+    
+    # Read the header rows of the existing worksheets in a single request;
+    # rows are written by header, so a column missing there would be lost
+    headers = {}
+    added = {}
+    if existing:
+        response = spreadsheet.values_batch_get([f"'{name}'!1:1" for name in existing])
+        for name, value_range in zip(existing, response.get('valueRanges', [])):
+            header = [str(column) for column in (value_range.get('values') or [[]])[0]]
+            new_columns = [column for column in SHEET_HEADERS[name] if column not in header]
+            if new_columns:
+                headers[name] = header + new_columns
+                added[name] = new_columns
+    
+    if not missing and not headers:
+        return []
+    
+    # Add the missing worksheets and widen the narrow ones in a single batch_update
+    requests = [
+        {'addSheet': {'properties': {'title': name, 'gridProperties': {'rowCount': 1000, 'columnCount': 20}}}}
+        for name in missing
+    ]
+    for name, header in headers.items():
+        col_count = getattr(worksheets[name], 'col_count', None)
+        if col_count is not None and col_count < len(header):
+            requests.append({'appendDimension': {
+                'sheetId': worksheets[name].id, 'dimension': 'COLUMNS', 'length': len(header) - col_count
+            }})
+    if requests:
+        spreadsheet.batch_update({'requests': requests})
+    
+    # Write all header rows in a single values update
+    spreadsheet.values_batch_update({
+        'valueInputOption': 'RAW',
+        'data': [
+            {'range': f"'{name}'!A1", 'values': [SHEET_HEADERS[name]]}
+            for name in missing
+        ] + [
+            {'range': f"'{name}'!A1", 'values': [header]}
+            for name, header in headers.items()
+        ]
+    })
+    
+    if missing:
+        logging.info(f"Created worksheets: {', '.join(missing)}")
+    for name, new_columns in added.items():
+        logging.info(f"Added columns to {name}: {', '.join(new_columns)}")
+    return missing
+
+def _connect():
+    """Authorize and open the spreadsheet (blocking)"""
+    gc = pool.connect(CREDENTIALS_FILE)
+    return gc, gc.open_by_key(SPREADSHEET_ID)
 
 async def setup():
     """Setup Google Sheets connection"""
@@ -33,167 +315,164 @@ async def setup():
     if sheet is not None:
         return sheet
     
-    # Validate environment variables
-    if not SPREADSHEET_ID:
-        logging.error("SPREADSHEET_ID is not set in the .env file")
-        raise ValueError("SPREADSHEET_ID is not set in the .env file")
-    
-    if not CREDENTIALS_FILE:
-        logging.error("GOOGLE_CREDENTIALS_FILE is not set in the .env file")
-        raise ValueError("GOOGLE_CREDENTIALS_FILE is not set in the .env file")
-    
-    if not os.path.exists(CREDENTIALS_FILE):
-        logging.error(f"Credentials file not found at: {CREDENTIALS_FILE}")
-        raise FileNotFoundError(f"Credentials file not found at: {CREDENTIALS_FILE}")
-    
-    try:
-        # Create credentials from the service account file
-        creds = Credentials.from_service_account_file(CREDENTIALS_FILE, scopes=SCOPES)
-        
-        # Authorize with Google
-        client = gspread.authorize(creds)
+    async with _setup_lock:
+        # Another task may have finished the setup while we were waiting
+        if sheet is not None:
+            return sheet
         
-        # Open the spreadsheet with timeout and retry
-        max_retries = 3
-        retry_count = 0
-        while retry_count < max_retries:
-            try:
-                sheet = client.open_by_key(SPREADSHEET_ID, timeout=30)  # Set timeout to 30 seconds
-                break
-            except Exception as e:
-                retry_count += 1
-                if retry_count >= max_retries:
-                    raise
-                logging.warning(f"Retry {retry_count}/{max_retries} opening spreadsheet: {str(e)}")
-                await asyncio.sleep(2)  # Wait before retrying
+        # Validate environment variables
+        if not SPREADSHEET_ID:
+            logging.error("SPREADSHEET_ID is not set in the .env file")
+            raise ValueError("SPREADSHEET_ID is not set in the .env file")
         
-        # Ensure all required worksheets exist
-        worksheets = [ws.title for ws in sheet.worksheets()]
+        if not CREDENTIALS_FILE:
+            logging.error("GOOGLE_CREDENTIALS_FILE is not set in the .env file")
+            raise ValueError("GOOGLE_CREDENTIALS_FILE is not set in the .env file")
         
-        required_sheets = [
-            'Services', 'Clients', 'Appointments', 'History', 'Masters', 
-            'Categories', 'Offers', 'VerifiedUsers', 'ServiceTemplates', 
-            'Subscriptions', 'ServiceCosts', 'FinanceAnalytics', 'ClientStats',
-            'Payments'  # Add payments sheet
-        ]
+        if not os.path.exists(CREDENTIALS_FILE):
+            logging.error(f"Credentials file not found at: {CREDENTIALS_FILE}")
+            raise FileNotFoundError(f"Credentials file not found at: {CREDENTIALS_FILE}")
         
-        for required in required_sheets:
-            if required not in worksheets:
-                # Create the worksheet if it doesn't exist
-                sheet.add_worksheet(title=required, rows=1000, cols=20)
-                
-                # Add headers based on worksheet
-                if required == 'Services':
-                    sheet.worksheet(required).append_row(['id', 'name', 'description', 'price', 'duration', 'category_id'])
-                elif required == 'Clients':
-                    sheet.worksheet(required).append_row(['user_id', 'username', 'full_name', 'role', 'master_id'])
-                elif required == 'Appointments':
-                    sheet.worksheet(required).append_row(['id', 'user_id', 'service_id', 'date', 'time', 'status', 'master_id', 'payment_method'])
-                elif required == 'History':
-                    sheet.worksheet(required).append_row(['timestamp', 'user_id', 'service_id', 'date', 'time', 'amount', 'master_id', 'payment_method'])
-                elif required == 'Masters':
-                    sheet.worksheet(required).append_row(['id', 'telegram_id', 'name', 'telegram', 'phone', 'specialties', 'location', 'description'])
-                elif required == 'Categories':
-                    sheet.worksheet(required).append_row(['id', 'name'])
-                elif required == 'Offers':
-                    sheet.worksheet(required).append_row(['id', 'name', 'description', 'price', 'duration_days'])  # Changed from 'duration' to 'duration_days'
-                elif required == 'VerifiedUsers':
-                    sheet.worksheet(required).append_row(['user_id'])
-                elif required == 'ServiceTemplates':
-                    sheet.worksheet(required).append_row(['category_name', 'service_name', 'description', 'default_duration', 'category_id'])
-                elif required == 'Subscriptions':
-                    sheet.worksheet(required).append_row(['user_id', 'start_date', 'end_date', 'trial', 'referrer_id'])
-                elif required == 'ServiceCosts':
-                    sheet.worksheet(required).append_row(['service_id', 'materials_cost', 'time_cost', 'other_costs', 'last_updated'])
-                elif required == 'FinanceAnalytics':
-                    sheet.worksheet(required).append_row(['admin_id', 'date', 'total_income', 'total_expenses', 'profit', 'appointments_count'])
-                elif required == 'ClientStats':
-                    sheet.worksheet(required).append_row(['client_id', 'total_visits', 'total_spent', 'last_visit', 'favorite_service', 'vip_status', 'notes'])
-                elif required == 'Payments':
-                    sheet.worksheet(required).append_row(['id', 'user_id', 'plan_months', 'amount', 'payment_date', 'payment_method', 'verified'])
-        
-        # Initialize template services if ServiceTemplates is empty
-        templates_sheet = sheet.worksheet('ServiceTemplates')
-        if len(templates_sheet.get_all_records()) == 0:
-            # Setup in a separate function to avoid timeout
-            asyncio.create_task(initialize_template_services_async())
+        try:
+            started = time.perf_counter()
+            
+            # Open the spreadsheet with retry, off the event loop
+            max_retries = 3
+            retry_count = 0
+            while retry_count < max_retries:
+                try:
+                    gc, spreadsheet = await asyncio.to_thread(_connect)
+                    break
+                except Exception as e:
+                    retry_count += 1
+                    if retry_count >= max_retries:
+                        raise
+                    logging.warning(f"Retry {retry_count}/{max_retries} opening spreadsheet: {str(e)}")
+                    await asyncio.sleep(2)  # Wait before retrying
+            connected = time.perf_counter()
+            
+            # Ensure all required worksheets exist, unless this schema was already checked
+            fingerprint = get_schema_fingerprint()
+            if is_schema_cached(fingerprint):
+                schema_status = "cached"
+            else:
+                created = await asyncio.to_thread(ensure_schema, spreadsheet)
+                save_schema_fingerprint(fingerprint)
+                schema_status = f"created {len(created)} sheets" if created else "verified"
+            
+            client, sheet = gc, spreadsheet
+            pool.add(SPREADSHEET_ID, spreadsheet, pin=True)
+            
+            logging.info(
+                f"Successfully connected to Google Sheets in {(time.perf_counter() - started) * 1000:.0f} ms "
+                f"(connect {(connected - started) * 1000:.0f} ms, schema {schema_status})"
+            )
+            return sheet
         
-        logging.info("Successfully connected to Google Sheets")
+        except Exception as e:
+            logging.error(f"Error connecting to Google Sheets: {str(e)}")
+            if "MalformedError" in str(e):
+                logging.error("Your credentials file appears to be invalid. Please verify it contains all required fields.")
+                logging.error("Run the verify_credentials.py script to check your credentials file.")
+            return None
+
+def _ensure_tenant_schema(spreadsheet_id, spreadsheet):
+    """Create the missing tenant worksheets, once per spreadsheet (blocking)"""
+    if spreadsheet_id in _tenant_schemas:
+        return
+    created = ensure_schema(spreadsheet, TENANT_SHEETS)
+    if created:
+        logging.info(f"Tenant spreadsheet {spreadsheet_id}: created {len(created)} sheets")
+    _tenant_schemas.add(spreadsheet_id)
+
+async def get_spreadsheet(sheet_name):
+    """Get the spreadsheet holding a sheet for the current tenant"""
+    key = get_tenant_key(sheet_name)
+    if key is None:
+        if sheet is None:
+            return await setup()
+        await pool.refresh_credentials()
         return sheet
     
+    # The main setup authorizes the client shared by all spreadsheets
+    if await setup() is None:
+        return None
+    try:
+        return await pool.open(key, prepare=lambda spreadsheet: _ensure_tenant_schema(key, spreadsheet))
     except Exception as e:
-        logging.error(f"Error connecting to Google Sheets: {str(e)}")
-        if "MalformedError" in str(e):
-            logging.error("Your credentials file appears to be invalid. Please verify it contains all required fields.")
-            logging.error("Run the verify_credentials.py script to check your credentials file.")
+        logging.error(f"Error opening tenant spreadsheet {key}: {str(e)}")
         return None
 
-async def initialize_template_services_async():
-    """Initialize template services asynchronously to avoid timeouts"""
-    global sheet
-    
-    if sheet is None:
-        sheet = await setup()
-        if sheet is None:
-            return
-    
+def reset_schema_cache():
+    """Forget the cached schema fingerprint so the next setup re-checks worksheets"""
     try:
-        templates_sheet = sheet.worksheet('ServiceTemplates')
-        initialize_template_services(templates_sheet)
-    except Exception as e:
-        logging.error(f"Error initializing template services: {str(e)}")
+        os.remove(SCHEMA_CACHE_FILE)
+    except FileNotFoundError:
+        pass
 
-def initialize_template_services(worksheet):
-    """Initialize template services with category_id"""
-    # Get all categories or create them if they don't exist
-    category_ids = {}
-    
-    templates = [
-        # Format: category_name, service_name, description, default_duration
-        # Маникюр
-        ['Маникюр', 'Классический маникюр', 'Обрезной маникюр с обработкой кутикулы', 45],
-        ['Маникюр', 'Аппаратный маникюр', 'Маникюр с использованием аппарата без повреждения кутикулы', 60],
-        # More templates...
+def _load_worksheet(spreadsheet, sheet_name):
+    """Read and parse all records of a worksheet (blocking, run in a thread)"""
+    worksheet = spreadsheet.worksheet(sheet_name)
+    try:
+        data = worksheet.get_all_records()
+    except IndexError:
+        # gspread fails on a sheet holding only the header row
+        data = []
+    return parse_sheet(sheet_name, data)
+
+def _written_rows(sheet_name, headers, data):
+    """Rows written to a record sheet as they read back: records are kept, dicts keep the columns of the sheet"""
+    record_type = RECORD_TYPES[sheet_name]
+    columns = set(headers)
+    # Records are kept unless they have fields the sheet has no column for
+    keep_records = record_type.FIELDS.keys() <= columns
+    return [
+        item if keep_records and type(item) is record_type and (not item.extra or item.extra.keys() <= columns)
+        else {header: item.get(header, "") for header in headers}
+        for item in data
     ]
+
+def _write_worksheet(spreadsheet, sheet_name, data):
+    """
+    Replace the rows of a worksheet (blocking, run in a thread). Returns the
+    written data in the form the sheet is cached in, or None if the sheet
+    has no record type and is only known once read back.
+    """
+    worksheet = spreadsheet.worksheet(sheet_name)
     
-    # Add just a few templates for testing instead of all
-    test_templates = templates[:10]  # Just add first 10 templates for now
+    # Get the headers
+    headers = worksheet.row_values(1)
     
-    # Add template services in batches to avoid API limits
-    batch_size = 5
-    for i in range(0, len(test_templates), batch_size):
-        batch = test_templates[i:i+batch_size]
-        
-        # Add category_id field to each template service
-        enhanced_batch = []
-        for template in batch:
-            category_name = template[0]
-            # We'll set a placeholder for category_id - it will be updated later
-            enhanced_template = template + [""]
-            enhanced_batch.append(enhanced_template)
-            
-        worksheet.append_rows(enhanced_batch)
-        time.sleep(1)  # Avoid rate limits
+    # Clear the sheet (except headers)
+    if worksheet.row_count > 1:
+        worksheet.delete_rows(2, worksheet.row_count)
     
-    return True
-
-async def get_sheet(sheet_name):
-    """Get data from a specific sheet with caching"""
-    global sheet, sheet_cache
+    # Write all rows with a single request
+    rows = [[item.get(header, "") for header in headers] for item in data]
+    if rows:
+        worksheet.append_rows(rows)
     
-    # Check cache first
-    cache_key = f"sheet_{sheet_name}"
-    if cache_key in sheet_cache:
-        cache_entry = sheet_cache[cache_key]
-        if time.time() - cache_entry['timestamp'] < cache_ttl:
-            return cache_entry['data']
+    if sheet_name not in RECORD_TYPES:
+        return None
+    return parse_sheet(sheet_name, _written_rows(sheet_name, headers, data))
+
+def _append_worksheet(spreadsheet, sheet_name, data):
+    """Append rows to a worksheet (blocking, run in a thread). Returns the headers of the worksheet"""
+    worksheet = spreadsheet.worksheet(sheet_name)
+    headers = worksheet.row_values(1)
     
-    # Ensure sheet is initialized
-    if sheet is None:
-        sheet = await setup()
-        if sheet is None:
-            logging.error(f"Error getting sheet {sheet_name}: sheet is not initialized")
-            return []
+    rows = [[item.get(header, "") for header in headers] for item in data]
+    if rows:
+        worksheet.append_rows(rows)
+    return headers
+
+async def _read_sheet(sheet_name):
+    """Read all records of a sheet, or None if it could not be read"""
+    # Ensure the spreadsheet of the sheet is opened
+    spreadsheet = await get_spreadsheet(sheet_name)
+    if spreadsheet is None:
+        logging.error(f"Error getting sheet {sheet_name}: sheet is not initialized")
+        return None
     
     try:
         # Get the worksheet with retry
@@ -202,43 +481,109 @@ async def get_sheet(sheet_name):
         
         while retry_count < max_retries:
             try:
-                # Get the worksheet
-                worksheet = sheet.worksheet(sheet_name)
-                
-                # Get all data from the sheet
-                data = worksheet.get_all_records()
-                
-                # Cache the result
-                sheet_cache[cache_key] = {
-                    'data': data,
-                    'timestamp': time.time()
-                }
-                
+                # Large sheets take seconds to read and parse, keep the event loop free
+                data = await get_worksheet_guard(sheet_name).read(_load_worksheet, spreadsheet, sheet_name)
+                notify_sheet_hooks('read', sheet_name)
                 return data
+            except gspread.exceptions.WorksheetNotFound:
+                # The cached schema is stale, re-check it on the next setup
+                logging.error(f"Worksheet {sheet_name} not found")
+                reset_schema_cache()
+                return None
             except Exception as e:
                 retry_count += 1
                 if retry_count >= max_retries:
                     logging.error(f"Failed to get sheet {sheet_name} after {max_retries} retries: {str(e)}")
-                    return []
+                    return None
                 
                 logging.warning(f"Retry {retry_count}/{max_retries} getting sheet {sheet_name}: {str(e)}")
                 await asyncio.sleep(2)  # Wait before retrying
         
-        return []
+        return None
     except Exception as e:
         logging.error(f"Error getting sheet {sheet_name}: {str(e)}")
-        return []
+        return None
+
+async def get_sheet(sheet_name):
+    """
+    Get data from a specific sheet with caching.
+    
+    Rows of the sheets in RECORD_TYPES are immutable records shared with the
+    cache; the returned list itself is a copy the caller may change.
+    """
+    data = await get_sheet_cache(sheet_name).get_or_load(sheet_name, lambda: _read_sheet(sheet_name))
+    return list(data) if data is not None else []
+
+async def get_sheet_table(sheet_name):
+    """
+    Get the cached data of a sheet as is, without copying it.
+    
+    That is the sequence of rows, or a column store for the sheets in
+    columnar_sheets. It is shared with the cache and must not be changed.
+    """
+    data = await get_sheet_cache(sheet_name).get_or_load(sheet_name, lambda: _read_sheet(sheet_name))
+    return data if data is not None else ()
+
+async def _read_sheet_page(sheet_name, offset, limit):
+    """Read one page of records of a sheet, or None if it could not be read"""
+    # Ensure the spreadsheet of the sheet is opened
+    spreadsheet = await get_spreadsheet(sheet_name)
+    if spreadsheet is None:
+        logging.error(f"Error getting page of sheet {sheet_name}: sheet is not initialized")
+        return None
+    
+    try:
+        worksheet = spreadsheet.worksheet(sheet_name)
+        
+        # Row 1 holds the headers; read one extra row to know if there is a next page
+        first_index = offset + 2
+        if first_index > worksheet.row_count:
+            records = []
+        else:
+            last_index = min(first_index + limit, worksheet.row_count)
+            try:
+                records = worksheet.get_records(first_index=first_index, last_index=last_index)
+            except IndexError:
+                # The requested range is empty
+                records = []
+            notify_sheet_hooks('read', sheet_name)
+        
+        return list(parse_records(sheet_name, records[:limit])), len(records) > limit
+    except Exception as e:
+        logging.error(f"Error getting page of sheet {sheet_name}: {str(e)}")
+        return None
+
+async def get_sheet_page(sheet_name, offset=0, limit=10):
+    """
+    Get one page of records from a specific sheet.
+    
+    Returns a tuple (records, has_more). If the whole sheet is cached the
+    page is sliced from the cache, otherwise only the rows of the page
+    are read from the worksheet.
+    """
+    cache = get_sheet_cache(sheet_name)
+    
+    # Serve the page from the full sheet cache if it is fresh
+    data = cache.peek(sheet_name)
+    if data is not None:
+        notify_sheet_hooks('cache_hit', sheet_name)
+        return list(data[offset:offset + limit]), len(data) > offset + limit
+    
+    page = await cache.get_or_load(
+        sheet_name,
+        lambda: _read_sheet_page(sheet_name, offset, limit),
+        key=f"page:{offset}:{limit}",
+        size=lambda page: len(page[0])
+    )
+    return page if page is not None else ([], False)
 
 async def write_to_sheet(sheet_name, data):
     """Write data to a specific sheet"""
-    global sheet, sheet_cache
-    
-    # Ensure sheet is initialized
-    if sheet is None:
-        sheet = await setup()
-        if sheet is None:
-            logging.error(f"Error writing to sheet {sheet_name}: sheet is not initialized")
-            return False
+    # Ensure the spreadsheet of the sheet is opened
+    spreadsheet = await get_spreadsheet(sheet_name)
+    if spreadsheet is None:
+        logging.error(f"Error writing to sheet {sheet_name}: sheet is not initialized")
+        return False
     
     try:
         # Get the worksheet with retry
@@ -247,40 +592,25 @@ async def write_to_sheet(sheet_name, data):
         
         while retry_count < max_retries:
             try:
-                # Get the worksheet
-                worksheet = sheet.worksheet(sheet_name)
-                
-                # Get the headers
-                headers = worksheet.row_values(1)
-                
-                # Clear the sheet (except headers)
-                if worksheet.row_count > 1:
-                    worksheet.delete_rows(2, worksheet.row_count)
+                written = await get_worksheet_guard(sheet_name).write(_write_worksheet, spreadsheet, sheet_name, data)
+                notify_sheet_hooks('write', sheet_name)
                 
-                # Write the data in batches
-                batch_size = 10
-                rows = []
-                
-                for item in data:
-                    row = []
-                    for header in headers:
-                        row.append(item.get(header, ""))
-                    rows.append(row)
-                
-                # Write data in batches
-                for i in range(0, len(rows), batch_size):
-                    batch = rows[i:i+batch_size]
-                    if batch:
-                        worksheet.append_rows(batch)
-                        time.sleep(1)  # Avoid rate limits
-                
-                # Invalidate cache
-                cache_key = f"sheet_{sheet_name}"
-                if cache_key in sheet_cache:
-                    del sheet_cache[cache_key]
+                # Readers get the written data while the sheet is read back in
+                # the background; cached pages of the sheet are dropped
+                cache = get_sheet_cache(sheet_name)
+                if written is not None:
+                    cache.store(sheet_name, written)
+                else:
+                    cache.invalidate(sheet_name)
                 
                 return True
             
+            except gspread.exceptions.WorksheetNotFound:
+                # The cached schema is stale, re-check it on the next setup
+                logging.error(f"Worksheet {sheet_name} not found")
+                reset_schema_cache()
+                return False
+            
             except Exception as e:
                 retry_count += 1
                 if retry_count >= max_retries:
@@ -295,9 +625,68 @@ async def write_to_sheet(sheet_name, data):
         logging.error(f"Error writing to sheet {sheet_name}: {str(e)}")
         return False
 
+async def append_to_sheet(sheet_name, data):
+    """
+    Append rows to a specific sheet, without rewriting the existing ones.
+    
+    A failed request is retried, so after a network error the rows may be
+    appended twice; sheets written this way must tolerate repeated rows.
+    """
+    # Ensure the spreadsheet of the sheet is opened
+    spreadsheet = await get_spreadsheet(sheet_name)
+    if spreadsheet is None:
+        logging.error(f"Error appending to sheet {sheet_name}: sheet is not initialized")
+        return False
+    
+    max_retries = 3
+    retry_count = 0
+    
+    while retry_count < max_retries:
+        try:
+            headers = await get_worksheet_guard(sheet_name).write(_append_worksheet, spreadsheet, sheet_name, data)
+            notify_sheet_hooks('write', sheet_name)
+            
+            # Cached records of the sheet get the appended rows, as on a write;
+            # other sheets are read again
+            cache = get_sheet_cache(sheet_name)
+            cached = cache.cached(sheet_name)
+            if sheet_name in RECORD_TYPES and isinstance(cached, tuple):
+                cache.store(sheet_name, cached + parse_records(sheet_name, _written_rows(sheet_name, headers, data)))
+            else:
+                cache.invalidate(sheet_name)
+            
+            return True
+        
+        except gspread.exceptions.WorksheetNotFound:
+            # The cached schema is stale, re-check it on the next setup
+            logging.error(f"Worksheet {sheet_name} not found")
+            reset_schema_cache()
+            return False
+        
+        except Exception as e:
+            retry_count += 1
+            if retry_count >= max_retries:
+                logging.error(f"Failed to append to sheet {sheet_name} after {max_retries} retries: {str(e)}")
+                return False
+            
+            logging.warning(f"Retry {retry_count}/{max_retries} appending to sheet {sheet_name}: {str(e)}")
+            await asyncio.sleep(2)  # Wait before retrying
+    
+    return False
+
 # Function to clear cache
-async def clear_cache():
-    """Clear sheet cache to force fresh data"""
-    global sheet_cache
-    sheet_cache = {}
+async def clear_cache(sheet_name=None):
+    """Clear sheet cache (of one sheet or all of them, of every tenant) to force fresh data"""
+    for cache in (sheet_cache, *_tenant_caches.values()):
+        cache.invalidate(sheet_name)
     return True
+
+def get_cache_stats():
+    """Get hit/miss counters and cached rows per sheet, summed over the tenants"""
+    stats = sheet_cache.get_stats()
+    for cache in _tenant_caches.values():
+        for sheet_name, counters in cache.get_stats().items():
+            sheet_stats = stats.setdefault(sheet_name, dict.fromkeys(counters, 0))
+            for name, value in counters.items():
+                sheet_stats[name] = sheet_stats.get(name, 0) + value
+    return stats
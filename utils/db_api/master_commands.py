@@ -1,7 +1,8 @@
 
 # This file includes functions for working with master data
 from utils.db_api.google_sheets import get_sheet, write_to_sheet
-from datetime import datetime, timedelta
+from utils.db_api.records import next_id
+from datetime import datetime
 
 # Sheet name for masters
 MASTERS_SHEET = "Masters"
@@ -19,7 +20,7 @@ async def get_master(master_id):
     """Get a master by their ID"""
     masters = await get_all_masters()
     for master in masters:
-        if master.get('id') == master_id:
+        if str(master.get('id')) == str(master_id):
             return master
     return None
 
@@ -61,9 +62,7 @@ async def add_master(name, telegram_id=None, phone=None, specialties=None, teleg
                 return master
     
     # Generate a new ID
-    new_id = "1"
-    if masters:
-        new_id = str(max([int(master.get('id', 0)) for master in masters]) + 1)
+    new_id = str(next_id(masters))
     
     # Create new master
     new_master = {
@@ -91,28 +90,32 @@ async def add_master(name, telegram_id=None, phone=None, specialties=None, teleg
     
     return new_master
 
-async def update_master(master_id, name=None, telegram_id=None, phone=None, specialties=None, telegram=None, location=None, description=None):
+async def update_master(master_id, name=None, telegram_id=None, phone=None, specialties=None, telegram=None, location=None, description=None, address=None):
     """Update a master in the database"""
     masters = await get_all_masters()
     updated = False
     
     for i, master in enumerate(masters):
-        if master.get('id') == master_id:
+        if str(master.get('id')) == str(master_id):
             # Update fields if provided
+            changes = {}
             if name is not None:
-                masters[i]['name'] = name
+                changes['name'] = name
             if telegram_id is not None:
-                masters[i]['telegram_id'] = telegram_id
+                changes['telegram_id'] = telegram_id
             if phone is not None:
-                masters[i]['phone'] = phone
+                changes['phone'] = phone
             if specialties is not None:
-                masters[i]['specialties'] = specialties
+                changes['specialties'] = specialties
             if telegram is not None:
-                masters[i]['telegram'] = telegram
+                changes['telegram'] = telegram
             if location is not None:
-                masters[i]['location'] = location
+                changes['location'] = location
             if description is not None:
-                masters[i]['description'] = description
+                changes['description'] = description
+            if address is not None:
+                changes['address'] = address
+            masters[i] = master.replace(**changes)
             
             updated = True
             break
@@ -127,7 +130,7 @@ async def delete_master(master_id):
     masters = await get_all_masters()
     
     # Filter out the master to delete
-    updated_masters = [master for master in masters if master.get('id') != master_id]
+    updated_masters = [master for master in masters if str(master.get('id')) != str(master_id)]
     
     # Check if a master was removed
     if len(updated_masters) < len(masters):
@@ -143,6 +146,10 @@ async def get_master_working_hours(master_id):
     if not master:
         return {}
     
+    return parse_working_hours(master)
+
+def parse_working_hours(master):
+    """Get the working hours of a master record"""
     working_hours = master.get('working_hours')
     if not working_hours:
         # Default working hours (10:00 - 19:00 every day)
@@ -172,13 +179,13 @@ async def update_master_working_hours(master_id, working_hours):
     updated = False
     
     for i, master in enumerate(masters):
-        if master.get('id') == master_id:
+        if str(master.get('id')) == str(master_id):
             # Convert to string for storage if needed
             if not isinstance(working_hours, str):
                 import json
                 working_hours = json.dumps(working_hours)
             
-            masters[i]['working_hours'] = working_hours
+            masters[i] = master.replace(working_hours=working_hours)
             updated = True
             break
     
@@ -195,6 +202,10 @@ async def get_master_services(master_id):
     if not master:
         return []
     
+    return parse_master_services(master)
+
+def parse_master_services(master):
+    """Get the service IDs of a master record"""
     services = master.get('services')
     if not services:
         return []
@@ -209,19 +220,29 @@ async def get_master_services(master_id):
     
     return services
 
+async def get_service_masters(service_id):
+    """Get the masters offering a service (masters without a services list offer all of them)"""
+    masters = await get_all_masters()
+    service_masters = []
+    for master in masters:
+        services = parse_master_services(master)
+        if not services or str(service_id) in {str(master_service) for master_service in services}:
+            service_masters.append(master)
+    return service_masters
+
 async def update_master_services(master_id, service_ids):
     """Update services associated with a specific master"""
     masters = await get_all_masters()
     updated = False
     
     for i, master in enumerate(masters):
-        if master.get('id') == master_id:
+        if str(master.get('id')) == str(master_id):
             # Convert to string for storage if needed
             if not isinstance(service_ids, str):
                 import json
                 service_ids = json.dumps(service_ids)
             
-            masters[i]['services'] = service_ids
+            masters[i] = master.replace(services=service_ids)
             updated = True
             break
     
@@ -232,30 +253,23 @@ async def update_master_services(master_id, service_ids):
     return False
 
 # Availability functions
-async def get_master_availability(master_id, date):
-    """Get availability for a specific master on a specific date"""
-    # This is a placeholder implementation
-    # In a real application, this would check the master's working hours,
-    # existing appointments, and any other factors that affect availability
-    
-    # Get master's working hours
-    working_hours = await get_master_working_hours(master_id)
-    
+def get_working_window(working_hours, date):
+    """Get the working hours of a date as minutes since midnight (start, end), or None"""
     # Get day of week (1-7, Monday=1)
     try:
         date_obj = datetime.strptime(date, "%Y-%m-%d")
         day_of_week = str(date_obj.isoweekday())
     except:
-        return []
+        return None
     
     # Check if master works on this day
     if day_of_week not in working_hours:
-        return []
+        return None
     
     # Get start and end hours
     hours = working_hours.get(day_of_week)
     if not hours:
-        return []
+        return None
     
     start_time = hours.get('start', '10:00')
     end_time = hours.get('end', '19:00')
@@ -264,16 +278,28 @@ async def get_master_availability(master_id, date):
     start_hour, start_minute = map(int, start_time.split(':'))
     end_hour, end_minute = map(int, end_time.split(':'))
     
-    # Generate time slots every 30 minutes
-    time_slots = []
-    current = datetime(date_obj.year, date_obj.month, date_obj.day, start_hour, start_minute)
-    end = datetime(date_obj.year, date_obj.month, date_obj.day, end_hour, end_minute)
-    
-    while current < end:
-        time_slots.append(current.strftime("%H:%M"))
-        current += timedelta(minutes=30)
-    
-    # Filter out already booked time slots
-    # (would need appointment data from database)
-    
-    return time_slots
+    return start_hour * 60 + start_minute, end_hour * 60 + end_minute
+
+async def get_master_availability(master_id, date, owner=None, service_id=None, ignore=None):
+    """
+    Get the times at which a service (or a slot, without a service) fits the
+    schedule of a specific master on a specific date, including breaks, days
+    off and extra hours of the date.
+    
+    The whole service with its cleanup buffer must fit between the other
+    appointments of the master, and its resource must have room left.
+    Slots held for the owner count as free; the appointment `ignore` (the
+    one being moved) does not take its time.
+    """
+    # Get master's working time: the weekly hours with the exceptions of the date
+    from utils.db_api import schedule, work_calendar
+    working = await work_calendar.get_working_intervals(master_id, date)
+    
+    return await schedule.get_free_slots(master_id, working, date, service_id, owner, ignore)
+
+async def get_master_availability_by_date(master_id, dates, owner=None, service_id=None):
+    """Get availability of a master for a service on many dates at once, as {date: free times}"""
+    from utils.db_api import schedule, work_calendar
+    working_by_date = {date: await work_calendar.get_working_intervals(master_id, date) for date in dates}
+    # The calendars of all dates are built in one pass over the appointments
+    return await schedule.get_free_slots_by_date(master_id, working_by_date, service_id, owner)
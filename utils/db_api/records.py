@@ -0,0 +1,392 @@
+import sys
+from collections.abc import Mapping
+from functools import lru_cache
+from datetime import date, datetime
+from enum import Enum
+
+# Typed rows of the main sheets.
+#
+# Rows are parsed once when a sheet is loaded: IDs and amounts become
+# numbers, dates are normalized to ISO strings (so they still compare and
+# format like before), statuses become enums and repeated labels are
+# interned. Records are immutable, so cached rows can be shared safely;
+# replace() returns a changed copy and to_dict() a plain dict to enrich
+# for display. Records keep the dict read interface (get, [], keys, dict(r))
+# and carry columns they do not know in `extra`, so rewriting a sheet
+# never drops data.
+
+DATE_FORMATS = ("%Y-%m-%d", "%d.%m.%Y", "%Y/%m/%d")
+
+# Distinct dates and times of parsed texts remembered, as they repeat across rows
+PARSE_CACHE_SIZE = 4096
+
+
+class AppointmentStatus(str, Enum):
+    PENDING = 'pending'
+    CONFIRMED = 'confirmed'
+    COMPLETED = 'completed'
+    PAID = 'paid'
+    CANCELED = 'canceled'
+
+    # Written to the sheet and shown to users as the plain value
+    __str__ = str.__str__
+    # Equal to the plain value, so must hash like it in sets and dict keys
+    __hash__ = str.__hash__
+
+
+def parse_int(value):
+    """Parse an ID or a count, keeping values that are not integers as is"""
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        text = value.strip()
+        if text.lstrip('-').isdigit():
+            return int(text)
+    return value
+
+def next_id(rows, field='id'):
+    """Get the next free numeric ID of rows, skipping IDs that are not integers"""
+    ids = [value for value in (parse_int(row.get(field)) for row in rows) if type(value) is int]
+    return max(ids, default=0) + 1
+
+def parse_number(value):
+    """Parse a price or an amount"""
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            number = float(value.strip().replace(',', '.'))
+        except ValueError:
+            return value
+        return int(number) if number.is_integer() else number
+    return value
+
+def parse_text(value):
+    """Parse free text"""
+    return '' if value is None else str(value)
+
+def parse_label(value):
+    """Parse a short text repeated across rows (roles, locations, methods)"""
+    return sys.intern(parse_text(value))
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_date_text(text):
+    for date_format in DATE_FORMATS:
+        try:
+            return sys.intern(datetime.strptime(text.strip(), date_format).date().isoformat())
+        except ValueError:
+            continue
+    return text
+
+def parse_date(value):
+    """Normalize a date to an ISO string (YYYY-MM-DD)"""
+    if isinstance(value, str):
+        return _parse_date_text(value)
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_time_text(text):
+    hours, sep, minutes = text.strip().partition(':')
+    if sep and hours.isdigit() and minutes[:2].isdigit():
+        return sys.intern(f"{int(hours):02d}:{minutes[:2]}")
+    return text
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _date_of(text):
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        return None
+
+def as_date(value):
+    """Get a parsed ISO date string as a date, or None if it is not a valid date"""
+    return _date_of(value) if isinstance(value, str) else None
+
+def parse_time(value):
+    """Normalize a time of day to HH:MM"""
+    return _parse_time_text(value) if isinstance(value, str) else value
+
+STATUSES = {status.value: status for status in AppointmentStatus}
+
+def parse_status(value):
+    """Parse an appointment status, keeping unknown statuses as text"""
+    status = STATUSES.get(value)
+    if status is None:
+        text = parse_text(value)
+        status = STATUSES.get(text.strip().lower()) or sys.intern(text)
+    return status
+
+
+class Record(Mapping):
+    """Immutable, slotted row of a sheet"""
+
+    # Field name -> parser, in sheet column order
+    FIELDS = {}
+    __slots__ = ('extra',)
+
+    def __init__(self, row=(), **changes):
+        values = row if type(row) is dict and not changes else dict(row, **changes)
+        fields = self.FIELDS
+        set_field = object.__setattr__
+        for name, parse in fields.items():
+            set_field(self, name, parse(values.get(name, '')))
+        # Columns the record type does not know about
+        extra = None
+        if not values.keys() <= fields.keys():
+            extra = {key: value for key, value in values.items() if key not in fields}
+        set_field(self, 'extra', extra)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Parse rows loaded from a sheet; records of this type are kept as they are"""
+        return tuple(row if type(row) is cls else cls(row) for row in rows)
+
+    def replace(self, **changes):
+        """Get a copy of the record with some fields changed"""
+        return type(self)(self, **changes)
+
+    def to_dict(self):
+        """Get the row as a new plain dict, e.g. to enrich it for display"""
+        return dict(self)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable, use replace()")
+
+    def __setitem__(self, key, value):
+        raise TypeError(f"{type(self).__name__} is immutable, use replace() or to_dict()")
+
+    def __delitem__(self, key):
+        raise TypeError(f"{type(self).__name__} is immutable, use replace() or to_dict()")
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            return getattr(self, key)
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        if key in self.FIELDS:
+            return getattr(self, key)
+        if self.extra:
+            return self.extra.get(key, default)
+        return default
+
+    def __contains__(self, key):
+        return key in self.FIELDS or bool(self.extra and key in self.extra)
+
+    def __iter__(self):
+        yield from self.FIELDS
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self):
+        return len(self.FIELDS) + (len(self.extra) if self.extra else 0)
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.FIELDS)
+        return f"{type(self).__name__}({fields})"
+
+    def __reduce__(self):
+        return type(self), (dict(self),)
+
+
+class Appointment(Record):
+    FIELDS = {
+        'id': parse_int,
+        'user_id': parse_int,
+        'service_id': parse_int,
+        'date': parse_date,
+        'time': parse_time,
+        'status': parse_status,
+        'master_id': parse_int,
+        'payment_method': parse_label,
+        'starts_at': parse_int,
+    }
+    __slots__ = tuple(FIELDS)
+
+    @property
+    def day(self):
+        """Date of the appointment, or None if it is not a valid date"""
+        return as_date(self.date)
+
+
+class Client(Record):
+    FIELDS = {
+        'user_id': parse_int,
+        'username': parse_text,
+        'full_name': parse_text,
+        'role': parse_label,
+        'master_id': parse_int,
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class Master(Record):
+    FIELDS = {
+        'id': parse_int,
+        'telegram_id': parse_int,
+        'name': parse_text,
+        'telegram': parse_text,
+        'phone': parse_text,
+        'specialties': parse_label,
+        'location': parse_label,
+        'description': parse_text,
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class Service(Record):
+    FIELDS = {
+        'id': parse_int,
+        'name': parse_text,
+        'description': parse_text,
+        'price': parse_number,
+        'duration': parse_int,
+        'category_id': parse_int,
+        # Cleanup minutes after the service, before the master's next appointment
+        'buffer': parse_int,
+        # Shared resource (chair, room, equipment) the service takes, if any
+        'resource_id': parse_int,
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class Resource(Record):
+    FIELDS = {
+        'id': parse_int,
+        'name': parse_text,
+        # Appointments that may use the resource at the same time
+        'capacity': parse_int,
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class Subscription(Record):
+    FIELDS = {
+        'user_id': parse_int,
+        'start_date': parse_date,
+        'end_date': parse_date,
+        'trial': parse_label,
+        'referrer_id': parse_int,
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class Payment(Record):
+    FIELDS = {
+        # Idempotency key of the payment, not necessarily a number
+        'id': parse_text,
+        'user_id': parse_int,
+        'plan_months': parse_int,
+        'amount': parse_number,
+        'payment_date': parse_date,
+        'payment_method': parse_label,
+        'verified': parse_label,
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class ReferralCredit(Record):
+    FIELDS = {
+        'id': parse_text,
+        'referrer_id': parse_int,
+        'days': parse_int,
+        'created_at': parse_text,
+        # "pending" or "applied"
+        'status': parse_label,
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class WaitlistEntry(Record):
+    FIELDS = {
+        'id': parse_int,
+        'user_id': parse_int,
+        'service_id': parse_int,
+        # Empty for any master
+        'master_id': parse_int,
+        'date_from': parse_date,
+        'date_to': parse_date,
+        'created_at': parse_text,
+        'status': parse_label,
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class AppointmentSeries(Record):
+    FIELDS = {
+        'id': parse_int,
+        'user_id': parse_int,
+        'service_id': parse_int,
+        'master_id': parse_int,
+        'start_date': parse_date,
+        'time': parse_time,
+        # Recurrence rule, e.g. "FREQ=WEEKLY;INTERVAL=2;COUNT=10"
+        'rule': parse_text,
+        # Last date whose appointment was created (or skipped as busy)
+        'materialized_until': parse_date,
+        'status': parse_label,
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class WorkException(Record):
+    FIELDS = {
+        'id': parse_int,
+        # Empty for the whole salon
+        'master_id': parse_int,
+        'date_from': parse_date,
+        'date_to': parse_date,
+        # Empty for whole days
+        'start': parse_time,
+        'end': parse_time,
+        # "off" or "extra"
+        'kind': parse_label,
+        'note': parse_text,
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class Tenant(Record):
+    FIELDS = {
+        'tenant_id': parse_int,
+        'admin_id': parse_int,
+        'spreadsheet_id': parse_text,
+        'name': parse_text,
+        # IANA time zone of the salon, e.g. "Europe/Moscow"
+        'timezone': parse_text,
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class TenantMember(Record):
+    FIELDS = {
+        'user_id': parse_int,
+        'tenant_id': parse_int,
+    }
+    __slots__ = tuple(FIELDS)
+
+
+# Record type of each sheet whose rows are parsed on load
+RECORD_TYPES = {
+    'Appointments': Appointment,
+    'Clients': Client,
+    'Masters': Master,
+    'Services': Service,
+    'Subscriptions': Subscription,
+    'Payments': Payment,
+    'ReferralCredits': ReferralCredit,
+    'Tenants': Tenant,
+    'TenantMembers': TenantMember,
+    'Waitlist': WaitlistEntry,
+    'Series': AppointmentSeries,
+    'Resources': Resource,
+    'WorkExceptions': WorkException,
+}
@@ -0,0 +1,297 @@
+import bisect
+from collections import OrderedDict
+
+from utils.db_api import appointment_commands, timezones
+from utils.db_api.google_sheets import get_sheet_table, get_tenant_key
+from utils.db_api.records import parse_date
+
+# Sheet names
+SERVICES_SHEET = "Services"
+RESOURCES_SHEET = "Resources"
+
+# Minutes between the start times offered to clients
+SLOT_STEP = 30
+
+# Length of services without a duration (and of appointments of unknown services)
+DEFAULT_DURATION = 30
+
+# Calendars of this many dates are kept, least recently used ones are dropped
+CALENDAR_CACHE_SIZE = 64
+
+# Day calendars by tenant and date
+_calendars = OrderedDict()
+
+
+def to_minutes(time):
+    """Get minutes since midnight of a time (HH:MM), or None"""
+    hours, sep, minutes = str(time).partition(':')
+    if not sep or not hours.strip().isdigit() or not minutes[:2].isdigit():
+        return None
+    return int(hours) * 60 + int(minutes[:2])
+
+def to_time(minutes):
+    """Format minutes since midnight as HH:MM"""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def not_before(date):
+    """Get the first minute of a date that has not passed yet in the salon's time zone (0 for other dates)"""
+    now = timezones.now()
+    if parse_date(date) != now.date().isoformat():
+        return 0
+    return now.hour * 60 + now.minute + 1
+
+def subtract(intervals, busy):
+    """Remove busy intervals from sorted, disjoint intervals"""
+    free = []
+    busy = sorted(busy)
+    i = 0
+    for start, end in intervals:
+        # Skip busy intervals that end before this one starts
+        while i < len(busy) and busy[i][1] <= start:
+            i += 1
+        j = i
+        while j < len(busy) and busy[j][0] < end:
+            if busy[j][0] > start:
+                free.append((start, busy[j][0]))
+            start = max(start, busy[j][1])
+            j += 1
+        if start < end:
+            free.append((start, end))
+    return free
+
+def intersect(first, second):
+    """Intersect two lists of sorted, disjoint intervals"""
+    result = []
+    i = j = 0
+    while i < len(first) and j < len(second):
+        start = max(first[i][0], second[j][0])
+        end = min(first[i][1], second[j][1])
+        if start < end:
+            result.append((start, end))
+        if first[i][1] < second[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+def saturated(usages, capacity):
+    """Get the intervals in which at least `capacity` usages overlap"""
+    events = sorted([(start, 1) for start, end in usages] + [(end, -1) for start, end in usages])
+    full = []
+    count = 0
+    for minute, change in events:
+        count += change
+        if count >= capacity and change == 1 and (not full or full[-1][1] is not None):
+            full.append([minute, None])
+        elif count < capacity and full and full[-1][1] is None:
+            full[-1][1] = minute
+    return [(start, end) for start, end in full if start < end]
+
+
+class ServiceSpec:
+    """What an appointment of a service takes: minutes, cleanup minutes after it and a resource"""
+
+    __slots__ = ('duration', 'buffer', 'resource_id')
+
+    def __init__(self, duration=DEFAULT_DURATION, buffer=0, resource_id=None):
+        self.duration = duration
+        self.buffer = buffer
+        self.resource_id = resource_id
+
+    @classmethod
+    def of(cls, service):
+        if service is None:
+            return cls()
+        duration = service.get('duration')
+        buffer = service.get('buffer')
+        return cls(
+            duration if isinstance(duration, int) and duration > 0 else DEFAULT_DURATION,
+            buffer if isinstance(buffer, int) and buffer > 0 else 0,
+            str(service.get('resource_id')) if service.get('resource_id') else None,
+        )
+
+    @property
+    def length(self):
+        """Minutes the master (and resource) are taken"""
+        return self.duration + self.buffer
+
+
+class DayCalendar:
+    """
+    Busy intervals of one date: of every master and of every shared
+    resource, built from the appointments taking a slot that day.
+    """
+
+    __slots__ = ('source', 'date', 'specs', 'capacities', 'masters', 'resources')
+
+    def __init__(self, source, date, appointments, services, resources):
+        self.source = source
+        self.date = date
+        self.specs = {str(service.get('id')): ServiceSpec.of(service) for service in services}
+        self.capacities = {
+            str(resource.get('id')): resource.get('capacity') if isinstance(resource.get('capacity'), int) else 1
+            for resource in resources
+        }
+        # Busy intervals as (start, end, appointment ID)
+        self.masters = {}
+        self.resources = {}
+        for appointment in appointments:
+            start = to_minutes(appointment.get('time'))
+            if start is None or appointment.get('status') in appointment_commands.FREE_SLOT_STATUSES:
+                continue
+            spec = self.spec(appointment.get('service_id'))
+            block = (start, start + spec.length, str(appointment.get('id')))
+            self.masters.setdefault(str(appointment.get('master_id')), []).append(block)
+            if spec.resource_id:
+                self.resources.setdefault(spec.resource_id, []).append(block)
+        for blocks in (*self.masters.values(), *self.resources.values()):
+            blocks.sort()
+
+    def spec(self, service_id):
+        """Get the requirements of a service"""
+        return self.specs.get(str(service_id)) or ServiceSpec()
+
+    def busy_minutes(self, master_id):
+        """Minutes of a master taken by appointments"""
+        return sum(end - start for start, end, _ in self.masters.get(str(master_id), ()))
+
+    def held_intervals(self, held):
+        """Get the intervals [(start, end)] taken by held slots ({time: service ID}), with their services' length"""
+        intervals = []
+        for time, service_id in held.items():
+            start = to_minutes(time)
+            if start is not None:
+                intervals.append((start, start + self.spec(service_id).length))
+        return intervals
+
+    def free_intervals(self, master_id, working, spec, held=(), ignore=None):
+        """
+        Get the intervals of the working time [(start, end)] in which the
+        master is free and the service's resource has room left. Held
+        intervals [(start, end)] are busy too.
+        """
+        if not working:
+            return []
+        # Cleanup may run past the end of the working day
+        window = working[:-1] + [(working[-1][0], working[-1][1] + spec.buffer)]
+        busy = [(start, end) for start, end, appointment_id in self.masters.get(str(master_id), ()) if appointment_id != ignore]
+        busy.extend(held)
+        free = subtract(window, busy)
+
+        if spec.resource_id and spec.resource_id in self.capacities:
+            usages = [
+                (start, end) for start, end, appointment_id in self.resources.get(spec.resource_id, ())
+                if appointment_id != ignore
+            ]
+            free = intersect(free, subtract(window, saturated(usages, self.capacities[spec.resource_id])))
+        return free
+
+    def free_slots(self, master_id, working, spec, held=(), ignore=None, earliest=0):
+        """Get the start times (HH:MM) from `earliest` on at which a service fits the free intervals of a master"""
+        free = self.free_intervals(master_id, working, spec, held, ignore)
+        starts = [start for start, _ in free]
+        slots = []
+        for work_start, work_end in working:
+            for start in range(work_start, work_end - spec.duration + 1, SLOT_STEP):
+                if start < earliest:
+                    continue
+                i = bisect.bisect_right(starts, start) - 1
+                if i >= 0 and start + spec.length <= free[i][1]:
+                    slots.append(to_time(start))
+        return slots
+
+
+async def _get_source():
+    """Get the cached tables calendars are built from"""
+    return (
+        await get_sheet_table(appointment_commands.APPOINTMENTS_SHEET),
+        await get_sheet_table(SERVICES_SHEET),
+        await get_sheet_table(RESOURCES_SHEET),
+    )
+
+def _cached_calendar(key, source):
+    """Get a cached calendar if it was built from the current tables, or None"""
+    calendar = _calendars.get(key)
+    if calendar is None or any(cached is not current for cached, current in zip(calendar.source, source)):
+        return None
+    return calendar
+
+def _store(key, calendar):
+    _calendars[key] = calendar
+    _calendars.move_to_end(key)
+    while len(_calendars) > CALENDAR_CACHE_SIZE:
+        _calendars.popitem(last=False)
+
+async def get_day_calendar(date):
+    """Get the calendar of a date, rebuilding it only if the cached sheets changed"""
+    date = parse_date(date)
+    key = (get_tenant_key(appointment_commands.APPOINTMENTS_SHEET), date)
+    source = await _get_source()
+
+    calendar = _cached_calendar(key, source)
+    if calendar is None:
+        table = await appointment_commands.get_appointments_table()
+        calendar = DayCalendar(source, date, table.select(date=date), source[1], source[2])
+    _store(key, calendar)
+    return calendar
+
+async def get_day_calendars(dates):
+    """
+    Get the calendars of many dates as {date: calendar}. The ones not cached
+    are built from a single pass over the appointments of the date range.
+    """
+    tenant_key = get_tenant_key(appointment_commands.APPOINTMENTS_SHEET)
+    source = await _get_source()
+
+    calendars = {}
+    missing = []
+    for date in {parse_date(date) for date in dates}:
+        calendar = _cached_calendar((tenant_key, date), source)
+        if calendar is None:
+            missing.append(date)
+        else:
+            calendars[date] = calendar
+
+    if missing:
+        table = await appointment_commands.get_appointments_table()
+        by_date = {date: [] for date in missing}
+        for appointment in table.select(date_from=min(missing), date_to=max(missing)):
+            appointments = by_date.get(appointment.get('date'))
+            if appointments is not None:
+                appointments.append(appointment)
+        for date, appointments in by_date.items():
+            calendars[date] = DayCalendar(source, date, appointments, source[1], source[2])
+
+    for date, calendar in calendars.items():
+        _store((tenant_key, date), calendar)
+    return calendars
+
+def _free_slots(calendar, master_id, working, date, service_id, owner, ignore):
+    held = calendar.held_intervals(appointment_commands.get_held_slots(master_id, date, owner))
+    ignore = str(ignore) if ignore is not None else None
+    return calendar.free_slots(master_id, working, calendar.spec(service_id), held, ignore, not_before(date))
+
+async def get_free_slots(master_id, working, date, service_id=None, owner=None, ignore=None):
+    """
+    Get the start times at which a service fits a master's working time
+    ([(start, end)] in minutes) on a date. Slots held for someone but the
+    owner are busy; the appointment `ignore` (e.g. the one being moved)
+    does not take its interval. Times of today that have passed in the
+    salon's time zone are not offered.
+    """
+    if not working:
+        return []
+    calendar = await get_day_calendar(date)
+    return _free_slots(calendar, master_id, working, date, service_id, owner, ignore)
+
+async def get_free_slots_by_date(master_id, working_by_date, service_id=None, owner=None):
+    """Get the free start times of a master on many dates, as {date: times}; see get_free_slots()"""
+    calendars = await get_day_calendars([date for date, working in working_by_date.items() if working])
+    return {
+        date: _free_slots(calendars[parse_date(date)], master_id, working, date, service_id, owner, None) if working else []
+        for date, working in working_by_date.items()
+    }
+
+def clear():
+    """Drop all cached calendars"""
+    _calendars.clear()
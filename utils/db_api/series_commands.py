@@ -0,0 +1,224 @@
+import asyncio
+import os
+from datetime import date, timedelta
+from utils.db_api.google_sheets import get_sheet, get_sheet_table, write_to_sheet, append_to_sheet
+from utils.db_api.records import as_date, next_id
+from utils.db_api import appointment_commands, timezones
+
+# Sheet name
+SERIES_SHEET = "Series"
+
+# Series statuses
+ACTIVE = 'active'
+CANCELED = 'canceled'
+
+# Appointments of a series are created this many days ahead, the rest later
+SERIES_HORIZON_DAYS = int(os.getenv('SERIES_HORIZON_DAYS', '28'))
+
+# Days between occurrences for each supported frequency
+FREQUENCIES = {'DAILY': 1, 'WEEKLY': 7}
+
+# Serializes every read-modify-write of the series sheet, so two clients
+# cannot get the same ID and concurrent writes do not undo each other
+_series_lock = asyncio.Lock()
+
+
+def parse_rule(rule):
+    """
+    Parse a recurrence rule, a subset of RFC 5545 RRULE: FREQ (DAILY or
+    WEEKLY), INTERVAL, COUNT and UNTIL (YYYY-MM-DD). Returns None if the
+    rule is not supported.
+    """
+    parts = {}
+    for part in str(rule).split(';'):
+        name, _, value = part.partition('=')
+        parts[name.strip().upper()] = value.strip()
+
+    step = FREQUENCIES.get(parts.get('FREQ', '').upper())
+    interval = parts.get('INTERVAL', '1')
+    count = parts.get('COUNT', '')
+    if step is None or not interval.isdigit() or int(interval) < 1 or (count and not count.isdigit()):
+        return None
+    until = as_date(parts.get('UNTIL', ''))
+    if parts.get('UNTIL') and until is None:
+        return None
+    return {
+        'step': timedelta(days=step * int(interval)),
+        'count': int(count) if count else None,
+        'until': until,
+    }
+
+def format_rule(weeks, count=None, until=None):
+    """Make a weekly recurrence rule"""
+    rule = f"FREQ=WEEKLY;INTERVAL={weeks}"
+    if count:
+        rule += f";COUNT={count}"
+    if until:
+        rule += f";UNTIL={until}"
+    return rule
+
+def occurrences(series, last):
+    """Dates (ISO strings) of a series from its start up to the last date, lazily"""
+    rule = parse_rule(series.get('rule'))
+    day = as_date(series.get('start_date'))
+    if rule is None or day is None:
+        return
+
+    until = min(last, rule['until']) if rule['until'] else last
+    number = 0
+    while day <= until and (rule['count'] is None or number < rule['count']):
+        yield day.isoformat()
+        day += rule['step']
+        number += 1
+
+
+async def get_all_series():
+    """Get all appointment series"""
+    return await get_sheet(SERIES_SHEET)
+
+async def get_series(series_id):
+    """Get a series by its ID"""
+    for series in await get_sheet_table(SERIES_SHEET):
+        if str(series.get('id')) == str(series_id):
+            return series
+    return None
+
+async def get_user_series(user_id):
+    """Get the active series of a client"""
+    return [
+        series for series in await get_sheet_table(SERIES_SHEET)
+        if str(series.get('user_id')) == str(user_id) and series.get('status') == ACTIVE
+    ]
+
+async def _materialize(series, today):
+    """
+    Book the occurrences of a series that came within the horizon.
+
+    Returns (new appointments, busy dates, new materialized_until), the
+    latter None if nothing came within the horizon.
+    """
+    horizon = today + timedelta(days=SERIES_HORIZON_DAYS)
+    done = series.get('materialized_until') or ''
+    dates = [day for day in occurrences(series, horizon) if day > done and day >= today.isoformat()]
+    if not dates:
+        return [], [], None
+
+    time = series.get('time')
+    booked = await appointment_commands.book_slots(
+        series.get('user_id'), series.get('service_id'), [(day, time) for day in dates], series.get('master_id')
+    )
+    if booked is None:
+        # Nothing was written, the dates are tried again on the next run
+        return [], [], None
+    appointments, busy = booked
+    return appointments, [day for day, _ in busy], dates[-1]
+
+async def create_series(user_id, service_id, master_id, start_date, time, rule, today=None):
+    """
+    Create a series with one row and book its occurrences within the horizon.
+
+    Returns (series, new appointments, busy dates), or (None, [], []) if the
+    rule is not supported or the series could not be written.
+    """
+    if parse_rule(rule) is None:
+        return None, [], []
+
+    async with _series_lock:
+        series_list = await get_sheet_table(SERIES_SHEET)
+        new_id = next_id(series_list)
+        new_series = {
+            'id': new_id,
+            'user_id': user_id,
+            'service_id': service_id,
+            'master_id': master_id,
+            'start_date': start_date,
+            'time': time,
+            'rule': rule,
+            'materialized_until': '',
+            'status': ACTIVE,
+        }
+        if not await append_to_sheet(SERIES_SHEET, [new_series]):
+            return None, [], []
+
+    series = await get_series(new_id)
+    appointments, busy, until = await _materialize(series, today or timezones.today())
+    if until:
+        await _set_materialized({str(new_id): until})
+    return series, appointments, busy
+
+async def _set_materialized(until_by_id):
+    """Store how far series were materialized, with a single write"""
+    async with _series_lock:
+        series_list = await get_all_series()
+        for i, series in enumerate(series_list):
+            until = until_by_id.get(str(series.get('id')))
+            if until:
+                series_list[i] = series.replace(materialized_until=until)
+        return await write_to_sheet(SERIES_SHEET, series_list)
+
+async def materialize_all_series(today=None):
+    """
+    Book the occurrences of all active series that came within the horizon.
+
+    Returns (number of new appointments, [(series, busy dates)]) for the
+    series whose occurrences could not be booked because the time was taken.
+    """
+    today = today or timezones.today()
+    created = 0
+    busy_by_series = []
+    until_by_id = {}
+    table = await get_sheet_table(SERIES_SHEET)
+    for series in table:
+        if series.get('status') != ACTIVE:
+            continue
+        # Booked under the lock, so a series canceled meanwhile is skipped
+        # and a cancel does not miss the appointments being booked
+        async with _series_lock:
+            if await get_sheet_table(SERIES_SHEET) is not table:
+                series = await get_series(series.get('id'))
+                if series is None or series.get('status') != ACTIVE:
+                    continue
+            appointments, busy, until = await _materialize(series, today)
+        created += len(appointments)
+        if busy:
+            busy_by_series.append((series, busy))
+        if until:
+            until_by_id[str(series.get('id'))] = until
+
+    if until_by_id:
+        await _set_materialized(until_by_id)
+    return created, busy_by_series
+
+async def cancel_series(series_id, user_id=None, today=None):
+    """Stop a series and cancel its upcoming appointments. Returns False if there is no such series"""
+    async with _series_lock:
+        series_list = await get_all_series()
+        for i, series in enumerate(series_list):
+            if str(series.get('id')) == str(series_id):
+                break
+        else:
+            return False
+        if user_id is not None and str(series.get('user_id')) != str(user_id):
+            return False
+
+        series_list[i] = series.replace(status=CANCELED)
+        if not await write_to_sheet(SERIES_SHEET, series_list):
+            return False
+
+        # Appointments of a series are those of its client, master and time on
+        # its dates; the ones that have already started are kept. Dates up to
+        # the horizon are covered too, materialized_until is stored only after
+        # a whole run of materialize_all_series
+        today = today or timezones.today()
+        last = max(as_date(series.get('materialized_until')) or date.min, today + timedelta(days=SERIES_HORIZON_DAYS))
+        dates = {day for day in occurrences(series, last) if day >= today.isoformat()}
+        table = await appointment_commands.get_appointments_table()
+        now = timezones.epoch_now()
+        appointment_ids = [
+            appointment.get('id')
+            for appointment in table.select(user_id=series.get('user_id'), master_id=series.get('master_id'))
+            if appointment.get('date') in dates and appointment.get('time') == series.get('time')
+            and not timezones.has_started(appointment, now)
+        ]
+        await appointment_commands.cancel_appointments(appointment_ids)
+    return True
@@ -1,5 +1,8 @@
 
-from utils.db_api.google_sheets import get_sheet, write_to_sheet
+from utils.db_api.google_sheets import get_sheet, write_to_sheet, get_tenant_key
+from utils.db_api.records import next_id
+import csv
+import io
 import json
 
 # Sheet names
@@ -8,6 +11,19 @@ CATEGORIES_SHEET = "Categories"
 OFFERS_SHEET = "Offers"
 TEMPLATES_SHEET = "ServiceTemplates"
 
+# Catalog version of each tenant (None is the main spreadsheet), incremented
+# on every catalog change (services, categories, offers) made by the bot
+catalog_versions = {}
+
+def get_catalog_version():
+    """Get the catalog version of the current tenant"""
+    return catalog_versions.get(get_tenant_key(SERVICES_SHEET), 0)
+
+def invalidate_catalog():
+    """Mark the catalog of the current tenant as changed so its cached snapshot gets rebuilt"""
+    key = get_tenant_key(SERVICES_SHEET)
+    catalog_versions[key] = catalog_versions.get(key, 0) + 1
+
 async def get_all_services():
     """Get all services from the database"""
     services = await get_sheet(SERVICES_SHEET)
@@ -17,62 +33,35 @@ async def get_service(service_id):
     """Get a service by its ID"""
     services = await get_all_services()
     for service in services:
-        if service.get('id') == service_id:
+        if str(service.get('id')) == str(service_id):
             return service
     return None
 
 async def get_services_by_category():
     """Get services grouped by category"""
-    services = await get_all_services()
-    categories = await get_all_categories()
-    
-    # Create a lookup dictionary for category names
-    category_lookup = {category['id']: category['name'] for category in categories}
-    
-    # Group services by category
-    services_by_category = {}
-    for service in services:
-        category_id = service.get('category_id', 'uncategorized')
-        category_name = category_lookup.get(category_id, 'Без категории')
-        
-        if category_name not in services_by_category:
-            services_by_category[category_name] = []
-        
-        services_by_category[category_name].append(service)
+    from utils import catalog_snapshot
     
-    return services_by_category
+    catalog = await catalog_snapshot.get_catalog()
+    return catalog.grouped_services
 
 async def get_services_in_category(category_id):
     """Get all services in a specific category"""
     services = await get_all_services()
-    return [service for service in services if service.get('category_id') == category_id]
+    return [service for service in services if str(service.get('category_id')) == str(category_id)]
 
 async def get_services_by_category_name(category_name):
     """Get all services in a category by name"""
-    services = await get_all_services()
-    categories = await get_all_categories()
-    
-    # Find category ID by name
-    category_id = None
-    for category in categories:
-        if category.get('name') == category_name:
-            category_id = category.get('id')
-            break
-    
-    if not category_id:
-        return []
+    from utils import catalog_snapshot
     
-    # Get services in this category
-    return [service for service in services if service.get('category_id') == category_id]
+    catalog = await catalog_snapshot.get_catalog()
+    return list(catalog.get_services_by_category_name(category_name))
 
 async def add_service(name, description, price, duration, category_id=None):
     """Add a new service to the database"""
     services = await get_all_services()
     
     # Generate a new ID
-    new_id = "1"
-    if services:
-        new_id = str(max([int(service.get('id', 0)) for service in services]) + 1)
+    new_id = str(next_id(services))
     
     # Create new service
     new_service = {
@@ -90,6 +79,7 @@ async def add_service(name, description, price, duration, category_id=None):
     # Add to sheet
     services.append(new_service)
     await write_to_sheet(SERVICES_SHEET, services)
+    invalidate_catalog()
     
     return new_service
 
@@ -99,24 +89,27 @@ async def update_service(service_id, name=None, description=None, price=None, du
     updated = False
     
     for i, service in enumerate(services):
-        if service.get('id') == service_id:
+        if str(service.get('id')) == str(service_id):
             # Update fields if provided
+            changes = {}
             if name is not None:
-                services[i]['name'] = name
+                changes['name'] = name
             if description is not None:
-                services[i]['description'] = description
+                changes['description'] = description
             if price is not None:
-                services[i]['price'] = price
+                changes['price'] = price
             if duration is not None:
-                services[i]['duration'] = duration
+                changes['duration'] = duration
             if category_id is not None:
-                services[i]['category_id'] = category_id
+                changes['category_id'] = category_id
+            services[i] = service.replace(**changes)
             
             updated = True
             break
     
     if updated:
         await write_to_sheet(SERVICES_SHEET, services)
+        invalidate_catalog()
     
     return updated
 
@@ -125,11 +118,12 @@ async def delete_service(service_id):
     services = await get_all_services()
     
     # Filter out the service to delete
-    updated_services = [service for service in services if service.get('id') != service_id]
+    updated_services = [service for service in services if str(service.get('id')) != str(service_id)]
     
     # Check if a service was removed
     if len(updated_services) < len(services):
         await write_to_sheet(SERVICES_SHEET, updated_services)
+        invalidate_catalog()
         return True
     
     return False
@@ -148,7 +142,7 @@ async def get_category(category_id):
     """Get a category by its ID"""
     categories = await get_all_categories()
     for category in categories:
-        if category.get('id') == category_id:
+        if str(category.get('id')) == str(category_id):
             return category
     return None
 
@@ -170,9 +164,7 @@ async def add_category(name):
             return category
     
     # Generate a new ID
-    new_id = "1"
-    if categories:
-        new_id = str(max([int(category.get('id', 0)) for category in categories]) + 1)
+    new_id = str(next_id(categories))
     
     # Create new category
     new_category = {
@@ -183,6 +175,7 @@ async def add_category(name):
     # Add to sheet
     categories.append(new_category)
     await write_to_sheet(CATEGORIES_SHEET, categories)
+    invalidate_catalog()
     
     return new_category
 
@@ -192,7 +185,7 @@ async def update_category(category_id, name=None):
     updated = False
     
     for i, category in enumerate(categories):
-        if category.get('id') == category_id:
+        if str(category.get('id')) == str(category_id):
             # Update fields if provided
             if name is not None:
                 categories[i]['name'] = name
@@ -202,6 +195,7 @@ async def update_category(category_id, name=None):
     
     if updated:
         await write_to_sheet(CATEGORIES_SHEET, categories)
+        invalidate_catalog()
     
     return updated
 
@@ -210,25 +204,26 @@ async def delete_category(category_id):
     categories = await get_all_categories()
     
     # Filter out the category to delete
-    updated_categories = [category for category in categories if category.get('id') != category_id]
+    updated_categories = [category for category in categories if str(category.get('id')) != str(category_id)]
     
     # Check if a category was removed
     if len(updated_categories) < len(categories):
         await write_to_sheet(CATEGORIES_SHEET, updated_categories)
+        invalidate_catalog()
         
         # Also update any services that had this category
         services = await get_all_services()
         updated = False
         
         for i, service in enumerate(services):
-            if service.get('category_id') == category_id:
+            if str(service.get('category_id')) == str(category_id):
                 # Remove the category reference
-                if 'category_id' in services[i]:
-                    del services[i]['category_id']
+                services[i] = service.replace(category_id='')
                 updated = True
         
         if updated:
             await write_to_sheet(SERVICES_SHEET, services)
+            invalidate_catalog()
         
         return True
     
@@ -248,7 +243,7 @@ async def get_offer(offer_id):
     """Get a special offer by its ID"""
     offers = await get_all_offers()
     for offer in offers:
-        if offer.get('id') == offer_id:
+        if str(offer.get('id')) == str(offer_id):
             return offer
     return None
 
@@ -257,9 +252,7 @@ async def add_offer(name, description, price, duration):
     offers = await get_all_offers()
     
     # Generate a new ID
-    new_id = "1"
-    if offers:
-        new_id = str(max([int(offer.get('id', 0)) for offer in offers]) + 1)
+    new_id = str(next_id(offers))
     
     # Create new offer
     new_offer = {
@@ -273,6 +266,7 @@ async def add_offer(name, description, price, duration):
     # Add to sheet
     offers.append(new_offer)
     await write_to_sheet(OFFERS_SHEET, offers)
+    invalidate_catalog()
     
     return new_offer
 
@@ -282,7 +276,7 @@ async def update_offer(offer_id, name=None, description=None, price=None, durati
     updated = False
     
     for i, offer in enumerate(offers):
-        if offer.get('id') == offer_id:
+        if str(offer.get('id')) == str(offer_id):
             # Update fields if provided
             if name is not None:
                 offers[i]['name'] = name
@@ -298,6 +292,7 @@ async def update_offer(offer_id, name=None, description=None, price=None, durati
     
     if updated:
         await write_to_sheet(OFFERS_SHEET, offers)
+        invalidate_catalog()
     
     return updated
 
@@ -306,15 +301,271 @@ async def delete_offer(offer_id):
     offers = await get_all_offers()
     
     # Filter out the offer to delete
-    updated_offers = [offer for offer in offers if offer.get('id') != offer_id]
+    updated_offers = [offer for offer in offers if str(offer.get('id')) != str(offer_id)]
     
     # Check if an offer was removed
     if len(updated_offers) < len(offers):
         await write_to_sheet(OFFERS_SHEET, updated_offers)
+        invalidate_catalog()
         return True
     
     return False
 
+# Bulk catalog operations
+# Every bulk function reads the sheet once, applies all changes to a copy
+# and writes the result back in a single write. If any change is invalid
+# nothing is written, so the sheet never ends up half-updated.
+CATALOG_FIELDS = {
+    SERVICES_SHEET: ('name', 'description', 'price', 'duration', 'category_id'),
+    CATEGORIES_SHEET: ('name',),
+    OFFERS_SHEET: ('name', 'description', 'price', 'duration_days'),
+}
+
+async def _load_copy(sheet_name):
+    """Get a private copy of a catalog sheet that is safe to modify"""
+    rows = await get_sheet(sheet_name)
+    return [dict(row) for row in rows]
+
+async def _save(sheet_name, rows):
+    """Write a catalog sheet and invalidate the catalog snapshot"""
+    success = await write_to_sheet(sheet_name, rows)
+    if success:
+        invalidate_catalog()
+    return success
+
+async def bulk_apply(sheet_name, inserts=(), updates=None):
+    """Apply inserts and updates to a catalog sheet with a single write
+    
+    updates maps a row ID to a dict of changed fields; a field set to None is
+    removed from the row. Inserts get the next free IDs unless they bring
+    their own (which must not be taken yet). Returns a dict with the created rows and the
+    number of updated rows, or None if the batch is invalid or could not be
+    written.
+    """
+    rows = await _load_copy(sheet_name)
+    fields = CATALOG_FIELDS[sheet_name]
+    updates = updates or {}
+    index = {str(row.get('id')): row for row in rows}
+    
+    # Validate everything before touching the rows
+    if any(str(row_id) not in index for row_id in updates):
+        return None
+    if any(not item.get('name') for item in inserts):
+        return None
+    own_ids = [str(item['id']) for item in inserts if item.get('id')]
+    if any(row_id in index for row_id in own_ids) or len(set(own_ids)) < len(own_ids):
+        return None
+    
+    for row_id, changes in updates.items():
+        row = index[str(row_id)]
+        for field, value in changes.items():
+            if field not in fields:
+                continue
+            if value is None:
+                row.pop(field, None)
+            else:
+                row[field] = value
+    
+    new_id = max([next_id(rows)] + [int(row_id) + 1 for row_id in own_ids if row_id.isdigit()])
+    created = []
+    for item in inserts:
+        if item.get('id'):
+            new_row = {'id': str(item['id'])}
+        else:
+            new_row = {'id': str(new_id)}
+            new_id += 1
+        for field in fields:
+            if item.get(field) is not None:
+                new_row[field] = item[field]
+        created.append(new_row)
+    
+    result = {
+        'created': created,
+        'updated': len(updates)
+    }
+    
+    if created or result['updated']:
+        if not await _save(sheet_name, rows + created):
+            return None
+    
+    return result
+
+async def bulk_insert(sheet_name, items):
+    """Insert several catalog rows with a single write"""
+    result = await bulk_apply(sheet_name, inserts=items)
+    return result['created'] if result else None
+
+async def bulk_update(sheet_name, updates):
+    """Update several catalog rows with a single write
+    
+    Returns the number of updated rows, or False if any ID is unknown.
+    """
+    result = await bulk_apply(sheet_name, updates=updates)
+    return result['updated'] if result else False
+
+async def bulk_add_services(services):
+    """Add several services with a single write"""
+    return await bulk_insert(SERVICES_SHEET, services)
+
+def _plan_categories(categories, names):
+    """Get the categories to add for the names not taken yet, with the IDs they will get"""
+    existing = {str(category.get('name', '')).lower() for category in categories}
+    new_id = next_id(categories)
+    
+    new_categories = []
+    for name in names:
+        if name and name.lower() not in existing:
+            existing.add(name.lower())
+            new_categories.append({'id': str(new_id), 'name': name})
+            new_id += 1
+    return new_categories
+
+def _apply_price_change(current_price, price=None, percent=None):
+    """Get a new price from a fixed value or a percentage change"""
+    if price is not None:
+        return price
+    
+    new_price = float(current_price or 0) * (1 + percent / 100)
+    return round(new_price, 2)
+
+async def bulk_update_prices(category_id=None, price=None, percent=None, sheet_name=SERVICES_SHEET):
+    """Set a price or change prices by a percentage in a single write
+    
+    If category_id is given only services of that category are changed.
+    Returns the number of updated rows, or False if nothing was requested.
+    """
+    if price is None and percent is None:
+        return False
+    
+    rows = await get_sheet(sheet_name)
+    updates = {}
+    
+    for row in rows:
+        if category_id is not None and str(row.get('category_id')) != str(category_id):
+            continue
+        updates[row.get('id')] = {'price': _apply_price_change(row.get('price'), price, percent)}
+    
+    if not updates:
+        return 0
+    
+    return await bulk_update(sheet_name, updates)
+
+# Price list CSV import/export
+PRICE_LIST_COLUMNS = ['id', 'category', 'name', 'description', 'price', 'duration']
+
+async def export_price_list_csv():
+    """Export all services as a CSV price list"""
+    services = await get_all_services()
+    categories = await get_all_categories()
+    category_names = {str(category.get('id')): category.get('name') for category in categories}
+    
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=PRICE_LIST_COLUMNS)
+    writer.writeheader()
+    
+    for service in services:
+        writer.writerow({
+            'id': service.get('id', ''),
+            'category': category_names.get(str(service.get('category_id')), ''),
+            'name': service.get('name', ''),
+            'description': service.get('description', ''),
+            'price': service.get('price', ''),
+            'duration': service.get('duration', '')
+        })
+    
+    return output.getvalue()
+
+def _parse_price_list_csv(text):
+    """Parse and validate a CSV price list, returning (rows, errors)"""
+    # Only the delimiter is guessed from the header; quoting is the usual
+    # one, a header line alone tells nothing about escaped quotes
+    try:
+        delimiter = csv.Sniffer().sniff(text.splitlines()[0] if text else '', delimiters=',;\t').delimiter
+    except csv.Error:
+        delimiter = ','
+    
+    reader = csv.DictReader(io.StringIO(text), delimiter=delimiter)
+    missing = [column for column in ('name', 'price') if column not in (reader.fieldnames or [])]
+    if missing:
+        return [], [f"Нет обязательных колонок: {', '.join(missing)}"]
+    
+    rows = []
+    errors = []
+    for line_number, row in enumerate(reader, start=2):
+        name = (row.get('name') or '').strip()
+        if not name:
+            errors.append(f"Строка {line_number}: не указано название")
+            continue
+        
+        try:
+            price = float(str(row.get('price') or 0).replace(',', '.'))
+            duration = int(row['duration']) if (row.get('duration') or '').strip() else None
+        except ValueError:
+            errors.append(f"Строка {line_number}: неверная цена или продолжительность")
+            continue
+        
+        rows.append({
+            'id': (row.get('id') or '').strip(),
+            'category': (row.get('category') or '').strip(),
+            'name': name,
+            'description': (row.get('description') or '').strip(),
+            'price': int(price) if price.is_integer() else price,
+            'duration': duration
+        })
+    
+    return rows, errors
+
+async def import_price_list_csv(text):
+    """Import a CSV price list: rows with a known ID update services, others are added
+    
+    The whole file is validated first and all services are written at once.
+    Missing categories are written after the services, with the IDs the
+    services already refer to, so a failed import adds nothing. Returns a
+    tuple (success, message).
+    """
+    rows, errors = _parse_price_list_csv(text)
+    if errors:
+        return (False, "\n".join(errors[:10]))
+    if not rows:
+        return (False, "Файл не содержит услуг")
+    
+    categories = await get_all_categories()
+    new_categories = _plan_categories(categories, [row['category'] for row in rows if row['category']])
+    category_ids = {
+        str(category.get('name', '')).lower(): category.get('id')
+        for category in [*categories, *new_categories]
+    }
+    
+    services = await get_all_services()
+    known_ids = {str(service.get('id')) for service in services}
+    
+    updates = {}
+    new_services = []
+    for row in rows:
+        fields = {
+            'name': row['name'],
+            'description': row['description'],
+            'price': row['price'],
+            'duration': row['duration']
+        }
+        if row['category']:
+            fields['category_id'] = category_ids.get(row['category'].lower())
+        
+        if row['id'] in known_ids:
+            updates[row['id']] = {key: value for key, value in fields.items() if value is not None}
+        else:
+            new_services.append(fields)
+    
+    result = await bulk_apply(SERVICES_SHEET, inserts=new_services, updates=updates)
+    if result is None:
+        return (False, "Не удалось сохранить прайс-лист")
+    
+    message = f"Обновлено услуг: {result['updated']}, добавлено: {len(result['created'])}"
+    if new_categories and await bulk_insert(CATEGORIES_SHEET, new_categories) is None:
+        names = ", ".join(category['name'] for category in new_categories)
+        message += f"\nНе удалось добавить категории ({names}), их услуги пока показываются без категории"
+    return (True, message)
+
 # Template service functions
 async def get_all_template_categories():
     """Get all unique category names from the templates"""
@@ -352,24 +603,26 @@ async def create_services_from_template(category_name):
     # Get existing services
     existing_services = await get_all_services()
     existing_names = {service.get('name') for service in existing_services 
-                      if service.get('category_id') == category_id}
+                      if str(service.get('category_id')) == str(category_id)}
+    
+    # Add all missing template services with a single write
+    new_services = [
+        {
+            'name': template.get('service_name'),
+            'description': template.get('description', ''),
+            'price': 0,  # Placeholder price, admin will set the actual price later
+            'duration': template.get('default_duration', 60),
+            'category_id': category_id
+        }
+        for template in templates
+        if template.get('service_name') not in existing_names
+    ]
     
-    # Add each template service if it doesn't already exist
-    added_count = 0
-    for template in templates:
-        service_name = template.get('service_name')
-        if service_name not in existing_names:
-            # Placeholder price of 0, admin will set the actual price later
-            await add_service(
-                name=service_name,
-                description=template.get('description', ''),
-                price=0,  # Default price 0
-                duration=template.get('default_duration', 60),
-                category_id=category_id
-            )
-            added_count += 1
-    
-    return {"success": True, "message": f"Добавлено {added_count} новых услуг в категорию '{category_name}'", "category_id": category_id}
+    created = await bulk_add_services(new_services)
+    if created is None:
+        return (False, "Не удалось добавить услуги")
+    
+    return (True, f"Добавлено {len(created)} новых услуг в категорию '{category_name}'")
 
 async def add_template_services_to_category(category_name):
     """Add all template services for a category to the services table"""
@@ -0,0 +1,235 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+
+# Stats counted per sheet
+CACHE_EVENTS = ('hits', 'stale_hits', 'misses', 'coalesced', 'refreshes', 'load_failures')
+
+
+class CachePolicy:
+    """
+    How long cached data of a sheet is used.
+
+    Data younger than ttl is fresh. Up to stale_ttl more it is still served,
+    while a background refresh reloads it (stale-while-revalidate).
+    """
+
+    __slots__ = ('ttl', 'stale_ttl')
+
+    def __init__(self, ttl, stale_ttl=0):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+
+    def __repr__(self):
+        return f"CachePolicy(ttl={self.ttl}, stale_ttl={self.stale_ttl})"
+
+
+class CacheEntry:
+    __slots__ = ('value', 'stored_at', 'size', 'stale')
+
+    def __init__(self, value, stored_at, size, stale=False):
+        self.value = value
+        self.stored_at = stored_at
+        self.size = size
+        # Stored by the bot rather than loaded, revalidated on the next read
+        self.stale = stale
+
+
+class SheetCache:
+    """
+    Cache of sheet data with per-sheet policies.
+
+    Entries are keyed by sheet name and an optional sub-key (e.g. a page).
+    Sub-key entries are dropped whenever the whole sheet is stored again or
+    they expire, so pages of a sheet cannot pile up. Concurrent misses of the same key share a single load (single-flight),
+    stale entries are served while they are refreshed in the background, and
+    invalidation can target a sheet, one key of a sheet or everything. Data
+    the bot wrote can be stored as a stale entry, so readers get it at once
+    while the sheet is read back in the background.
+
+    Loaders are coroutine functions returning the data, or None if it could
+    not be loaded; None is never cached.
+    """
+
+    def __init__(self, policies=None, default_policy=None, on_hit=None):
+        self.policies = dict(policies or {})
+        self.default_policy = default_policy or CachePolicy(60)
+        # Called with the sheet name on every hit, fresh or stale
+        self.on_hit = on_hit
+        self._entries = {}
+        self._loading = {}
+        self._refreshing = set()
+        # Bumped on invalidation, so loads started before it are not stored
+        self._generations = Counter()
+        self._stats = {}
+
+    def get_policy(self, sheet_name):
+        return self.policies.get(sheet_name, self.default_policy)
+
+    def set_policy(self, sheet_name, ttl, stale_ttl=0):
+        """Set the cache policy of a sheet"""
+        self.policies[sheet_name] = CachePolicy(ttl, stale_ttl)
+
+    def _count(self, sheet_name, event):
+        stats = self._stats.get(sheet_name)
+        if stats is None:
+            stats = self._stats[sheet_name] = Counter()
+        stats[event] += 1
+
+    def _age(self, entry):
+        return time.monotonic() - entry.stored_at
+
+    def _servable(self, entry, policy):
+        """Check if an entry may still be served, fresh or stale"""
+        age = self._age(entry)
+        return age < policy.ttl + policy.stale_ttl or (entry.stale and age < policy.ttl)
+
+    def peek(self, sheet_name, key=None):
+        """Get fresh cached data without loading it, or None"""
+        entry = self._entries.get((sheet_name, key))
+        if entry is not None and self._age(entry) < self.get_policy(sheet_name).ttl:
+            return entry.value
+        return None
+
+    async def get_or_load(self, sheet_name, loader, key=None, size=len):
+        """Get cached data, loading it with loader() on a miss"""
+        cache_key = (sheet_name, key)
+        entry = self._entries.get(cache_key)
+
+        if entry is not None:
+            policy = self.get_policy(sheet_name)
+            age = self._age(entry)
+            if age < policy.ttl and not entry.stale:
+                self._count(sheet_name, 'hits')
+                self._notify_hit(sheet_name)
+                return entry.value
+            if self._servable(entry, policy):
+                self._count(sheet_name, 'stale_hits')
+                self._notify_hit(sheet_name)
+                self._refresh_in_background(cache_key, loader, size)
+                return entry.value
+
+        # Join a load of the same key that is already in progress
+        pending = self._loading.get(cache_key)
+        if pending is not None:
+            self._count(sheet_name, 'coalesced')
+            return await asyncio.shield(pending)
+
+        self._count(sheet_name, 'misses')
+        return await self._load(cache_key, loader, size)
+
+    async def _load(self, cache_key, loader, size):
+        sheet_name = cache_key[0]
+        generation = self._generations[sheet_name]
+        future = asyncio.get_running_loop().create_future()
+        self._loading[cache_key] = future
+
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            # Only the cancelled task stops: callers that joined the load
+            # get the stale data, if any, as if the load had failed
+            if self._loading.get(cache_key) is future:
+                del self._loading[cache_key]
+            stale = self._entries.get(cache_key)
+            future.set_result(stale.value if stale is not None else None)
+            raise
+        except Exception as e:
+            logging.error(f"Error loading {cache_key} into cache: {str(e)}")
+            value = None
+        finally:
+            if self._loading.get(cache_key) is future:
+                del self._loading[cache_key]
+
+        if value is None:
+            self._count(sheet_name, 'load_failures')
+        elif self._generations[sheet_name] == generation:
+            self._entries[cache_key] = CacheEntry(value, time.monotonic(), size(value))
+            self._evict(sheet_name, whole_sheet=cache_key[1] is None)
+
+        future.set_result(value)
+        return value
+
+    def _evict(self, sheet_name, whole_sheet=False):
+        """Drop the expired entries of a sheet, and all its sub-key entries if the whole sheet was stored"""
+        policy = self.get_policy(sheet_name)
+        expired = [
+            cache_key for cache_key, entry in self._entries.items()
+            if cache_key[0] == sheet_name and (
+                (whole_sheet and cache_key[1] is not None)
+                or self._age(entry) >= policy.ttl + policy.stale_ttl
+            )
+        ]
+        for cache_key in expired:
+            del self._entries[cache_key]
+
+    def cached(self, sheet_name):
+        """Get the whole-sheet data that may still be served, fresh or stale, without loading it, or None"""
+        entry = self._entries.get((sheet_name, None))
+        if entry is not None and self._servable(entry, self.get_policy(sheet_name)):
+            return entry.value
+        return None
+
+    def store(self, sheet_name, value, size=len):
+        """
+        Store the whole data of a sheet as the bot wrote it.
+
+        The other keys of the sheet and the loads in progress are dropped as
+        on invalidation. The entry is stale: it is served right away and the
+        next read reloads it in the background, so the cache ends up with the
+        sheet as it reads back.
+        """
+        self.invalidate(sheet_name)
+        self._entries[(sheet_name, None)] = CacheEntry(value, time.monotonic(), size(value), stale=True)
+
+    def _refresh_in_background(self, cache_key, loader, size):
+        if cache_key in self._refreshing or cache_key in self._loading:
+            return
+        self._refreshing.add(cache_key)
+        self._count(cache_key[0], 'refreshes')
+
+        task = asyncio.create_task(self._load(cache_key, loader, size))
+        task.add_done_callback(lambda _: self._refreshing.discard(cache_key))
+
+    def _notify_hit(self, sheet_name):
+        if self.on_hit is not None:
+            self.on_hit(sheet_name)
+
+    def invalidate(self, sheet_name=None, key=None, all_keys=True):
+        """
+        Drop cached data.
+
+        Without arguments everything is dropped. With a sheet name, all keys
+        of the sheet are dropped, or only the given key if all_keys is False.
+        """
+        if sheet_name is None:
+            for name in {name for name, _ in self._entries} | {name for name, _ in self._loading}:
+                self._generations[name] += 1
+            self._entries.clear()
+            # Later requests must not join loads that started before the invalidation
+            self._loading.clear()
+            return
+
+        self._generations[sheet_name] += 1
+        if all_keys:
+            for store in (self._entries, self._loading):
+                for cache_key in [cache_key for cache_key in store if cache_key[0] == sheet_name]:
+                    del store[cache_key]
+        else:
+            self._entries.pop((sheet_name, key), None)
+            self._loading.pop((sheet_name, key), None)
+
+    def get_stats(self):
+        """Hit/miss counters and cached size (entries and rows) per sheet"""
+        stats = {}
+        for sheet_name, counters in self._stats.items():
+            stats[sheet_name] = {event: counters[event] for event in CACHE_EVENTS}
+            stats[sheet_name].update(entries=0, rows=0)
+
+        for (sheet_name, _), entry in self._entries.items():
+            sheet_stats = stats.setdefault(sheet_name, {event: 0 for event in CACHE_EVENTS})
+            sheet_stats['entries'] = sheet_stats.get('entries', 0) + 1
+            sheet_stats['rows'] = sheet_stats.get('rows', 0) + entry.size
+
+        return stats
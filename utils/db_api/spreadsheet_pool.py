@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
+
+import gspread
+from google.auth.transport.requests import AuthorizedSession, Request
+from google.oauth2.service_account import Credentials
+from requests.adapters import HTTPAdapter
+
+# Opened spreadsheets kept at most, least recently used ones are dropped
+SPREADSHEET_POOL_SIZE = int(os.getenv('SPREADSHEET_POOL_SIZE', '32'))
+
+# Keep-alive connections to the Sheets API, one per concurrent request
+HTTP_POOL_SIZE = int(os.getenv('SHEETS_HTTP_POOL_SIZE', '16'))
+
+# The access token is refreshed off the event loop this long before it expires
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+# Sheets API quotas are counted per minute
+QUOTA_WINDOW = 60
+
+_SPREADSHEET_ID_RE = re.compile(r'/spreadsheets/([A-Za-z0-9_-]+)')
+
+
+class QuotaUsage:
+    """Sheets API requests made for one spreadsheet, in total and in the last minute"""
+
+    __slots__ = ('reads', 'writes', 'throttled', '_windows')
+
+    def __init__(self):
+        self.reads = 0
+        self.writes = 0
+        self.throttled = 0
+        self._windows = {'read': deque(), 'write': deque()}
+
+    def record(self, kind, throttled=False, now=None):
+        """Account for one request ("read" or "write")"""
+        now = time.monotonic() if now is None else now
+        if kind == 'read':
+            self.reads += 1
+        else:
+            self.writes += 1
+        if throttled:
+            self.throttled += 1
+        window = self._windows[kind]
+        window.append(now)
+        self._expire(window, now)
+
+    def per_minute(self, kind, now=None):
+        """Requests of a kind made in the last minute"""
+        window = self._windows[kind]
+        self._expire(window, time.monotonic() if now is None else now)
+        return len(window)
+
+    @staticmethod
+    def _expire(window, now):
+        while window and now - window[0] >= QUOTA_WINDOW:
+            window.popleft()
+
+    def to_dict(self):
+        return {
+            'reads': self.reads,
+            'writes': self.writes,
+            'throttled': self.throttled,
+            'reads_per_minute': self.per_minute('read'),
+            'writes_per_minute': self.per_minute('write'),
+        }
+
+
+class SpreadsheetPool:
+    """
+    Authorized gspread client shared by all spreadsheets, with the opened
+    spreadsheets kept by ID.
+
+    All spreadsheets go through one HTTP session, so connections to the
+    Sheets API are kept alive and reused. Every response is accounted to
+    the spreadsheet it was made for, to watch the per-minute quotas.
+    """
+
+    def __init__(self, scopes, size=SPREADSHEET_POOL_SIZE):
+        self.scopes = scopes
+        self.size = size
+        self.credentials = None
+        self.client = None
+        self.usage = {}
+        self._spreadsheets = OrderedDict()
+        self._pinned = set()
+        self._lock = asyncio.Lock()
+
+    def connect(self, credentials_file):
+        """Authorize the client with a service account file (blocking)"""
+        credentials = Credentials.from_service_account_file(credentials_file, scopes=self.scopes)
+
+        session = AuthorizedSession(credentials)
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        session.mount('https://', adapter)
+        session.hooks['response'].append(self._on_response)
+
+        self.credentials = credentials
+        self.client = gspread.Client(credentials, session=session)
+        return self.client
+
+    def _on_response(self, response, *args, **kwargs):
+        """Session hook: account a response to its spreadsheet"""
+        match = _SPREADSHEET_ID_RE.search(response.request.url or '')
+        if match is None:
+            return
+        kind = 'read' if response.request.method == 'GET' else 'write'
+        self.get_usage(match.group(1)).record(kind, throttled=response.status_code == 429)
+
+    def get_usage(self, spreadsheet_id):
+        """Get the quota usage of a spreadsheet"""
+        usage = self.usage.get(spreadsheet_id)
+        if usage is None:
+            usage = self.usage[spreadsheet_id] = QuotaUsage()
+        return usage
+
+    def get_stats(self):
+        """Requests per spreadsheet, in total and in the last minute"""
+        return {spreadsheet_id: usage.to_dict() for spreadsheet_id, usage in self.usage.items()}
+
+    def credentials_expiring(self):
+        """Check if the access token is missing or about to expire"""
+        credentials = self.credentials
+        if credentials is None:
+            return False
+        if not credentials.token or credentials.expiry is None:
+            return True
+        # google-auth keeps the expiry as a naive UTC datetime
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return credentials.expiry - now < TOKEN_REFRESH_MARGIN
+
+    async def refresh_credentials(self):
+        """Refresh the access token in a thread, so requests never refresh it on the event loop"""
+        if not self.credentials_expiring():
+            return
+        async with self._lock:
+            if self.credentials_expiring():
+                await asyncio.to_thread(self.credentials.refresh, Request())
+                logging.info("Google Sheets access token refreshed")
+
+    def add(self, spreadsheet_id, spreadsheet, pin=False):
+        """Keep an opened spreadsheet; pinned ones are never dropped"""
+        self._spreadsheets[spreadsheet_id] = spreadsheet
+        self._spreadsheets.move_to_end(spreadsheet_id)
+        if pin:
+            self._pinned.add(spreadsheet_id)
+        self._evict()
+        return spreadsheet
+
+    def _evict(self):
+        for spreadsheet_id in list(self._spreadsheets):
+            if len(self._spreadsheets) <= self.size:
+                break
+            if spreadsheet_id not in self._pinned:
+                del self._spreadsheets[spreadsheet_id]
+
+    def get(self, spreadsheet_id):
+        """Get an opened spreadsheet, or None"""
+        spreadsheet = self._spreadsheets.get(spreadsheet_id)
+        if spreadsheet is not None:
+            self._spreadsheets.move_to_end(spreadsheet_id)
+        return spreadsheet
+
+    async def open(self, spreadsheet_id, prepare=None):
+        """
+        Get a spreadsheet, opening it in a thread if it is not kept yet.
+
+        prepare(spreadsheet) is called in the same thread after opening,
+        e.g. to create missing worksheets.
+        """
+        spreadsheet = self.get(spreadsheet_id)
+        if spreadsheet is not None:
+            return spreadsheet
+
+        await self.refresh_credentials()
+        async with self._lock:
+            # Another task may have opened the spreadsheet while we were waiting
+            spreadsheet = self.get(spreadsheet_id)
+            if spreadsheet is not None:
+                return spreadsheet
+
+            def _open():
+                opened = self.client.open_by_key(spreadsheet_id)
+                if prepare is not None:
+                    prepare(opened)
+                return opened
+
+            return self.add(spreadsheet_id, await asyncio.to_thread(_open))
+
+    def clear(self):
+        """Forget the opened spreadsheets, except the pinned ones"""
+        for spreadsheet_id in list(self._spreadsheets):
+            if spreadsheet_id not in self._pinned:
+                del self._spreadsheets[spreadsheet_id]
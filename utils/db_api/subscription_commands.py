@@ -1,21 +1,70 @@
 
-from utils.db_api.google_sheets import get_sheet, write_to_sheet
-from datetime import datetime, timedelta
+import asyncio
+import logging
+import uuid
+from utils.db_api.google_sheets import get_sheet, get_sheet_table, write_to_sheet, append_to_sheet, add_sheet_hook
+from datetime import date, datetime, timedelta
 
 # Sheet names for subscriptions and payments
 SUBSCRIPTIONS_SHEET = "Subscriptions"
 PAYMENTS_SHEET = "Payments"  # New sheet for payment validation
+REFERRAL_CREDITS_SHEET = "ReferralCredits"
+
+# Subscriptions by user ID, rebuilt when the cached sheet changes
+_subscriptions_index = (None, {})
+
+# Computed statuses of subscribed users by user ID. Days left only change
+# at midnight, so statuses are kept until the end of the day unless the
+# bot writes the Subscriptions sheet.
+_statuses = {}
+_statuses_day = None
+
+# Bumped whenever the statuses are dropped, so statuses computed from
+# older data are not stored
+_statuses_generation = 0
+
+def clear_status_cache():
+    """Drop the computed subscription statuses"""
+    global _statuses_generation
+    _statuses_generation += 1
+    _statuses.clear()
+
+def forget_status(user_id):
+    """Drop the computed status of one user"""
+    global _statuses_generation
+    _statuses_generation += 1
+    _statuses.pop(str(user_id), None)
+
+def _on_sheet_operation(operation, sheet_name):
+    """Sheet hook: drop the statuses once subscriptions are written"""
+    if operation == 'write' and sheet_name == SUBSCRIPTIONS_SHEET:
+        clear_status_cache()
+
+add_sheet_hook(_on_sheet_operation)
+
+# Referral credits ledger. Like the payments, a credit is appended as a
+# pending row and applying it appends an applied row with the same ID, so
+# credits survive a restart until the sweeper applies them.
+CREDIT_PENDING = 'pending'
+CREDIT_APPLIED = 'applied'
+
+# Days credited to the referrer of a new admin
+REFERRAL_DAYS = 30
+
+# Serializes applying credits, so the sweeper and shutdown do not apply them twice
+_credits_lock = asyncio.Lock()
 
 async def get_subscription(user_id):
     """Get subscription for a specific user"""
-    subscriptions = await get_sheet(SUBSCRIPTIONS_SHEET)
-    user_id_str = str(user_id)
+    global _subscriptions_index
+    subscriptions = await get_sheet_table(SUBSCRIPTIONS_SHEET)
+    if _subscriptions_index[0] is not subscriptions:
+        by_user = {}
+        for subscription in subscriptions:
+            by_user.setdefault(str(subscription.get('user_id')), subscription)
+        _subscriptions_index = (subscriptions, by_user)
     
-    for subscription in subscriptions:
-        if str(subscription.get('user_id')) == user_id_str:
-            return subscription
-    
-    return None
+    return _subscriptions_index[1].get(str(user_id))
 
 async def create_subscription(user_id, days=30, trial=False, referrer_id=None):
     """Create a new subscription for a user (admin only)"""
@@ -40,56 +89,90 @@ async def create_subscription(user_id, days=30, trial=False, referrer_id=None):
     }
     
     subscriptions.append(new_subscription)
-    await write_to_sheet(SUBSCRIPTIONS_SHEET, subscriptions)
+    if not await write_to_sheet(SUBSCRIPTIONS_SHEET, subscriptions):
+        return None
     
     return new_subscription
 
+def _extended(subscription, days):
+    """Get a subscription extended by a number of days"""
+    # Get current end date
+    current_end_date = subscription.get('end_date')
+    
+    try:
+        # Parse current end date
+        if current_end_date:
+            end_date = datetime.strptime(current_end_date, "%Y-%m-%d")
+        else:
+            end_date = datetime.now()
+    except Exception:
+        # If date parsing fails, set a new date from today
+        end_date = datetime.now()
+    
+    # Add days to end date
+    new_end_date = (end_date + timedelta(days=days)).strftime("%Y-%m-%d")
+    # Update trial status to 'no' if extending
+    return subscription.replace(end_date=new_end_date, trial='no')
+
 async def extend_subscription(user_id, days):
     """Extend an existing subscription by a certain number of days"""
     subscriptions = await get_sheet(SUBSCRIPTIONS_SHEET)
     user_id_str = str(user_id)
-    updated = False
     
     for i, subscription in enumerate(subscriptions):
         if str(subscription.get('user_id')) == user_id_str:
-            # Get current end date
-            current_end_date = subscription.get('end_date')
-            
-            try:
-                # Parse current end date
-                if current_end_date:
-                    end_date = datetime.strptime(current_end_date, "%Y-%m-%d")
-                else:
-                    end_date = datetime.now()
-                
-                # Add days to end date
-                new_end_date = (end_date + timedelta(days=days)).strftime("%Y-%m-%d")
-                subscriptions[i]['end_date'] = new_end_date
-                
-                # Update trial status to 'no' if extending
-                subscriptions[i]['trial'] = 'no'
-                
-                updated = True
-                break
-            except Exception as e:
-                # If date parsing fails, set a new date from today
-                new_end_date = (datetime.now() + timedelta(days=days)).strftime("%Y-%m-%d")
-                subscriptions[i]['end_date'] = new_end_date
-                subscriptions[i]['trial'] = 'no'
-                updated = True
-                break
-    
-    if updated:
-        await write_to_sheet(SUBSCRIPTIONS_SHEET, subscriptions)
-        return subscriptions[i]
+            subscriptions[i] = _extended(subscription, days)
+            if not await write_to_sheet(SUBSCRIPTIONS_SHEET, subscriptions):
+                return None
+            return subscriptions[i]
     
     # If subscription doesn't exist, create a new one
     return await create_subscription(user_id, days)
 
+async def extend_subscriptions(days_by_user):
+    """Extend the subscriptions of several users with one write, creating missing ones"""
+    subscriptions = await get_sheet(SUBSCRIPTIONS_SHEET)
+    remaining = {str(user_id): days for user_id, days in days_by_user.items()}
+    
+    for i, subscription in enumerate(subscriptions):
+        days = remaining.pop(str(subscription.get('user_id')), None)
+        if days:
+            subscriptions[i] = _extended(subscription, days)
+    
+    for user_id, days in remaining.items():
+        subscriptions.append({
+            'user_id': user_id,
+            'start_date': datetime.now().strftime("%Y-%m-%d"),
+            'end_date': (datetime.now() + timedelta(days=days)).strftime("%Y-%m-%d"),
+            'trial': 'no',
+            'referrer_id': ''
+        })
+    
+    return await write_to_sheet(SUBSCRIPTIONS_SHEET, subscriptions)
+
 async def check_subscription_status(user_id):
     """Check if an admin has an active subscription"""
-    subscription = await get_subscription(user_id)
+    global _statuses_day
+    today = date.today()
+    if _statuses_day != today:
+        clear_status_cache()
+        _statuses_day = today
+    
+    status = _statuses.get(str(user_id))
+    if status is None:
+        generation = _statuses_generation
+        subscription = await get_subscription(user_id)
+        status = get_subscription_status(subscription)
+        # Users without a subscription are looked up again, the sheet may
+        # just have failed to load
+        if subscription and generation == _statuses_generation:
+            _statuses[str(user_id)] = status
     
+    # Callers may change the returned dict
+    return dict(status)
+
+def get_subscription_status(subscription):
+    """Compute the status of a subscription as of now"""
     if not subscription:
         return {
             'active': False,
@@ -136,8 +219,51 @@ async def create_trial(user_id, days=7):
     return await create_subscription(user_id, days, trial=True)
 
 async def process_referral(referrer_id):
-    """Process a referral - extend referrer's subscription by 30 days"""
-    return await extend_subscription(referrer_id, 30)
+    """Process a referral - credit 30 days to the referrer's subscription"""
+    # The credit is stored right away and applied in batches by the subscription sweeper
+    credit = {
+        'id': f"r{uuid.uuid4().hex[:16]}",
+        'referrer_id': str(referrer_id),
+        'days': REFERRAL_DAYS,
+        'created_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'status': CREDIT_PENDING,
+    }
+    return await append_to_sheet(REFERRAL_CREDITS_SHEET, [credit])
+
+async def get_pending_credits():
+    """Get the referral credits that were not applied yet"""
+    credits = {}
+    for credit in await get_sheet_table(REFERRAL_CREDITS_SHEET):
+        # Later rows hold later states
+        credits[str(credit.get('id'))] = credit
+    return [credit for credit in credits.values() if credit.get('status') == CREDIT_PENDING]
+
+async def apply_referral_credits():
+    """
+    Apply all pending referral credits with one write of the subscriptions
+    and one append to the credits ledger. Returns the number of credited users.
+    
+    Subscriptions are extended before the credits are marked as applied:
+    if the bot stops in between, the credits are applied again rather
+    than lost.
+    """
+    async with _credits_lock:
+        pending = await get_pending_credits()
+        if not pending:
+            return 0
+        
+        days_by_user = {}
+        for credit in pending:
+            user_id = str(credit.get('referrer_id'))
+            days_by_user[user_id] = days_by_user.get(user_id, 0) + int(credit.get('days') or 0)
+        
+        # Failed credits stay pending for the next run
+        if not await extend_subscriptions(days_by_user):
+            return 0
+        if not await append_to_sheet(REFERRAL_CREDITS_SHEET, [credit.replace(status=CREDIT_APPLIED) for credit in pending]):
+            logging.error(f"Referral credits {', '.join(str(credit.get('id')) for credit in pending)} were applied but not marked")
+        
+        return len(days_by_user)
 
 async def get_all_subscriptions():
     """Get all subscriptions"""
@@ -148,72 +274,174 @@ async def is_admin_subscribed(user_id):
     status = await check_subscription_status(user_id)
     return status['active']
 
-# New functions for payment validation
-async def record_payment(user_id, plan_months, amount, payment_method="manual"):
-    """Record a subscription payment"""
-    # Initialize payments sheet if not exists
-    payments = await get_sheet(PAYMENTS_SHEET)
+# Payment ledger. The Payments sheet is append-only: a payment is recorded
+# as a row, and every change of its state appends another row with the
+# same ID. The last row of an ID is the current state of the payment.
+PAYMENT_PENDING = 'no'
+# Being applied to the subscription; if the bot stops before the payment
+# is verified, it is applied again at startup
+PAYMENT_APPLYING = 'applying'
+PAYMENT_VERIFIED = 'yes'
+# The subscription could not be extended; may be verified again
+PAYMENT_FAILED = 'failed'
+
+# Allowed state changes; verified payments are final
+PAYMENT_TRANSITIONS = {
+    PAYMENT_PENDING: {PAYMENT_APPLYING},
+    PAYMENT_APPLYING: {PAYMENT_VERIFIED, PAYMENT_FAILED},
+    PAYMENT_FAILED: {PAYMENT_APPLYING},
+    PAYMENT_VERIFIED: set(),
+}
+
+# Serializes ledger changes, so a payment is recorded and applied only once
+_ledger_lock = asyncio.Lock()
+
+# Current state of the payments, rebuilt when the cached sheet changes
+_ledger_index = None
+
+class PaymentLedger:
+    """Current state of every payment, by payment ID and by user ID"""
     
-    payment_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    payment_id = str(len(payments) + 1)
+    __slots__ = ('source', 'by_id', 'by_user', 'verified_plans')
     
-    new_payment = {
-        'id': payment_id,
-        'user_id': str(user_id),
-        'plan_months': plan_months,
-        'amount': amount,
-        'payment_date': payment_date,
-        'payment_method': payment_method,
-        'verified': 'no'  # Default to unverified
-    }
+    def __init__(self, source):
+        by_id = {}
+        for payment in source:
+            # Later rows hold later states, keep the first position of each ID
+            by_id[str(payment.get('id'))] = payment
+        
+        by_user = {}
+        verified_plans = {}
+        for payment in by_id.values():
+            user_id = str(payment.get('user_id'))
+            by_user.setdefault(user_id, []).append(payment)
+            if payment.get('verified') == PAYMENT_VERIFIED:
+                verified_plans.setdefault(user_id, set()).add(payment.get('plan_months'))
+        
+        self.source = source
+        self.by_id = by_id
+        self.by_user = by_user
+        self.verified_plans = verified_plans
+
+async def get_payment_ledger():
+    """Get the current state of the payments"""
+    global _ledger_index
+    payments = await get_sheet_table(PAYMENTS_SHEET)
+    if _ledger_index is None or _ledger_index.source is not payments:
+        _ledger_index = PaymentLedger(payments)
+    return _ledger_index
+
+def new_payment_id():
+    """Generate a unique payment ID (starting with a letter, so the sheet keeps it as text)"""
+    return f"p{uuid.uuid4().hex[:16]}"
+
+async def get_payment(payment_id):
+    """Get the current state of a payment"""
+    ledger = await get_payment_ledger()
+    return ledger.by_id.get(str(payment_id))
+
+async def record_payment(user_id, plan_months, amount, payment_method="manual", payment_id=None):
+    """
+    Record a subscription payment.
     
-    payments.append(new_payment)
-    await write_to_sheet(PAYMENTS_SHEET, payments)
+    payment_id is the idempotency key of the payment: recording a payment
+    with an ID that is already in the ledger returns the recorded payment.
+    """
+    payment_id = str(payment_id or new_payment_id())
     
-    return new_payment
+    async with _ledger_lock:
+        payment = await get_payment(payment_id)
+        if payment is not None:
+            return payment
+        
+        new_payment = {
+            'id': payment_id,
+            'user_id': str(user_id),
+            'plan_months': plan_months,
+            'amount': amount,
+            'payment_date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'payment_method': payment_method,
+            'verified': PAYMENT_PENDING
+        }
+        
+        if not await append_to_sheet(PAYMENTS_SHEET, [new_payment]):
+            return None
+        return new_payment
+
+async def _set_payment_state(payment, state):
+    """Append a new state of a payment to the ledger"""
+    if state not in PAYMENT_TRANSITIONS.get(payment.get('verified'), ()):
+        raise ValueError(f"Payment {payment.get('id')} cannot change from {payment.get('verified')} to {state}")
+    return await append_to_sheet(PAYMENTS_SHEET, [payment.replace(verified=state)])
 
 async def verify_payment(payment_id):
-    """Verify a payment and activate subscription"""
-    payments = await get_sheet(PAYMENTS_SHEET)
-    verified = False
-    user_id = None
-    plan_months = 0
-    
-    for i, payment in enumerate(payments):
-        if payment.get('id') == payment_id:
-            payments[i]['verified'] = 'yes'
-            verified = True
-            user_id = payment.get('user_id')
-            plan_months = int(payment.get('plan_months', 1))
-            break
-    
-    if verified and user_id:
-        await write_to_sheet(PAYMENTS_SHEET, payments)
+    """
+    Verify a payment and extend the subscription of its user.
+    
+    The payment is marked as applying, the subscription is extended, then
+    the payment is marked as verified. A payment that is already verified
+    returns the current subscription; if the subscription cannot be
+    extended, the payment is marked as failed and may be verified again.
+    A payment left applying (the bot stopped in between) is verified again
+    by reconcile_payments: its subscription is extended again rather than
+    not at all.
+    """
+    async with _ledger_lock:
+        payment = await get_payment(payment_id)
+        if payment is None or not payment.get('user_id'):
+            return None
+        
+        user_id = payment.get('user_id')
+        if payment.get('verified') == PAYMENT_VERIFIED:
+            return await get_subscription(user_id)
+        if payment.get('verified') in (PAYMENT_PENDING, PAYMENT_FAILED):
+            if not await _set_payment_state(payment, PAYMENT_APPLYING):
+                return None
+            payment = payment.replace(verified=PAYMENT_APPLYING)
+        elif payment.get('verified') != PAYMENT_APPLYING:
+            return None
+        
         # Convert months to days
-        days = plan_months * 30
+        days = int(payment.get('plan_months') or 1) * 30
         # Extend subscription
-        return await extend_subscription(user_id, days)
+        subscription = await extend_subscription(user_id, days)
+        
+        if subscription is None:
+            # The payment can be verified again later
+            logging.error(f"Could not extend subscription of {user_id} for payment {payment_id}, payment marked as failed")
+            if not await _set_payment_state(payment, PAYMENT_FAILED):
+                logging.error(f"Payment {payment_id} was not applied and is left applying")
+            return None
+        
+        if not await _set_payment_state(payment, PAYMENT_VERIFIED):
+            logging.error(f"Payment {payment_id} was applied to the subscription but not marked as verified")
+        
+        return subscription
+
+async def reconcile_payments():
+    """Verify the payments left applying, returns the number of verified payments"""
+    ledger = await get_payment_ledger()
+    applying = [payment.get('id') for payment in ledger.by_id.values() if payment.get('verified') == PAYMENT_APPLYING]
     
-    return None
+    verified = 0
+    for payment_id in applying:
+        if await verify_payment(payment_id):
+            verified += 1
+        else:
+            logging.error(f"Could not reconcile payment {payment_id}")
+    if applying:
+        logging.info(f"Reconciled {verified} of {len(applying)} payments left applying")
+    return verified
 
 async def get_user_payments(user_id):
     """Get all payments for a user"""
-    payments = await get_sheet(PAYMENTS_SHEET)
-    user_payments = []
-    
-    for payment in payments:
-        if str(payment.get('user_id')) == str(user_id):
-            user_payments.append(payment)
-    
-    return user_payments
+    ledger = await get_payment_ledger()
+    return list(ledger.by_user.get(str(user_id), ()))
 
 async def check_payment_verified(user_id, plan_months=None):
     """Check if user has a verified payment for the specified plan"""
-    payments = await get_user_payments(user_id)
-    
-    for payment in payments:
-        if payment.get('verified') == 'yes':
-            if plan_months is None or int(payment.get('plan_months', 0)) == plan_months:
-                return True
-    
-    return False
+    ledger = await get_payment_ledger()
+    plans = ledger.verified_plans.get(str(user_id))
+    if not plans:
+        return False
+    return plan_months is None or plan_months in plans
@@ -0,0 +1,128 @@
+from contextlib import contextmanager
+from utils.db_api.google_sheets import get_sheet, get_sheet_table, write_to_sheet, current_tenant
+from utils.db_api.records import next_id
+
+# Sheet names
+TENANTS_SHEET = "Tenants"
+TENANT_MEMBERS_SHEET = "TenantMembers"
+
+# Indexes of the cached tenant sheets, rebuilt when the cached rows change
+_tenants_index = (None, {}, {})
+_members_index = (None, {})
+
+async def _get_tenant_indexes():
+    """Get the tenants by ID and by admin ID"""
+    global _tenants_index
+    tenants = await get_sheet_table(TENANTS_SHEET)
+    if _tenants_index[0] is not tenants:
+        by_id = {}
+        by_admin = {}
+        for tenant in tenants:
+            by_id.setdefault(str(tenant.get('tenant_id')), tenant)
+            by_admin.setdefault(str(tenant.get('admin_id')), tenant)
+        _tenants_index = (tenants, by_id, by_admin)
+    return _tenants_index[1], _tenants_index[2]
+
+async def _get_members_index():
+    """Get the tenant ID of every bound user"""
+    global _members_index
+    members = await get_sheet_table(TENANT_MEMBERS_SHEET)
+    if _members_index[0] is not members:
+        # Later rows win, so rebinding a user only needs a new row
+        _members_index = (members, {str(member.get('user_id')): str(member.get('tenant_id')) for member in members})
+    return _members_index[1]
+
+async def get_all_tenants():
+    """Get all tenants (salons with their own spreadsheet)"""
+    return await get_sheet(TENANTS_SHEET)
+
+async def get_tenant(tenant_id):
+    """Get a tenant by its ID"""
+    by_id, _ = await _get_tenant_indexes()
+    return by_id.get(str(tenant_id))
+
+async def get_tenant_by_admin(admin_id):
+    """Get the tenant of an admin"""
+    _, by_admin = await _get_tenant_indexes()
+    return by_admin.get(str(admin_id))
+
+async def get_user_tenant(user_id, role=None):
+    """
+    Get the tenant whose data a user works with: admins own a tenant,
+    clients and masters are bound to one. None means the main spreadsheet.
+    """
+    if role == 'admin':
+        tenant = await get_tenant_by_admin(user_id)
+        if tenant is not None:
+            return tenant
+
+    members = await _get_members_index()
+    tenant_id = members.get(str(user_id))
+    if tenant_id is None:
+        return None
+    return await get_tenant(tenant_id)
+
+async def add_tenant(admin_id, spreadsheet_id, name=''):
+    """Register the spreadsheet of an admin's salon, or change it if the admin has one"""
+    tenants = await get_sheet(TENANTS_SHEET)
+
+    for i, tenant in enumerate(tenants):
+        if str(tenant.get('admin_id')) == str(admin_id):
+            tenants[i] = tenant.replace(spreadsheet_id=spreadsheet_id, name=name or tenant.get('name'))
+            return tenants[i] if await write_to_sheet(TENANTS_SHEET, tenants) else None
+
+    # Generate a new ID
+    new_id = next_id(tenants, 'tenant_id')
+
+    new_tenant = {
+        'tenant_id': new_id,
+        'admin_id': admin_id,
+        'spreadsheet_id': spreadsheet_id,
+        'name': name,
+        'timezone': '',
+    }
+    tenants.append(new_tenant)
+    if await write_to_sheet(TENANTS_SHEET, tenants):
+        return await get_tenant(new_id)
+    return None
+
+async def set_tenant_timezone(tenant_id, timezone):
+    """
+    Set the time zone (IANA name) the dates and times of a tenant's salon
+    are in. Returns the tenant as read back from the sheet, or None if there
+    is no such tenant or the time zone was not stored.
+    """
+    tenants = await get_sheet(TENANTS_SHEET)
+
+    for i, tenant in enumerate(tenants):
+        if str(tenant.get('tenant_id')) == str(tenant_id):
+            tenants[i] = tenant.replace(timezone=timezone)
+            break
+    else:
+        return None
+    if not await write_to_sheet(TENANTS_SHEET, tenants):
+        return None
+
+    # Only columns of the sheet's header are written, check the value made it
+    tenant = await get_tenant(tenant_id)
+    return tenant if tenant is not None and tenant.get('timezone') == timezone else None
+
+async def add_tenant_member(user_id, tenant_id):
+    """Bind a client or master to a tenant"""
+    members = await _get_members_index()
+    if members.get(str(user_id)) == str(tenant_id):
+        return True
+
+    rows = await get_sheet(TENANT_MEMBERS_SHEET)
+    rows = [row for row in rows if str(row.get('user_id')) != str(user_id)]
+    rows.append({'user_id': user_id, 'tenant_id': tenant_id})
+    return await write_to_sheet(TENANT_MEMBERS_SHEET, rows)
+
+@contextmanager
+def use_tenant(tenant):
+    """Route the sheet operations of the block to a tenant (None for the main spreadsheet)"""
+    token = current_tenant.set(tenant)
+    try:
+        yield tenant
+    finally:
+        current_tenant.reset(token)
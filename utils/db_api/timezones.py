@@ -0,0 +1,114 @@
+import logging
+import os
+import time
+from datetime import date, datetime
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from utils.db_api.google_sheets import current_tenant
+
+# Dates and times in the sheets are wall-clock strings of the salon
+# ("YYYY-MM-DD", "HH:MM"). The salon's time zone turns them into UTC epoch
+# seconds, which are stored next to them and compared as plain integers.
+
+# Time zone of the main spreadsheet (IANA name, e.g. "Europe/Moscow");
+# tenants set their own in the Tenants sheet. Server time zone when not set.
+DEFAULT_TIMEZONE = os.getenv('TIMEZONE', '').strip()
+
+# Where the server's time zone is configured
+LOCALTIME_FILE = '/etc/localtime'
+TIMEZONE_FILE = '/etc/timezone'
+
+
+@lru_cache(maxsize=1)
+def _find_server_zone():
+    """Find the server's time zone with its DST rules, or None"""
+    names = [os.getenv('TZ', '').strip().lstrip(':')]
+    # /etc/localtime usually links to the zone's file under zoneinfo/
+    names.append(os.path.realpath(LOCALTIME_FILE).partition('zoneinfo/')[2])
+    try:
+        with open(TIMEZONE_FILE, 'r', encoding='utf-8') as f:
+            names.append(f.read().strip())
+    except OSError:
+        pass
+
+    for name in names:
+        if name and is_valid_zone(name):
+            return ZoneInfo(name)
+    try:
+        with open(LOCALTIME_FILE, 'rb') as f:
+            return ZoneInfo.from_file(f, key='localtime')
+    except (OSError, ValueError):
+        logging.warning("Server time zone not found, using its current UTC offset; set TIMEZONE")
+        return None
+
+def server_zone():
+    """Get the server's time zone"""
+    zone = _find_server_zone()
+    # A fixed offset is only right until the next DST change, so it is not kept
+    return zone if zone is not None else datetime.now().astimezone().tzinfo
+
+@lru_cache(maxsize=64)
+def _named_zone(name):
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        logging.warning(f"Unknown time zone {name!r}, using the server time zone")
+        return None
+
+def get_zone(name=''):
+    """Get a time zone by its IANA name, the default one for an empty or unknown name"""
+    name = str(name or '').strip() or DEFAULT_TIMEZONE
+    zone = _named_zone(name) if name else None
+    return zone if zone is not None else server_zone()
+
+def is_valid_zone(name):
+    """Check if a name is a known IANA time zone"""
+    try:
+        ZoneInfo(str(name).strip())
+        return True
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+
+def current_zone():
+    """Get the time zone of the current tenant's salon"""
+    tenant = current_tenant.get()
+    return get_zone(tenant.get('timezone') if tenant else '')
+
+def now(zone=None):
+    """Get the current wall-clock time of a salon (the current tenant's by default)"""
+    return datetime.now(zone or current_zone())
+
+def today(zone=None):
+    """Get the current date of a salon (the current tenant's by default)"""
+    return now(zone).date()
+
+def epoch_now():
+    """Get the current UTC epoch seconds"""
+    return int(time.time())
+
+@lru_cache(maxsize=16384)
+def _to_epoch(day, time_of_day, zone):
+    try:
+        local = datetime.strptime(f"{day} {time_of_day or '00:00'}", "%Y-%m-%d %H:%M")
+    except ValueError:
+        return None
+    return int(local.replace(tzinfo=zone).timestamp())
+
+def to_epoch(day, time_of_day='', zone=None):
+    """Get the UTC epoch seconds of a salon's date and time, or None if they are not valid"""
+    if isinstance(day, date):
+        day = day.isoformat()
+    return _to_epoch(str(day), str(time_of_day or ''), zone or current_zone())
+
+def starts_at(appointment, zone=None):
+    """Get the UTC epoch seconds an appointment starts at, from the stored value or its date and time"""
+    stored = appointment.get('starts_at')
+    if isinstance(stored, int):
+        return stored
+    return to_epoch(appointment.get('date'), appointment.get('time'), zone)
+
+def has_started(appointment, now=None):
+    """Check if an appointment has started (False if its date or time is not valid)"""
+    start = starts_at(appointment)
+    return start is not None and start <= (now if now is not None else epoch_now())
@@ -1,5 +1,6 @@
 
-from utils.db_api.google_sheets import sheet, setup
+from utils.db_api.google_sheets import sheet, setup, notify_sheet_hooks
+from utils.db_api.records import Client
 
 async def get_user(user_id):
     """Get user by Telegram ID"""
@@ -15,14 +16,10 @@ async def get_user(user_id):
     try:
         clients_sheet = sheet.worksheet('Clients')
         cell = clients_sheet.find(str(user_id), in_column=1)
+        notify_sheet_hooks('read', 'Clients')
         if cell:
             row = clients_sheet.row_values(cell.row)
-            return {
-                'user_id': int(row[0]),
-                'username': row[1],
-                'full_name': row[2],
-                'role': row[3]
-            }
+            return Client(dict(zip(Client.FIELDS, row)))
         return None
     except Exception as e:
         print(f"Error getting user: {e}")
@@ -52,14 +49,10 @@ async def add_user(user_id, username, full_name, role='client'):
             full_name or '',
             role
         ])
+        notify_sheet_hooks('write', 'Clients')
         
         # Return the newly created user
-        return {
-            'user_id': user_id,
-            'username': username or '',
-            'full_name': full_name or '',
-            'role': role
-        }
+        return Client(user_id=user_id, username=username or '', full_name=full_name or '', role=role)
     except Exception as e:
         print(f"Error adding user: {e}")
         return None
@@ -78,9 +71,11 @@ async def update_user_role(user_id, new_role):
         clients_sheet = sheet.worksheet('Clients')
         # Find the user by ID
         cell = clients_sheet.find(str(user_id), in_column=1)
+        notify_sheet_hooks('read', 'Clients')
         if cell:
             # Update the role cell (column 4)
             clients_sheet.update_cell(cell.row, 4, new_role)
+            notify_sheet_hooks('write', 'Clients')
             return True
         return False
     except Exception as e:
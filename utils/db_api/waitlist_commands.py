@@ -0,0 +1,153 @@
+import asyncio
+from datetime import timedelta
+from utils.db_api.google_sheets import get_sheet, get_sheet_table, write_to_sheet, append_to_sheet, get_tenant_key
+from utils.db_api.records import as_date
+from utils.db_api import timezones
+
+# Sheet name
+WAITLIST_SHEET = "Waitlist"
+
+# Entry statuses
+WAITING = 'waiting'
+BOOKED = 'booked'
+CANCELED = 'canceled'
+
+# Longest date range a client may wait for, so an entry is indexed under a few days only
+MAX_WAIT_DAYS = 14
+
+# Serializes changes of the Waitlist sheet, so two clients cannot get the
+# same ID and a status change is not overwritten by another
+_waitlist_lock = asyncio.Lock()
+
+# Indexes of the cached Waitlist sheets by tenant key
+_indexes = {}
+
+
+class WaitlistIndex:
+    """
+    Waiting entries by (master ID, date), in the order they were added.
+
+    Entries for any master are kept under the master ID None, so the
+    candidates for a freed slot are two dict lookups away.
+    """
+
+    __slots__ = ('source', 'by_slot', 'by_id', 'by_user')
+
+    def __init__(self, source):
+        self.source = source
+        self.by_slot = {}
+        self.by_id = {}
+        self.by_user = {}
+        for entry in source:
+            self.by_id[str(entry.get('id'))] = entry
+            if entry.get('status') != WAITING:
+                continue
+            self.by_user.setdefault(str(entry.get('user_id')), []).append(entry)
+            master_id = str(entry.get('master_id')) if entry.get('master_id') else None
+            for day in _days(entry):
+                self.by_slot.setdefault((master_id, day), []).append(entry)
+
+    def candidates(self, master_id, day):
+        """Get the entries waiting for a master on a date, oldest first"""
+        entries = self.by_slot.get((str(master_id), day), []) + self.by_slot.get((None, day), [])
+        return sorted(entries, key=lambda entry: int(entry.get('id') or 0))
+
+
+def _days(entry):
+    """Dates (ISO strings) an entry waits for"""
+    first = as_date(entry.get('date_from'))
+    last = as_date(entry.get('date_to')) or first
+    if first is None:
+        return []
+    last = min(last, first + timedelta(days=MAX_WAIT_DAYS - 1))
+    return [(first + timedelta(days=i)).isoformat() for i in range((last - first).days + 1)]
+
+
+async def get_waitlist_index():
+    """Get the waitlist index, rebuilding it only if the cached sheet changed"""
+    key = get_tenant_key(WAITLIST_SHEET)
+    entries = await get_sheet_table(WAITLIST_SHEET)
+    index = _indexes.get(key)
+    if index is None or index.source is not entries:
+        index = _indexes[key] = WaitlistIndex(entries)
+    return index
+
+async def get_entry(entry_id):
+    """Get a waitlist entry by its ID"""
+    index = await get_waitlist_index()
+    return index.by_id.get(str(entry_id))
+
+async def get_user_entries(user_id):
+    """Get the entries a user is waiting with"""
+    index = await get_waitlist_index()
+    return index.by_user.get(str(user_id), [])
+
+async def find_candidates(master_id, day, exclude=()):
+    """Get the entries that may take a freed slot of a master on a date, oldest first"""
+    index = await get_waitlist_index()
+    return [
+        entry for entry in index.candidates(master_id, day)
+        if str(entry.get('id')) not in exclude
+    ]
+
+async def add_to_waitlist(user_id, service_id, date_from, date_to=None, master_id=None):
+    """
+    Register a client waiting for a slot of a service in a date range
+    (master_id None for any master). Returns the entry, or None if it
+    could not be written.
+    """
+    date_to = date_to or date_from
+    if as_date(date_to) < as_date(date_from):
+        return None
+
+    async with _waitlist_lock:
+        # An entry for the same wish is not added twice
+        for entry in await get_user_entries(user_id):
+            if (str(entry.get('service_id')) == str(service_id)
+                    and str(entry.get('master_id') or '') == str(master_id or '')
+                    and entry.get('date_from') == date_from and entry.get('date_to') == date_to):
+                return entry
+
+        index = await get_waitlist_index()
+        new_id = max((int(entry_id) for entry_id in index.by_id if entry_id.isdigit()), default=0) + 1
+        new_entry = {
+            'id': new_id,
+            'user_id': user_id,
+            'service_id': service_id,
+            'master_id': master_id or '',
+            'date_from': date_from,
+            'date_to': date_to,
+            'created_at': timezones.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'status': WAITING,
+        }
+        if not await append_to_sheet(WAITLIST_SHEET, [new_entry]):
+            return None
+    return await get_entry(new_id)
+
+async def set_entry_status(entry_id, status):
+    """Change the status of a waitlist entry"""
+    async with _waitlist_lock:
+        entries = await get_sheet(WAITLIST_SHEET)
+
+        for i, entry in enumerate(entries):
+            if str(entry.get('id')) == str(entry_id):
+                entries[i] = entry.replace(status=status)
+                return await write_to_sheet(WAITLIST_SHEET, entries)
+    return False
+
+async def expire_entries(today=None):
+    """Cancel the entries whose date range is over, so the index stays small"""
+    today = (today or timezones.today()).isoformat()
+    async with _waitlist_lock:
+        entries = await get_sheet(WAITLIST_SHEET)
+        expired = 0
+
+        for i, entry in enumerate(entries):
+            last = entry.get('date_to') or entry.get('date_from')
+            if entry.get('status') == WAITING and str(last) < today:
+                entries[i] = entry.replace(status=CANCELED)
+                expired += 1
+
+        if expired and not await write_to_sheet(WAITLIST_SHEET, entries):
+            return 0
+    return expired
@@ -0,0 +1,195 @@
+import asyncio
+from collections import OrderedDict
+from datetime import timedelta
+from utils.db_api.google_sheets import get_sheet, get_sheet_table, write_to_sheet, append_to_sheet, get_tenant_key
+from utils.db_api.records import as_date, parse_date, next_id
+from utils.db_api.schedule import to_minutes
+from utils.db_api import master_commands
+
+# Sheet name
+WORK_EXCEPTIONS_SHEET = "WorkExceptions"
+
+# Exception kinds: time off (a break, a day off, a vacation or a holiday)
+# and extra working hours
+OFF = 'off'
+EXTRA = 'extra'
+
+# Working time is kept as a bitmap of 5-minute units, bit i is [5i, 5i + 5) minutes
+UNIT = 5
+DAY_UNITS = 24 * 60 // UNIT
+WHOLE_DAY = (1 << DAY_UNITS) - 1
+
+# Bitmaps of this many (master, date) pairs are kept, least recently used ones are dropped
+BITMAP_CACHE_SIZE = 1024
+
+# Longest range of one exception, so a typo cannot cover years
+MAX_EXCEPTION_DAYS = 366
+
+# Serializes new exceptions, so two admins cannot get the same ID
+_exceptions_lock = asyncio.Lock()
+
+# Index of the cached WorkExceptions sheet
+_index = None
+
+# Working bitmaps by (tenant key, master ID, date), with the tables they were compiled from
+_bitmaps = OrderedDict()
+
+
+def interval_bits(start, end):
+    """Get the bitmap of the minutes [start, end), rounded out to whole units"""
+    first = max(start // UNIT, 0)
+    last = min(-(-end // UNIT), DAY_UNITS)
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+def bits_to_intervals(bits):
+    """Get the runs of set bits of a bitmap as minute intervals [(start, end)]"""
+    intervals = []
+    position = 0
+    while bits:
+        # Skip the unset bits, then take the run of set ones
+        skip = (bits & -bits).bit_length() - 1
+        bits >>= skip
+        position += skip
+        run = (~bits & (bits + 1)).bit_length() - 1
+        intervals.append((position * UNIT, (position + run) * UNIT))
+        bits >>= run
+        position += run
+    return intervals
+
+
+class ExceptionIndex:
+    """Exceptions by master ID and date; salon-wide ones (empty master ID) under None"""
+
+    __slots__ = ('source', 'by_day')
+
+    def __init__(self, source):
+        self.source = source
+        self.by_day = {}
+        for exception in source:
+            first = as_date(exception.get('date_from'))
+            last = as_date(exception.get('date_to')) or first
+            if first is None or last < first:
+                continue
+            master_id = str(exception.get('master_id')) if exception.get('master_id') else None
+            for i in range(min((last - first).days + 1, MAX_EXCEPTION_DAYS)):
+                day = (first + timedelta(days=i)).isoformat()
+                self.by_day.setdefault((master_id, day), []).append(exception)
+
+    def on(self, master_id, date):
+        """Get the exceptions of a master on a date, the salon-wide ones first"""
+        return self.by_day.get((None, date), []) + self.by_day.get((str(master_id), date), [])
+
+
+def exception_bits(exception):
+    """Get the bitmap of the time an exception covers, the whole day if it has no times"""
+    start = to_minutes(exception.get('start'))
+    end = to_minutes(exception.get('end'))
+    if start is None or end is None:
+        return WHOLE_DAY
+    return interval_bits(start, end)
+
+def compile_day(window, exceptions):
+    """
+    Compile the working bitmap of a day: the weekly hours, minus the time
+    off, plus the extra hours (one-off extra hours win over time off).
+    """
+    bits = interval_bits(*window) if window else 0
+    for exception in exceptions:
+        if exception.get('kind') != EXTRA:
+            bits &= ~exception_bits(exception)
+    for exception in exceptions:
+        if exception.get('kind') == EXTRA:
+            bits |= exception_bits(exception)
+    return bits
+
+
+async def get_exception_index():
+    """Get the exception index, rebuilding it only if the cached sheet changed"""
+    global _index
+    exceptions = await get_sheet_table(WORK_EXCEPTIONS_SHEET)
+    if _index is None or _index.source is not exceptions:
+        _index = ExceptionIndex(exceptions)
+    return _index
+
+async def get_day_bitmap(master_id, date):
+    """Get the working bitmap of a master on a date, compiling it if the cached one is outdated"""
+    date = parse_date(date)
+    key = (get_tenant_key(WORK_EXCEPTIONS_SHEET), str(master_id), date)
+    index = await get_exception_index()
+    masters = await get_sheet_table(master_commands.MASTERS_SHEET)
+
+    cached = _bitmaps.get(key)
+    if cached is not None and cached[0] is index.source and cached[1] is masters:
+        _bitmaps.move_to_end(key)
+        return cached[2]
+
+    working_hours = await master_commands.get_master_working_hours(master_id)
+    bits = compile_day(master_commands.get_working_window(working_hours, date), index.on(master_id, date))
+    _bitmaps[key] = (index.source, masters, bits)
+    while len(_bitmaps) > BITMAP_CACHE_SIZE:
+        _bitmaps.popitem(last=False)
+    return bits
+
+async def get_working_intervals(master_id, date):
+    """Get the working time of a master on a date as minute intervals [(start, end)]"""
+    return bits_to_intervals(await get_day_bitmap(master_id, date))
+
+async def get_exceptions(master_id=None):
+    """Get the exceptions of a master (with the salon-wide ones), or all of them"""
+    exceptions = await get_sheet_table(WORK_EXCEPTIONS_SHEET)
+    if master_id is None:
+        return list(exceptions)
+    return [
+        exception for exception in exceptions
+        if not exception.get('master_id') or str(exception.get('master_id')) == str(master_id)
+    ]
+
+async def add_exception(master_id, date_from, date_to=None, start=None, end=None, kind=OFF, note=''):
+    """
+    Add a working-hours exception of a master (master_id None for the whole
+    salon). Without times it covers whole days. Returns the exception, or
+    None if it is invalid or could not be written.
+    """
+    date_to = date_to or date_from
+    first, last = as_date(parse_date(date_from)), as_date(parse_date(date_to))
+    if first is None or last is None or last < first or (last - first).days >= MAX_EXCEPTION_DAYS:
+        return None
+    if (start or end) and (to_minutes(start) is None or to_minutes(end) is None or to_minutes(end) <= to_minutes(start)):
+        return None
+    if kind == EXTRA and not start:
+        return None
+
+    async with _exceptions_lock:
+        exceptions = await get_sheet_table(WORK_EXCEPTIONS_SHEET)
+        new_id = next_id(exceptions)
+        new_exception = {
+            'id': new_id,
+            'master_id': master_id or '',
+            'date_from': first.isoformat(),
+            'date_to': last.isoformat(),
+            'start': start or '',
+            'end': end or '',
+            'kind': kind,
+            'note': note,
+        }
+        if not await append_to_sheet(WORK_EXCEPTIONS_SHEET, [new_exception]):
+            return None
+
+    for exception in await get_sheet_table(WORK_EXCEPTIONS_SHEET):
+        if str(exception.get('id')) == str(new_id):
+            return exception
+    return None
+
+async def delete_exception(exception_id):
+    """Delete a working-hours exception"""
+    exceptions = await get_sheet(WORK_EXCEPTIONS_SHEET)
+    remaining = [exception for exception in exceptions if str(exception.get('id')) != str(exception_id)]
+    if len(remaining) == len(exceptions):
+        return False
+    return await write_to_sheet(WORK_EXCEPTIONS_SHEET, remaining)
+
+def clear():
+    """Drop all cached bitmaps"""
+    _bitmaps.clear()
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from utils import metrics
+
+# Frames of the blocked stack included in the log
+STACK_LIMIT = 20
+
+
+class LoopWatchdog:
+    """
+    Detector of a blocked event loop.
+
+    A heartbeat task on the loop measures how late it is woken up (loop lag).
+    A separate thread watches the heartbeat; when the loop has not ticked for
+    longer than the threshold, the thread captures the stack of the loop
+    thread, i.e. of the code blocking it, and logs it with the handler the
+    blocking task is processing.
+    """
+
+    def __init__(self, threshold=0.1, interval=0.05):
+        self.threshold = threshold
+        self.interval = interval
+        self.loop = None
+        self.loop_thread_id = None
+        self.last_beat = None
+        self._heartbeat_task = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    async def start(self):
+        """Start watching the running event loop"""
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self._stopped.clear()
+
+        self._heartbeat_task = asyncio.create_task(self._heartbeat(), name="loop-watchdog-heartbeat")
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+        logging.info(f"Event loop watchdog started (threshold {self.threshold * 1000:.0f} ms)")
+
+    async def stop(self):
+        """Stop watching"""
+        self._stopped.set()
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+        if self._thread:
+            await asyncio.to_thread(self._thread.join)
+
+    async def _heartbeat(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.last_beat = now
+            metrics.observe_loop_lag(max(now - started - self.interval, 0))
+
+    def _watch(self):
+        reported_beat = None
+        while not self._stopped.wait(self.threshold / 2):
+            beat = self.last_beat
+            blocked = time.monotonic() - beat - self.interval
+            # Report every stall once, while it is still in progress
+            if blocked > self.threshold and beat != reported_beat:
+                reported_beat = beat
+                self._report(blocked)
+
+    def _report(self, blocked):
+        """Log the stack of the code blocking the loop"""
+        frame = sys._current_frames().get(self.loop_thread_id)
+        stack = "".join(traceback.format_stack(frame, limit=STACK_LIMIT)) if frame else "  (stack unavailable)\n"
+
+        task = asyncio.current_task(self.loop)
+        if task is None:
+            handler_name = "event loop"
+        else:
+            handler_name = metrics.active_handlers.get(task) or task.get_name()
+
+        metrics.observe_loop_block(handler_name)
+        logging.warning(
+            f"Event loop blocked for more than {blocked * 1000:.0f} ms in {handler_name}:\n{stack.rstrip()}"
+        )
+
+
+# Watchdog of the bot, if enabled
+watchdog = None
+
+async def start_watchdog(threshold_ms=100):
+    """Start the event loop watchdog of the bot"""
+    global watchdog
+    if watchdog is None:
+        watchdog = LoopWatchdog(threshold=threshold_ms / 1000)
+        await watchdog.start()
+    return watchdog
@@ -0,0 +1,63 @@
+from utils.db_api import appointment_commands, master_commands, schedule, work_calendar
+
+# Master ID the booking flow keeps for "any available master"
+ANY_MASTER = "any"
+
+
+async def get_free_masters(service_id, date):
+    """
+    Get the masters offering a service with the times the service fits
+    their schedule on a date, as [(master, free times, utilization)] where
+    utilization is the share of the master's working time already taken.
+    """
+    calendar = await schedule.get_day_calendar(date)
+    spec = calendar.spec(service_id)
+    earliest = schedule.not_before(date)
+    free_masters = []
+    for master in await master_commands.get_service_masters(service_id):
+        working = await work_calendar.get_working_intervals(master.get('id'), date)
+        working_minutes = sum(end - start for start, end in working)
+        if not working_minutes:
+            continue
+        held = calendar.held_intervals(appointment_commands.get_held_slots(master.get('id'), date))
+        free = calendar.free_slots(master.get('id'), working, spec, held, earliest=earliest)
+        if free:
+            free_masters.append((master, free, calendar.busy_minutes(master.get('id')) / working_minutes))
+    return free_masters
+
+
+async def get_any_master_availability(service_id, date):
+    """Get the times of a date at which at least one master offering the service is free"""
+    times = set()
+    for _, free, _ in await get_free_masters(service_id, date):
+        times.update(free)
+    return sorted(times)
+
+
+async def choose_master(service_id, date, time, exclude=()):
+    """Choose the least loaded master offering the service who is free at a time, or None"""
+    candidates = [
+        (utilization, str(master.get('id')), master)
+        for master, free, utilization in await get_free_masters(service_id, date)
+        if time in free and str(master.get('id')) not in exclude
+    ]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda candidate: candidate[:2])[2]
+
+
+async def book_any_master(user_id, service_id, date, time):
+    """
+    Book a slot with the least loaded free master. Returns the appointment,
+    or None if no master is free at that time any more.
+    """
+    tried = set()
+    while True:
+        master = await choose_master(service_id, date, time, exclude=tried)
+        if master is None:
+            return None
+        # Another client may have taken the master meanwhile, then try the next one
+        appointment = await appointment_commands.book_slot(user_id, service_id, date, time, master.get('id'))
+        if appointment:
+            return appointment
+        tried.add(str(master.get('id')))
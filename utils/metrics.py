@@ -0,0 +1,269 @@
+import bisect
+import contextvars
+import logging
+from collections import Counter
+
+from aiohttp import web
+
+from utils.db_api import google_sheets
+from utils.db_api.sheet_cache import CACHE_EVENTS
+
+# Upper bounds of the handler latency buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Upper bounds of the event loop lag buckets, in seconds
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Upper bounds of the Sheets operations per update buckets
+OPERATIONS_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250, 500)
+
+SHEET_OPERATIONS = ('read', 'write', 'cache_hit')
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, as exposed by Prometheus"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # The last slot counts observations above the largest bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket it falls into"""
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def render(self, name, labels=""):
+        lines = []
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            lines.append(f'{name}_bucket{{{labels}{"," if labels else ""}le="{bound}"}} {seen}')
+        lines.append(f'{name}_bucket{{{labels}{"," if labels else ""}le="+Inf"}} {self.count}')
+        suffix = f"{{{labels}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.sum}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+
+class UpdateStats:
+    """Sheets operations triggered while one update is processed"""
+
+    __slots__ = SHEET_OPERATIONS
+
+    def __init__(self):
+        self.read = 0
+        self.write = 0
+        self.cache_hit = 0
+
+
+# Stats of the update being processed in the current context
+current_update = contextvars.ContextVar('current_update', default=None)
+
+# Per-handler metrics
+handler_latency = {}
+handler_errors = Counter()
+handler_operations = Counter()  # (handler, operation) -> count
+
+# Sheets operations per update
+update_operations = {operation: Histogram(OPERATIONS_BUCKETS) for operation in SHEET_OPERATIONS}
+
+# Sheets operations by sheet, including those outside of updates (scheduler, warm-up)
+sheet_operations = Counter()  # (sheet, operation) -> count
+
+# Event loop health, fed by utils.loop_watchdog
+loop_lag = Histogram(LOOP_LAG_BUCKETS)
+loop_blocks = Counter()  # handler -> times it blocked the loop
+
+# Handler each running task is processing, so a blocked loop can be attributed
+active_handlers = {}  # task -> handler
+
+
+def on_sheet_operation(operation, sheet_name):
+    """Sheet hook: count the operation globally and for the current update"""
+    sheet_operations[(sheet_name, operation)] += 1
+
+    stats = current_update.get()
+    if stats is not None:
+        setattr(stats, operation, getattr(stats, operation) + 1)
+
+
+def observe_update(handler_name, duration, stats, failed=False):
+    """Record a processed update"""
+    histogram = handler_latency.get(handler_name)
+    if histogram is None:
+        histogram = handler_latency[handler_name] = Histogram(LATENCY_BUCKETS)
+    histogram.observe(duration)
+
+    if failed:
+        handler_errors[handler_name] += 1
+
+    for operation in SHEET_OPERATIONS:
+        count = getattr(stats, operation)
+        update_operations[operation].observe(count)
+        handler_operations[(handler_name, operation)] += count
+
+
+def observe_loop_lag(lag):
+    """Record how late the event loop ran a scheduled callback"""
+    loop_lag.observe(lag)
+
+
+def observe_loop_block(handler_name):
+    """Record that a handler blocked the event loop longer than the threshold"""
+    loop_blocks[handler_name] += 1
+
+
+def render():
+    """Render all metrics in the Prometheus text exposition format"""
+    lines = [
+        "# HELP bot_handler_duration_seconds Time spent handling an update, by handler",
+        "# TYPE bot_handler_duration_seconds histogram",
+    ]
+    for handler_name, histogram in sorted(handler_latency.items()):
+        lines.extend(histogram.render("bot_handler_duration_seconds", f'handler="{handler_name}"'))
+
+    lines.append("# HELP bot_handler_errors_total Updates whose handler raised an exception")
+    lines.append("# TYPE bot_handler_errors_total counter")
+    for handler_name, count in sorted(handler_errors.items()):
+        lines.append(f'bot_handler_errors_total{{handler="{handler_name}"}} {count}')
+
+    lines.append("# HELP bot_handler_sheet_operations_total Sheets operations triggered by a handler")
+    lines.append("# TYPE bot_handler_sheet_operations_total counter")
+    for (handler_name, operation), count in sorted(handler_operations.items()):
+        lines.append(
+            f'bot_handler_sheet_operations_total{{handler="{handler_name}",operation="{operation}"}} {count}'
+        )
+
+    lines.append("# HELP bot_update_sheet_operations Sheets operations per update")
+    lines.append("# TYPE bot_update_sheet_operations histogram")
+    for operation, histogram in update_operations.items():
+        lines.extend(histogram.render("bot_update_sheet_operations", f'operation="{operation}"'))
+
+    lines.append("# HELP bot_sheet_operations_total Sheets operations, by sheet")
+    lines.append("# TYPE bot_sheet_operations_total counter")
+    for (sheet_name, operation), count in sorted(sheet_operations.items()):
+        lines.append(f'bot_sheet_operations_total{{sheet="{sheet_name}",operation="{operation}"}} {count}')
+
+    cache_stats = google_sheets.get_cache_stats()
+    lines.append("# HELP bot_sheet_cache_events_total Sheet cache lookups and loads, by sheet and outcome")
+    lines.append("# TYPE bot_sheet_cache_events_total counter")
+    for sheet_name, stats in sorted(cache_stats.items()):
+        for event in CACHE_EVENTS:
+            lines.append(f'bot_sheet_cache_events_total{{sheet="{sheet_name}",event="{event}"}} {stats[event]}')
+
+    lines.append("# HELP bot_sheet_cache_rows Rows held in the sheet cache, by sheet")
+    lines.append("# TYPE bot_sheet_cache_rows gauge")
+    for sheet_name, stats in sorted(cache_stats.items()):
+        lines.append(f'bot_sheet_cache_rows{{sheet="{sheet_name}"}} {stats["rows"]}')
+
+    api_stats = google_sheets.pool.get_stats()
+    lines.append("# HELP bot_sheets_api_requests_total Sheets API requests, by spreadsheet and kind")
+    lines.append("# TYPE bot_sheets_api_requests_total counter")
+    for spreadsheet_id, stats in sorted(api_stats.items()):
+        for kind in ('reads', 'writes', 'throttled'):
+            lines.append(f'bot_sheets_api_requests_total{{spreadsheet="{spreadsheet_id}",kind="{kind}"}} {stats[kind]}')
+
+    lines.append("# HELP bot_sheets_api_requests_per_minute Sheets API requests in the last minute, compared to the quota")
+    lines.append("# TYPE bot_sheets_api_requests_per_minute gauge")
+    for spreadsheet_id, stats in sorted(api_stats.items()):
+        lines.append(f'bot_sheets_api_requests_per_minute{{spreadsheet="{spreadsheet_id}",kind="read"}} {stats["reads_per_minute"]}')
+        lines.append(f'bot_sheets_api_requests_per_minute{{spreadsheet="{spreadsheet_id}",kind="write"}} {stats["writes_per_minute"]}')
+
+    if loop_lag.count:
+        lines.append("# HELP bot_event_loop_lag_seconds Delay of the event loop in running scheduled callbacks")
+        lines.append("# TYPE bot_event_loop_lag_seconds histogram")
+        lines.extend(loop_lag.render("bot_event_loop_lag_seconds"))
+
+        lines.append("# HELP bot_event_loop_blocks_total Times the event loop was blocked longer than the threshold")
+        lines.append("# TYPE bot_event_loop_blocks_total counter")
+        for handler_name, count in sorted(loop_blocks.items()):
+            lines.append(f'bot_event_loop_blocks_total{{handler="{handler_name}"}} {count}')
+
+    return "\n".join(lines) + "\n"
+
+
+def format_summary(limit=10):
+    """Short human-readable summary of the metrics, slowest handlers first"""
+    totals = Counter()
+    for (_, operation), count in sheet_operations.items():
+        totals[operation] += count
+
+    lines = [
+        "📈 Bot metrics",
+        "",
+        f"Sheets: {totals['read']} reads, {totals['write']} writes, {totals['cache_hit']} cache hits",
+    ]
+
+    api_stats = google_sheets.pool.get_stats()
+    if api_stats:
+        busiest = max(api_stats.items(), key=lambda item: item[1]['reads_per_minute'] + item[1]['writes_per_minute'])
+        lines.append(
+            f"Sheets API: {len(api_stats)} spreadsheets, busiest {busiest[0][:8]}… "
+            f"{busiest[1]['reads_per_minute']} reads/{busiest[1]['writes_per_minute']} writes per minute, "
+            f"{sum(stats['throttled'] for stats in api_stats.values())} throttled"
+        )
+
+    if loop_lag.count:
+        blocks = ", ".join(f"{name} ×{count}" for name, count in loop_blocks.most_common(3))
+        lines.append(
+            f"Event loop: lag p95 ≤ {loop_lag.quantile(0.95) * 1000:.0f} ms, "
+            f"{sum(loop_blocks.values())} blocks" + (f" ({blocks})" if blocks else "")
+        )
+
+    if not handler_latency:
+        lines.append("No updates handled yet")
+        return "\n".join(lines)
+
+    lines.append("")
+    lines.append(f"Slowest handlers (p95), top {limit}:")
+    slowest = sorted(handler_latency.items(), key=lambda item: item[1].quantile(0.95), reverse=True)
+    for handler_name, histogram in slowest[:limit]:
+        reads = handler_operations[(handler_name, 'read')] / histogram.count
+        lines.append(
+            f"• {handler_name}: {histogram.count} updates, "
+            f"avg {histogram.sum / histogram.count * 1000:.0f} ms, "
+            f"p95 ≤ {histogram.quantile(0.95) * 1000:.0f} ms, "
+            f"{reads:.1f} reads/update"
+            + (f", {handler_errors[handler_name]} errors" if handler_errors[handler_name] else "")
+        )
+
+    return "\n".join(lines)
+
+
+async def handle_metrics(request):
+    """HTTP handler of the Prometheus endpoint"""
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(port, host="0.0.0.0"):
+    """Serve the metrics at http://<host>:<port>/metrics"""
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+
+    logging.info(f"Metrics are served on http://{host}:{port}/metrics")
+    return runner
+
+
+# Count Sheets operations from the moment metrics are imported
+google_sheets.add_sheet_hook(on_sheet_operation)
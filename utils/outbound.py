@@ -0,0 +1,45 @@
+import asyncio
+import logging
+from aiogram.exceptions import TelegramRetryAfter
+
+# Telegram allows about 30 messages per second to different chats;
+# stay below it so replies to users are not throttled
+MESSAGES_PER_SECOND = 20
+
+# Messages waiting to be sent, as (chat_id, text, kwargs of send_message)
+_queue = asyncio.Queue()
+
+
+def send_later(chat_id, text, **kwargs):
+    """Queue a message to be sent by the outbound worker"""
+    _queue.put_nowait((chat_id, text, kwargs))
+
+
+def pending():
+    """Number of messages waiting to be sent"""
+    return _queue.qsize()
+
+
+async def _send(bot, chat_id, text, kwargs):
+    while True:
+        try:
+            await bot.send_message(chat_id, text, **kwargs)
+            return
+        except TelegramRetryAfter as e:
+            # Flood limit hit, wait as long as Telegram asks and retry
+            logging.warning(f"Flood limit sending to {chat_id}, retrying in {e.retry_after} s")
+            await asyncio.sleep(e.retry_after)
+        except Exception as e:
+            logging.error(f"Error sending message to {chat_id}: {str(e)}")
+            return
+
+
+async def start_outbound_worker(bot):
+    """Send the queued messages one by one, at most MESSAGES_PER_SECOND"""
+    while True:
+        chat_id, text, kwargs = await _queue.get()
+        try:
+            await _send(bot, chat_id, text, kwargs)
+        finally:
+            _queue.task_done()
+        await asyncio.sleep(1 / MESSAGES_PER_SECOND)
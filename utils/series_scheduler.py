@@ -0,0 +1,44 @@
+import asyncio
+import logging
+from utils import outbound
+from utils.db_api import series_commands, tenant_commands
+
+# Seconds between runs; the horizon moves by a day, so a few runs a day are enough
+MATERIALIZE_INTERVAL = 6 * 60 * 60
+
+
+def report_busy_dates(busy_by_series):
+    """Tell the clients which occurrences of their series could not be booked"""
+    for series, busy in busy_by_series:
+        logging.warning(f"Series {series.get('id')}: time is taken on {', '.join(busy)}, appointments not created")
+        outbound.send_later(
+            series.get('user_id'),
+            f"Не удалось записать вас по повторяющейся записи на {series.get('time')}: "
+            f"время занято ({', '.join(busy)}). Выберите другое время для этих дат."
+        )
+
+async def materialize_tenant():
+    """Book the upcoming occurrences of the series of the current tenant"""
+    created, busy_by_series = await series_commands.materialize_all_series()
+    report_busy_dates(busy_by_series)
+    return created
+
+async def materialize_everywhere():
+    """Book the upcoming occurrences of the series of the main spreadsheet and of every tenant"""
+    created = await materialize_tenant()
+    for tenant in await tenant_commands.get_all_tenants():
+        with tenant_commands.use_tenant(tenant):
+            created += await materialize_tenant()
+    if created:
+        logging.info(f"Created {created} appointments of recurring series")
+    return created
+
+
+async def start_series_scheduler():
+    """Start the scheduler creating the appointments of recurring series ahead"""
+    while True:
+        try:
+            await materialize_everywhere()
+        except Exception as e:
+            logging.error(f"Error materializing recurring series: {str(e)}")
+        await asyncio.sleep(MATERIALIZE_INTERVAL)
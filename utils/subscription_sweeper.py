@@ -0,0 +1,164 @@
+import asyncio
+import bisect
+import json
+import logging
+import os
+from datetime import date, timedelta
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from utils.db_api import subscription_commands
+from utils.db_api.google_sheets import get_sheet_table
+from utils.db_api.records import as_date
+
+# Admins are reminded this many days before their subscription ends
+RENEWAL_NOTICE_DAYS = int(os.getenv('RENEWAL_NOTICE_DAYS', '3'))
+
+# Subscriptions that ended within this many days are reported as expired
+EXPIRED_LOOKBACK_DAYS = 7
+
+# Seconds between sweeps; referral credits wait at most this long
+SWEEP_INTERVAL = 300
+
+# Local file remembering the notices already sent, so a restart does not repeat them
+SUBSCRIPTION_NOTICES_FILE = os.getenv('SUBSCRIPTION_NOTICES_FILE', '.subscription_notices.json')
+
+# Notices already sent, as (user_id, end_date, kind); a new end date
+# means a new subscription period with its own notices
+_notified = None
+
+# Expiry index of the cached Subscriptions sheet
+_index = None
+
+
+class ExpiryIndex:
+    """Subscriptions sorted by end date, to find those ending in a date range"""
+
+    __slots__ = ('source', 'end_dates', 'subscriptions')
+
+    def __init__(self, source):
+        entries = {}
+        for subscription in source:
+            end_date = as_date(subscription.get('end_date'))
+            # The first row of a user is the one check_subscription_status uses
+            if end_date is not None:
+                entries.setdefault(str(subscription.get('user_id')), (end_date, subscription))
+
+        ordered = sorted(entries.values(), key=lambda entry: entry[0])
+        self.source = source
+        self.end_dates = [end_date for end_date, _ in ordered]
+        self.subscriptions = [subscription for _, subscription in ordered]
+
+    def ending_between(self, first, last):
+        """Get the subscriptions whose end date is in [first, last]"""
+        start = bisect.bisect_left(self.end_dates, first)
+        stop = bisect.bisect_right(self.end_dates, last)
+        return self.subscriptions[start:stop]
+
+
+def load_notices():
+    """Load the notices already sent"""
+    try:
+        with open(SUBSCRIPTION_NOTICES_FILE, 'r', encoding='utf-8') as f:
+            return {tuple(notice) for notice in json.load(f)}
+    except (OSError, ValueError, TypeError):
+        return set()
+
+
+def save_notices(today):
+    """Remember the notices sent, except those of periods that ended long ago"""
+    oldest = (today - timedelta(days=EXPIRED_LOOKBACK_DAYS)).isoformat()
+    _notified.difference_update({notice for notice in _notified if str(notice[1]) < oldest})
+    try:
+        with open(SUBSCRIPTION_NOTICES_FILE, 'w', encoding='utf-8') as f:
+            json.dump(sorted(_notified), f)
+    except OSError as e:
+        logging.warning(f"Could not save subscription notices: {str(e)}")
+
+
+async def get_expiry_index():
+    """Get the expiry index, rebuilding it only if the cached sheet changed"""
+    global _index
+    subscriptions = await get_sheet_table(subscription_commands.SUBSCRIPTIONS_SHEET)
+    if _index is None or _index.source is not subscriptions:
+        _index = ExpiryIndex(subscriptions)
+    return _index
+
+
+def get_renewal_keyboard():
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="💳 Продлить подписку", callback_data="buy_subscription")],
+        [InlineKeyboardButton(text="📋 Моя подписка", callback_data="subscription_status")],
+    ])
+
+
+async def notify_admin(bot, subscription, kind, today):
+    """Send a renewal or expiry notice once per subscription period"""
+    user_id = str(subscription.get('user_id'))
+    end_date = subscription.get('end_date')
+    key = (user_id, end_date, kind)
+    if key in _notified:
+        return False
+
+    if kind == 'expired':
+        text = (
+            f"⛔ Ваша подписка закончилась {end_date}.\n"
+            f"Функции администратора недоступны до продления подписки."
+        )
+    else:
+        days_left = (as_date(end_date) - today).days
+        text = (
+            f"⏰ Ваша {'пробная ' if subscription.get('trial') == 'yes' else ''}подписка "
+            f"закончится через {days_left} дн. ({end_date}).\n"
+            f"Продлите ее, чтобы не потерять доступ."
+        )
+
+    try:
+        await bot.send_message(int(user_id), text, reply_markup=get_renewal_keyboard())
+    except Exception as e:
+        logging.error(f"Error sending subscription notice to {user_id}: {str(e)}")
+    # Not retried, a blocked bot would fail on every sweep
+    _notified.add(key)
+    return True
+
+
+async def sweep(bot, today=None):
+    """Apply referral credits, then remind admins of ending subscriptions and report expired ones"""
+    global _notified
+    today = today or date.today()
+    credited = await subscription_commands.apply_referral_credits()
+    if _notified is None:
+        _notified = load_notices()
+
+    index = await get_expiry_index()
+    reminded = expired = 0
+
+    # Subscriptions are active while their end date is after today
+    for subscription in index.ending_between(today + timedelta(days=1), today + timedelta(days=RENEWAL_NOTICE_DAYS)):
+        if await notify_admin(bot, subscription, 'renewal', today):
+            reminded += 1
+            await asyncio.sleep(0.3)  # Avoid flood limit
+
+    for subscription in index.ending_between(today - timedelta(days=EXPIRED_LOOKBACK_DAYS), today):
+        if await notify_admin(bot, subscription, 'expired', today):
+            # Downgrade: drop the cached active status, admin features are locked from now on
+            subscription_commands.forget_status(subscription.get('user_id'))
+            expired += 1
+            await asyncio.sleep(0.3)
+
+    if reminded or expired:
+        save_notices(today)
+    if credited or reminded or expired:
+        logging.info(
+            f"Subscription sweep: {credited} referral credits applied, "
+            f"{reminded} renewal reminders, {expired} expired"
+        )
+    return {'credited': credited, 'reminded': reminded, 'expired': expired}
+
+
+async def start_subscription_sweeper(bot):
+    """Start the scheduler of the subscription sweep"""
+    while True:
+        try:
+            await sweep(bot)
+        except Exception as e:
+            logging.error(f"Error in subscription sweep: {str(e)}")
+        await asyncio.sleep(SWEEP_INTERVAL)
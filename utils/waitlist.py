@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import time as clock
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from keyboards.callback_data import WaitlistCallback
+from utils import catalog_snapshot, outbound
+from utils.db_api import appointment_commands, master_commands, timezones, waitlist_commands
+from utils.db_api.google_sheets import current_tenant
+from utils.db_api.tenant_commands import use_tenant, get_all_tenants
+
+# Minutes a freed slot is held for the client it is offered to
+HOLD_MINUTES = 15
+
+# Seconds between checks for expired offers
+CHECK_INTERVAL = 30
+
+# Seconds between cancellations of the entries whose date range is over
+EXPIRE_ENTRIES_INTERVAL = 60 * 60
+
+
+class Offer:
+    """Freed slot offered to a waiting client and held for them until it expires"""
+
+    __slots__ = ('entry', 'master_id', 'date', 'time', 'tenant', 'expires', 'offered')
+
+    def __init__(self, entry, master_id, date, time, tenant, offered):
+        self.entry = entry
+        self.master_id = master_id
+        self.date = date
+        self.time = time
+        self.tenant = tenant
+        self.expires = clock.monotonic() + HOLD_MINUTES * 60
+        # IDs of the entries the slot was offered to, this one included
+        self.offered = offered
+
+    @property
+    def owner(self):
+        return f"wl{self.entry.get('id')}"
+
+
+# Open offers by entry ID
+_offers = {}
+
+
+def get_offer_keyboard(entry_id):
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="✅ Записаться", callback_data=WaitlistCallback(action="accept", id=str(entry_id)).pack())],
+        [InlineKeyboardButton(text="❌ Отказаться", callback_data=WaitlistCallback(action="decline", id=str(entry_id)).pack())],
+    ])
+
+
+def _slot_passed(date, time):
+    starts_at = timezones.to_epoch(date, time)
+    return starts_at is None or starts_at <= timezones.epoch_now()
+
+
+async def offer_slot(master_id, date, time, offered=frozenset()):
+    """Offer a free slot of the current tenant to the first client waiting for it"""
+    if _slot_passed(date, time):
+        return None
+
+    for entry in await waitlist_commands.find_candidates(master_id, date, exclude=offered):
+        # A client gets one offer at a time, of a slot their service fits in
+        if str(entry.get('id')) in _offers:
+            continue
+        if time in await master_commands.get_master_availability(master_id, date, service_id=entry.get('service_id')):
+            break
+    else:
+        return None
+
+    offer = Offer(entry, master_id, date, time, current_tenant.get(), offered | {str(entry.get('id'))})
+    _offers[str(entry.get('id'))] = offer
+    appointment_commands.hold_slot(master_id, date, time, offer.owner, HOLD_MINUTES * 60, entry.get('service_id'))
+
+    catalog = await catalog_snapshot.get_catalog()
+    service = catalog.get_service(entry.get('service_id'))
+    master = await master_commands.get_master(master_id)
+    outbound.send_later(
+        entry.get('user_id'),
+        f"🔔 Освободилось время, которое вы ждали:\n"
+        f"Услуга: {service['name'] if service else '-'}\n"
+        f"Мастер: {master['name'] if master else '-'}\n"
+        f"Дата: {date}\n"
+        f"Время: {time}\n\n"
+        f"Время закреплено за вами на {HOLD_MINUTES} минут.",
+        reply_markup=get_offer_keyboard(entry.get('id')),
+    )
+    return offer
+
+
+async def on_appointment_change(before, after):
+    """Appointment hook: offer a slot freed by a cancellation or a move to the waitlist"""
+    if before is None or before.get('status') in appointment_commands.FREE_SLOT_STATUSES:
+        return
+    slot = (before.get('master_id'), before.get('date'), before.get('time'))
+    if after is not None and after.get('status') not in appointment_commands.FREE_SLOT_STATUSES \
+            and (after.get('master_id'), after.get('date'), after.get('time')) == slot:
+        return
+    if slot[0]:
+        await offer_slot(*slot)
+
+
+async def _pass_on(offer):
+    """Release the slot of a declined or expired offer and offer it to the next client"""
+    appointment_commands.release_slot(offer.master_id, offer.date, offer.time, offer.owner)
+    with use_tenant(offer.tenant):
+        await offer_slot(offer.master_id, offer.date, offer.time, offer.offered)
+
+
+async def accept_offer(entry_id, user_id):
+    """Book the offered slot. Returns the appointment, or None if the offer is gone"""
+    offer = _offers.get(str(entry_id))
+    if offer is None or str(offer.entry.get('user_id')) != str(user_id):
+        return None
+    del _offers[str(entry_id)]
+
+    entry = offer.entry
+    with use_tenant(offer.tenant):
+        appointment = await appointment_commands.book_slot(
+            entry.get('user_id'), entry.get('service_id'), offer.date, offer.time, offer.master_id, owner=offer.owner
+        )
+        if appointment is None:
+            return None
+        await waitlist_commands.set_entry_status(entry.get('id'), waitlist_commands.BOOKED)
+    return appointment
+
+
+async def decline_offer(entry_id, user_id):
+    """Decline an offer, the slot goes to the next waiting client"""
+    offer = _offers.get(str(entry_id))
+    if offer is None or str(offer.entry.get('user_id')) != str(user_id):
+        return False
+    del _offers[str(entry_id)]
+    await _pass_on(offer)
+    return True
+
+
+async def expire_offers():
+    """Pass on the offers nobody answered in time"""
+    now = clock.monotonic()
+    expired = [entry_id for entry_id, offer in _offers.items() if offer.expires <= now]
+    for entry_id in expired:
+        offer = _offers.pop(entry_id)
+        outbound.send_later(
+            offer.entry.get('user_id'),
+            f"⌛ Время {offer.date} {offer.time} больше не закреплено за вами. "
+            f"Вы остаетесь в листе ожидания."
+        )
+        await _pass_on(offer)
+    return len(expired)
+
+
+async def expire_entries_everywhere():
+    """Cancel the entries whose date range is over, in the main spreadsheet and of every tenant"""
+    expired = await waitlist_commands.expire_entries()
+    for tenant in await get_all_tenants():
+        with use_tenant(tenant):
+            expired += await waitlist_commands.expire_entries()
+    if expired:
+        logging.info(f"Canceled {expired} waitlist entries whose dates are over")
+    return expired
+
+
+async def start_waitlist_scheduler():
+    """Start the scheduler passing on expired offers and canceling entries whose dates are over"""
+    entries_expired_at = None
+    while True:
+        try:
+            await expire_offers()
+        except Exception as e:
+            logging.error(f"Error expiring waitlist offers: {str(e)}")
+        if entries_expired_at is None or clock.monotonic() - entries_expired_at >= EXPIRE_ENTRIES_INTERVAL:
+            entries_expired_at = clock.monotonic()
+            try:
+                await expire_entries_everywhere()
+            except Exception as e:
+                logging.error(f"Error expiring waitlist entries: {str(e)}")
+        await asyncio.sleep(CHECK_INTERVAL)
+
+
+appointment_commands.add_appointment_hook(on_appointment_change)